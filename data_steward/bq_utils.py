@@ -1,4 +1,6 @@
 # Python imports
+import io
+import json
 import logging
 import os
 import socket
@@ -9,11 +11,13 @@ from datetime import datetime
 # Third party imports
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
 from deprecated import deprecated
 
 # Project imports
 import app_identity
 import common
+from gcloud.bq.job_waiter import JobWaiter, get_timeout_for_retries
 from gcloud.gcs import StorageClient
 import resources
 from constants import bq_utils as bq_consts
@@ -359,18 +363,6 @@ def table_exists(table_id, dataset_id=None):
         return False
 
 
-def job_status_done(job_id):
-    """
-    Check if the job is complete
-
-    :param job_id: the job id
-    :return: a bool indicating whether the job is done
-    """
-    job_details = get_job_details(job_id)
-    job_running_status = job_details['status']['state']
-    return job_running_status == 'DONE'
-
-
 @deprecated(reason='job_status_errored is deprecated')
 def job_status_errored(job_id):
     """
@@ -397,27 +389,57 @@ def sleeper(poll_interval):
     return
 
 
-def wait_on_jobs(job_ids, retry_count=bq_consts.BQ_DEFAULT_RETRY_COUNT):
+def get_done_job_ids(job_ids):
+    """
+    Get the jobs that are complete with one batched request per chunk of jobs
+
+    :param job_ids: list of job_id strings
+    :return: set of the job ids that are done
+    """
+    bq_service = create_service()
+    app_id = app_identity.get_application_id()
+    request_ids = {str(job_id): job_id for job_id in job_ids}
+    done = set()
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            # the job is polled again
+            logging.warning(f'Unable to get status of job {request_id}: '
+                            f'{exception}')
+        elif response['status']['state'] == 'DONE':
+            done.add(request_ids[request_id])
+
+    request_id_list = list(request_ids)
+    for start in range(0, len(request_id_list), bq_consts.JOB_BATCH_SIZE):
+        batch = bq_service.new_batch_http_request(callback=callback)
+        for request_id in request_id_list[start:start +
+                                          bq_consts.JOB_BATCH_SIZE]:
+            batch.add(bq_service.jobs().get(projectId=app_id, jobId=request_id),
+                      request_id=request_id)
+        try:
+            batch.execute()
+        except HttpError as err:
+            # the jobs in this chunk are polled again
+            logging.warning(f'Unable to get status of jobs: {err}')
+    return done
+
+
+def wait_on_jobs(job_ids,
+                 retry_count=bq_consts.BQ_DEFAULT_RETRY_COUNT,
+                 on_done=None):
     """
-    Implements exponential backoff to wait for jobs to complete
+    Wait for jobs to complete, polling the status of all of them at once
+
     :param job_ids: list of job_id strings
-    :param retry_count: max number of iterations for exponent
+    :param retry_count: bounds the wait to the time this many doubling poll
+        intervals took
+    :param on_done: optional function called with each job id as soon as it
+        completes
     :return: list of jobs that failed to complete or empty list if all completed
     """
-    job_ids = list(job_ids)
-    poll_interval = 1
-    for _ in range(retry_count):
-        logging.info(
-            f'Waiting {poll_interval} seconds for completion of job(s): {job_ids}'
-        )
-        sleeper(poll_interval)
-        job_ids = [job_id for job_id in job_ids if not job_status_done(job_id)]
-        if not job_ids:
-            return job_ids
-        if poll_interval < bq_consts.MAX_POLL_INTERVAL:
-            poll_interval *= 2
-    logging.info(f'Job(s) {job_ids} failed to complete')
-    return job_ids
+    timeout = get_timeout_for_retries(retry_count, bq_consts.MAX_POLL_INTERVAL)
+    waiter = JobWaiter(get_done_job_ids, sleep=sleeper, clock=time.monotonic)
+    return waiter.wait(job_ids, timeout=timeout, on_done=on_done)
 
 
 def get_job_details(job_id):
@@ -873,9 +895,10 @@ def csv_line_to_sql_row_expr(row: dict, fields: list):
     "(1234, '2019-01-01', NULL)"
     """
     val_exprs = []
+    fields_by_name = {field['name']: field for field in fields}
     # TODO refactor for all other types or use external library
     for field_name, val in row.items():
-        field = next(filter(lambda f: f['name'] == field_name, fields), None)
+        field = fields_by_name.get(field_name)
         if field is None:
             raise InvalidOperationError(
                 f'Unable to marshal {val}: field "{field_name}" was not found')
@@ -896,6 +919,90 @@ def csv_line_to_sql_row_expr(row: dict, fields: list):
     return f'({cols})'
 
 
+def csv_line_to_json_row(row: dict, fields: list) -> dict:
+    """
+    Translate a dict to a row of a JSON load based on a fields spec
+
+    Values are matched to fields by column name.  As in
+    csv_line_to_sql_row_expr, an empty value is loaded as NULL in a nullable
+    field and as an empty string in a required string field.
+
+    :param row: dict whose values are all strings
+    :param fields: bigquery fields spec with keys {name, type, mode, description}
+    :return: dict of the non null values by field name
+    :raises InvalidOperationError: if a column is not a field or a required
+        field that is not a string has no value
+    :example:
+    >>> fields = [{ 'name': 'int_col',  'type': 'integer', 'mode': 'required', 'description': ''},
+    >>>           { 'name': 'date_col', 'type': 'date',    'mode': 'nullable', 'description': ''},
+    >>>           { 'name': 'str_col',  'type': 'string',  'mode': 'required', 'description': ''}]
+    >>> csv_line_to_json_row({'int_col': '1234', 'date_col': '', 'str_col': ''}, fields)
+    {'int_col': '1234', 'str_col': ''}
+    """
+    json_row = dict()
+    fields_by_name = {field['name']: field for field in fields}
+    for field_name, val in row.items():
+        field = fields_by_name.get(field_name)
+        if field is None:
+            raise InvalidOperationError(
+                f'Unable to marshal {val}: field "{field_name}" was not found')
+        if not val:
+            if field['mode'] == 'nullable':
+                continue
+            if field['type'] != 'string':
+                raise InvalidOperationError(
+                    f'Value not provided for required field {field_name}')
+        json_row[field_name] = val
+    return json_row
+
+
+def load_local_rows(rows,
+                    fields,
+                    project_id,
+                    dataset_id,
+                    table_id,
+                    write_disposition=bq_consts.WRITE_TRUNCATE):
+    """
+    Load rows into a table in bigquery, without a GCS bucket
+
+    The rows are uploaded as newline delimited JSON with the load job request.
+
+    :param rows: list of dicts of values by field name
+    :param fields: fields in list of dicts format
+    :param project_id: project containing the dataset
+    :param dataset_id: dataset containing the table
+    :param table_id: table to load the rows into
+    :param write_disposition:  tell BQ how to handle existing tables.
+        options are TRUNCATE, APPEND, and EMPTY.  default is TRUNCATE.
+    :return: an object describing the associated bigquery job
+    """
+    bq_service = create_service()
+
+    load = {
+        bq_consts.SCHEMA: {
+            bq_consts.FIELDS: fields
+        },
+        'destinationTable': {
+            'projectId': project_id,
+            'datasetId': dataset_id,
+            'tableId': table_id
+        },
+        'writeDisposition': write_disposition,
+        'sourceFormat': 'NEWLINE_DELIMITED_JSON'
+    }
+    job_body = {'configuration': {'load': load}}
+    payload = '\n'.join(json.dumps(row) for row in rows)
+    media = MediaIoBaseUpload(io.BytesIO(payload.encode('utf-8')),
+                              mimetype='application/octet-stream',
+                              resumable=True)
+    insert_job = bq_service.jobs().insert(projectId=project_id,
+                                          body=job_body,
+                                          media_body=media)
+    insert_result = insert_job.execute(
+        num_retries=bq_consts.BQ_DEFAULT_RETRY_COUNT)
+    return insert_result
+
+
 def load_table_from_csv(project_id,
                         dataset_id,
                         table_name,
@@ -904,6 +1011,9 @@ def load_table_from_csv(project_id,
     """
     Loads BQ table from a csv file without making use of GCS buckets
 
+    The table is re-created and the rows of the file are uploaded with a load
+    job, which is waited on.  Columns are matched to fields by name.
+
     :param project_id: project containing the dataset
     :param dataset_id: dataset where the table needs to be created
     :param table_name: name of the table to be created
@@ -911,31 +1021,40 @@ def load_table_from_csv(project_id,
                      If None, assumes that the file exists in the resource_files folder with the name table_name.csv
     :param fields: fields in list of dicts format. If set to None, assumes that
                    the fields are stored in a json file in resource_files/fields named table_name.json
-    :return: BQ response for the load query
+    :return: BQ response for the load job
+    :raises InvalidOperationError: if a column of the file is not a field or a
+        required field that is not a string has no value
+    :raises BigQueryJobWaitError: if the load job fails or does not complete
     """
     if not csv_path:
         csv_path = os.path.join(resources.resource_files_path,
                                 table_name + ".csv")
+
     table_list = resources.csv_to_list(csv_path)
 
     if not fields:
         fields = resources.fields_for(table_name)
-    field_names = ', '.join([field['name'] for field in fields])
-    row_exprs = [csv_line_to_sql_row_expr(t, fields) for t in table_list]
-    formatted_mapping_list = ', '.join(row_exprs)
+    rows = [csv_line_to_json_row(t, fields) for t in table_list]
 
     create_table(table_id=table_name,
                  fields=fields,
                  drop_existing=True,
                  dataset_id=dataset_id)
 
-    table_populate_query = bq_consts.INSERT_QUERY.format(
-        project_id=project_id,
-        dataset_id=dataset_id,
-        table_id=table_name,
-        columns=field_names,
-        mapping_list=formatted_mapping_list)
-    result = query(table_populate_query)
+    result = load_local_rows(rows,
+                             fields,
+                             project_id,
+                             dataset_id,
+                             table_name,
+                             write_disposition=bq_consts.WRITE_APPEND)
+    job_id = result['jobReference']['jobId']
+    incomplete_jobs = wait_on_jobs([job_id])
+    if incomplete_jobs:
+        raise BigQueryJobWaitError(incomplete_jobs)
+    job_status = get_job_details(job_id)['status']
+    if 'errorResult' in job_status:
+        raise BigQueryJobWaitError([job_id],
+                                   job_status['errorResult']['message'])
     return result
 
 
@@ -10,417 +10,264 @@ import typing
 
 # Project imports
 import cdr_cleaner.clean_cdr_engine as clean_engine
-from cdr_cleaner.cleaning_rules.backfill_lifestyle import BackfillLifestyle
-from cdr_cleaner.cleaning_rules.backfill_overall_health import BackfillOverallHealth
-from cdr_cleaner.cleaning_rules.backfill_the_basics import BackfillTheBasics
-from cdr_cleaner.cleaning_rules.calculate_bmi import CalculateBmi
-from cdr_cleaner.cleaning_rules.calculate_primary_death_record import CalculatePrimaryDeathRecord
-from cdr_cleaner.cleaning_rules.clean_by_birth_year import CleanByBirthYear
-from cdr_cleaner.cleaning_rules.convert_pre_post_coordinated_concepts import ConvertPrePostCoordinatedConcepts
-from cdr_cleaner.cleaning_rules.create_aian_lookup import CreateAIANLookup
-from cdr_cleaner.cleaning_rules.create_expected_ct_list import StoreExpectedCTList
-from cdr_cleaner.cleaning_rules.deid.ct_additional_privacy_suppression import CTAdditionalPrivacyConceptSuppression
-from cdr_cleaner.cleaning_rules.deid.rt_additional_privacy_suppression import RTAdditionalPrivacyConceptSuppression
-from cdr_cleaner.cleaning_rules.deid.rt_observation_privacy_suppression import RTObservationPrivacySuppression
-from cdr_cleaner.cleaning_rules.domain_alignment import DomainAlignment
-import cdr_cleaner.cleaning_rules.drop_duplicate_states as drop_duplicate_states
-from cdr_cleaner.cleaning_rules.drop_extreme_measurements import DropExtremeMeasurements
-from cdr_cleaner.cleaning_rules.drop_multiple_measurements import DropMultipleMeasurements
-from cdr_cleaner.cleaning_rules.drop_participants_without_any_basics import DropParticipantsWithoutAnyBasics
-from cdr_cleaner.cleaning_rules.clean_survey_conduct_recurring_surveys import CleanSurveyConductRecurringSurveys
-from cdr_cleaner.cleaning_rules.update_survey_source_concept_id import UpdateSurveySourceConceptId
-from cdr_cleaner.cleaning_rules.drop_unverified_survey_data import DropUnverifiedSurveyData
-from cdr_cleaner.cleaning_rules.drug_refills_days_supply import DrugRefillsDaysSupply
-from cdr_cleaner.cleaning_rules.maps_to_value_ppi_vocab_update import MapsToValuePpiVocabUpdate
-from cdr_cleaner.cleaning_rules.populate_route_ids import PopulateRouteIds
-from cdr_cleaner.cleaning_rules.populate_survey_conduct_ext import PopulateSurveyConductExt
-from cdr_cleaner.cleaning_rules.remove_invalid_procedure_source_records import RemoveInvalidProcedureSourceRecords
-from cdr_cleaner.cleaning_rules.remove_non_matching_participant import RemoveNonMatchingParticipant
-from cdr_cleaner.cleaning_rules.sandbox_and_remove_withdrawn_pids import SandboxAndRemoveWithdrawnPids
-from cdr_cleaner.cleaning_rules.remove_records_with_wrong_date import RemoveRecordsWithWrongDate
-from cdr_cleaner.cleaning_rules.remove_participants_under_18years import RemoveParticipantsUnder18Years
-from cdr_cleaner.cleaning_rules.round_ppi_values_to_nearest_integer import RoundPpiValuesToNearestInteger
-from cdr_cleaner.cleaning_rules.replace_freetext_notes import ReplaceFreeTextNotes
-from cdr_cleaner.cleaning_rules.update_family_history_qa_codes import UpdateFamilyHistoryCodes
-from cdr_cleaner.cleaning_rules.remove_operational_pii_fields import RemoveOperationalPiiFields
-from cdr_cleaner.cleaning_rules.update_ppi_negative_pain_level import UpdatePpiNegativePainLevel
-from cdr_cleaner.cleaning_rules.clean_height_weight import CleanHeightAndWeight
-from cdr_cleaner.cleaning_rules.clean_mapping import CleanMappingExtTables
-from cdr_cleaner.cleaning_rules.clean_ppi_numeric_fields_using_parameters import \
-    CleanPPINumericFieldsUsingParameters
-from cdr_cleaner.cleaning_rules.create_person_ext_table import CreatePersonExtTable
-from cdr_cleaner.cleaning_rules.date_unshift_cope_responses import DateUnShiftCopeResponses
-from cdr_cleaner.cleaning_rules.deid.survey_conduct_dateshift import SurveyConductDateShiftRule
-from cdr_cleaner.cleaning_rules.remove_ehr_data_without_consent import RemoveEhrDataWithoutConsent
-from cdr_cleaner.cleaning_rules.generate_ext_tables import GenerateExtTables
-from cdr_cleaner.cleaning_rules.truncate_fitbit_data import TruncateFitbitData
-from cdr_cleaner.cleaning_rules.truncate_era_tables import TruncateEraTables
-# from cdr_cleaner.cleaning_rules.clean_digital_health_data import CleanDigitalHealthStatus
-from cdr_cleaner.cleaning_rules.remove_non_existing_pids import RemoveNonExistingPids
-from cdr_cleaner.cleaning_rules.drop_invalid_sleep_level_records import DropInvalidSleepLevelRecords
-from cdr_cleaner.cleaning_rules.deid.fitbit_dateshift import FitbitDateShiftRule
-from cdr_cleaner.cleaning_rules.deid.fitbit_deid_src_id import FitbitDeidSrcID
-from cdr_cleaner.cleaning_rules.deid.fitbit_pid_rid_map import FitbitPIDtoRID
-from cdr_cleaner.cleaning_rules.deid.remove_fitbit_data_if_max_age_exceeded import \
-    RemoveFitbitDataIfMaxAgeExceeded
-from cdr_cleaner.cleaning_rules.deid.rt_ct_pid_rid_map import RtCtPIDtoRID
-from cdr_cleaner.cleaning_rules.deid.repopulate_person_controlled_tier import \
-    RepopulatePersonControlledTier
-from cdr_cleaner.cleaning_rules.deid.conflicting_hpo_state_generalization import \
-    ConflictingHpoStateGeneralize
-from cdr_cleaner.cleaning_rules.deid.generalize_cope_insurance_answers import GeneralizeCopeInsuranceAnswers
-from cdr_cleaner.cleaning_rules.deid.generalize_indian_health_services import GeneralizeIndianHealthServices
-from cdr_cleaner.cleaning_rules.drop_cope_duplicate_responses import DropCopeDuplicateResponses
-from cdr_cleaner.cleaning_rules.drop_duplicate_ppi_questions_and_answers import \
-    DropDuplicatePpiQuestionsAndAnswers
-from cdr_cleaner.cleaning_rules.drop_row_duplicates import DropRowDuplicates
-from cdr_cleaner.cleaning_rules.clean_smoking_ppi import CleanSmokingPpi
-from cdr_cleaner.cleaning_rules.drop_ppi_duplicate_responses import DropPpiDuplicateResponses
-from cdr_cleaner.cleaning_rules.drop_zero_concept_ids import DropZeroConceptIDs
-from cdr_cleaner.cleaning_rules.ensure_date_datetime_consistency import \
-    EnsureDateDatetimeConsistency
-from cdr_cleaner.cleaning_rules.fill_source_value_text_fields import FillSourceValueTextFields
-from cdr_cleaner.cleaning_rules.fix_unmapped_survey_answers import FixUnmappedSurveyAnswers
-from cdr_cleaner.cleaning_rules.id_deduplicate import DeduplicateIdColumn
-from cdr_cleaner.cleaning_rules.measurement_table_suppression import MeasurementRecordsSuppression
-from cdr_cleaner.cleaning_rules.no_data_30_days_after_death import NoDataAfterDeath
-from cdr_cleaner.cleaning_rules.null_concept_ids_for_numeric_ppi import NullConceptIDForNumericPPI
-from cdr_cleaner.cleaning_rules.null_invalid_foreign_keys import NullInvalidForeignKeys
-from cdr_cleaner.cleaning_rules.ppi_branching import PpiBranching
-from cdr_cleaner.cleaning_rules.rdr_observation_source_concept_id_suppression import (
-    ObservationSourceConceptIDRowSuppression)
-from cdr_cleaner.cleaning_rules.remove_multiple_race_ethnicity_answers import RemoveMultipleRaceEthnicityAnswersQueries
-from cdr_cleaner.cleaning_rules.deid.motor_vehicle_accident_suppression import \
-    MotorVehicleAccidentSuppression
-from cdr_cleaner.cleaning_rules.deid.birth_information_suppression import \
-    BirthInformationSuppression
-from cdr_cleaner.cleaning_rules.deid.year_of_birth_records_suppression import \
-    YearOfBirthRecordsSuppression
-from cdr_cleaner.cleaning_rules.replace_standard_id_in_domain_tables import \
-    ReplaceWithStandardConceptId
-from cdr_cleaner.cleaning_rules.remove_participant_data_past_deactivation_date import \
-    RemoveParticipantDataPastDeactivationDate
-from cdr_cleaner.cleaning_rules.ehr_submission_data_cutoff import EhrSubmissionDataCutoff
-from cdr_cleaner.cleaning_rules.repopulate_person_post_deid import RepopulatePersonPostDeid
-from cdr_cleaner.cleaning_rules.truncate_rdr_using_date import TruncateRdrData
-from cdr_cleaner.cleaning_rules.unit_normalization import UnitNormalization
-from cdr_cleaner.cleaning_rules.update_cope_flu_concepts import UpdateCopeFluQuestionConcept
-from cdr_cleaner.cleaning_rules.update_fields_numbers_as_strings import UpdateFieldsNumbersAsStrings
-from cdr_cleaner.cleaning_rules.temporal_consistency import TemporalConsistency
-from cdr_cleaner.cleaning_rules.valid_death_dates import ValidDeathDates
-from cdr_cleaner.cleaning_rules.negative_ages import NegativeAges
-from cdr_cleaner.cleaning_rules.deid.explicit_identifier_suppression import ExplicitIdentifierSuppression
-from cdr_cleaner.cleaning_rules.deid.geolocation_concept_suppression import GeoLocationConceptSuppression
-from cdr_cleaner.cleaning_rules.null_person_birthdate import NullPersonBirthdate
-from cdr_cleaner.cleaning_rules.race_ethnicity_record_suppression import RaceEthnicityRecordSuppression
-from cdr_cleaner.cleaning_rules.table_suppression import TableSuppression
-from cdr_cleaner.cleaning_rules.deid.controlled_cope_survey_suppression import ControlledCopeSurveySuppression
-from cdr_cleaner.cleaning_rules.deid.registered_cope_survey_suppression import RegisteredCopeSurveyQuestionsSuppression
-from cdr_cleaner.cleaning_rules.deid.questionnaire_response_id_map import QRIDtoRID
-from cdr_cleaner.cleaning_rules.generalize_zip_codes import GeneralizeZipCodes
-from cdr_cleaner.cleaning_rules.free_text_survey_response_suppression import FreeTextSurveyResponseSuppression
-from cdr_cleaner.cleaning_rules.cancer_concept_suppression import CancerConceptSuppression
-from cdr_cleaner.cleaning_rules.identifying_field_suppression import IDFieldSuppression
-from cdr_cleaner.cleaning_rules.aggregate_zip_codes import AggregateZipCodes
-from cdr_cleaner.cleaning_rules.remove_extra_tables import RemoveExtraTables
-from cdr_cleaner.cleaning_rules.store_pid_rid_mappings import StoreNewPidRidMappings
-from cdr_cleaner.cleaning_rules.store_new_duplicate_measurement_concept_ids import \
-    StoreNewDuplicateMeasurementConceptIds
-from cdr_cleaner.cleaning_rules.update_invalid_zip_codes import UpdateInvalidZipCodes
-from cdr_cleaner.cleaning_rules.deid.survey_version_info import COPESurveyVersionTask
-from cdr_cleaner.cleaning_rules.deid.string_fields_suppression import StringFieldsSuppression
-from cdr_cleaner.cleaning_rules.generalize_sex_gender_concepts import GeneralizeSexGenderConcepts
-from cdr_cleaner.cleaning_rules.generalize_state_by_population import GeneralizeStateByPopulation
-from cdr_cleaner.cleaning_rules.section_participation_concept_suppression import SectionParticipationConceptSuppression
-from cdr_cleaner.cleaning_rules.deid.recent_concept_suppression import RecentConceptSuppression
-from cdr_cleaner.cleaning_rules.missing_concept_record_suppression import MissingConceptRecordSuppression
-from cdr_cleaner.cleaning_rules.create_deid_questionnaire_response_map import CreateDeidQuestionnaireResponseMap
-from cdr_cleaner.cleaning_rules.set_unmapped_question_answer_survey_concepts import (
-    SetConceptIdsForSurveyQuestionsAnswers)
-from cdr_cleaner.cleaning_rules.map_health_insurance_responses import MapHealthInsuranceResponses
-from cdr_cleaner.cleaning_rules.vehicular_accident_concept_suppression import VehicularAccidentConceptSuppression
-from cdr_cleaner.cleaning_rules.deid.ct_replaced_concept_suppression import \
-    ControlledTierReplacedConceptSuppression
-from cdr_cleaner.cleaning_rules.dedup_measurement_value_as_concept_id import DedupMeasurementValueAsConceptId
-from cdr_cleaner.cleaning_rules.drop_orphaned_pids import DropOrphanedPIDS
-from cdr_cleaner.cleaning_rules.drop_orphaned_survey_conduct_ids import DropOrphanedSurveyConductIds
-from cdr_cleaner.cleaning_rules.deid.deidentify_aian_zip3_values import DeidentifyAIANZip3Values
+from cdr_cleaner.rule_registry import RuleRegistry
 import constants.global_variables
 from constants.cdr_cleaner import clean_cdr_engine as ce_consts
 from constants.cdr_cleaner.clean_cdr import DataStage, DATA_CONSISTENCY, CRON_RETRACTION
-from cdr_cleaner.cleaning_rules.generate_research_device_ids import GenerateResearchDeviceIds
-from cdr_cleaner.cleaning_rules.deid.fitbit_device_id import DeidFitbitDeviceId
-from cdr_cleaner.cleaning_rules.drop_survey_data_via_survey_conduct import DropViaSurveyConduct
-from cdr_cleaner.cleaning_rules.generate_wear_study_table import GenerateWearStudyTable
-
-# Third party imports
 
 LOGGER = logging.getLogger(__name__)
 
+# The cleaning rules of each data stage, as import paths of the rule classes
+# or functions in the order they run.  The rule modules are only imported
+# when the rules of their data stage are looked up in DATA_STAGE_RULES_MAPPING.
 EHR_CLEANING_CLASSES = [
-    (CleanMappingExtTables,),  # should be one of the last cleaning rules run
+    'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables',  # should be one of the last cleaning rules run
 ]
 
 UNIONED_EHR_CLEANING_CLASSES = [
-    (EhrSubmissionDataCutoff,
-    ),  # should run before EnsureDateDatetimeConsistency
-    (DeduplicateIdColumn,),
-    (CleanByBirthYear,),
-    (EnsureDateDatetimeConsistency,),
-    (RemoveRecordsWithWrongDate,),
-    (RemoveInvalidProcedureSourceRecords,),
-    (CalculatePrimaryDeathRecord,),
-    (CleanMappingExtTables,),  # should be one of the last cleaning rules run
+    'cdr_cleaner.cleaning_rules.ehr_submission_data_cutoff.EhrSubmissionDataCutoff',  # should run before EnsureDateDatetimeConsistency
+    'cdr_cleaner.cleaning_rules.id_deduplicate.DeduplicateIdColumn',
+    'cdr_cleaner.cleaning_rules.clean_by_birth_year.CleanByBirthYear',
+    'cdr_cleaner.cleaning_rules.ensure_date_datetime_consistency.EnsureDateDatetimeConsistency',
+    'cdr_cleaner.cleaning_rules.remove_records_with_wrong_date.RemoveRecordsWithWrongDate',
+    'cdr_cleaner.cleaning_rules.remove_invalid_procedure_source_records.RemoveInvalidProcedureSourceRecords',
+    'cdr_cleaner.cleaning_rules.calculate_primary_death_record.CalculatePrimaryDeathRecord',
+    'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables',  # should be one of the last cleaning rules run
 ]
 
 RDR_CLEANING_CLASSES = [
-    (StoreNewPidRidMappings,),
-    (CreateDeidQuestionnaireResponseMap,),
-    (CreateAIANLookup,),
-    (TruncateRdrData,),
-    (RemoveParticipantsUnder18Years,),
-    (SandboxAndRemoveWithdrawnPids,),
+    'cdr_cleaner.cleaning_rules.store_pid_rid_mappings.StoreNewPidRidMappings',
+    'cdr_cleaner.cleaning_rules.create_deid_questionnaire_response_map.CreateDeidQuestionnaireResponseMap',
+    'cdr_cleaner.cleaning_rules.create_aian_lookup.CreateAIANLookup',
+    'cdr_cleaner.cleaning_rules.truncate_rdr_using_date.TruncateRdrData',
+    'cdr_cleaner.cleaning_rules.remove_participants_under_18years.RemoveParticipantsUnder18Years',
+    'cdr_cleaner.cleaning_rules.sandbox_and_remove_withdrawn_pids.SandboxAndRemoveWithdrawnPids',
     # execute SetConceptIdsForSurveyQuestionAnswers before PpiBranching gets executed
     # since PpiBranching relies on fully mapped concepts
-    (
-        SetConceptIdsForSurveyQuestionsAnswers,),
-    (MapHealthInsuranceResponses,),
-    (PpiBranching,),
+    'cdr_cleaner.cleaning_rules.set_unmapped_question_answer_survey_concepts.SetConceptIdsForSurveyQuestionsAnswers',
+    'cdr_cleaner.cleaning_rules.map_health_insurance_responses.MapHealthInsuranceResponses',
+    'cdr_cleaner.cleaning_rules.ppi_branching.PpiBranching',
     # execute FixUnmappedSurveyAnswers before the dropping responses rules get executed
     # (e.g. DropPpiDuplicateResponses and DropDuplicatePpiQuestionsAndAnswers)
-    (
-        FixUnmappedSurveyAnswers,),
-    (ObservationSourceConceptIDRowSuppression,),
-    (UpdateFieldsNumbersAsStrings,),
-    (UpdateCopeFluQuestionConcept,),
-    (MapsToValuePpiVocabUpdate,),
-    (BackfillTheBasics,),
-    (BackfillLifestyle,),
-    (BackfillOverallHealth,),
-    (CleanPPINumericFieldsUsingParameters,),
-    (RemoveMultipleRaceEthnicityAnswersQueries,),
-    (UpdatePpiNegativePainLevel,),
+    'cdr_cleaner.cleaning_rules.fix_unmapped_survey_answers.FixUnmappedSurveyAnswers',
+    'cdr_cleaner.cleaning_rules.rdr_observation_source_concept_id_suppression.ObservationSourceConceptIDRowSuppression',
+    'cdr_cleaner.cleaning_rules.update_fields_numbers_as_strings.UpdateFieldsNumbersAsStrings',
+    'cdr_cleaner.cleaning_rules.update_cope_flu_concepts.UpdateCopeFluQuestionConcept',
+    'cdr_cleaner.cleaning_rules.maps_to_value_ppi_vocab_update.MapsToValuePpiVocabUpdate',
+    'cdr_cleaner.cleaning_rules.backfill_the_basics.BackfillTheBasics',
+    'cdr_cleaner.cleaning_rules.backfill_lifestyle.BackfillLifestyle',
+    'cdr_cleaner.cleaning_rules.backfill_overall_health.BackfillOverallHealth',
+    'cdr_cleaner.cleaning_rules.clean_ppi_numeric_fields_using_parameters.CleanPPINumericFieldsUsingParameters',
+    'cdr_cleaner.cleaning_rules.remove_multiple_race_ethnicity_answers.RemoveMultipleRaceEthnicityAnswersQueries',
+    'cdr_cleaner.cleaning_rules.update_ppi_negative_pain_level.UpdatePpiNegativePainLevel',
     # trying to load a table while creating query strings,
     # won't work with mocked strings.  should use base class
     # setup_query_execution function to load dependencies before query execution
-    (
-        DropPpiDuplicateResponses,),
-    (DropCopeDuplicateResponses,),
-    (RemoveOperationalPiiFields,),
-    (RoundPpiValuesToNearestInteger,),
-    (UpdateFamilyHistoryCodes,),
-    (ConvertPrePostCoordinatedConcepts,),
-    (CleanSmokingPpi,),
-    (NullConceptIDForNumericPPI,),
-    (DropDuplicatePpiQuestionsAndAnswers,),
-    (CalculateBmi,),
-    (DropExtremeMeasurements,),
-    (DropMultipleMeasurements,),
-    (CleanByBirthYear,),
-    (UpdateInvalidZipCodes,),
-    (CleanSurveyConductRecurringSurveys,),
-    (UpdateSurveySourceConceptId,),
-    (DropUnverifiedSurveyData,),
-    (DropParticipantsWithoutAnyBasics,),
-    (StoreExpectedCTList,),
-    (DropOrphanedSurveyConductIds,),
-    (CalculatePrimaryDeathRecord,),
-    (DropRowDuplicates,),
-    (CleanMappingExtTables,),
+    'cdr_cleaner.cleaning_rules.drop_ppi_duplicate_responses.DropPpiDuplicateResponses',
+    'cdr_cleaner.cleaning_rules.drop_cope_duplicate_responses.DropCopeDuplicateResponses',
+    'cdr_cleaner.cleaning_rules.remove_operational_pii_fields.RemoveOperationalPiiFields',
+    'cdr_cleaner.cleaning_rules.round_ppi_values_to_nearest_integer.RoundPpiValuesToNearestInteger',
+    'cdr_cleaner.cleaning_rules.update_family_history_qa_codes.UpdateFamilyHistoryCodes',
+    'cdr_cleaner.cleaning_rules.convert_pre_post_coordinated_concepts.ConvertPrePostCoordinatedConcepts',
+    'cdr_cleaner.cleaning_rules.clean_smoking_ppi.CleanSmokingPpi',
+    'cdr_cleaner.cleaning_rules.null_concept_ids_for_numeric_ppi.NullConceptIDForNumericPPI',
+    'cdr_cleaner.cleaning_rules.drop_duplicate_ppi_questions_and_answers.DropDuplicatePpiQuestionsAndAnswers',
+    'cdr_cleaner.cleaning_rules.calculate_bmi.CalculateBmi',
+    'cdr_cleaner.cleaning_rules.drop_extreme_measurements.DropExtremeMeasurements',
+    'cdr_cleaner.cleaning_rules.drop_multiple_measurements.DropMultipleMeasurements',
+    'cdr_cleaner.cleaning_rules.clean_by_birth_year.CleanByBirthYear',
+    'cdr_cleaner.cleaning_rules.update_invalid_zip_codes.UpdateInvalidZipCodes',
+    'cdr_cleaner.cleaning_rules.clean_survey_conduct_recurring_surveys.CleanSurveyConductRecurringSurveys',
+    'cdr_cleaner.cleaning_rules.update_survey_source_concept_id.UpdateSurveySourceConceptId',
+    'cdr_cleaner.cleaning_rules.drop_unverified_survey_data.DropUnverifiedSurveyData',
+    'cdr_cleaner.cleaning_rules.drop_participants_without_any_basics.DropParticipantsWithoutAnyBasics',
+    'cdr_cleaner.cleaning_rules.create_expected_ct_list.StoreExpectedCTList',
+    'cdr_cleaner.cleaning_rules.drop_orphaned_survey_conduct_ids.DropOrphanedSurveyConductIds',
+    'cdr_cleaner.cleaning_rules.calculate_primary_death_record.CalculatePrimaryDeathRecord',
+    'cdr_cleaner.cleaning_rules.drop_row_duplicates.DropRowDuplicates',
+    'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables',
 ]
 
 COMBINED_CLEANING_CLASSES = [
     # trying to load a table while creating query strings,
     # won't work with mocked strings.  should use base class
     # setup_query_execution function to load dependencies before query execution
-    (
-        ReplaceWithStandardConceptId,),
-    (MissingConceptRecordSuppression,),
-    (DomainAlignment,),
-    (NegativeAges,),
+    'cdr_cleaner.cleaning_rules.replace_standard_id_in_domain_tables.ReplaceWithStandardConceptId',
+    'cdr_cleaner.cleaning_rules.missing_concept_record_suppression.MissingConceptRecordSuppression',
+    'cdr_cleaner.cleaning_rules.domain_alignment.DomainAlignment',
+    'cdr_cleaner.cleaning_rules.negative_ages.NegativeAges',
     # Valid Death dates needs to be applied before no data after death as running no data after death is
     # wiping out the needed consent related data for cleaning.
-    (
-        ValidDeathDates,),
-    (RemoveEhrDataWithoutConsent,),
-    (StoreNewDuplicateMeasurementConceptIds,),
-    (DedupMeasurementValueAsConceptId,),
-    (DrugRefillsDaysSupply,),
-    (PopulateRouteIds,),
-    (TemporalConsistency,),
-    (EnsureDateDatetimeConsistency,),
-    (drop_duplicate_states.get_drop_duplicate_states_queries,),
+    'cdr_cleaner.cleaning_rules.valid_death_dates.ValidDeathDates',
+    'cdr_cleaner.cleaning_rules.remove_ehr_data_without_consent.RemoveEhrDataWithoutConsent',
+    'cdr_cleaner.cleaning_rules.store_new_duplicate_measurement_concept_ids.StoreNewDuplicateMeasurementConceptIds',
+    'cdr_cleaner.cleaning_rules.dedup_measurement_value_as_concept_id.DedupMeasurementValueAsConceptId',
+    'cdr_cleaner.cleaning_rules.drug_refills_days_supply.DrugRefillsDaysSupply',
+    'cdr_cleaner.cleaning_rules.populate_route_ids.PopulateRouteIds',
+    'cdr_cleaner.cleaning_rules.temporal_consistency.TemporalConsistency',
+    'cdr_cleaner.cleaning_rules.ensure_date_datetime_consistency.EnsureDateDatetimeConsistency',
+    'cdr_cleaner.cleaning_rules.drop_duplicate_states.get_drop_duplicate_states_queries',
     # TODO : Make null_invalid_foreign_keys able to run on de_identified dataset
-    (
-        NullInvalidForeignKeys,),
-    (RemoveParticipantDataPastDeactivationDate,),
-    (RemoveNonMatchingParticipant,),
-    (ReplaceFreeTextNotes,),
-    (DropOrphanedSurveyConductIds,),
-    (DropOrphanedPIDS,),
-    (GenerateExtTables,),
-    (COPESurveyVersionTask,
-    ),  # Should run after GenerateExtTables and before CleanMappingExtTables
-    (PopulateSurveyConductExt,),
-    (CalculatePrimaryDeathRecord,),
-    (NoDataAfterDeath,),  # should run after CalculatePrimaryDeathRecord
-    (CleanMappingExtTables,),  # should be one of the last cleaning rules run
+    'cdr_cleaner.cleaning_rules.null_invalid_foreign_keys.NullInvalidForeignKeys',
+    'cdr_cleaner.cleaning_rules.remove_participant_data_past_deactivation_date.RemoveParticipantDataPastDeactivationDate',
+    'cdr_cleaner.cleaning_rules.remove_non_matching_participant.RemoveNonMatchingParticipant',
+    'cdr_cleaner.cleaning_rules.replace_freetext_notes.ReplaceFreeTextNotes',
+    'cdr_cleaner.cleaning_rules.drop_orphaned_survey_conduct_ids.DropOrphanedSurveyConductIds',
+    'cdr_cleaner.cleaning_rules.drop_orphaned_pids.DropOrphanedPIDS',
+    'cdr_cleaner.cleaning_rules.generate_ext_tables.GenerateExtTables',
+    'cdr_cleaner.cleaning_rules.deid.survey_version_info.COPESurveyVersionTask',  # Should run after GenerateExtTables and before CleanMappingExtTables
+    'cdr_cleaner.cleaning_rules.populate_survey_conduct_ext.PopulateSurveyConductExt',
+    'cdr_cleaner.cleaning_rules.calculate_primary_death_record.CalculatePrimaryDeathRecord',
+    'cdr_cleaner.cleaning_rules.no_data_30_days_after_death.NoDataAfterDeath',  # should run after CalculatePrimaryDeathRecord
+    'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables',  # should be one of the last cleaning rules run
 ]
 
 FITBIT_CLEANING_CLASSES = [
-    (TruncateFitbitData,),
-    (RemoveParticipantDataPastDeactivationDate,),
-    # (CleanDigitalHealthStatus,),
-    (
-        DropInvalidSleepLevelRecords,),
-    (RemoveNonExistingPids,),  # assumes combined dataset is ready for reference
-    (GenerateResearchDeviceIds,),
+    'cdr_cleaner.cleaning_rules.truncate_fitbit_data.TruncateFitbitData',
+    'cdr_cleaner.cleaning_rules.remove_participant_data_past_deactivation_date.RemoveParticipantDataPastDeactivationDate',
+    # 'cdr_cleaner.cleaning_rules.clean_digital_health_data.CleanDigitalHealthStatus',
+    'cdr_cleaner.cleaning_rules.drop_invalid_sleep_level_records.DropInvalidSleepLevelRecords',
+    'cdr_cleaner.cleaning_rules.remove_non_existing_pids.RemoveNonExistingPids',  # assumes combined dataset is ready for reference
+    'cdr_cleaner.cleaning_rules.generate_research_device_ids.GenerateResearchDeviceIds',
 ]
 
 REGISTERED_TIER_DEID_CLEANING_CLASSES = [
     # Data mappings/re-mappings
     ####################################
     # TODO: Uncomment rule after date-shift removed from deid module
-    # (SurveyConductDateShiftRule,),
-    (
-        QRIDtoRID,),  # Should run before any row suppression rules
+    # 'cdr_cleaner.cleaning_rules.deid.survey_conduct_dateshift.SurveyConductDateShiftRule',
+    'cdr_cleaner.cleaning_rules.deid.questionnaire_response_id_map.QRIDtoRID',  # Should run before any row suppression rules
 
     # Data generalizations
     ####################################
-    (
-        ConflictingHpoStateGeneralize,),
-    (GeneralizeStateByPopulation,),
-    (GeneralizeCopeInsuranceAnswers,),
-    (GeneralizeIndianHealthServices,),
-    # (GeneralizeSexGenderConcepts,),
+    'cdr_cleaner.cleaning_rules.deid.conflicting_hpo_state_generalization.ConflictingHpoStateGeneralize',
+    'cdr_cleaner.cleaning_rules.generalize_state_by_population.GeneralizeStateByPopulation',
+    'cdr_cleaner.cleaning_rules.deid.generalize_cope_insurance_answers.GeneralizeCopeInsuranceAnswers',
+    'cdr_cleaner.cleaning_rules.deid.generalize_indian_health_services.GeneralizeIndianHealthServices',
+    # 'cdr_cleaner.cleaning_rules.generalize_sex_gender_concepts.GeneralizeSexGenderConcepts',
 
     # Data suppressions
     ####################################
-    (
-        RecentConceptSuppression,),  # should run after QRIDtoRID
-    (VehicularAccidentConceptSuppression,),
-    (BirthInformationSuppression,),  # run after VehicularAccidentConcept
-    (SectionParticipationConceptSuppression,),
-    (RegisteredCopeSurveyQuestionsSuppression,),
-    (ExplicitIdentifierSuppression,),
-    (CancerConceptSuppression,),
-    (RTAdditionalPrivacyConceptSuppression,),
-    (RTObservationPrivacySuppression,),
-    (StringFieldsSuppression,),
-    (FreeTextSurveyResponseSuppression,),
-    (DropOrphanedSurveyConductIds,),
-    (DropOrphanedPIDS,),
-    (CalculatePrimaryDeathRecord,),
-    (GenerateWearStudyTable,),
-    (DropViaSurveyConduct,),  # should run after wear study table creation
-    (CleanMappingExtTables,),  # should be one of the last cleaning rules run
+    'cdr_cleaner.cleaning_rules.deid.recent_concept_suppression.RecentConceptSuppression',  # should run after QRIDtoRID
+    'cdr_cleaner.cleaning_rules.vehicular_accident_concept_suppression.VehicularAccidentConceptSuppression',
+    'cdr_cleaner.cleaning_rules.deid.birth_information_suppression.BirthInformationSuppression',  # run after VehicularAccidentConcept
+    'cdr_cleaner.cleaning_rules.section_participation_concept_suppression.SectionParticipationConceptSuppression',
+    'cdr_cleaner.cleaning_rules.deid.registered_cope_survey_suppression.RegisteredCopeSurveyQuestionsSuppression',
+    'cdr_cleaner.cleaning_rules.deid.explicit_identifier_suppression.ExplicitIdentifierSuppression',
+    'cdr_cleaner.cleaning_rules.cancer_concept_suppression.CancerConceptSuppression',
+    'cdr_cleaner.cleaning_rules.deid.rt_additional_privacy_suppression.RTAdditionalPrivacyConceptSuppression',
+    'cdr_cleaner.cleaning_rules.deid.rt_observation_privacy_suppression.RTObservationPrivacySuppression',
+    'cdr_cleaner.cleaning_rules.deid.string_fields_suppression.StringFieldsSuppression',
+    'cdr_cleaner.cleaning_rules.free_text_survey_response_suppression.FreeTextSurveyResponseSuppression',
+    'cdr_cleaner.cleaning_rules.drop_orphaned_survey_conduct_ids.DropOrphanedSurveyConductIds',
+    'cdr_cleaner.cleaning_rules.drop_orphaned_pids.DropOrphanedPIDS',
+    'cdr_cleaner.cleaning_rules.calculate_primary_death_record.CalculatePrimaryDeathRecord',
+    'cdr_cleaner.cleaning_rules.generate_wear_study_table.GenerateWearStudyTable',
+    'cdr_cleaner.cleaning_rules.drop_survey_data_via_survey_conduct.DropViaSurveyConduct',  # should run after wear study table creation
+    'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables',  # should be one of the last cleaning rules run
 ]
 
 REGISTERED_TIER_DEID_BASE_CLEANING_CLASSES = [
-    (FillSourceValueTextFields,),
-    (RepopulatePersonPostDeid,),
-    (DateUnShiftCopeResponses,),
-    (CreatePersonExtTable,),
-    (CalculatePrimaryDeathRecord,),
-    (CleanMappingExtTables,),  # should be one of the last cleaning rules run
+    'cdr_cleaner.cleaning_rules.fill_source_value_text_fields.FillSourceValueTextFields',
+    'cdr_cleaner.cleaning_rules.repopulate_person_post_deid.RepopulatePersonPostDeid',
+    'cdr_cleaner.cleaning_rules.date_unshift_cope_responses.DateUnShiftCopeResponses',
+    'cdr_cleaner.cleaning_rules.create_person_ext_table.CreatePersonExtTable',
+    'cdr_cleaner.cleaning_rules.calculate_primary_death_record.CalculatePrimaryDeathRecord',
+    'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables',  # should be one of the last cleaning rules run
 ]
 
 REGISTERED_TIER_DEID_CLEAN_CLEANING_CLASSES = [
     # TODO: uncomment when pid-rid logic is removed from legacy deid
-    # (RtCtPIDtoRID,),
-    (
-        MeasurementRecordsSuppression,),
-    (CleanHeightAndWeight,),  # dependent on MeasurementRecordsSuppression
-    (UnitNormalization,),  # dependent on CleanHeightAndWeight
-    (DropZeroConceptIDs,),
-    (DropOrphanedSurveyConductIds,),
-    (CalculatePrimaryDeathRecord,),
-    (NoDataAfterDeath,),  # should run after CalculatePrimaryDeathRecord
-    (CleanMappingExtTables,),  # should be one of the last cleaning rules run
+    # 'cdr_cleaner.cleaning_rules.deid.rt_ct_pid_rid_map.RtCtPIDtoRID',
+    'cdr_cleaner.cleaning_rules.measurement_table_suppression.MeasurementRecordsSuppression',
+    'cdr_cleaner.cleaning_rules.clean_height_weight.CleanHeightAndWeight',  # dependent on MeasurementRecordsSuppression
+    'cdr_cleaner.cleaning_rules.unit_normalization.UnitNormalization',  # dependent on CleanHeightAndWeight
+    'cdr_cleaner.cleaning_rules.drop_zero_concept_ids.DropZeroConceptIDs',
+    'cdr_cleaner.cleaning_rules.drop_orphaned_survey_conduct_ids.DropOrphanedSurveyConductIds',
+    'cdr_cleaner.cleaning_rules.calculate_primary_death_record.CalculatePrimaryDeathRecord',
+    'cdr_cleaner.cleaning_rules.no_data_30_days_after_death.NoDataAfterDeath',  # should run after CalculatePrimaryDeathRecord
+    'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables',  # should be one of the last cleaning rules run
 ]
 
 REGISTERED_TIER_FITBIT_CLEANING_CLASSES = [
-    (RemoveFitbitDataIfMaxAgeExceeded,),
-    (DeidFitbitDeviceId,
-    ),  # This rule must occur so that PID can map to device_id
-    (FitbitPIDtoRID,),
-    (FitbitDeidSrcID,),
-    (RemoveNonExistingPids,),  # assumes RT dataset is ready for reference
-    (FitbitDateShiftRule,),
+    'cdr_cleaner.cleaning_rules.deid.remove_fitbit_data_if_max_age_exceeded.RemoveFitbitDataIfMaxAgeExceeded',
+    'cdr_cleaner.cleaning_rules.deid.fitbit_device_id.DeidFitbitDeviceId',  # This rule must occur so that PID can map to device_id
+    'cdr_cleaner.cleaning_rules.deid.fitbit_pid_rid_map.FitbitPIDtoRID',
+    'cdr_cleaner.cleaning_rules.deid.fitbit_deid_src_id.FitbitDeidSrcID',
+    'cdr_cleaner.cleaning_rules.remove_non_existing_pids.RemoveNonExistingPids',  # assumes RT dataset is ready for reference
+    'cdr_cleaner.cleaning_rules.deid.fitbit_dateshift.FitbitDateShiftRule',
 ]
 
 CONTROLLED_TIER_DEID_CLEANING_CLASSES = [
-    (RtCtPIDtoRID,),
-    (QRIDtoRID,),  # Should run before any row suppression rules
-    (TruncateEraTables,),
-    (NullPersonBirthdate,),
-    (TableSuppression,),
-    (ControlledTierReplacedConceptSuppression,),
-    (GeneralizeZipCodes,),  # Should run after any data remapping rules
-    # (RaceEthnicityRecordSuppression,),  # Should run after any data remapping rules
-    (
-        MotorVehicleAccidentSuppression,),
-    (VehicularAccidentConceptSuppression,),
-    (ExplicitIdentifierSuppression,),
-    (GeoLocationConceptSuppression,),
-    (BirthInformationSuppression,),
-    (YearOfBirthRecordsSuppression,),
-    (ControlledCopeSurveySuppression,),
-    (IDFieldSuppression,),  # Should run after any data remapping
-    (CancerConceptSuppression,),  # Should run after any data remapping rules
-    (SectionParticipationConceptSuppression,),
-    (CTAdditionalPrivacyConceptSuppression,),
-    (StringFieldsSuppression,),
-    (AggregateZipCodes,),
-    (DeidentifyAIANZip3Values,),
-    (FreeTextSurveyResponseSuppression,),
-    (DropOrphanedSurveyConductIds,),
-    (DropOrphanedPIDS,),
-    (GenerateWearStudyTable,),
-    (DropViaSurveyConduct,),  # should run after wear study table creation
-    (RemoveExtraTables,),  # Should be last cleaning rule to be run
-    (CalculatePrimaryDeathRecord,),
-    (CleanMappingExtTables,),  # should be one of the last cleaning rules run
+    'cdr_cleaner.cleaning_rules.deid.rt_ct_pid_rid_map.RtCtPIDtoRID',
+    'cdr_cleaner.cleaning_rules.deid.questionnaire_response_id_map.QRIDtoRID',  # Should run before any row suppression rules
+    'cdr_cleaner.cleaning_rules.truncate_era_tables.TruncateEraTables',
+    'cdr_cleaner.cleaning_rules.null_person_birthdate.NullPersonBirthdate',
+    'cdr_cleaner.cleaning_rules.table_suppression.TableSuppression',
+    'cdr_cleaner.cleaning_rules.deid.ct_replaced_concept_suppression.ControlledTierReplacedConceptSuppression',
+    'cdr_cleaner.cleaning_rules.generalize_zip_codes.GeneralizeZipCodes',  # Should run after any data remapping rules
+    # 'cdr_cleaner.cleaning_rules.race_ethnicity_record_suppression.RaceEthnicityRecordSuppression',  # Should run after any data remapping rules
+    'cdr_cleaner.cleaning_rules.deid.motor_vehicle_accident_suppression.MotorVehicleAccidentSuppression',
+    'cdr_cleaner.cleaning_rules.vehicular_accident_concept_suppression.VehicularAccidentConceptSuppression',
+    'cdr_cleaner.cleaning_rules.deid.explicit_identifier_suppression.ExplicitIdentifierSuppression',
+    'cdr_cleaner.cleaning_rules.deid.geolocation_concept_suppression.GeoLocationConceptSuppression',
+    'cdr_cleaner.cleaning_rules.deid.birth_information_suppression.BirthInformationSuppression',
+    'cdr_cleaner.cleaning_rules.deid.year_of_birth_records_suppression.YearOfBirthRecordsSuppression',
+    'cdr_cleaner.cleaning_rules.deid.controlled_cope_survey_suppression.ControlledCopeSurveySuppression',
+    'cdr_cleaner.cleaning_rules.identifying_field_suppression.IDFieldSuppression',  # Should run after any data remapping
+    'cdr_cleaner.cleaning_rules.cancer_concept_suppression.CancerConceptSuppression',  # Should run after any data remapping rules
+    'cdr_cleaner.cleaning_rules.section_participation_concept_suppression.SectionParticipationConceptSuppression',
+    'cdr_cleaner.cleaning_rules.deid.ct_additional_privacy_suppression.CTAdditionalPrivacyConceptSuppression',
+    'cdr_cleaner.cleaning_rules.deid.string_fields_suppression.StringFieldsSuppression',
+    'cdr_cleaner.cleaning_rules.aggregate_zip_codes.AggregateZipCodes',
+    'cdr_cleaner.cleaning_rules.deid.deidentify_aian_zip3_values.DeidentifyAIANZip3Values',
+    'cdr_cleaner.cleaning_rules.free_text_survey_response_suppression.FreeTextSurveyResponseSuppression',
+    'cdr_cleaner.cleaning_rules.drop_orphaned_survey_conduct_ids.DropOrphanedSurveyConductIds',
+    'cdr_cleaner.cleaning_rules.drop_orphaned_pids.DropOrphanedPIDS',
+    'cdr_cleaner.cleaning_rules.generate_wear_study_table.GenerateWearStudyTable',
+    'cdr_cleaner.cleaning_rules.drop_survey_data_via_survey_conduct.DropViaSurveyConduct',  # should run after wear study table creation
+    'cdr_cleaner.cleaning_rules.remove_extra_tables.RemoveExtraTables',  # Should be last cleaning rule to be run
+    'cdr_cleaner.cleaning_rules.calculate_primary_death_record.CalculatePrimaryDeathRecord',
+    'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables',  # should be one of the last cleaning rules run
 ]
 
 CONTROLLED_TIER_DEID_BASE_CLEANING_CLASSES = [
-    (FillSourceValueTextFields,),
-    (RepopulatePersonControlledTier,),
-    (CreatePersonExtTable,),
-    (CalculatePrimaryDeathRecord,),
-    (CleanMappingExtTables,),  # should be one of the last cleaning rules run
+    'cdr_cleaner.cleaning_rules.fill_source_value_text_fields.FillSourceValueTextFields',
+    'cdr_cleaner.cleaning_rules.deid.repopulate_person_controlled_tier.RepopulatePersonControlledTier',
+    'cdr_cleaner.cleaning_rules.create_person_ext_table.CreatePersonExtTable',
+    'cdr_cleaner.cleaning_rules.calculate_primary_death_record.CalculatePrimaryDeathRecord',
+    'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables',  # should be one of the last cleaning rules run
 ]
 
 CONTROLLED_TIER_DEID_CLEAN_CLEANING_CLASSES = [
-    (MeasurementRecordsSuppression,),
-    (CleanHeightAndWeight,),  # dependent on MeasurementRecordsSuppression
-    (UnitNormalization,),  # dependent on CleanHeightAndWeight
-    (DropZeroConceptIDs,),
-    (DropOrphanedSurveyConductIds,),
-    (CalculatePrimaryDeathRecord,),
-    (NoDataAfterDeath,),  # should run after CalculatePrimaryDeathRecord
-    (CleanMappingExtTables,),  # should be one of the last cleaning rules run
+    'cdr_cleaner.cleaning_rules.measurement_table_suppression.MeasurementRecordsSuppression',
+    'cdr_cleaner.cleaning_rules.clean_height_weight.CleanHeightAndWeight',  # dependent on MeasurementRecordsSuppression
+    'cdr_cleaner.cleaning_rules.unit_normalization.UnitNormalization',  # dependent on CleanHeightAndWeight
+    'cdr_cleaner.cleaning_rules.drop_zero_concept_ids.DropZeroConceptIDs',
+    'cdr_cleaner.cleaning_rules.drop_orphaned_survey_conduct_ids.DropOrphanedSurveyConductIds',
+    'cdr_cleaner.cleaning_rules.calculate_primary_death_record.CalculatePrimaryDeathRecord',
+    'cdr_cleaner.cleaning_rules.no_data_30_days_after_death.NoDataAfterDeath',  # should run after CalculatePrimaryDeathRecord
+    'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables',  # should be one of the last cleaning rules run
 ]
 
 CONTROLLED_TIER_FITBIT_CLEANING_CLASSES = [
-    (DeidFitbitDeviceId,
-    ),  # This rule must occur so that PID can map to device_id
-    (FitbitPIDtoRID,),
-    (FitbitDeidSrcID,),
-    (RemoveNonExistingPids,),  # assumes CT dataset is ready for reference
+    'cdr_cleaner.cleaning_rules.deid.fitbit_device_id.DeidFitbitDeviceId',  # This rule must occur so that PID can map to device_id
+    'cdr_cleaner.cleaning_rules.deid.fitbit_pid_rid_map.FitbitPIDtoRID',
+    'cdr_cleaner.cleaning_rules.deid.fitbit_deid_src_id.FitbitDeidSrcID',
+    'cdr_cleaner.cleaning_rules.remove_non_existing_pids.RemoveNonExistingPids',  # assumes CT dataset is ready for reference
 ]
 
 DATA_CONSISTENCY_CLEANING_CLASSES = [
-    (DropOrphanedSurveyConductIds,),
-    (DropOrphanedPIDS,),
-    (CleanMappingExtTables,),  # should be one of the last cleaning rules run
+    'cdr_cleaner.cleaning_rules.drop_orphaned_survey_conduct_ids.DropOrphanedSurveyConductIds',
+    'cdr_cleaner.cleaning_rules.drop_orphaned_pids.DropOrphanedPIDS',
+    'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables',  # should be one of the last cleaning rules run
 ]
 
 CRON_RETRACTION_CLEANING_CLASSES = [
-    (CleanMappingExtTables,),  # should be one of the last cleaning rules run
+    'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables',  # should be one of the last cleaning rules run
 ]
 
-DATA_STAGE_RULES_MAPPING = {
+DATA_STAGE_RULES_MAPPING = RuleRegistry({
     DataStage.EHR.value:
         EHR_CLEANING_CLASSES,
     DataStage.UNIONED.value:
@@ -451,7 +298,7 @@ DATA_STAGE_RULES_MAPPING = {
         DATA_CONSISTENCY_CLEANING_CLASSES,
     DataStage.CRON_RETRACTION.value:
         CRON_RETRACTION_CLEANING_CLASSES
-}
+})
 
 
 def get_parser():
@@ -478,6 +325,81 @@ def get_parser():
         dest='run_as',
         action='store',
         help='Service account email address to impersonate')
+    engine_parser.add_argument(
+        '--max_concurrency',
+        required=False,
+        dest='max_concurrency',
+        action='store',
+        type=int,
+        default=1,
+        help=('Maximum number of queries to run at the same time.  Values '
+              'greater than 1 run independent cleaning rules concurrently.'))
+    engine_parser.add_argument(
+        '--ledger_file',
+        required=False,
+        dest='ledger_file',
+        action='store',
+        default=None,
+        help=('Local JSON file recording each completed rule and query.  '
+              'Used with --resume to restart a failed run.'))
+    engine_parser.add_argument(
+        '--ledger_table',
+        required=False,
+        dest='ledger_table',
+        action='store_true',
+        help=('Record each completed rule and query in the '
+              'cleaning_run_ledger table of the sandbox dataset.'))
+    engine_parser.add_argument(
+        '--resume',
+        required=False,
+        dest='resume',
+        action='store_true',
+        help=('Skip the rules and queries the ledger lists as complete.  '
+              'Requires --ledger_file or --ledger_table.'))
+    engine_parser.add_argument(
+        '--plan',
+        required=False,
+        dest='plan',
+        action='store_true',
+        help=('Dry-run every query and report the bytes processed per rule, '
+              'per table and overall without running the rules.'))
+    engine_parser.add_argument(
+        '--batch_threshold_gb',
+        required=False,
+        dest='batch_threshold_gb',
+        action='store',
+        type=float,
+        default=None,
+        help=('Run sandbox and DML queries estimated to process at least this '
+              'many GiB at BATCH priority.  Other queries stay INTERACTIVE.'))
+    engine_parser.add_argument(
+        '--fuse_sandbox',
+        required=False,
+        dest='fuse_sandbox',
+        action='store_true',
+        help=('Run each sandbox query and the delete query following it as '
+              'one script, for the rules that allow it.'))
+    engine_parser.add_argument(
+        '--fuse_rules',
+        required=False,
+        dest='fuse_rules',
+        action='store_true',
+        help=('Fuse adjacent rules that only rewrite the same table into a '
+              'single table rewrite.'))
+    engine_parser.add_argument(
+        '--combine_suppressions',
+        required=False,
+        dest='combine_suppressions',
+        action='store_true',
+        help=('Combine adjacent concept suppression rules so each domain '
+              'table is scanned once for all of them.'))
+    engine_parser.add_argument(
+        '--key_only_sandbox',
+        required=False,
+        dest='key_only_sandbox',
+        action='store_true',
+        help=('Sandbox only the keys of removed rows, for the rules that '
+              'support it.  Full rows can be read back through time travel.'))
     return engine_parser
 
 
@@ -609,20 +531,47 @@ def main(args=None):
             sandbox_dataset_id=args.sandbox_dataset_id,
             rules=rules,
             table_namer=table_namer,
+            fuse_sandbox=args.fuse_sandbox,
+            key_only_sandbox=args.key_only_sandbox,
             **kwargs)
         for query in query_list:
             LOGGER.info(query)
+    elif args.plan:
+        clean_engine.add_console_logging()
+        clean_engine.plan_dataset(
+            project_id=args.project_id,
+            dataset_id=args.dataset_id,
+            sandbox_dataset_id=args.sandbox_dataset_id,
+            rules=rules,
+            table_namer=table_namer,
+            run_as=args.run_as,
+            batch_threshold_gb=args.batch_threshold_gb,
+            fuse_sandbox=args.fuse_sandbox,
+            fuse_rules=args.fuse_rules,
+            combine_suppressions=args.combine_suppressions,
+            key_only_sandbox=args.key_only_sandbox,
+            **kwargs)
     else:
         # Disable logging if running retraction cron
         if not constants.global_variables.DISABLE_SANDBOX:
             clean_engine.add_console_logging(args.console_log)
-        clean_engine.clean_dataset(project_id=args.project_id,
-                                   dataset_id=args.dataset_id,
-                                   sandbox_dataset_id=args.sandbox_dataset_id,
-                                   rules=rules,
-                                   table_namer=table_namer,
-                                   run_as=args.run_as,
-                                   **kwargs)
+        clean_engine.clean_dataset(
+            project_id=args.project_id,
+            dataset_id=args.dataset_id,
+            sandbox_dataset_id=args.sandbox_dataset_id,
+            rules=rules,
+            table_namer=table_namer,
+            run_as=args.run_as,
+            max_concurrency=args.max_concurrency,
+            ledger_file=args.ledger_file,
+            ledger_table=args.ledger_table,
+            resume=args.resume,
+            batch_threshold_gb=args.batch_threshold_gb,
+            fuse_sandbox=args.fuse_sandbox,
+            fuse_rules=args.fuse_rules,
+            combine_suppressions=args.combine_suppressions,
+            key_only_sandbox=args.key_only_sandbox,
+            **kwargs)
 
 
 if __name__ == '__main__':
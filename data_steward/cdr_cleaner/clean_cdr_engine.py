@@ -2,6 +2,7 @@
 import inspect
 import logging
 from concurrent.futures import TimeoutError as TOError
+from functools import partial
 
 # Third party imports
 import google.cloud.bigquery as gbq
@@ -12,6 +13,13 @@ from gcloud.bq import BigQueryClient
 from utils.auth import get_impersonation_credentials
 from utils.pipeline_logging import configure
 from cdr_cleaner.cleaning_rules.base_cleaning_rule import BaseCleaningRule
+from cdr_cleaner.dataset_catalog import DatasetCatalog
+from cdr_cleaner.query_planner import (BatchPriorityPolicy, estimate_bytes,
+                                       format_bytes, get_target_table,
+                                       log_plan_report)
+from cdr_cleaner.rule_fusion import RuleChainFuser
+from cdr_cleaner.rule_scheduler import RuleScheduler, has_setup
+from cdr_cleaner.run_ledger import get_run_ledger
 from constants import bq_utils as bq_consts
 from constants.cdr_cleaner import clean_cdr as cdr_consts
 from constants.cdr_cleaner import clean_cdr_engine as ce_consts
@@ -27,12 +35,38 @@ def add_console_logging(add_handler=True):
     configure(add_console_handler=add_handler)
 
 
+def get_client(project_id, run_as=None):
+    """
+    Get a BigQueryClient, impersonating run_as if provided
+
+    :param project_id: identifies the project
+    :param run_as: email address of the service account to impersonate
+    :return: a BigQueryClient
+    """
+    impersonation_creds = None
+    if run_as:
+        # get credentials and create client
+        impersonation_creds = get_impersonation_credentials(
+            run_as, target_scopes=CDR_SCOPES)
+    return BigQueryClient(project_id=project_id,
+                          credentials=impersonation_creds)
+
+
 def clean_dataset(project_id,
                   dataset_id,
                   sandbox_dataset_id,
                   rules,
                   table_namer='',
                   run_as=None,
+                  max_concurrency=1,
+                  ledger_file=None,
+                  ledger_table=False,
+                  resume=False,
+                  batch_threshold_gb=None,
+                  fuse_sandbox=False,
+                  fuse_rules=False,
+                  combine_suppressions=False,
+                  key_only_sandbox=False,
                   **kwargs):
     """
     Run the assigned cleaning rules and return list of BQ job objects
@@ -43,36 +77,126 @@ def clean_dataset(project_id,
     :param rules: a list of cleaning rule objects/functions as tuples
     :param table_namer: source differentiator value expected to be the same for all rules run on the same dataset
     :param run_as: email address of the service account to impersonate
+    :param max_concurrency: maximum number of queries to run at the same time.
+        If greater than 1, independent rules and queries are run concurrently
+        by a RuleScheduler.  Defaults to running rules one after another.
+    :param ledger_file: path of a local JSON file used as the run ledger.
+        Each completed rule and query is recorded in the ledger.
+    :param ledger_table: if True and ledger_file is not set, the run ledger is
+        kept in a table of the sandbox dataset
+    :param resume: if True, rules and queries the run ledger lists as complete
+        are skipped, picking up a failed run at its first unfinished query.
+        Rules are still set up and generate their query specs, since the
+        ledger identifies them by module name and a hash of their query specs.
+        Otherwise the ledger is reset before the run.
+    :param batch_threshold_gb: if set, sandbox and DML queries estimated to
+        process at least this many GiB are run at BATCH priority.  All other
+        queries run at INTERACTIVE priority.
+    :param fuse_sandbox: if True, rules that allow it run each sandbox query
+        and the delete query following it as one script
+    :param fuse_rules: if True, adjacent rules rewriting the same table are
+        fused into one table rewrite by a rule_fusion.RuleChainFuser
+    :param combine_suppressions: if True, adjacent concept suppression rules
+        scan each domain table once, combined by a
+        concept_suppression_combiner.SuppressionCombiner
+    :param key_only_sandbox: if True, rules that support it sandbox the keys
+        of the rows they remove instead of the full rows
     :param kwargs: keyword arguments a cleaning rule may require
     :return all_jobs: List of BigQuery job objects
     """
-    # Set up client
-    impersonation_creds = None
-    if run_as:
-        # get credentials and create client
-        impersonation_creds = get_impersonation_credentials(
-            run_as, target_scopes=CDR_SCOPES)
-    client = BigQueryClient(project_id=project_id,
-                            credentials=impersonation_creds)
-
-    all_jobs = []
-    for rule_index, rule in enumerate(rules):
-        clazz = rule[0]
-        query_function, setup_function, rule_info = infer_rule(
-            clazz, project_id, dataset_id, sandbox_dataset_id, table_namer,
-            **kwargs)
-
-        LOGGER.info(
-            f"Applying cleaning rule {rule_info[cdr_consts.MODULE_NAME]} "
-            f"{rule_index+1}/{len(rules)}")
-        setup_function(client)
-        query_list = query_function()
-        jobs = run_queries(client, query_list, rule_info)
-        LOGGER.info(
-            f"For clean rule {rule_info[cdr_consts.MODULE_NAME]}, {len(jobs)} jobs "
-            f"were run successfully for {len(query_list)} queries")
-        all_jobs.extend(jobs)
-    return all_jobs
+    client = get_client(project_id, run_as)
+    # tables and schemas looked up by the rules are shared and only reloaded
+    # once the run modifies them
+    catalog = DatasetCatalog(client, [dataset_id, sandbox_dataset_id])
+
+    ledger = get_run_ledger(client, dataset_id, sandbox_dataset_id, ledger_file,
+                            ledger_table)
+    if resume:
+        if ledger is None:
+            raise ValueError('Resuming a cleaning run requires a ledger_file '
+                             'or ledger_table')
+        ledger.load()
+    elif ledger is not None:
+        ledger.reset()
+
+    query_runner = run_query
+    if batch_threshold_gb is not None:
+        query_runner = partial(run_query,
+                               priority_policy=BatchPriorityPolicy(
+                                   sandbox_dataset_id, batch_threshold_gb))
+    query_runner = partial(run_cataloged_query,
+                           catalog=catalog,
+                           query_runner=query_runner)
+
+    # rules are instantiated lazily, right before they are applied
+    inferred_rules = ((rule[0],) + infer_rule(rule[0],
+                                              project_id,
+                                              dataset_id,
+                                              sandbox_dataset_id,
+                                              table_namer,
+                                              fuse_sandbox=fuse_sandbox,
+                                              key_only_sandbox=key_only_sandbox,
+                                              catalog=catalog,
+                                              **kwargs) for rule in rules)
+    # combining suppressions changes the number of rules run.  Fusing does
+    # not, each fused rule keeps its place.
+    rule_count = len(rules)
+    if combine_suppressions:
+        # imported here, it imports the concept suppression rules
+        from cdr_cleaner.concept_suppression_combiner import SuppressionCombiner
+        inferred_rules = list(SuppressionCombiner().combine(
+            list(inferred_rules)))
+        rule_count = len(inferred_rules)
+    if fuse_rules:
+        # runs of rules are fused from their metadata, so query specs are
+        # still generated after the rules before them were applied
+        inferred_rules = RuleChainFuser(client, dataset_id,
+                                        sandbox_dataset_id).fuse(
+                                            list(inferred_rules))
+
+    try:
+        if max_concurrency > 1:
+            scheduler = RuleScheduler(client,
+                                      dataset_id,
+                                      sandbox_dataset_id,
+                                      query_runner,
+                                      max_concurrency,
+                                      ledger=ledger,
+                                      catalog=catalog)
+            return scheduler.run(list(inferred_rules))
+
+        all_jobs = []
+        for rule_index, (clazz, query_function, setup_function,
+                         rule_info) in enumerate(inferred_rules):
+            rule_name = rule_info[cdr_consts.MODULE_NAME]
+            setup_function(client)
+            if has_setup(setup_function):
+                catalog.invalidate_all()
+            query_list = query_function()
+            if ledger and ledger.is_rule_complete(rule_name, query_list):
+                LOGGER.info(f"Skipping cleaning rule {rule_name} "
+                            f"{rule_index+1}/{rule_count}, it completed in a "
+                            f"previous run")
+                continue
+
+            LOGGER.info(f"Applying cleaning rule {rule_name} "
+                        f"{rule_index+1}/{rule_count}")
+            jobs = run_queries(client,
+                               query_list,
+                               rule_info,
+                               ledger=ledger,
+                               rule_index=rule_index,
+                               query_runner=query_runner)
+            LOGGER.info(f"For clean rule {rule_name}, {len(jobs)} jobs "
+                        f"were run successfully for {len(query_list)} queries")
+            if ledger:
+                ledger.record_rule(rule_index, rule_name, query_list)
+            all_jobs.extend(jobs)
+        return all_jobs
+    finally:
+        if ledger:
+            # keep the queries of a rule that failed partway through
+            ledger.flush()
 
 
 def generate_job_config(project_id, query_dict):
@@ -84,6 +208,8 @@ def generate_job_config(project_id, query_dict):
     :return: BQ job_configuration object
     """
     job_config = gbq.job.QueryJobConfig()
+    if query_dict.get(cdr_consts.BATCH):
+        job_config.priority = bq_consts.BATCH
     if query_dict.get(cdr_consts.DESTINATION_TABLE) is None:
         return job_config
 
@@ -100,52 +226,124 @@ def generate_job_config(project_id, query_dict):
     return job_config
 
 
-def run_queries(client, query_list, rule_info):
+def run_query(client,
+              query_dict,
+              rule_info,
+              query_no,
+              query_count,
+              priority_policy=None):
+    """
+    Runs a single query_dict and waits for it to complete
+
+    :param client: a BigQueryClient
+    :param query_dict: query_dict generated by a cleaning rule
+    :param rule_info: contains information about the query function
+    :param query_no: index of the query within the rule's query list
+    :param query_count: number of queries generated by the rule
+    :param priority_policy: an optional query_planner.BatchPriorityPolicy
+        choosing the priority the query runs at
+    :return: the completed BQ job object
+    """
+    try:
+        LOGGER.info(
+            ce_consts.QUERY_RUN_MESSAGE_TEMPLATE.render(query_no=query_no,
+                                                        query_count=query_count,
+                                                        **rule_info))
+        job_config = generate_job_config(client.project, query_dict)
+        if priority_policy:
+            job_config.priority = priority_policy.get_priority(
+                client, query_dict, job_config)
+            LOGGER.info(f'Submitting at {job_config.priority} priority')
+
+        module_short_name = rule_info[cdr_consts.MODULE_NAME].split(
+            '.')[-1][:10]
+        query_job = client.query(query=query_dict.get(cdr_consts.QUERY),
+                                 job_config=job_config,
+                                 job_id_prefix=f'{module_short_name}_')
+        LOGGER.info(f'Running {query_job.job_id}')
+        # wait for job to complete
+        query_job.result()
+        if query_job.errors:
+            raise RuntimeError(
+                ce_consts.FAILURE_MESSAGE_TEMPLATE.render(
+                    client.project, query_job, **rule_info, **query_dict))
+        LOGGER.info(
+            ce_consts.SUCCESS_MESSAGE_TEMPLATE.render(project_id=client.project,
+                                                      query_job=query_job,
+                                                      query_no=query_no,
+                                                      query_count=query_count,
+                                                      **rule_info))
+    except (GoogleCloudError, TOError) as exp:
+        LOGGER.exception(
+            ce_consts.FAILURE_MESSAGE_TEMPLATE.render(project_id=client.project,
+                                                      **rule_info,
+                                                      **query_dict,
+                                                      exception=exp))
+        raise exp
+    return query_job
+
+
+def run_cataloged_query(client, query_dict, rule_info, query_no, query_count,
+                        catalog, query_runner):
+    """
+    Runs a single query_dict, marking the tables it writes as modified
+
+    The tables are marked once the query is submitted and again once it is
+    done, in case a concurrent rule reloads the catalog while it runs.
+
+    :param client: a BigQueryClient
+    :param query_dict: query_dict generated by a cleaning rule
+    :param rule_info: contains information about the query function
+    :param query_no: index of the query within the rule's query list
+    :param query_count: number of queries generated by the rule
+    :param catalog: the dataset_catalog.DatasetCatalog of the cleaning run
+    :param query_runner: callable with the signature of run_query used to run
+        the query
+    :return: the completed BQ job object
+    """
+    catalog.invalidate_query(query_dict)
+    try:
+        return query_runner(client, query_dict, rule_info, query_no,
+                            query_count)
+    finally:
+        catalog.invalidate_query(query_dict)
+
+
+def run_queries(client,
+                query_list,
+                rule_info,
+                ledger=None,
+                rule_index=None,
+                query_runner=None):
     """
     Runs queries from the list of query_dicts
 
     :param client: a BigQueryClient
     :param query_list: list of query_dicts generated by a cleaning rule
     :param rule_info: contains information about the query function
+    :param ledger: an optional run_ledger.RunLedger.  Queries it lists as
+        complete are skipped and the queries that run are recorded in it.
+    :param rule_index: position of the rule in the list of rules being run,
+        recorded in the ledger for reference
+    :param query_runner: callable with the signature of run_query used to run
+        each query.  Defaults to run_query.
     :return: integers indicating the number of queries that succeeded and failed
     """
+    query_runner = query_runner or run_query
     query_count = len(query_list)
+    rule_name = rule_info[cdr_consts.MODULE_NAME]
     jobs = []
     for query_no, query_dict in enumerate(query_list):
-        try:
-            LOGGER.info(
-                ce_consts.QUERY_RUN_MESSAGE_TEMPLATE.render(
-                    query_no=query_no, query_count=query_count, **rule_info))
-            job_config = generate_job_config(client.project, query_dict)
-
-            module_short_name = rule_info[cdr_consts.MODULE_NAME].split(
-                '.')[-1][:10]
-            query_job = client.query(query=query_dict.get(cdr_consts.QUERY),
-                                     job_config=job_config,
-                                     job_id_prefix=f'{module_short_name}_')
-            jobs.append(query_job)
-            LOGGER.info(f'Running {query_job.job_id}')
-            # wait for job to complete
-            query_job.result()
-            if query_job.errors:
-                raise RuntimeError(
-                    ce_consts.FAILURE_MESSAGE_TEMPLATE.render(
-                        client.project, query_job, **rule_info, **query_dict))
-            LOGGER.info(
-                ce_consts.SUCCESS_MESSAGE_TEMPLATE.render(
-                    project_id=client.project,
-                    query_job=query_job,
-                    query_no=query_no,
-                    query_count=query_count,
-                    **rule_info))
-        except (GoogleCloudError, TOError) as exp:
-            LOGGER.exception(
-                ce_consts.FAILURE_MESSAGE_TEMPLATE.render(
-                    project_id=client.project,
-                    **rule_info,
-                    **query_dict,
-                    exception=exp))
-            raise exp
+        if ledger and ledger.is_query_complete(rule_name, query_no, query_dict):
+            LOGGER.info(f"Skipping query {query_no+1}/{query_count} of "
+                        f"{rule_name}, it completed in a previous run")
+            continue
+        query_job = query_runner(client, query_dict, rule_info, query_no,
+                                 query_count)
+        if ledger:
+            ledger.record_query(rule_index, rule_name, query_no, query_dict,
+                                query_job)
+        jobs.append(query_job)
     return jobs
 
 
@@ -189,7 +387,14 @@ def get_custom_kwargs(clazz, **kwargs):
     return kwargs
 
 
-def infer_rule(clazz, project_id, dataset_id, sandbox_dataset_id, table_namer,
+def infer_rule(clazz,
+               project_id,
+               dataset_id,
+               sandbox_dataset_id,
+               table_namer,
+               fuse_sandbox=False,
+               key_only_sandbox=False,
+               catalog=None,
                **kwargs):
     """
     Extract information about the cleaning rule
@@ -199,6 +404,12 @@ def infer_rule(clazz, project_id, dataset_id, sandbox_dataset_id, table_namer,
     :param dataset_id: identifies the dataset to clean
     :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
     :param table_namer: source differentiator value expected to be the same for all rules run on the same dataset
+    :param fuse_sandbox: if True and the rule allows it, the query function
+        fuses each sandbox query and the delete query following it
+    :param key_only_sandbox: if True and the rule supports it, the rule
+        sandboxes the keys of the rows it removes instead of the full rows
+    :param catalog: an optional dataset_catalog.DatasetCatalog the rule looks
+        up the tables of the datasets in
     :param kwargs: keyword arguments a cleaning rule may require
     :return:
         query_function: function that generates query_list
@@ -224,11 +435,15 @@ def infer_rule(clazz, project_id, dataset_id, sandbox_dataset_id, table_namer,
                            f"`table_namer` property yet.")
             instance = clazz(project_id, dataset_id, sandbox_dataset_id,
                              **kwargs)
+        instance.catalog = catalog
+        instance.key_only_sandbox = key_only_sandbox
         query_function = instance.get_query_specs
         setup_function = instance.setup_rule
         function_name = query_function.__name__
         module_name = inspect.getmodule(query_function).__name__
         line_no = inspect.getsourcelines(query_function)[1]
+        if fuse_sandbox and instance.fuse_sandbox_queries:
+            query_function = instance.get_fused_query_specs
     else:
         function_name = clazz.__name__
         module_name = inspect.getmodule(clazz).__name__
@@ -262,6 +477,8 @@ def get_query_list(project_id,
                    sandbox_dataset_id,
                    rules,
                    table_namer='',
+                   fuse_sandbox=False,
+                   key_only_sandbox=False,
                    **kwargs):
     """
     Generates list of all query_dicts that will be run on the dataset
@@ -271,15 +488,118 @@ def get_query_list(project_id,
     :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
     :param table_namer: source differentiator value expected to be the same for all rules run on the same dataset
     :param rules: a list of cleaning rule objects/functions as tuples
+    :param fuse_sandbox: if True, list the fused sandbox and delete scripts of
+        rules that allow it
+    :param key_only_sandbox: if True, rules that support it sandbox the keys
+        of the rows they remove instead of the full rows
     :param kwargs: keyword arguments a cleaning rule may require
     :return list of all query_dicts that will be run on the dataset
     """
     all_queries_list = []
     for rule in rules:
         clazz = rule[0]
-        query_function, _, rule_info = infer_rule(clazz, project_id, dataset_id,
-                                                  sandbox_dataset_id,
-                                                  table_namer, **kwargs)
+        query_function, _, rule_info = infer_rule(
+            clazz,
+            project_id,
+            dataset_id,
+            sandbox_dataset_id,
+            table_namer,
+            fuse_sandbox=fuse_sandbox,
+            key_only_sandbox=key_only_sandbox,
+            **kwargs)
         query_list = query_function()
         all_queries_list.extend(query_list)
     return all_queries_list
+
+
+def plan_dataset(project_id,
+                 dataset_id,
+                 sandbox_dataset_id,
+                 rules,
+                 table_namer='',
+                 run_as=None,
+                 batch_threshold_gb=None,
+                 fuse_sandbox=False,
+                 fuse_rules=False,
+                 combine_suppressions=False,
+                 key_only_sandbox=False,
+                 **kwargs):
+    """
+    Dry-run all query_dicts that will be run on the dataset and report their cost
+
+    Rules are not set up and no query is run.  Queries reading tables that
+    earlier rules or rule setup would create cannot be estimated and are
+    reported as failures.
+
+    :param project_id: identifies the project
+    :param dataset_id: identifies the dataset to clean
+    :param sandbox_dataset_id: identifies the sandbox dataset to store backup rows
+    :param rules: a list of cleaning rule objects/functions as tuples
+    :param table_namer: source differentiator value expected to be the same for all rules run on the same dataset
+    :param run_as: email address of the service account to impersonate
+    :param batch_threshold_gb: if set, report the priority each query would
+        run at under the BatchPriorityPolicy with this threshold
+    :param fuse_sandbox: if True, estimate the fused sandbox and delete
+        scripts of rules that allow it
+    :param fuse_rules: if True, estimate the rewrites of adjacent rules as
+        fused by a rule_fusion.RuleChainFuser and report the bytes saved
+    :param combine_suppressions: if True, estimate the queries of adjacent
+        concept suppression rules as combined by a
+        concept_suppression_combiner.SuppressionCombiner
+    :param key_only_sandbox: if True, rules that support it sandbox the keys
+        of the rows they remove instead of the full rows
+    :param kwargs: keyword arguments a cleaning rule may require
+    :return: list of estimate dicts with the keys rule, query_no, table,
+        bytes_processed, priority and error
+    """
+    client = get_client(project_id, run_as)
+    policy = None
+    if batch_threshold_gb is not None:
+        policy = BatchPriorityPolicy(sandbox_dataset_id, batch_threshold_gb)
+    dataset_ids = {dataset_id, sandbox_dataset_id}
+
+    inferred_rules = [(rule[0],) + infer_rule(rule[0],
+                                              project_id,
+                                              dataset_id,
+                                              sandbox_dataset_id,
+                                              table_namer,
+                                              fuse_sandbox=fuse_sandbox,
+                                              key_only_sandbox=key_only_sandbox,
+                                              **kwargs) for rule in rules]
+    if combine_suppressions:
+        from cdr_cleaner.concept_suppression_combiner import SuppressionCombiner
+        inferred_rules = list(SuppressionCombiner().combine(inferred_rules))
+    fuser = None
+    if fuse_rules:
+        fuser = RuleChainFuser(client, dataset_id, sandbox_dataset_id)
+        inferred_rules = list(fuser.fuse(inferred_rules))
+
+    estimates = []
+    for _, query_function, _, rule_info in inferred_rules:
+        for query_no, query_dict in enumerate(query_function()):
+            job_config = generate_job_config(project_id, query_dict)
+            estimate = {
+                'rule': rule_info[cdr_consts.MODULE_NAME],
+                'query_no': query_no,
+                'table': get_target_table(query_dict, dataset_ids),
+                'bytes_processed': None,
+                'priority': job_config.priority or bq_consts.INTERACTIVE,
+                'error': None
+            }
+            try:
+                estimate['bytes_processed'] = estimate_bytes(
+                    client, query_dict, job_config)
+            except GoogleCloudError as exp:
+                estimate['error'] = str(exp)
+            else:
+                if policy:
+                    estimate['priority'] = policy.get_estimated_priority(
+                        query_dict, job_config, estimate['bytes_processed'])
+            estimates.append(estimate)
+
+    log_plan_report(estimates)
+    if fuser:
+        saved = [report['saved_bytes'] for report in fuser.reports]
+        LOGGER.info(f'Estimated bytes saved by fusing {len(saved)} runs of '
+                    f'rules:\t{format_bytes(sum(filter(None, saved)))}')
+    return estimates
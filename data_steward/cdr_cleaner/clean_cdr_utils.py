@@ -31,8 +31,11 @@ AS (
 )""")
 
 
-def get_tables_in_dataset(client: Client, project_id, dataset_id,
-                          table_names) -> List[str]:
+def get_tables_in_dataset(client: Client,
+                          project_id,
+                          dataset_id,
+                          table_names,
+                          catalog=None) -> List[str]:
     """
     This function retrieves tables that exist in dataset for an inital list table_names . This
     function raises GoogleCloudError if the query throws an error
@@ -41,8 +44,14 @@ def get_tables_in_dataset(client: Client, project_id, dataset_id,
     :param project_id: identifies the project
     :param dataset_id: dataset that contains the tables
     :param table_names: tables to retrieve
+    :param catalog: an optional dataset_catalog.DatasetCatalog of the cleaning
+        run.  If it keeps the dataset, the tables are looked up in it instead
+        of querying the dataset.
     :return: a list of tables that exist in the given dataset
     """
+    if catalog is not None and catalog.covers(project_id, dataset_id):
+        return catalog.get_tables(dataset_id, table_names)
+
     # The following makes sure the tables exist in the dataset
     query_job = client.query(
         GET_ALL_TABLES_QUERY_TEMPLATE.render(project=project_id,
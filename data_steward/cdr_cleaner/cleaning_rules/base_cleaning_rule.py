@@ -49,11 +49,31 @@ LOOP
 END LOOP
 """)
 
+# A script running a sandbox query and deleting the sandboxed rows by key
+FUSED_SANDBOX_AND_DELETE_QUERY = JINJA_ENV.from_string("""
+{{sandbox_query}};
+
+DELETE FROM `{{project}}.{{dataset}}.{{table}}`
+WHERE {{key_field}} IN (
+  SELECT {{key_field}}
+  FROM `{{project}}.{{sandbox_dataset}}.{{sandbox_table}}`
+)
+""")
+
+SANDBOX_CREATE_PATTERN = re.compile(
+    r'^\s*CREATE\s+(?:OR\s+REPLACE\s+)?TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?'
+    r'`?(?:[\w-]+\.)?(\w+)\.([\w-]+)`?', re.IGNORECASE)
+DELETE_PATTERN = re.compile(
+    r'^\s*DELETE\s+(?:FROM\s+)?`?(?:[\w-]+\.)?(\w+)\.([\w-]+)`?', re.IGNORECASE)
+
 
 def get_delete_empty_sandbox_tables_queries(project_id, sandbox_dataset_id,
                                             sandbox_tablenames):
     """
     Generate the query that drop the empty sandbox tables
+
+    Tables are found empty by their row count, so full row and key-only
+    sandbox tables are dropped alike.
     
     :param project_id: 
     :param sandbox_dataset_id: 
@@ -77,6 +97,69 @@ def get_delete_empty_sandbox_tables_queries(project_id, sandbox_dataset_id,
     }]
 
 
+def _is_single_statement(query) -> bool:
+    return ';' not in query.strip().rstrip(';')
+
+
+def fuse_sandbox_and_delete_queries(query_specs, project_id, dataset_id,
+                                    sandbox_dataset_id, get_key_field):
+    """
+    Combine each sandbox query and the delete query following it into one script
+
+    A sandbox query creating a table in the sandbox dataset from a table of
+    the dataset, directly followed by a DELETE from that same table, is
+    replaced by a single multi-statement script.  The script keeps the sandbox
+    statement and deletes the rows whose key is in the sandbox table, so the
+    rule's predicate is evaluated once and the sandbox and delete run as one
+    job.  Query specs that do not form such a pair are returned unchanged.
+
+    :param query_specs: list of query dictionaries generated by a rule
+    :param project_id: identifies the project
+    :param dataset_id: identifies the dataset being cleaned
+    :param sandbox_dataset_id: identifies the sandbox dataset
+    :param get_key_field: callable returning the key field of a table
+    :return: list of query dictionaries
+    """
+    fused_specs = []
+    index = 0
+    while index < len(query_specs):
+        sandbox_spec = query_specs[index]
+        delete_spec = query_specs[index +
+                                  1] if index + 1 < len(query_specs) else None
+        fused_query = None
+        if (delete_spec and
+                not sandbox_spec.get(cdr_consts.DESTINATION_TABLE) and
+                not delete_spec.get(cdr_consts.DESTINATION_TABLE)):
+            sandbox_query = sandbox_spec.get(cdr_consts.QUERY, '')
+            delete_query = delete_spec.get(cdr_consts.QUERY, '')
+            sandbox_match = SANDBOX_CREATE_PATTERN.match(sandbox_query)
+            delete_match = DELETE_PATTERN.match(delete_query)
+            if (sandbox_match and delete_match and
+                    sandbox_match.group(1) == sandbox_dataset_id and
+                    delete_match.group(1) == dataset_id and
+                    _is_single_statement(sandbox_query) and
+                    _is_single_statement(delete_query) and
+                    re.search(rf'\b{dataset_id}\.{delete_match.group(2)}\b',
+                              sandbox_query)):
+                table = delete_match.group(2)
+                fused_query = FUSED_SANDBOX_AND_DELETE_QUERY.render(
+                    sandbox_query=sandbox_query.strip().rstrip(';'),
+                    project=project_id,
+                    dataset=dataset_id,
+                    table=table,
+                    key_field=get_key_field(table),
+                    sandbox_dataset=sandbox_dataset_id,
+                    sandbox_table=sandbox_match.group(2))
+
+        if fused_query:
+            fused_specs.append({**sandbox_spec, cdr_consts.QUERY: fused_query})
+            index += 2
+        else:
+            fused_specs.append(sandbox_spec)
+            index += 1
+    return fused_specs
+
+
 class AbstractBaseCleaningRule(ABC):
     """
     Contains attributes and functions relevant to all cleaning rules.
@@ -178,7 +261,9 @@ class BaseCleaningRule(AbstractBaseCleaningRule):
                  depends_on: cleaning_class_list = None,
                  affected_tables: List = None,
                  table_namer: str = None,
-                 table_tag: str = None):
+                 table_tag: str = None,
+                 fuse_sandbox_queries: bool = False,
+                 fuse_rewrites: bool = False):
         """
         Instantiate a cleaning rule with basic attributes.
 
@@ -215,6 +300,16 @@ class BaseCleaningRule(AbstractBaseCleaningRule):
         :param table_namer: string used to help programmatically create
             sandbox table names
         :param table_tag: string used to create a label in the sandbox options
+        :param fuse_sandbox_queries: if True, the engine may run each sandbox
+            query and the delete query following it as one script.  Only set
+            this if each delete removes exactly the rows its sandbox query
+            saved and the sandbox table contains the table's key field.
+        :param fuse_rewrites: if True, the engine may fuse the rewrites of this
+            rule with those of adjacent rules rewriting the same table.  Only
+            set this if the rule has a single affected table, its queries
+            rewrite values of that table without removing rows, optionally
+            after sandbox queries, and its query specs do not depend on the
+            contents of the dataset.
         """
         self._issue_numbers = issue_numbers
         self._description = description
@@ -227,6 +322,10 @@ class BaseCleaningRule(AbstractBaseCleaningRule):
         self._affected_tables = affected_tables
         self._table_namer = self.table_namer = table_namer
         self._table_tag = table_tag
+        self._fuse_sandbox_queries = fuse_sandbox_queries
+        self._fuse_rewrites = fuse_rewrites
+        self._catalog = None
+        self._key_only_sandbox = False
 
         # fields jinja template
         self.fields_templ = JINJA_ENV.from_string("""
@@ -410,6 +509,52 @@ class BaseCleaningRule(AbstractBaseCleaningRule):
         """
         return self._table_tag
 
+    @property
+    def fuse_sandbox_queries(self):
+        """
+        Get whether sandbox and delete queries of this rule may be fused.
+        """
+        return self._fuse_sandbox_queries
+
+    @property
+    def fuse_rewrites(self):
+        """
+        Get whether rewrites of this rule may be fused with adjacent rules.
+        """
+        return self._fuse_rewrites
+
+    @property
+    def catalog(self):
+        """
+        Get the dataset_catalog.DatasetCatalog of the cleaning run, if any
+        """
+        return self._catalog
+
+    @catalog.setter
+    def catalog(self, catalog):
+        """
+        Set the catalog rules use to look up the tables of the datasets
+        """
+        self._catalog = catalog
+
+    @property
+    def key_only_sandbox(self):
+        """
+        Get whether the rule sandboxes the keys of rows instead of full rows
+        """
+        return self._key_only_sandbox
+
+    @key_only_sandbox.setter
+    def key_only_sandbox(self, key_only_sandbox):
+        """
+        Set whether the rule sandboxes the keys of rows instead of full rows
+
+        Rules supporting key-only sandbox tables save the key fields of the
+        rows they remove along with the sandbox metadata columns of
+        utils.sandbox.  Other rules keep sandboxing full rows.
+        """
+        self._key_only_sandbox = key_only_sandbox
+
     @affected_tables.setter
     def affected_tables(self, affected_tables):
         """
@@ -495,6 +640,29 @@ class BaseCleaningRule(AbstractBaseCleaningRule):
         base_name = f'{"_".join(self.issue_numbers).lower()}_{affected_table}'
         return get_sandbox_table_name(self.table_namer, base_name)
 
+    def get_sandbox_key_field(self, affected_table):
+        """
+        Get the field identifying rows of the affected_table in its sandbox table
+
+        Override this if the rule sandboxes a table keyed by another field.
+
+        :param affected_table: name of a table the rule deletes rows from
+        :return: name of the key field
+        """
+        return f'{affected_table}_id'
+
+    def get_fused_query_specs(self, *args, **keyword_args) -> query_spec_list:
+        """
+        Get the query specs with each sandbox and delete pair fused into a script
+
+        :return: a list of query dictionaries.  See
+            fuse_sandbox_and_delete_queries.
+        """
+        return fuse_sandbox_and_delete_queries(
+            self.get_query_specs(*args, **keyword_args), self.project_id,
+            self.dataset_id, self.sandbox_dataset_id,
+            self.get_sandbox_key_field)
+
     def log_queries(self):
         """
         Helper function to print the SQL a class generates.
@@ -4,15 +4,18 @@ from google.cloud.bigquery.client import Client
 from google.cloud.exceptions import GoogleCloudError
 
 from cdr_cleaner.clean_cdr_utils import get_tables_in_dataset
-from resources import get_concept_id_fields, has_domain_table_id
-from common import AOU_DEATH, DEATH, JINJA_ENV
+from resources import get_concept_id_fields, get_field_names, has_domain_table_id
+from common import AOU_DEATH, DEATH, JINJA_ENV, PERSON
 from constants import bq_utils as bq_consts
 import constants.cdr_cleaner.clean_cdr as cdr_consts
 from cdr_cleaner.cleaning_rules.base_cleaning_rule import BaseCleaningRule, query_spec_list, \
     get_delete_empty_sandbox_tables_queries
+from utils.sandbox import get_key_only_sandbox_columns, get_sandboxed_rows_query
 
 LOGGER = logging.getLogger(__name__)
 
+PERSON_ID = f'{PERSON}_id'
+
 
 class AbstractConceptSuppression(BaseCleaningRule):
     """
@@ -67,8 +70,11 @@ class AbstractConceptSuppression(BaseCleaningRule):
     def setup_rule(self, client: Client, *args, **keyword_args):
         # The following makes sure the tables exist in the dataset
         try:
-            self.affected_tables = get_tables_in_dataset(
-                client, self.project_id, self.dataset_id, self.affected_tables)
+            self.affected_tables = get_tables_in_dataset(client,
+                                                         self.project_id,
+                                                         self.dataset_id,
+                                                         self.affected_tables,
+                                                         catalog=self.catalog)
         except GoogleCloudError as error:
             LOGGER.error(error)
             raise
@@ -79,6 +85,55 @@ class AbstractConceptSuppression(BaseCleaningRule):
             for affected_table in self.affected_tables
         ]
 
+    def get_sandbox_key_field(self, affected_table):
+        # death has no key field of its own, its rows are deleted by person
+        if affected_table == DEATH:
+            return PERSON_ID
+        return super().get_sandbox_key_field(affected_table)
+
+    def get_sandbox_columns(self, table_name, alias='d'):
+        """
+        Get the columns the sandbox query saves, full rows by default
+
+        In key-only sandbox mode only the key field, person_id and the
+        sandbox metadata columns are saved.  Keeping person_id lets retraction
+        find and clean up the sandbox tables.
+
+        :param table_name: name of the domain table
+        :param alias: alias of the domain table in the sandbox query
+        :return: a select list for the sandbox query
+        """
+        if not self.key_only_sandbox:
+            return f'{alias}.*'
+
+        key_fields = [self.get_sandbox_key_field(table_name)]
+        if PERSON_ID not in key_fields and PERSON_ID in get_field_names(
+                table_name):
+            key_fields.append(PERSON_ID)
+        return get_key_only_sandbox_columns(
+            key_fields, self.__class__.__name__,
+            f'{self.project_id}.{self.dataset_id}.{table_name}', alias)
+
+    def get_sandboxed_rows_query(self, table_name, destination_table=None):
+        """
+        Get the query reading the full rows of a key-only sandbox table
+
+        See utils.sandbox.get_sandboxed_rows_query.
+
+        :param table_name: name of the domain table
+        :param destination_table: if set, the rows are saved to this table of
+            the sandbox dataset
+        :return: query dict
+        """
+        return {
+            cdr_consts.QUERY:
+                get_sandboxed_rows_query(self.project_id, self.dataset_id,
+                                         table_name, self.sandbox_dataset_id,
+                                         self.sandbox_table_for(table_name),
+                                         self.get_sandbox_key_field(table_name),
+                                         destination_table)
+        }
+
     @abstractmethod
     def get_sandbox_query(self, table_name):
         """
@@ -133,7 +188,7 @@ class AbstractBqLookupTableConceptSuppression(AbstractConceptSuppression):
     """
     BQ_LOOKUP_TABLE_SANDBOX_QUERY_TEMPLATE = JINJA_ENV.from_string("""
     SELECT
-      d.*
+      {{sandbox_columns}}
     FROM `{{project}}.{{dataset}}.{{domain_table}}` AS d
     {% for concept_field in concept_fields %}
     LEFT JOIN `{{project}}.{{sandbox_dataset}}.{{suppression_concept}}` AS s{{loop.index}}
@@ -217,7 +272,8 @@ class AbstractBqLookupTableConceptSuppression(AbstractConceptSuppression):
             domain_table=table_name,
             concept_fields=get_concept_id_fields(
                 table_name, self.exclude_source_concept_id),
-            suppression_concept=self.concept_suppression_lookup_table)
+            suppression_concept=self.concept_suppression_lookup_table,
+            sandbox_columns=self.get_sandbox_columns(table_name))
 
         return {
             cdr_consts.QUERY: suppression_record_sandbox_query,
@@ -243,7 +299,7 @@ class AbstractInMemoryLookupTableConceptSuppression(AbstractConceptSuppression):
     )
     
     SELECT
-      d.*
+      {{sandbox_columns}}
     FROM `{{project}}.{{dataset}}.{{domain_table}}` AS d
     {% for concept_field in concept_fields %}
     LEFT JOIN suppressed_concepts AS s{{loop.index}}
@@ -273,7 +329,8 @@ class AbstractInMemoryLookupTableConceptSuppression(AbstractConceptSuppression):
             sandbox_dataset=self.sandbox_dataset_id,
             domain_table=table_name,
             concept_fields=get_concept_id_fields(table_name),
-            suppressed_concept_ids=self.get_suppressed_concept_ids())
+            suppressed_concept_ids=self.get_suppressed_concept_ids(),
+            sandbox_columns=self.get_sandbox_columns(table_name))
 
         return {
             cdr_consts.QUERY: suppression_record_sandbox_query,
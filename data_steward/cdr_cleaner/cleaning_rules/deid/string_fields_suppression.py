@@ -160,8 +160,11 @@ class StringFieldsSuppression(BaseCleaningRule):
 
         # The following makes sure the tables exist in the dataset
         try:
-            self.affected_tables = get_tables_in_dataset(
-                client, self.project_id, self.dataset_id, self.affected_tables)
+            self.affected_tables = get_tables_in_dataset(client,
+                                                         self.project_id,
+                                                         self.dataset_id,
+                                                         self.affected_tables,
+                                                         catalog=self.catalog)
         except GoogleCloudError as error:
             LOGGER.error(error)
             raise
@@ -120,9 +120,11 @@ class DeduplicateIdColumn(BaseCleaningRule):
         ]
 
     def setup_rule(self, client, *args, **keyword_args):
-        self.affected_tables = get_tables_in_dataset(client, self.project_id,
+        self.affected_tables = get_tables_in_dataset(client,
+                                                     self.project_id,
                                                      self.dataset_id,
-                                                     self.affected_tables)
+                                                     self.affected_tables,
+                                                     catalog=self.catalog)
 
     def setup_validation(self, client, *args, **keyword_args):
         pass
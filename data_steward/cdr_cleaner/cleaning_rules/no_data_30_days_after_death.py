@@ -174,7 +174,8 @@ class NoDataAfterDeath(BaseCleaningRule):
                          dataset_id=dataset_id,
                          sandbox_dataset_id=sandbox_dataset_id,
                          depends_on=[CalculatePrimaryDeathRecord],
-                         table_namer=table_namer)
+                         table_namer=table_namer,
+                         fuse_sandbox_queries=True)
 
     def get_sandbox_query_for(self, table):
         """
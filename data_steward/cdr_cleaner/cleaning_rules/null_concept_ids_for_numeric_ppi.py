@@ -106,7 +106,8 @@ class NullConceptIDForNumericPPI(BaseCleaningRule):
                          project_id=project_id,
                          dataset_id=dataset_id,
                          sandbox_dataset_id=sandbox_dataset_id,
-                         affected_tables=[OBSERVATION])
+                         affected_tables=[OBSERVATION],
+                         fuse_rewrites=True)
 
     def get_query_specs(self):
         """
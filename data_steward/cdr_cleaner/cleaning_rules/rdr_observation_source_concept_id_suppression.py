@@ -69,7 +69,8 @@ class ObservationSourceConceptIDRowSuppression(BaseCleaningRule):
                          project_id=project_id,
                          dataset_id=dataset_id,
                          sandbox_dataset_id=sandbox_dataset_id,
-                         affected_tables=[OBSERVATION])
+                         affected_tables=[OBSERVATION],
+                         fuse_sandbox_queries=True)
 
     def get_query_specs(self):
         """
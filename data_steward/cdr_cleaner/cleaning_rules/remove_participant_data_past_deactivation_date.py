@@ -201,7 +201,11 @@ class RemoveParticipantDataPastDeactivationDate(BaseCleaningRule):
         :return: dataframe of columns from INFORMATION_SCHEMA
         """
         table_cols_df = DataFrame()
-        if client:
+        if client and self.catalog and self.catalog.covers(
+                project_id, dataset_id):
+            # the catalog of the cleaning run already has the table schemas
+            table_cols_df = self.catalog.get_schema(dataset_id).to_dataframe()
+        elif client:
             LOGGER.info(
                 f"Getting column information from live dataset: `{self.dataset_id}`"
             )
@@ -164,8 +164,11 @@ class RemoveParticipantsUnder18Years(BaseCleaningRule):
         Function to run any data upload options before executing a query.
         """
         try:
-            self.affected_tables = get_tables_in_dataset(
-                client, self.project_id, self.dataset_id, self.affected_tables)
+            self.affected_tables = get_tables_in_dataset(client,
+                                                         self.project_id,
+                                                         self.dataset_id,
+                                                         self.affected_tables,
+                                                         catalog=self.catalog)
         except GoogleCloudError as error:
             LOGGER.error(error)
             raise
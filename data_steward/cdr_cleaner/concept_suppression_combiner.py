@@ -0,0 +1,415 @@
+"""
+Combined pass of adjacent concept suppression rules.
+
+The deid data stages run many concept suppression rules one after another.
+Each one sandboxes the rows of every domain table that reference one of its
+concepts, joining its lookup table once per concept field, and then deletes
+the sandboxed rows.  Every rule scans every domain table.
+
+The SuppressionCombiner replaces runs of adjacent rules extending
+AbstractBqLookupTableConceptSuppression or
+AbstractInMemoryLookupTableConceptSuppression by a single rule that
+
+1. sets up each rule, creating its lookup table as before,
+2. copies the concepts of all lookups into one lookup table of the sandbox
+   dataset, tagged with the number of the rule they belong to,
+3. scans each domain table once, saving the suppressed rows to a tagged
+   sandbox table along with the number of the first rule suppressing them,
+4. copies the rows of each rule from the tagged sandbox table to the sandbox
+   table the rule itself would have created,
+5. deletes the tagged rows from each domain table once.
+
+In key-only sandbox mode the tagged and the rule sandbox tables hold the
+key-only columns of utils.sandbox, attributed to the rule they belong to.
+Rules are only combined with rules of the same sandbox mode.
+
+A row is attributed to the first rule in the run that suppresses it, which is
+the rule that would have sandboxed and deleted it running the rules one
+after another.  Rules that exclude source concept fields only match on the
+other concept fields.
+
+The lookups of all combined rules are built before any row is deleted.  A
+rule building its lookup from the data, e.g. RecentConceptSuppression, sees
+the rows rules ahead of it in the run would already have deleted.  Rules
+overriding how the rows are sandboxed or deleted are never combined.
+"""
+# Python imports
+import logging
+
+# Project imports
+from cdr_cleaner.cleaning_rules.base_cleaning_rule import \
+    get_delete_empty_sandbox_tables_queries
+from cdr_cleaner.cleaning_rules.deid.concept_suppression import (
+    AbstractBqLookupTableConceptSuppression, AbstractConceptSuppression,
+    AbstractInMemoryLookupTableConceptSuppression)
+from common import JINJA_ENV
+from constants import bq_utils as bq_consts
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+from resources import get_concept_id_fields
+from utils.sandbox import SANDBOXED_BY, get_sandbox_table_name
+
+LOGGER = logging.getLogger(__name__)
+
+COMBINED_MODULE_NAME = 'combined_concept_suppression'
+COMBINED_LOOKUP_TABLE = 'combined_suppression_{group_no}_concepts'
+COMBINED_SANDBOX_TABLE = 'combined_suppression_{group_no}_{table}'
+RULE_NO = 'suppression_rule_no'
+
+COMBINED_LOOKUP_QUERY = JINJA_ENV.from_string("""
+CREATE OR REPLACE TABLE `{{project}}.{{sandbox_dataset}}.{{lookup_table}}` AS
+{% for member in members %}
+{% if loop.previtem is defined %}UNION ALL{% endif %}
+SELECT DISTINCT
+  concept_id,
+  {{loop.index}} AS rule_no,
+  '{{member.name}}' AS rule,
+  {{member.include_source}} AS include_source
+{% if member.lookup_table %}
+FROM `{{project}}.{{sandbox_dataset}}.{{member.lookup_table}}`
+{% else %}
+FROM UNNEST(ARRAY<INT64>[{{member.concept_ids|join(', ')}}]) AS concept_id
+{% endif %}
+{% endfor %}
+""")
+
+COMBINED_SANDBOX_QUERY = JINJA_ENV.from_string("""
+WITH suppressed_concepts AS (
+  SELECT
+    concept_id,
+    MIN(rule_no) AS rule_no,
+    MIN(IF(include_source, rule_no, NULL)) AS source_rule_no
+  FROM `{{project}}.{{sandbox_dataset}}.{{lookup_table}}`
+  WHERE rule_no IN ({{rule_nos|join(', ')}})
+  GROUP BY concept_id
+)
+
+SELECT * FROM (
+  SELECT
+    {{sandbox_columns}},
+    LEAST(
+    {% for concept_field, is_source in concept_fields %}
+      {% if loop.previtem is defined %}, {% else %}  {% endif %}COALESCE(s{{loop.index}}.{{'source_rule_no' if is_source else 'rule_no'}}, {{no_rule}})
+    {% endfor %}) AS {{rule_no_field}}
+  FROM `{{project}}.{{dataset}}.{{domain_table}}` AS d
+  {% for concept_field, is_source in concept_fields %}
+  LEFT JOIN suppressed_concepts AS s{{loop.index}}
+    ON d.{{concept_field}} = s{{loop.index}}.concept_id
+  {% endfor %}
+)
+WHERE {{rule_no_field}} < {{no_rule}}
+""")
+
+RULE_SANDBOX_QUERY = JINJA_ENV.from_string("""
+SELECT * EXCEPT ({{rule_no_field}})
+{% if key_only %}REPLACE ('{{rule}}' AS {{sandboxed_by}}){% endif %}
+FROM `{{project}}.{{sandbox_dataset}}.{{combined_sandbox_table}}`
+WHERE {{rule_no_field}} = {{rule_no}}
+""")
+
+DROP_COMBINED_SANDBOX_TABLES_QUERY = JINJA_ENV.from_string("""
+{% for table in tables %}
+DROP TABLE IF EXISTS `{{project}}.{{sandbox_dataset}}.{{table}}`;
+{% endfor %}
+""")
+
+
+def get_combinable_instance(rule):
+    """
+    Get the concept suppression rule instance of a rule that can be combined
+
+    :param rule: tuple of (clazz, query_function, setup_function, rule_info)
+    :return: the rule instance, None if the rule can not be combined
+    """
+    instance = getattr(rule[2], '__self__', None)
+    if not isinstance(instance,
+                      (AbstractBqLookupTableConceptSuppression,
+                       AbstractInMemoryLookupTableConceptSuppression)):
+        return None
+    clazz = type(instance)
+    if clazz.get_query_specs is not AbstractConceptSuppression.get_query_specs:
+        return None
+    if clazz.get_sandbox_query not in (
+            AbstractBqLookupTableConceptSuppression.get_sandbox_query,
+            AbstractInMemoryLookupTableConceptSuppression.get_sandbox_query):
+        return None
+    if clazz.get_suppression_query is not AbstractConceptSuppression.get_suppression_query:
+        return None
+    return instance
+
+
+class CombinedConceptSuppression:
+    """
+    Adjacent concept suppression rules scanning each domain table once
+    """
+
+    def __init__(self, rules, instances, group_no):
+        """
+        :param rules: list of (clazz, query_function, setup_function, rule_info)
+        :param instances: the concept suppression rule instance of each rule
+        :param group_no: number of the run of rules in the data stage, which
+            keeps the names of the tables of different runs apart
+        """
+        self.rules = rules
+        self.instances = instances
+        first = instances[0]
+        self.project_id = first.project_id
+        self.dataset_id = first.dataset_id
+        self.sandbox_dataset_id = first.sandbox_dataset_id
+        self.table_namer = first.table_namer
+        self.key_only_sandbox = first.key_only_sandbox
+        self.lookup_table = get_sandbox_table_name(
+            self.table_namer, COMBINED_LOOKUP_TABLE.format(group_no=group_no))
+        self.group_no = group_no
+
+    @property
+    def rule_names(self):
+        return [type(instance).__name__ for instance in self.instances]
+
+    def combined_sandbox_table_for(self, table_name):
+        """
+        Get the name of the tagged sandbox table of a domain table
+
+        :param table_name: name of the domain table
+        :return: name of the sandbox table
+        """
+        return get_sandbox_table_name(
+            self.table_namer,
+            COMBINED_SANDBOX_TABLE.format(group_no=self.group_no,
+                                          table=table_name))
+
+    def get_tables(self):
+        """
+        Get the domain tables affected by any of the rules
+
+        :return: dict of table name to the numbers of the rules affecting it
+        """
+        tables = {}
+        for rule_no, instance in enumerate(self.instances, start=1):
+            for table_name in instance.affected_tables:
+                tables.setdefault(table_name, []).append(rule_no)
+        return tables
+
+    def setup_rule(self, client, *args, **keyword_args):
+        """
+        Set up each rule, creating its lookup table
+
+        :param client: a BigQueryClient
+        """
+        for instance in self.instances:
+            instance.setup_rule(client, *args, **keyword_args)
+
+    def get_lookup_query(self):
+        members = []
+        for instance in self.instances:
+            member = {
+                'name': type(instance).__name__,
+                'include_source': True,
+                'lookup_table': None,
+                'concept_ids': None
+            }
+            if isinstance(instance, AbstractBqLookupTableConceptSuppression):
+                member[
+                    'lookup_table'] = instance.concept_suppression_lookup_table
+                member[
+                    'include_source'] = not instance.exclude_source_concept_id
+            else:
+                member['concept_ids'] = [
+                    int(concept_id)
+                    for concept_id in instance.get_suppressed_concept_ids()
+                ]
+            members.append(member)
+
+        return {
+            cdr_consts.QUERY:
+                COMBINED_LOOKUP_QUERY.render(
+                    project=self.project_id,
+                    sandbox_dataset=self.sandbox_dataset_id,
+                    lookup_table=self.lookup_table,
+                    members=members)
+        }
+
+    def get_combined_sandbox_query(self, table_name, rule_nos):
+        """
+        Get the query saving the suppressed rows of a table with their rule
+
+        :param table_name: name of the domain table
+        :param rule_nos: numbers of the rules affecting the table
+        :return: query dict
+        """
+        source_fields = set(get_concept_id_fields(table_name)) - set(
+            get_concept_id_fields(table_name, True))
+        concept_fields = [(field, field in source_fields)
+                          for field in get_concept_id_fields(table_name)]
+        query = COMBINED_SANDBOX_QUERY.render(
+            project=self.project_id,
+            dataset=self.dataset_id,
+            sandbox_dataset=self.sandbox_dataset_id,
+            lookup_table=self.lookup_table,
+            domain_table=table_name,
+            rule_nos=rule_nos,
+            concept_fields=concept_fields,
+            rule_no_field=RULE_NO,
+            no_rule=len(self.instances) + 1,
+            sandbox_columns=self.instances[0].get_sandbox_columns(table_name))
+        return {
+            cdr_consts.QUERY:
+                query,
+            cdr_consts.DESTINATION_TABLE:
+                self.combined_sandbox_table_for(table_name),
+            cdr_consts.DISPOSITION:
+                bq_consts.WRITE_TRUNCATE,
+            cdr_consts.DESTINATION_DATASET:
+                self.sandbox_dataset_id
+        }
+
+    def get_rule_sandbox_query(self, table_name, rule_no):
+        """
+        Get the query copying the rows a rule suppresses to its sandbox table
+
+        :param table_name: name of the domain table
+        :param rule_no: number of the rule
+        :return: query dict
+        """
+        query = RULE_SANDBOX_QUERY.render(
+            project=self.project_id,
+            sandbox_dataset=self.sandbox_dataset_id,
+            combined_sandbox_table=self.combined_sandbox_table_for(table_name),
+            rule_no_field=RULE_NO,
+            rule_no=rule_no,
+            key_only=self.key_only_sandbox,
+            rule=self.rule_names[rule_no - 1],
+            sandboxed_by=SANDBOXED_BY)
+        return {
+            cdr_consts.QUERY:
+                query,
+            cdr_consts.DESTINATION_TABLE:
+                self.instances[rule_no - 1].sandbox_table_for(table_name),
+            cdr_consts.DISPOSITION:
+                bq_consts.WRITE_TRUNCATE,
+            cdr_consts.DESTINATION_DATASET:
+                self.sandbox_dataset_id
+        }
+
+    def get_suppression_query(self, table_name):
+        """
+        Get the query deleting the rows saved to the tagged sandbox table
+
+        :param table_name: name of the domain table
+        :return: query dict
+        """
+        query = AbstractConceptSuppression.SUPPRESSION_RECORD_QUERY_TEMPLATE.render(
+            project=self.project_id,
+            dataset=self.dataset_id,
+            sandbox_dataset=self.sandbox_dataset_id,
+            domain_table=table_name,
+            sandbox_table=self.combined_sandbox_table_for(table_name))
+        return {cdr_consts.QUERY: query}
+
+    def get_query_specs(self, *args, **keyword_args):
+        tables = self.get_tables()
+        if not tables:
+            return []
+
+        table_scans = sum(len(rule_nos) for rule_nos in tables.values())
+        LOGGER.info(f"Combined concept suppression of {self.rule_names} scans "
+                    f"{len(tables)} tables once instead of {table_scans} "
+                    f"table scans")
+
+        sandbox_queries = [
+            self.get_combined_sandbox_query(table_name, rule_nos)
+            for table_name, rule_nos in tables.items()
+        ]
+        rule_sandbox_queries = [
+            self.get_rule_sandbox_query(table_name, rule_no)
+            for table_name, rule_nos in tables.items()
+            for rule_no in rule_nos
+        ]
+        queries = [
+            self.get_suppression_query(table_name) for table_name in tables
+        ]
+
+        # Clean up the empty sandbox tables of the rules and the tagged
+        # sandbox tables, whose rows were copied to them
+        delete_empty_sandbox_queries = get_delete_empty_sandbox_tables_queries(
+            self.project_id, self.sandbox_dataset_id, [
+                instance.sandbox_table_for(table_name)
+                for instance in self.instances
+                for table_name in instance.affected_tables
+            ])
+        drop_combined_sandbox_query = {
+            cdr_consts.QUERY:
+                DROP_COMBINED_SANDBOX_TABLES_QUERY.render(
+                    project=self.project_id,
+                    sandbox_dataset=self.sandbox_dataset_id,
+                    tables=[
+                        self.combined_sandbox_table_for(table_name)
+                        for table_name in tables
+                    ])
+        }
+
+        return ([self.get_lookup_query()] + sandbox_queries +
+                rule_sandbox_queries + queries + delete_empty_sandbox_queries +
+                [drop_combined_sandbox_query])
+
+    def as_rule(self):
+        """
+        Get the combined rules as a rule tuple the engine can run
+
+        :return: tuple of (clazz, query_function, setup_function, rule_info)
+        """
+        first_info = self.rules[0][3]
+        rule_info = {
+            cdr_consts.QUERY_FUNCTION:
+                self.get_query_specs,
+            cdr_consts.SETUP_FUNCTION:
+                self.setup_rule,
+            cdr_consts.FUNCTION_NAME:
+                first_info[cdr_consts.FUNCTION_NAME],
+            cdr_consts.MODULE_NAME:
+                f"{COMBINED_MODULE_NAME}.{'__'.join(self.rule_names)}",
+            cdr_consts.LINE_NO:
+                first_info[cdr_consts.LINE_NO]
+        }
+        return (self.rules[0][0], self.get_query_specs, self.setup_rule,
+                rule_info)
+
+
+class SuppressionCombiner:
+    """
+    Replaces runs of adjacent concept suppression rules by combined rules
+    """
+
+    def __init__(self):
+        self.group_count = 0
+
+    def combine(self, rules):
+        """
+        Generate the rules to run, combining runs of concept suppression rules
+
+        :param rules: list of (clazz, query_function, setup_function, rule_info)
+        :return: generator of (clazz, query_function, setup_function, rule_info)
+        """
+        index = 0
+        while index < len(rules):
+            group, instances = [], []
+            while index < len(rules):
+                instance = get_combinable_instance(rules[index])
+                if instance is None or (instances and instance.key_only_sandbox
+                                        != instances[0].key_only_sandbox):
+                    break
+                group.append(rules[index])
+                instances.append(instance)
+                index += 1
+
+            if len(group) > 1:
+                self.group_count += 1
+                LOGGER.info(f"Combining concept suppression rules "
+                            f"{[type(i).__name__ for i in instances]}")
+                yield CombinedConceptSuppression(group, instances,
+                                                 self.group_count).as_rule()
+            else:
+                yield from group
+
+            if index < len(rules) and not group:
+                yield rules[index]
+                index += 1
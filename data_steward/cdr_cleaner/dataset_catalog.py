@@ -0,0 +1,121 @@
+"""
+Run-scoped catalog of the tables of the datasets a cleaning run modifies.
+
+Cleaning rules discover the state of the dataset they clean in `setup_rule`,
+e.g. `clean_cdr_utils.get_tables_in_dataset` queries `__TABLES__` for the
+affected tables that exist and other rules query INFORMATION_SCHEMA for the
+columns of every table.  Each rule does so independently, which adds up to
+hundreds of metadata queries per data stage.
+
+`clean_cdr_engine.clean_dataset` keeps a DatasetCatalog for the dataset being
+cleaned and its sandbox dataset and passes it to the rules it runs.  The
+tables and columns of a dataset are loaded with one query the first time a
+rule asks for them and are answered from memory afterwards.
+
+The engine marks the tables each query spec writes or drops as stale, and
+every dataset of the catalog once a rule's `setup_rule` ran, since setup may
+modify any table.  The next lookup concerning a stale table reloads the
+dataset, lookups concerning other tables do not.  A rule modifying tables by
+other means calls `invalidate` for them.
+"""
+# Python imports
+import logging
+import threading
+
+# Project imports
+from cdr_cleaner.rule_scheduler import get_query_tables
+
+LOGGER = logging.getLogger(__name__)
+
+
+class DatasetCatalog:
+    """
+    Tables and columns of datasets, shared by the rules of a run
+    """
+
+    def __init__(self, client, dataset_ids):
+        """
+        :param client: a BigQueryClient used to load the catalog
+        :param dataset_ids: ids of the datasets of the client's project kept
+            in the catalog, typically the dataset being cleaned and its
+            sandbox dataset
+        """
+        self.client = client
+        self.project_id = client.project
+        self.dataset_ids = set(dataset_ids)
+        self._schemas = {}
+        self._stale_schemas = {dataset_id: set() for dataset_id in dataset_ids}
+        self._lock = threading.RLock()
+
+    def covers(self, project_id, dataset_id) -> bool:
+        """
+        Determine whether the catalog keeps the tables of a dataset
+
+        :param project_id: identifies the project
+        :param dataset_id: identifies the dataset
+        :return: True if the dataset is in the catalog
+        """
+        return project_id == self.project_id and dataset_id in self.dataset_ids
+
+    def get_schema(self, dataset_id, table_ids=None):
+        """
+        Get the tables and columns of a dataset
+
+        The dataset is reloaded if it was not loaded yet or if any of the
+        tables of interest is stale.
+
+        :param dataset_id: identifies the dataset
+        :param table_ids: the tables of interest, all tables by default
+        :return: a gcloud.bq.DatasetSchema snapshot of the dataset
+        """
+        with self._lock:
+            stale = self._stale_schemas[dataset_id]
+            if (dataset_id not in self._schemas or
+                (stale if table_ids is None else stale & set(table_ids))):
+                LOGGER.info(f"Loading the tables of `{dataset_id}`")
+                self._schemas[dataset_id] = self.client.get_dataset_schema(
+                    dataset_id)
+                stale.clear()
+            return self._schemas[dataset_id]
+
+    def get_tables(self, dataset_id, table_ids) -> list:
+        """
+        Get the tables of a list that exist in a dataset
+
+        :param dataset_id: identifies the dataset
+        :param table_ids: ids of the tables to look for
+        :return: the ids of the tables that exist, in the order given
+        """
+        schema = self.get_schema(dataset_id, table_ids)
+        return [
+            table_id for table_id in table_ids if schema.has_table(table_id)
+        ]
+
+    def invalidate(self, dataset_id, table_id):
+        """
+        Mark a table as modified, so the next lookup concerning it reloads
+
+        :param dataset_id: identifies the dataset
+        :param table_id: identifies the table
+        """
+        if dataset_id not in self.dataset_ids:
+            return
+        with self._lock:
+            self._stale_schemas[dataset_id].add(table_id)
+
+    def invalidate_all(self):
+        """
+        Mark all tables as modified, so the next lookup of each dataset reloads
+        """
+        with self._lock:
+            self._schemas.clear()
+
+    def invalidate_query(self, query_dict):
+        """
+        Mark the tables a query spec writes or drops as modified
+
+        :param query_dict: a query spec
+        """
+        _, written = get_query_tables(query_dict, self.dataset_ids)
+        for table in written:
+            self.invalidate(*table.split('.'))
@@ -0,0 +1,210 @@
+"""
+Dry-run cost estimation and query priority policy for the cleaning engine.
+
+`clean_cdr --plan` dry-runs every query spec of a data stage and reports the
+bytes each rule, each table and the whole run would process, without
+modifying any data.  This is the place to budget slot usage and to catch
+unexpected full table scans before a release run.
+
+The BatchPriorityPolicy submits large sandbox and DML queries at BATCH
+priority.  Table rewrites, DDL and small queries stay INTERACTIVE so the
+queries the rest of the run waits on are not queued behind batch work.
+"""
+# Python imports
+import copy
+import logging
+import re
+from collections import OrderedDict
+
+# Third party imports
+from google.cloud.exceptions import GoogleCloudError
+
+# Project imports
+from cdr_cleaner.rule_scheduler import get_query_tables
+from constants import bq_utils as bq_consts
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+from validation.sql_wrangle import remove_comments
+
+LOGGER = logging.getLogger(__name__)
+
+BYTES_PER_GIB = 2**30
+DML_PATTERN = re.compile(r'^\s*(?:INSERT|DELETE|UPDATE|MERGE)\b', re.IGNORECASE)
+UNKNOWN_TABLE = 'unknown'
+
+
+def format_bytes(num_bytes) -> str:
+    """
+    Format a byte count in GiB for reports
+
+    :param num_bytes: number of bytes, None if unknown
+    :return: formatted string
+    """
+    if num_bytes is None:
+        return 'n/a'
+    return f'{num_bytes / BYTES_PER_GIB:,.2f} GiB'
+
+
+def get_target_table(query_dict, dataset_ids) -> str:
+    """
+    Get the table a query spec's cost is reported against
+
+    :param query_dict: a query spec generated by a cleaning rule
+    :param dataset_ids: ids of the dataset being cleaned and its sandbox
+    :return: 'dataset_id.table_id' of the destination or the first table the
+        query writes, 'unknown' if neither can be determined
+    """
+    if query_dict.get(cdr_consts.DESTINATION_TABLE):
+        return (f'{query_dict.get(cdr_consts.DESTINATION_DATASET)}.'
+                f'{query_dict[cdr_consts.DESTINATION_TABLE]}')
+    _, written = get_query_tables(query_dict, dataset_ids)
+    return sorted(written)[0] if written else UNKNOWN_TABLE
+
+
+def estimate_bytes(client, query_dict, job_config) -> int:
+    """
+    Dry-run a query spec and get the number of bytes it would process
+
+    :param client: a BigQueryClient
+    :param query_dict: a query spec generated by a cleaning rule
+    :param job_config: the QueryJobConfig the query would run with.  It is
+        copied, not modified.
+    :return: estimated number of bytes processed
+    :raises GoogleCloudError: if the dry run fails, e.g. the query reads a
+        table an earlier rule creates
+    """
+    dry_run_config = copy.deepcopy(job_config)
+    dry_run_config.dry_run = True
+    dry_run_config.use_query_cache = False
+    query_job = client.query(query=query_dict.get(cdr_consts.QUERY),
+                             job_config=dry_run_config)
+    return query_job.total_bytes_processed or 0
+
+
+def is_batch_candidate(query_dict, sandbox_dataset_id) -> bool:
+    """
+    Determine if a query spec may run at BATCH priority
+
+    Sandbox queries only back up rows and DML statements change rows in place,
+    so they can wait for batch slots.  Queries rewriting a table through a
+    destination and DDL on the dataset being cleaned stay interactive.
+
+    :param query_dict: a query spec generated by a cleaning rule
+    :param sandbox_dataset_id: identifies the sandbox dataset
+    :return: True if the query writes only to the sandbox or is a DML statement
+    """
+    if query_dict.get(cdr_consts.DESTINATION_TABLE):
+        return query_dict.get(
+            cdr_consts.DESTINATION_DATASET) == sandbox_dataset_id
+    query = query_dict.get(cdr_consts.QUERY) or ''
+    if DML_PATTERN.search(remove_comments(query)):
+        return True
+    _, written = get_query_tables(query_dict, {sandbox_dataset_id})
+    return bool(written)
+
+
+class BatchPriorityPolicy:
+    """
+    Submits large sandbox and DML queries at BATCH priority
+    """
+
+    def __init__(self, sandbox_dataset_id, batch_threshold_gb):
+        """
+        :param sandbox_dataset_id: identifies the sandbox dataset
+        :param batch_threshold_gb: queries estimated to process at least this
+            many GiB are run at BATCH priority if they are batch candidates
+        """
+        if batch_threshold_gb < 0:
+            raise ValueError(f'batch_threshold_gb must not be negative, '
+                             f'got {batch_threshold_gb}')
+        self.sandbox_dataset_id = sandbox_dataset_id
+        self.threshold_bytes = int(batch_threshold_gb * BYTES_PER_GIB)
+
+    def get_priority(self, client, query_dict, job_config) -> str:
+        """
+        Get the priority a query spec should run at, dry-running it if needed
+
+        :param client: a BigQueryClient
+        :param query_dict: a query spec generated by a cleaning rule
+        :param job_config: the QueryJobConfig the query will run with
+        :return: bq_consts.BATCH or bq_consts.INTERACTIVE
+        """
+        if (job_config.priority == bq_consts.BATCH or
+                not is_batch_candidate(query_dict, self.sandbox_dataset_id)):
+            return self.get_estimated_priority(query_dict, job_config, None)
+        try:
+            num_bytes = estimate_bytes(client, query_dict, job_config)
+        except GoogleCloudError as exp:
+            LOGGER.warning(f'Unable to estimate the query cost, running it '
+                           f'at {bq_consts.INTERACTIVE} priority: {exp}')
+            num_bytes = None
+        return self.get_estimated_priority(query_dict, job_config, num_bytes)
+
+    def get_estimated_priority(self, query_dict, job_config, num_bytes) -> str:
+        """
+        Get the priority a query spec should run at given its estimated cost
+
+        :param query_dict: a query spec generated by a cleaning rule
+        :param job_config: the QueryJobConfig the query will run with
+        :param num_bytes: estimated bytes processed, None if unknown
+        :return: bq_consts.BATCH or bq_consts.INTERACTIVE
+        """
+        if job_config.priority == bq_consts.BATCH:
+            # the query spec asked for BATCH priority
+            return bq_consts.BATCH
+        if (num_bytes is not None and num_bytes >= self.threshold_bytes and
+                is_batch_candidate(query_dict, self.sandbox_dataset_id)):
+            return bq_consts.BATCH
+        return bq_consts.INTERACTIVE
+
+
+def summarize_estimates(estimates):
+    """
+    Total the estimated bytes per rule, per table and overall
+
+    :param estimates: list of estimate dicts as returned by
+        clean_cdr_engine.plan_dataset
+    :return: tuple of (per_rule, per_table, total) where per_rule and
+        per_table are ordered dicts of name to bytes
+    """
+    per_rule = OrderedDict()
+    per_table = OrderedDict()
+    total = 0
+    for estimate in estimates:
+        num_bytes = estimate['bytes_processed'] or 0
+        per_rule[estimate['rule']] = per_rule.get(estimate['rule'],
+                                                  0) + num_bytes
+        per_table[estimate['table']] = per_table.get(estimate['table'],
+                                                     0) + num_bytes
+        total += num_bytes
+    return per_rule, per_table, total
+
+
+def log_plan_report(estimates):
+    """
+    Log the estimated bytes per rule, per table and overall
+
+    :param estimates: list of estimate dicts as returned by
+        clean_cdr_engine.plan_dataset
+    """
+    per_rule, per_table, total = summarize_estimates(estimates)
+    LOGGER.info('Estimated bytes processed per rule:')
+    for rule, num_bytes in per_rule.items():
+        LOGGER.info(f'\t{rule}:\t{format_bytes(num_bytes)}')
+    LOGGER.info('Estimated bytes processed per table:')
+    for table, num_bytes in sorted(per_table.items(),
+                                   key=lambda item: item[1],
+                                   reverse=True):
+        LOGGER.info(f'\t{table}:\t{format_bytes(num_bytes)}')
+    batch_count = sum(
+        1 for estimate in estimates if estimate['priority'] == bq_consts.BATCH)
+    LOGGER.info(f'Estimated bytes processed overall:\t{format_bytes(total)} '
+                f'for {len(estimates)} queries, {batch_count} at '
+                f'{bq_consts.BATCH} priority')
+
+    failed = [estimate for estimate in estimates if estimate['error']]
+    if failed:
+        LOGGER.warning(f'{len(failed)} queries could not be estimated.  They '
+                       f'may read tables created earlier in the run:')
+        for estimate in failed:
+            LOGGER.warning(f"\t{estimate['rule']} query "
+                           f"{estimate['query_no'] + 1}:\t{estimate['error']}")
@@ -0,0 +1,562 @@
+"""
+Fusion of adjacent cleaning rules that rewrite the same table.
+
+Several cleaning rules only rewrite columns of a single table, e.g. a
+`SELECT ... FROM observation` written back to `observation` with
+WRITE_TRUNCATE, an equivalent `CREATE OR REPLACE TABLE`, or an `UPDATE`.  When
+such rules are adjacent in a data stage, each one scans and rewrites the whole
+table.  The RuleChainFuser composes their rewrites into a single query, each
+rule's SELECT reading the previous one's result as a common table expression,
+and writes the table once.
+
+An `UPDATE table SET col = expr WHERE condition` is composed as
+`SELECT * REPLACE (IF(condition, expr, col) AS col) FROM table`.
+
+A rule may also run queries ahead of its rewrites, typically a sandbox query.
+Those queries keep their position ahead of the fused rewrite.  References they
+make to the rewritten table are replaced by the composition of the rewrites of
+the rules before them, so they read the same rows they would have read
+unfused.  Such queries may only write to the sandbox dataset.
+
+Only rules that opt in by passing `fuse_rewrites=True` to
+`BaseCleaningRule.__init__`, have a single affected table and do not implement
+`setup_rule` are fused.  Runs of such rules are found from this metadata
+alone.  The query specs of a run are generated when its first rule is about
+to run.
+"""
+# Python imports
+import logging
+import re
+from functools import partial
+
+# Third party imports
+from google.cloud import bigquery
+from google.cloud.exceptions import GoogleCloudError
+
+# Project imports
+from cdr_cleaner.cleaning_rules.base_cleaning_rule import BaseCleaningRule
+from cdr_cleaner.query_planner import estimate_bytes, format_bytes
+from cdr_cleaner.rule_scheduler import (get_query_tables, has_setup,
+                                        is_opaque_query)
+from common import JINJA_ENV
+from constants import bq_utils as bq_consts
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+
+LOGGER = logging.getLogger(__name__)
+
+FUSED_STEP = 'fused_step_{step_no}'
+
+FUSED_REWRITE_QUERY = JINJA_ENV.from_string("""
+WITH
+{% for step_query in step_queries %}
+fused_step_{{loop.index}} AS (
+{{step_query}}
+){{ ',' if not loop.last }}
+{% endfor %}
+SELECT * FROM fused_step_{{step_queries|length}}
+""")
+
+UPDATE_AS_SELECT_QUERY = JINJA_ENV.from_string("""
+SELECT * REPLACE (
+{% for column, expression in assignments %}
+  IF((
+{{condition}}
+  ), (
+{{expression}}
+  ), {{column}}) AS {{column}}{{ ',' if not loop.last }}
+{% endfor %}
+)
+FROM {{table_ref}}{{ ' AS ' ~ alias if alias }}
+""")
+
+TABLE_REF = r'(`?(?:[\w-]+\.)?(\w+)\.([\w-]+)`?)'
+SELECT_START_PATTERN = re.compile(r'^\s*(?:SELECT|WITH|\()', re.IGNORECASE)
+CREATE_OR_REPLACE_PATTERN = re.compile(
+    r'^\s*CREATE\s+OR\s+REPLACE\s+TABLE\s+' + TABLE_REF + r'\s+AS\b',
+    re.IGNORECASE)
+UPDATE_PATTERN = re.compile(
+    r'^\s*UPDATE\s+' + TABLE_REF +
+    r'(?:\s+(?:AS\s+)?(?!SET\b)([A-Za-z_]\w*))?\s+SET\b', re.IGNORECASE)
+WHERE_PATTERN = re.compile(r'\bWHERE\b', re.IGNORECASE)
+FROM_PATTERN = re.compile(r'\bFROM\b', re.IGNORECASE)
+ASSIGNMENT_PATTERN = re.compile(r'^\s*(?:\w+\.)?(\w+)\s*=(.*)$', re.DOTALL)
+# keywords that may directly follow a table reference which has no alias
+ALIAS_PATTERN = re.compile(
+    r'\s+(?:AS\s+)?(?!(?:WHERE|JOIN|INNER|LEFT|RIGHT|FULL|CROSS|ON|USING|'
+    r'GROUP|ORDER|LIMIT|UNION|EXCEPT|INTERSECT|WINDOW|HAVING|QUALIFY|FOR|'
+    r'TABLESAMPLE|SET|WHEN|THEN|ELSE|END|AND|OR|NOT|SELECT|FROM|AS)\b)'
+    r'[A-Za-z_]\w*', re.IGNORECASE)
+OPENING_BRACKETS = '(['
+CLOSING_BRACKETS = ')]'
+
+
+def get_depths(sql):
+    """
+    Get the bracket depth of each character of SQL code
+
+    :param sql: SQL text
+    :return: list holding, for each character, its bracket depth or None if
+        it is part of a literal, a quoted identifier or a comment.  Opening
+        quotes are reported as code.
+    """
+    depths = [None] * len(sql)
+    depth = 0
+    index = 0
+    while index < len(sql):
+        char = sql[index]
+        if char in '\'"`':
+            quote = sql[index:index + 3] if sql[index:index +
+                                                3] in ("'''", '"""') else char
+            depths[index] = depth
+            index += len(quote)
+            while index < len(sql) and sql[index:index + len(quote)] != quote:
+                index += 2 if sql[index] == '\\' else 1
+            index += len(quote)
+            continue
+        if sql[index:index + 2] == '--' or char == '#':
+            newline = sql.find('\n', index)
+            index = len(sql) if newline < 0 else newline
+            continue
+        if sql[index:index + 2] == '/*':
+            end = sql.find('*/', index + 2)
+            index = len(sql) if end < 0 else end + 2
+            continue
+        if char in OPENING_BRACKETS:
+            depths[index] = depth
+            depth += 1
+        elif char in CLOSING_BRACKETS:
+            depth -= 1
+            depths[index] = depth
+        else:
+            depths[index] = depth
+        index += 1
+    return depths
+
+
+def find_top_level(pattern, sql):
+    """
+    Find the first match of a pattern in top level SQL code
+
+    :param pattern: compiled regular expression
+    :param sql: SQL text
+    :return: the match or None
+    """
+    depths = get_depths(sql)
+    for match in pattern.finditer(sql):
+        if depths[match.start()] == 0:
+            return match
+    return None
+
+
+def split_top_level(sql, separator):
+    """
+    Split SQL text on a separator character found in top level code
+
+    :param sql: SQL text
+    :param separator: a single character, e.g. ',' or ';'
+    :return: list of SQL fragments
+    """
+    depths = get_depths(sql)
+    parts = []
+    start = 0
+    for index, char in enumerate(sql):
+        if char == separator and depths[index] == 0:
+            parts.append(sql[start:index])
+            start = index + 1
+    parts.append(sql[start:])
+    return parts
+
+
+def is_single_statement(sql) -> bool:
+    """
+    Determine if SQL text holds a single statement
+
+    :param sql: SQL text
+    :return: True if it contains no top level ';' other than a trailing one
+    """
+    return len([
+        statement for statement in split_top_level(sql, ';')
+        if statement.strip()
+    ]) == 1
+
+
+def update_as_select(query, dataset_id):
+    """
+    Express an UPDATE of a table in the dataset as a SELECT of the updated table
+
+    :param query: SQL text of an UPDATE statement
+    :param dataset_id: identifies the dataset being cleaned
+    :return: tuple of (table_id, select_query) or None if the UPDATE is not a
+        simple `UPDATE table SET ... WHERE ...` of a table in the dataset
+    """
+    match = UPDATE_PATTERN.match(query)
+    if not match or match.group(2) != dataset_id:
+        return None
+    table_ref, _, table_id, alias = match.groups()
+    remainder = query[match.end():].strip().rstrip(';')
+    where = find_top_level(WHERE_PATTERN, remainder)
+    if where is None:
+        return None
+    set_clause = remainder[:where.start()]
+    if find_top_level(FROM_PATTERN, set_clause):
+        # UPDATE ... FROM joins other tables
+        return None
+
+    assignments = []
+    for assignment in split_top_level(set_clause, ','):
+        assignment_match = ASSIGNMENT_PATTERN.match(assignment)
+        if not assignment_match:
+            return None
+        column, expression = assignment_match.groups()
+        assignments.append((column, expression.strip()))
+    if len({column for column, _ in assignments}) != len(assignments):
+        return None
+
+    return table_id, UPDATE_AS_SELECT_QUERY.render(
+        assignments=assignments,
+        condition=remainder[where.end():].strip(),
+        table_ref=table_ref,
+        alias=alias)
+
+
+def get_rewrite(query_dict, dataset_id):
+    """
+    Get the SELECT a query spec rewrites a table of the dataset with
+
+    :param query_dict: a query spec generated by a cleaning rule
+    :param dataset_id: identifies the dataset being cleaned
+    :return: tuple of (table_id, select_query, native) or None.  native is
+        False if the query spec is an UPDATE expressed as a SELECT.
+    """
+    query = query_dict.get(cdr_consts.QUERY) or ''
+    if query_dict.get(cdr_consts.LEGACY_SQL) or not is_single_statement(query):
+        return None
+
+    if query_dict.get(cdr_consts.DESTINATION_TABLE):
+        if (query_dict.get(cdr_consts.DESTINATION_DATASET) == dataset_id and
+                query_dict.get(
+                    cdr_consts.DISPOSITION) == bq_consts.WRITE_TRUNCATE and
+                SELECT_START_PATTERN.match(query)):
+            return (query_dict[cdr_consts.DESTINATION_TABLE],
+                    query.strip().rstrip(';'), True)
+        return None
+
+    match = CREATE_OR_REPLACE_PATTERN.match(query)
+    if match:
+        select_query = query[match.end():]
+        if match.group(2) == dataset_id and SELECT_START_PATTERN.match(
+                select_query):
+            return match.group(3), select_query.strip().rstrip(';'), True
+        return None
+
+    converted = update_as_select(query, dataset_id)
+    if converted:
+        return converted + (False,)
+    return None
+
+
+def replace_table_references(query, dataset_id, table_id, replacement):
+    """
+    Replace the references to a table in top level or nested SQL code
+
+    References without an alias are given the table name as alias, so
+    columns qualified by the table name still resolve.
+
+    :param query: SQL text
+    :param dataset_id: identifies the dataset of the table
+    :param table_id: identifies the table
+    :param replacement: SQL text replacing each reference, e.g. a CTE name
+        or a parenthesized subquery
+    :return: SQL text
+    """
+    pattern = re.compile(rf'(?<![\w.`-])`?(?:[\w-]+\.)?{re.escape(dataset_id)}'
+                         rf'\.{re.escape(table_id)}`?(?![\w-])')
+    depths = get_depths(query)
+    parts = []
+    last = 0
+    for match in pattern.finditer(query):
+        if depths[match.start()] is None:
+            continue
+        parts.append(query[last:match.start()])
+        parts.append(replacement)
+        if not ALIAS_PATTERN.match(query, match.end()):
+            parts.append(f' AS {table_id}')
+        last = match.end()
+    parts.append(query[last:])
+    return ''.join(parts)
+
+
+def get_rewrite_table(rule):
+    """
+    Get the table a rule declares its fusable rewrites are for
+
+    :param rule: tuple of (clazz, query_function, setup_function, rule_info)
+    :return: the table_id or None if the rule may not be fused
+    """
+    instance = getattr(rule[2], '__self__', None)
+    if (not isinstance(instance, BaseCleaningRule) or
+            not instance.fuse_rewrites or has_setup(rule[2])):
+        return None
+    tables = instance.affected_tables or []
+    return tables[0] if len(tables) == 1 else None
+
+
+class RuleChain:
+    """
+    Adjacent rules whose rewrites of the same table are fused
+    """
+
+    def __init__(self, dataset_id, table_id):
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+        self.rules = []
+        self.steps = []
+        self.query_list = []
+        self.touched = set()
+
+    @property
+    def rule_names(self):
+        return [rule[3][cdr_consts.MODULE_NAME] for rule in self.rules]
+
+    def get_rewrite_query(self, step_count=None):
+        """
+        Get the fused rewrite of the first step_count steps
+
+        :param step_count: number of steps to compose, all steps by default
+        :return: SQL text
+        """
+        steps = self.steps[:step_count]
+        step_queries = [steps[0][1]]
+        for step_no, (_, select_query, _) in enumerate(steps[1:], start=1):
+            step_queries.append(
+                replace_table_references(select_query, self.dataset_id,
+                                         self.table_id,
+                                         FUSED_STEP.format(step_no=step_no)))
+        return FUSED_REWRITE_QUERY.render(step_queries=step_queries)
+
+    def add_prefix_query(self, query_dict):
+        """
+        Add a query a rule runs ahead of its rewrites
+
+        :param query_dict: the query spec.  If rewrites of earlier rules
+            precede it, its references to the table read their fused result.
+        """
+        if not self.steps:
+            self.query_list.append(query_dict)
+            return
+        subquery = f'(\n{self.get_rewrite_query()}\n)'
+        self.query_list.append({
+            **query_dict, cdr_consts.QUERY:
+                replace_table_references(query_dict[cdr_consts.QUERY],
+                                         self.dataset_id, self.table_id,
+                                         subquery)
+        })
+
+    def get_fused_query(self):
+        """
+        Get the query spec running the fused rewrite
+
+        :return: a query spec writing the table with WRITE_TRUNCATE
+        """
+        return {
+            cdr_consts.QUERY: self.get_rewrite_query(),
+            cdr_consts.DESTINATION_DATASET: self.dataset_id,
+            cdr_consts.DESTINATION_TABLE: self.table_id,
+            cdr_consts.DISPOSITION: bq_consts.WRITE_TRUNCATE
+        }
+
+
+class FusionRun:
+    """
+    Adjacent rules declaring they rewrite the same table
+
+    The run yields one rule tuple per member.  The first member's query
+    function generates the query specs of the members, fuses the rewrites of
+    the longest prefix of members that can be fused and returns the fused
+    queries.  The members fused into it run no queries.  The remaining
+    members run their own query specs.
+    """
+
+    def __init__(self, fuser, table_id, rules):
+        """
+        :param fuser: the RuleChainFuser
+        :param table_id: identifies the table the rules rewrite
+        :param rules: list of (clazz, query_function, setup_function, rule_info)
+        """
+        self.fuser = fuser
+        self.table_id = table_id
+        self.rules = rules
+        self.chain = None
+        self.fused_count = 0
+        self.query_lists = {}
+
+    def _fuse(self):
+        chain = RuleChain(self.fuser.dataset_id, self.table_id)
+        for position, rule in enumerate(self.rules):
+            self.query_lists[position] = rule[1]()
+            if not self.fuser.add_rule(chain, rule, self.query_lists[position]):
+                break
+        self.chain = chain
+
+        if len(chain.rules) > 1 and any(native for _, _, native in chain.steps):
+            self.fuser.report(chain)
+            self.fused_count = len(chain.rules)
+        else:
+            LOGGER.info(f"Not fusing the rewrites of `{self.table_id}` by "
+                        f"{', '.join(self.chain.rule_names)}")
+
+    def get_query_list(self, position):
+        """
+        Get the query specs a member runs
+
+        :param position: index of the member in the run
+        :return: list of query specs
+        """
+        if self.chain is None:
+            self._fuse()
+        if position < self.fused_count:
+            if position > 0:
+                LOGGER.info(f"Rewrites of "
+                            f"{self.chain.rule_names[position]} ran fused "
+                            f"with {self.chain.rule_names[0]}")
+                return []
+            return self.chain.query_list + [self.chain.get_fused_query()]
+        if position in self.query_lists:
+            return self.query_lists.pop(position)
+        return self.rules[position][1]()
+
+    def as_rules(self):
+        """
+        Get the rule tuples the engine runs in place of the members
+
+        :return: generator of (clazz, query_function, setup_function, rule_info)
+        """
+        for position, (clazz, _, setup_function,
+                       rule_info) in enumerate(self.rules):
+            yield (clazz, partial(self.get_query_list,
+                                  position), setup_function, rule_info)
+
+
+class RuleChainFuser:
+    """
+    Replaces runs of adjacent rules rewriting the same table by fused rules
+    """
+
+    def __init__(self, client, dataset_id, sandbox_dataset_id):
+        """
+        :param client: a BigQueryClient, used to estimate the bytes saved
+        :param dataset_id: identifies the dataset being cleaned
+        :param sandbox_dataset_id: identifies the sandbox dataset
+        """
+        self.client = client
+        self.dataset_id = dataset_id
+        self.sandbox_dataset_id = sandbox_dataset_id
+        self.dataset_ids = {dataset_id, sandbox_dataset_id}
+        self.reports = []
+
+    def _is_valid_prefix(self, query_dict, chain):
+        touched, written = get_query_tables(query_dict, self.dataset_ids)
+        if is_opaque_query(query_dict, touched):
+            return False
+        if any(not table.startswith(f'{self.sandbox_dataset_id}.')
+               for table in written):
+            return False
+        # tables read by earlier members must keep their contents until the
+        # fused rewrite runs
+        return not written & chain.touched
+
+    def add_rule(self, chain, rule, query_list):
+        """
+        Add a rule to the chain if all its queries can be fused
+
+        :return: True if the rule was added
+        """
+        rewrites = [
+            get_rewrite(query_dict, self.dataset_id)
+            for query_dict in query_list
+        ]
+        first = next((index for index, rewrite in enumerate(rewrites)
+                      if rewrite is not None), None)
+        if first is None or any(rewrite is None or rewrite[0] != chain.table_id
+                                for rewrite in rewrites[first:]):
+            return False
+        prefix = query_list[:first]
+        if not all(
+                self._is_valid_prefix(query_dict, chain)
+                for query_dict in prefix):
+            return False
+
+        for query_dict in prefix:
+            chain.add_prefix_query(query_dict)
+        for query_dict, rewrite in zip(query_list[first:], rewrites[first:]):
+            chain.steps.append((query_dict, rewrite[1], rewrite[2]))
+        for query_dict in query_list:
+            chain.touched |= get_query_tables(query_dict, self.dataset_ids)[0]
+        chain.rules.append(rule)
+        return True
+
+    def _estimate(self, query_dict):
+        try:
+            return estimate_bytes(self.client, query_dict,
+                                  bigquery.QueryJobConfig())
+        except GoogleCloudError as exp:
+            LOGGER.warning(f'Unable to estimate the query cost: {exp}')
+            return None
+
+    def report(self, chain):
+        """
+        Log the rules fused by a chain and the estimated bytes saved
+
+        :param chain: the fused RuleChain
+        :return: dict describing the fusion
+        """
+        unfused = [
+            self._estimate(query_dict) for query_dict, _, _ in chain.steps
+        ]
+        fused = self._estimate({cdr_consts.QUERY: chain.get_rewrite_query()})
+        saved = None
+        if fused is not None and None not in unfused:
+            saved = sum(unfused) - fused
+        report = {
+            'rules': chain.rule_names,
+            'table': f'{self.dataset_id}.{chain.table_id}',
+            'unfused_rewrites': len(chain.steps),
+            'unfused_bytes': None if None in unfused else sum(unfused),
+            'fused_bytes': fused,
+            'saved_bytes': saved
+        }
+        LOGGER.info(f"Fused {len(chain.rules)} rules rewriting "
+                    f"`{report['table']}` into one rewrite instead of "
+                    f"{len(chain.steps)}: {', '.join(chain.rule_names)}.  "
+                    f"Estimated bytes processed "
+                    f"{format_bytes(report['fused_bytes'])} instead of "
+                    f"{format_bytes(report['unfused_bytes'])}, saving "
+                    f"{format_bytes(saved)}")
+        self.reports.append(report)
+        return report
+
+    def fuse(self, rules):
+        """
+        Generate the rules to run, fusing runs of adjacent rewrite rules
+
+        Runs of rules are found from the rules' metadata, see
+        get_rewrite_table.  No query specs are generated here.  The specs of
+        a run are generated when its first rule's query function is called.
+
+        :param rules: list of (clazz, query_function, setup_function, rule_info)
+        :return: generator of (clazz, query_function, setup_function, rule_info)
+        """
+        index = 0
+        while index < len(rules):
+            table_id = get_rewrite_table(rules[index])
+            end = index + 1
+            while (table_id and end < len(rules) and
+                   get_rewrite_table(rules[end]) == table_id):
+                end += 1
+
+            if end - index > 1:
+                yield from FusionRun(self, table_id,
+                                     rules[index:end]).as_rules()
+            else:
+                yield rules[index]
+            index = end
@@ -0,0 +1,83 @@
+"""
+Registry of the cleaning rules of each data stage, imported on first use.
+
+clean_cdr declares the cleaning rules of a data stage as the import paths of
+the rule classes or functions, in the order they run.  Importing all of the
+rule modules up front costs about a second per invocation, even when a single
+data stage is cleaned or only its queries are listed.  The RuleRegistry
+imports the rules of a data stage the first time the stage is looked up and
+keeps them, so only the rule modules of the stages actually used are loaded.
+"""
+# Python imports
+import importlib
+import threading
+from collections.abc import Mapping
+
+
+def import_rule(rule_path):
+    """
+    Import a cleaning rule class or function
+
+    :param rule_path: dotted import path of the rule,
+        e.g. 'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables'
+    :return: the rule class or function
+    :raises ImportError: if the module or the rule can not be imported
+    """
+    module_name, _, rule_name = rule_path.rpartition('.')
+    if not module_name:
+        raise ImportError(f'`{rule_path}` is not a rule import path')
+    module = importlib.import_module(module_name)
+    try:
+        return getattr(module, rule_name)
+    except AttributeError:
+        raise ImportError(
+            f'Module `{module_name}` has no cleaning rule `{rule_name}`'
+        ) from None
+
+
+class RuleRegistry(Mapping):
+    """
+    Read-only mapping of data stages to lists of cleaning rule tuples
+
+    The values have the form clean_cdr_engine expects, e.g.
+    [(CleanMappingExtTables,)].  Listing the data stages does not import
+    any rule.
+    """
+
+    def __init__(self, rule_paths):
+        """
+        :param rule_paths: dictionary of data stage values to lists of rule
+            import paths, in the order the rules run
+        """
+        self._rule_paths = {
+            data_stage: list(paths) for data_stage, paths in rule_paths.items()
+        }
+        self._rules = {}
+        self._lock = threading.Lock()
+
+    def get_rule_paths(self, data_stage):
+        """
+        Get the import paths of the rules of a data stage without importing
+
+        :param data_stage: value of a DataStage
+        :return: list of rule import paths
+        """
+        return list(self._rule_paths[data_stage])
+
+    def __getitem__(self, data_stage):
+        with self._lock:
+            if data_stage not in self._rules:
+                self._rules[data_stage] = [
+                    (import_rule(rule_path),)
+                    for rule_path in self._rule_paths[data_stage]
+                ]
+            return self._rules[data_stage]
+
+    def __contains__(self, data_stage):
+        return data_stage in self._rule_paths
+
+    def __iter__(self):
+        return iter(self._rule_paths)
+
+    def __len__(self):
+        return len(self._rule_paths)
@@ -0,0 +1,381 @@
+"""
+Dependency-aware scheduling of cleaning rule queries.
+
+By default the cleaning engine applies rules, and the queries of each rule,
+strictly one after another.  This module lets `clean_cdr_engine.clean_dataset`
+run independent rules and independent per-table queries at the same time,
+bounded by a concurrency cap, while still honoring the list order wherever
+two rules or two queries could affect each other.
+
+Dependencies are inferred from:
+    * each rule's `depends_on_classes`
+    * each rule's `affected_tables`
+    * the tables each query spec reads and writes within the dataset being
+      cleaned and its sandbox dataset
+
+A rule whose tables cannot be determined (a legacy function rule, a rule
+declaring no affected tables or a rule with a query using dynamic SQL or
+referencing no known tables) is a barrier.  It runs only after every
+rule listed before it and every rule listed after it waits for it.  A rule
+that implements `setup_rule` is set up only after all earlier rules finish,
+because setup may read tables earlier rules modify.  This preserves the
+ordering notes in `clean_cdr` (e.g. "should be one of the last cleaning rules
+run") since those rules read the tables rewritten by the rules before them.
+"""
+# Python imports
+import dis
+import logging
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Project imports
+from cdr_cleaner.cleaning_rules.base_cleaning_rule import BaseCleaningRule
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+
+LOGGER = logging.getLogger(__name__)
+
+# matches `project.dataset.table`, `dataset.table` and their unquoted forms.
+# sandbox table names may contain hyphens, e.g. issue numbers like dc-529
+TABLE_REFERENCE = r'`?(?:[\w-]+\.)?(\w+)\.([\w-]+)`?'
+TABLE_REFERENCE_PATTERN = re.compile(TABLE_REFERENCE)
+WRITE_REFERENCE_PATTERN = re.compile(
+    r'\b(?:CREATE(?:\s+OR\s+REPLACE)?\s+TABLE(?:\s+IF\s+NOT\s+EXISTS)?'
+    r'|INSERT(?:\s+INTO)?|DELETE(?:\s+FROM)?|UPDATE|MERGE(?:\s+INTO)?'
+    r'|TRUNCATE\s+TABLE|DROP\s+TABLE(?:\s+IF\s+EXISTS)?|ALTER\s+TABLE)\s+' +
+    TABLE_REFERENCE, re.IGNORECASE)
+DYNAMIC_SQL_PATTERN = re.compile(r'\bEXECUTE\s+IMMEDIATE\b', re.IGNORECASE)
+
+# instructions of a function body that only returns None, e.g. `pass`
+NOOP_INSTRUCTIONS = ([('LOAD_CONST', None),
+                      ('RETURN_VALUE', None)], [('RETURN_CONST', None)])
+
+
+def has_setup(setup_function) -> bool:
+    """
+    Determine if a rule's setup function does any work
+
+    :param setup_function: a rule's setup_rule method or the legacy stand-in
+    :return: False if the function body is empty (e.g. only `pass`), True otherwise
+    """
+    if getattr(setup_function, '__code__', None) is None:
+        return False
+    # compare instructions rather than raw bytecode since a docstring shifts
+    # the index of the None constant
+    instructions = [(instruction.opname, instruction.argval)
+                    for instruction in dis.get_instructions(setup_function)
+                    if instruction.opname not in ('RESUME', 'NOP')]
+    return instructions not in NOOP_INSTRUCTIONS
+
+
+def get_query_tables(query_dict, dataset_ids):
+    """
+    Get the tables a query spec references and the tables it writes
+
+    Only tables within `dataset_ids` are reported, other datasets are not
+    modified by the cleaning run.
+
+    :param query_dict: a query spec generated by a cleaning rule
+    :param dataset_ids: ids of the datasets whose tables are tracked
+    :return: tuple of (referenced, written) sets of 'dataset_id.table_id' strings
+    """
+    query = query_dict.get(cdr_consts.QUERY) or ''
+    referenced = {
+        f'{dataset}.{table}'
+        for dataset, table in TABLE_REFERENCE_PATTERN.findall(query)
+        if dataset in dataset_ids
+    }
+    written = {
+        f'{dataset}.{table}'
+        for dataset, table in WRITE_REFERENCE_PATTERN.findall(query)
+        if dataset in dataset_ids
+    }
+    if query_dict.get(cdr_consts.DESTINATION_TABLE):
+        written.add(f'{query_dict.get(cdr_consts.DESTINATION_DATASET)}.'
+                    f'{query_dict[cdr_consts.DESTINATION_TABLE]}')
+    return referenced | written, written
+
+
+def is_opaque_query(query_dict, referenced) -> bool:
+    """
+    Determine if the tables affected by a query cannot be inferred from its text
+
+    :param query_dict: a query spec generated by a cleaning rule
+    :param referenced: tables the query is known to reference
+    :return: True if the query uses dynamic SQL or references no known tables
+    """
+    query = query_dict.get(cdr_consts.QUERY) or ''
+    return not referenced or bool(DYNAMIC_SQL_PATTERN.search(query))
+
+
+def tables_conflict(touched_a, written_a, touched_b, written_b) -> bool:
+    """
+    Determine if two units of work must keep their relative order
+
+    :return: True if either one writes a table the other reads or writes
+    """
+    return bool(written_a & touched_b or written_b & touched_a)
+
+
+class QueryNode:
+    """
+    A single query spec and the queries it must wait for
+    """
+
+    def __init__(self, rule_index, query_no, query_dict, touched, written,
+                 opaque):
+        self.rule_index = rule_index
+        self.query_no = query_no
+        self.query_dict = query_dict
+        self.touched = touched
+        self.written = written
+        self.opaque = opaque
+        self.deps = set()
+
+    @property
+    def key(self):
+        return self.rule_index, self.query_no
+
+
+class RuleNode:
+    """
+    A cleaning rule, the tables it touches and its query nodes
+    """
+
+    def __init__(self, index, clazz, query_function, setup_function, rule_info,
+                 dataset_id):
+        self.index = index
+        self.clazz = clazz
+        self.query_function = query_function
+        self.setup_function = setup_function
+        self.rule_info = rule_info
+        instance = getattr(query_function, '__self__', None)
+        if instance is None:
+            # the query function may wrap the rule's get_query_specs
+            instance = getattr(rule_info.get(cdr_consts.QUERY_FUNCTION),
+                               '__self__', None)
+        if isinstance(instance, BaseCleaningRule):
+            self.instance = instance
+            self.depends_on = list(instance.depends_on_classes or [])
+        else:
+            self.instance = None
+            self.depends_on = []
+        self.declared = self._declared_tables(dataset_id)
+        self.is_barrier = not self.declared
+        self.needs_setup = has_setup(setup_function)
+        self.touched = set(self.declared)
+        self.written = set(self.declared)
+        self.queries = []
+        self.deps = set()
+
+    def _declared_tables(self, dataset_id):
+        if self.instance is None:
+            return set()
+        return {
+            f'{dataset_id}.{table}'
+            for table in (self.instance.affected_tables or [])
+        }
+
+    @property
+    def name(self):
+        return self.rule_info[cdr_consts.MODULE_NAME]
+
+
+class RuleScheduler:
+    """
+    Runs cleaning rules concurrently while honoring their inferred dependencies
+    """
+
+    def __init__(self,
+                 client,
+                 dataset_id,
+                 sandbox_dataset_id,
+                 run_query,
+                 max_concurrency,
+                 ledger=None,
+                 catalog=None):
+        """
+        :param client: a BigQueryClient
+        :param dataset_id: identifies the dataset being cleaned
+        :param sandbox_dataset_id: identifies the sandbox dataset
+        :param run_query: callable(client, query_dict, rule_info, query_no,
+            query_count) that runs one query spec and returns its finished job
+        :param max_concurrency: maximum number of queries running at one time
+        :param ledger: an optional run_ledger.RunLedger.  Completed rules and
+            queries are recorded in it and work it lists as complete is skipped.
+        :param catalog: an optional dataset_catalog.DatasetCatalog the rules
+            look up tables in.  It is reloaded after a rule's setup.
+        """
+        if max_concurrency < 1:
+            raise ValueError(
+                f'max_concurrency must be at least 1, got {max_concurrency}')
+        self.client = client
+        self.dataset_id = dataset_id
+        self.dataset_ids = {dataset_id, sandbox_dataset_id}
+        self.run_query = run_query
+        self.max_concurrency = max_concurrency
+        self.ledger = ledger
+        self.catalog = catalog
+        self.rules = []
+        self.done = set()
+
+    def is_rule_done(self, rule):
+        return all(query.key in self.done for query in rule.queries)
+
+    def setup_gate(self, rule):
+        """
+        Get the earlier rules that must finish before `rule` can be set up
+
+        :param rule: the RuleNode to set up next
+        :return: set of indexes of earlier rules
+        """
+        earlier = self.rules[:rule.index]
+        if rule.is_barrier or rule.needs_setup:
+            return {other.index for other in earlier}
+        return {
+            other.index for other in earlier if other.is_barrier or
+            other.clazz in rule.depends_on or other.declared & rule.declared
+        }
+
+    def plan(self, rule):
+        """
+        Set up a rule, generate its query specs and attach their dependencies
+
+        :param rule: the RuleNode to plan.  All rules before it are planned.
+        """
+        rule.setup_function(self.client)
+        if self.catalog and rule.needs_setup:
+            self.catalog.invalidate_all()
+        query_list = rule.query_function()
+        if self.ledger and self.ledger.is_rule_complete(rule.name, query_list):
+            LOGGER.info(f"Skipping cleaning rule {rule.name} "
+                        f"{rule.index + 1}/{len(self.rules)}, it completed "
+                        f"in a previous run")
+            return
+
+        LOGGER.info(f"Applying cleaning rule {rule.name} "
+                    f"{rule.index + 1}/{len(self.rules)}")
+        for query_no, query_dict in enumerate(query_list):
+            touched, written = get_query_tables(query_dict, self.dataset_ids)
+            node = QueryNode(rule.index, query_no, query_dict, touched, written,
+                             is_opaque_query(query_dict, touched))
+            if self.ledger and self.ledger.is_query_complete(
+                    rule.name, query_no, query_dict):
+                LOGGER.info(f"Skipping query {query_no + 1}/{len(query_list)} "
+                            f"of {rule.name}, it completed in a previous run")
+                self.done.add(node.key)
+            for previous in rule.queries:
+                if (node.opaque or previous.opaque or
+                        tables_conflict(node.touched, node.written,
+                                        previous.touched, previous.written)):
+                    node.deps.add(previous.key)
+            rule.queries.append(node)
+            rule.touched |= touched
+            rule.written |= written
+
+        if any(query.opaque for query in rule.queries):
+            # an opaque query may write any table, so the rule waits for all
+            # earlier rules and all later rules wait for it
+            rule.is_barrier = True
+        rule.deps = self.setup_gate(rule) | {
+            other.index for other in self.rules[:rule.index] if tables_conflict(
+                rule.touched, rule.written, other.touched, other.written)
+        }
+        upstream = {
+            query.key
+            for index in rule.deps
+            for query in self.rules[index].queries
+        }
+        for query in rule.queries:
+            query.deps |= upstream
+
+        if self.is_rule_done(rule):
+            self.complete_rule(rule)
+
+    def complete_rule(self, rule):
+        """
+        Log and record a rule whose queries have all finished
+
+        :param rule: the finished RuleNode
+        """
+        LOGGER.info(f"For clean rule {rule.name}, {len(rule.queries)} jobs "
+                    f"were run successfully for {len(rule.queries)} queries")
+        if self.ledger:
+            self.ledger.record_rule(
+                rule.index, rule.name,
+                [query.query_dict for query in rule.queries])
+
+    def run(self, rules):
+        """
+        Run the rules and return their jobs in rule and query order
+
+        :param rules: list of (clazz, query_function, setup_function, rule_info)
+        :return: list of BigQuery job objects
+        :raises: the first exception raised by a query, after jobs already
+            running have finished
+        """
+        self.rules = [
+            RuleNode(index, clazz, query_function, setup_function, rule_info,
+                     self.dataset_id)
+            for index, (clazz, query_function, setup_function,
+                        rule_info) in enumerate(rules)
+        ]
+        jobs = {}
+        pending = []
+        running = {}
+        failure = None
+        next_rule = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while True:
+                while (failure is None and next_rule < len(self.rules) and all(
+                        self.is_rule_done(self.rules[index])
+                        for index in self.setup_gate(self.rules[next_rule]))):
+                    rule = self.rules[next_rule]
+                    self.plan(rule)
+                    pending.extend(query for query in rule.queries
+                                   if query.key not in self.done)
+                    next_rule += 1
+
+                if failure is None:
+                    for node in list(pending):
+                        if len(running) >= self.max_concurrency:
+                            break
+                        if node.deps <= self.done:
+                            pending.remove(node)
+                            rule = self.rules[node.rule_index]
+                            future = executor.submit(self.run_query,
+                                                     self.client,
+                                                     node.query_dict,
+                                                     rule.rule_info,
+                                                     node.query_no,
+                                                     len(rule.queries))
+                            running[future] = node
+
+                if not running:
+                    if failure is None and (pending or
+                                            next_rule < len(self.rules)):
+                        raise RuntimeError(
+                            'Unable to schedule the remaining cleaning rules')
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    node = running.pop(future)
+                    try:
+                        jobs[node.key] = future.result()
+                    except Exception as exp:
+                        failure = failure or exp
+                    else:
+                        self.done.add(node.key)
+                        rule = self.rules[node.rule_index]
+                        if self.ledger:
+                            self.ledger.record_query(rule.index, rule.name,
+                                                     node.query_no,
+                                                     node.query_dict,
+                                                     jobs[node.key])
+                        if self.is_rule_done(rule):
+                            self.complete_rule(rule)
+
+        if failure is not None:
+            raise failure
+        return [jobs[key] for key in sorted(jobs)]
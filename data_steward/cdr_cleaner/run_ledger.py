@@ -0,0 +1,424 @@
+"""
+Checkpoint ledger for resumable cleaning runs.
+
+The cleaning engine records every completed query and rule in a ledger.  When
+a run fails partway through a data stage, rerunning `clean_cdr` with
+`--resume` skips rules and queries the ledger lists as complete and picks up
+at the first unfinished query.  Entries are identified by the rule's module
+name and a hash of its query specs, not by the rule's position, so they still
+match when rules are combined or fused.
+
+Two backends are available:
+    * LocalRunLedger stores the entries in a local JSON file
+    * BigQueryRunLedger stores the entries in a BigQuery table, by default in
+      the sandbox dataset
+"""
+# Python imports
+import hashlib
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime, timezone
+
+# Third party imports
+from google.cloud import bigquery
+
+# Project imports
+from common import JINJA_ENV
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+
+LOGGER = logging.getLogger(__name__)
+
+LEDGER_TABLE = 'cleaning_run_ledger'
+QUERY_ENTRY = 'query'
+RULE_ENTRY = 'rule'
+
+LEDGER_ENTRIES_QUERY = JINJA_ENV.from_string("""
+SELECT * EXCEPT (completed_at),
+  FORMAT_TIMESTAMP('%Y-%m-%dT%H:%M:%E6S%Ez', completed_at) AS completed_at
+FROM `{{project_id}}.{{ledger_dataset_id}}.{{ledger_table_id}}`
+WHERE project_id = '{{project_id}}'
+AND dataset_id = '{{dataset_id}}'
+ORDER BY completed_at
+""")
+
+DELETE_LEDGER_ENTRIES_QUERY = JINJA_ENV.from_string("""
+DELETE FROM `{{project_id}}.{{ledger_dataset_id}}.{{ledger_table_id}}`
+WHERE project_id = '{{project_id}}'
+AND dataset_id = '{{dataset_id}}'
+""")
+
+
+def get_query_hash(query_dict) -> str:
+    """
+    Get a stable hash identifying a query spec
+
+    :param query_dict: a query spec generated by a cleaning rule
+    :return: hex digest of the query text and its destination settings
+    """
+    key = json.dumps([
+        query_dict.get(cdr_consts.QUERY),
+        query_dict.get(cdr_consts.DESTINATION_DATASET),
+        query_dict.get(cdr_consts.DESTINATION_TABLE),
+        query_dict.get(cdr_consts.DISPOSITION)
+    ],
+                     default=str)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def get_rule_hash(query_list) -> str:
+    """
+    Get a stable hash identifying the query specs of a rule
+
+    :param query_list: the query specs generated by a cleaning rule
+    :return: hex digest of the hashes of the query specs
+    """
+    key = json.dumps([get_query_hash(query_dict) for query_dict in query_list])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class RunLedger(ABC):
+    """
+    Records completed rules and queries of a cleaning run
+
+    Entries are buffered and written when a rule completes or the ledger is
+    flushed.  An entry of a previous attempt marks a single occurrence of the
+    rule or query as complete, so a rule listed twice in a data stage is only
+    skipped as often as it completed.
+    """
+
+    # write each entry as soon as it is recorded instead of once per rule
+    flush_each_entry = False
+
+    def __init__(self, project_id, dataset_id):
+        """
+        :param project_id: identifies the project containing the dataset
+        :param dataset_id: identifies the dataset being cleaned
+        """
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self._lock = threading.Lock()
+        self._entries = []
+        self._pending = []
+        self._completed_queries = Counter()
+        self._completed_rules = Counter()
+
+    @abstractmethod
+    def read_entries(self) -> list:
+        """
+        Read the entries stored by the backend for this dataset
+        """
+        pass
+
+    @abstractmethod
+    def write_entries(self, entries):
+        """
+        Durably store entries recorded since the last write, in one write
+        """
+        pass
+
+    @abstractmethod
+    def clear_entries(self):
+        """
+        Remove all entries stored by the backend for this dataset
+        """
+        pass
+
+    def load(self):
+        """
+        Load existing entries so completed work can be skipped
+        """
+        with self._lock:
+            self._entries = self.read_entries()
+            self._pending = []
+            self._completed_queries = Counter()
+            self._completed_rules = Counter()
+            for entry in self._entries:
+                if entry['entry_type'] == QUERY_ENTRY:
+                    self._completed_queries[(entry['rule_name'],
+                                             entry['query_no'],
+                                             entry['query_hash'])] += 1
+                elif entry['entry_type'] == RULE_ENTRY:
+                    self._completed_rules[(entry['rule_name'],
+                                           entry['query_hash'])] += 1
+        LOGGER.info(f"Loaded {len(self._entries)} entries from the cleaning "
+                    f"run ledger for `{self.project_id}.{self.dataset_id}`")
+
+    def reset(self):
+        """
+        Start a new run, discarding any entries of a previous run
+        """
+        with self._lock:
+            self.clear_entries()
+            self._entries = []
+            self._pending = []
+            self._completed_queries = Counter()
+            self._completed_rules = Counter()
+
+    @property
+    def entries(self):
+        return list(self._entries)
+
+    def _record(self, entry):
+        entry.update({
+            'project_id': self.project_id,
+            'dataset_id': self.dataset_id,
+            'completed_at': datetime.now(timezone.utc).isoformat()
+        })
+        with self._lock:
+            self._entries.append(entry)
+            self._pending.append(entry)
+            if self.flush_each_entry:
+                self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self.write_entries(self._pending)
+            self._pending = []
+
+    def flush(self):
+        """
+        Write the entries recorded since the last write
+        """
+        with self._lock:
+            self._flush()
+
+    @staticmethod
+    def _consume(completed, key) -> bool:
+        if completed[key] < 1:
+            return False
+        completed[key] -= 1
+        return True
+
+    def is_rule_complete(self, rule_name, query_list) -> bool:
+        """
+        Determine if all queries of a rule completed in a previous attempt
+
+        If so, the rule's completed queries are consumed too.
+
+        :param rule_name: module name of the rule
+        :param query_list: the query specs generated by the rule.  A rule
+            whose query specs changed is not complete.
+        """
+        with self._lock:
+            if not self._consume(self._completed_rules,
+                                 (rule_name, get_rule_hash(query_list))):
+                return False
+            for query_no, query_dict in enumerate(query_list):
+                self._consume(self._completed_queries,
+                              (rule_name, query_no, get_query_hash(query_dict)))
+            return True
+
+    def is_query_complete(self, rule_name, query_no, query_dict) -> bool:
+        """
+        Determine if the query completed in a previous attempt
+
+        :param rule_name: module name of the rule
+        :param query_no: position of the query in the rule's query specs
+        :param query_dict: the query spec.  A changed query is not complete.
+        """
+        with self._lock:
+            return self._consume(
+                self._completed_queries,
+                (rule_name, query_no, get_query_hash(query_dict)))
+
+    def record_query(self, rule_index, rule_name, query_no, query_dict,
+                     query_job):
+        """
+        Record a completed query
+
+        :param rule_index: position of the rule in the list of rules being
+            run, for reference
+        :param rule_name: module name of the rule
+        :param query_no: position of the query in the rule's query specs
+        :param query_dict: the query spec
+        :param query_job: the completed BigQuery job
+        """
+        destination = getattr(query_job, 'destination', None)
+        total_rows = None
+        if destination is not None:
+            try:
+                total_rows = query_job.result().total_rows
+            except Exception:
+                LOGGER.warning(
+                    f"Unable to read the row count of job {query_job.job_id}")
+        self._record({
+            'entry_type':
+                QUERY_ENTRY,
+            'rule_index':
+                rule_index,
+            'rule_name':
+                rule_name,
+            'query_no':
+                query_no,
+            'query_hash':
+                get_query_hash(query_dict),
+            'query_count':
+                None,
+            'job_id':
+                query_job.job_id,
+            'destination_table':
+                (f'{destination.project}.'
+                 f'{destination.dataset_id}.'
+                 f'{destination.table_id}' if destination is not None else None
+                ),
+            'num_dml_affected_rows':
+                getattr(query_job, 'num_dml_affected_rows', None),
+            'total_rows':
+                total_rows
+        })
+
+    def record_rule(self, rule_index, rule_name, query_list):
+        """
+        Record that every query of a rule completed and write the entries
+
+        :param rule_index: position of the rule in the list of rules being
+            run, for reference
+        :param rule_name: module name of the rule
+        :param query_list: the query specs the rule generated
+        """
+        self._record({
+            'entry_type': RULE_ENTRY,
+            'rule_index': rule_index,
+            'rule_name': rule_name,
+            'query_no': None,
+            'query_hash': get_rule_hash(query_list),
+            'query_count': len(query_list),
+            'job_id': None,
+            'destination_table': None,
+            'num_dml_affected_rows': None,
+            'total_rows': None
+        })
+        self.flush()
+
+
+class LocalRunLedger(RunLedger):
+    """
+    A ledger stored in a local JSON file
+    """
+
+    # rewriting the local file is cheap, so every entry is written at once
+    flush_each_entry = True
+
+    def __init__(self, project_id, dataset_id, filepath):
+        """
+        :param project_id: identifies the project containing the dataset
+        :param dataset_id: identifies the dataset being cleaned
+        :param filepath: path of the JSON file holding the ledger
+        """
+        super().__init__(project_id, dataset_id)
+        self.filepath = filepath
+
+    def read_entries(self):
+        if not os.path.exists(self.filepath):
+            return []
+        with open(self.filepath, 'r') as fp:
+            ledger = json.load(fp)
+        if (ledger.get('project_id'),
+                ledger.get('dataset_id')) != (self.project_id, self.dataset_id):
+            raise RuntimeError(
+                f"Ledger `{self.filepath}` belongs to "
+                f"`{ledger.get('project_id')}.{ledger.get('dataset_id')}`, "
+                f"not `{self.project_id}.{self.dataset_id}`")
+        return ledger.get('entries', [])
+
+    def _dump(self, entries):
+        tmp_path = f'{self.filepath}.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(
+                {
+                    'project_id': self.project_id,
+                    'dataset_id': self.dataset_id,
+                    'entries': entries
+                },
+                fp,
+                indent=2)
+        os.replace(tmp_path, self.filepath)
+
+    def write_entries(self, entries):
+        self._dump(self._entries)
+
+    def clear_entries(self):
+        self._dump([])
+
+
+class BigQueryRunLedger(RunLedger):
+    """
+    A ledger stored in a BigQuery table
+    """
+
+    def __init__(self,
+                 client,
+                 dataset_id,
+                 ledger_dataset_id,
+                 ledger_table_id=LEDGER_TABLE):
+        """
+        :param client: a BigQueryClient
+        :param dataset_id: identifies the dataset being cleaned
+        :param ledger_dataset_id: identifies the dataset holding the ledger table
+        :param ledger_table_id: identifies the ledger table
+        """
+        super().__init__(client.project, dataset_id)
+        self.client = client
+        self.ledger_dataset_id = ledger_dataset_id
+        self.ledger_table_id = ledger_table_id
+        self.fq_table_id = (f'{client.project}.{ledger_dataset_id}.'
+                            f'{ledger_table_id}')
+
+    def _render(self, template):
+        return template.render(project_id=self.project_id,
+                               dataset_id=self.dataset_id,
+                               ledger_dataset_id=self.ledger_dataset_id,
+                               ledger_table_id=self.ledger_table_id)
+
+    def _ensure_table(self):
+        table = bigquery.Table(
+            self.fq_table_id, schema=self.client.get_table_schema(LEDGER_TABLE))
+        self.client.create_table(table, exists_ok=True)
+
+    def read_entries(self):
+        self._ensure_table()
+        rows = self.client.query(self._render(LEDGER_ENTRIES_QUERY)).result()
+        return [dict(row.items()) for row in rows]
+
+    def write_entries(self, entries):
+        # a load job avoids the streaming buffer, which would block the
+        # DELETE issued by clear_entries for rows written in the last minutes.
+        # Entries are buffered per rule, so there is one load job per rule.
+        job_config = bigquery.LoadJobConfig(
+            schema=self.client.get_table_schema(LEDGER_TABLE),
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND)
+        self.client.load_table_from_json(entries,
+                                         self.fq_table_id,
+                                         job_config=job_config).result()
+
+    def clear_entries(self):
+        self._ensure_table()
+        self.client.query(self._render(DELETE_LEDGER_ENTRIES_QUERY)).result()
+
+
+def get_run_ledger(client,
+                   dataset_id,
+                   sandbox_dataset_id,
+                   ledger_file=None,
+                   ledger_table=False):
+    """
+    Get the ledger backend for a cleaning run
+
+    :param client: a BigQueryClient
+    :param dataset_id: identifies the dataset being cleaned
+    :param sandbox_dataset_id: identifies the sandbox dataset, which holds the
+        ledger table
+    :param ledger_file: path of a local JSON ledger file.  Takes precedence
+        over ledger_table.
+    :param ledger_table: if True, use a ledger table in the sandbox dataset
+    :return: a RunLedger or None if no ledger was requested
+    """
+    if ledger_file:
+        return LocalRunLedger(client.project, dataset_id, ledger_file)
+    if ledger_table:
+        return BigQueryRunLedger(client, dataset_id, sandbox_dataset_id)
+    return None
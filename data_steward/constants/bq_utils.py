@@ -2,6 +2,8 @@
 SOCKET_TIMEOUT = 600000
 BQ_DEFAULT_RETRY_COUNT = 10
 MAX_POLL_INTERVAL = 500
+# number of job status requests sent in one batched http request
+JOB_BATCH_SIZE = 50
 # Maximum results returned by list_tables (API has a low default value)
 LIST_TABLES_MAX_RESULTS = 10000
 DATE_FORMAT = '%Y%m%d'
@@ -29,6 +31,9 @@ PAGE_TOKEN = 'pageToken'
 JOB_REFERENCE = 'jobReference'
 JOB_ID = 'jobId'
 ROWS = 'rows'
+TOTAL_ROWS = 'totalRows'
+JOB_COMPLETE = 'jobComplete'
+LOCATION = 'location'
 SCHEMA = 'schema'
 FIELDS = 'fields'
 DATASET_REF = 'datasetReference'
@@ -61,12 +66,6 @@ VALIDATION_DATASET_FORMAT = 'validation_{}'
 VALIDATION_DATASET_REGEX = 'validation_\d{8}'
 VALIDATION_DATE_FORMAT = '%Y%m%d'
 
-INSERT_QUERY = """
-INSERT INTO `{project_id}.{dataset_id}.{table_id}`
-  ({columns})
-VALUES {mapping_list}
-"""
-
 GET_HPO_CONTENTS_QUERY = """
 SELECT *
 FROM `{project_id}.{TABLES_DATASET_ID}.{HPO_SITE_TABLE}`
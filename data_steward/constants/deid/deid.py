@@ -1 +1,4 @@
 MAX_AGE = 89
+
+# number of tables de-identified at the same time
+DEID_MAX_WORKERS = 5
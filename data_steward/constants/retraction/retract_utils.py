@@ -11,3 +11,6 @@ FROM `{pid_source}`)
 """
 
 TRUE = 'true'
+
+# number of retraction queries running at the same time
+RETRACTION_MAX_WORKERS = 10
@@ -13,15 +13,15 @@ HPO_ID = 'HPO_ID'
 BUCKET_NAME = 'bucket_name'
 HPO_STATE = 'state'
 
-# Query to select bucket name
-SELECT_BUCKET_NAME_QUERY = """
+# Query to select the bucket names of all hpo sites for a service
+SELECT_HPO_BUCKET_NAMES_QUERY = """
 SELECT
+  LOWER(hpo_id) AS hpo_id,
   bucket_name
 FROM
   `{{project_id}}.{{dataset_id}}.{{table_id}}`
 WHERE
-  LOWER(hpo_id) = LOWER('{{hpo_id}}')
-  AND LOWER(service) = LOWER('{{service}}')
+  LOWER(service) = LOWER('{{service}}')
 """
 
 # Validation dataset prefix
@@ -36,8 +36,19 @@ SELECT *
 FROM `{{project_id}}.{{dataset_id}}.INFORMATION_SCHEMA.COLUMNS`
 """
 
+# Query to list the columns and table types of all tables within a dataset
+DATASET_SCHEMA_QUERY = """
+SELECT c.table_name, c.column_name, t.table_type
+FROM `{{project_id}}.{{dataset_id}}.INFORMATION_SCHEMA.COLUMNS` c
+JOIN `{{project_id}}.{{dataset_id}}.INFORMATION_SCHEMA.TABLES` t
+USING (table_name)
+ORDER BY c.table_name, c.ordinal_position
+"""
+
 TABLE_NAME = 'table_name'
 COLUMN_NAME = 'column_name'
+TABLE_TYPE = 'table_type'
+VIEW = 'VIEW'
 
 #Create or Replace Table query
 CREATE_OR_REPLACE_TABLE_QUERY = """
@@ -78,3 +89,10 @@ GET_HPO_CONTENTS_QUERY = """
 SELECT *
 FROM `{project_id}.{TABLES_DATASET_ID}.{HPO_SITE_TABLE}`
 """
+
+# Job waiter poll intervals in seconds.  The interval resets to the minimum
+# whenever a poll finds finished jobs and grows by the backoff factor otherwise
+JOB_POLL_MIN_INTERVAL = 0.5
+JOB_POLL_MAX_INTERVAL = 60
+JOB_POLL_BACKOFF = 1.5
+JOB_STATES_UNFINISHED = ['pending', 'running']
@@ -30,3 +30,9 @@ GENDER_CONSTANT_FACTOR = 1 * CONCEPT_CONSTANT_FACTOR
 RACE_CONSTANT_FACTOR = 2 * CONCEPT_CONSTANT_FACTOR
 DOB_CONSTANT_FACTOR = 3 * CONCEPT_CONSTANT_FACTOR
 ETHNICITY_CONSTANT_FACTOR = 4 * CONCEPT_CONSTANT_FACTOR
+
+# number of mapping and load queries running at the same time
+EHR_UNION_MAX_WORKERS = 10
+
+# submission tables read by the last successful union, used by incremental runs
+EHR_UNION_SOURCES = '_ehr_union_sources'
@@ -21,6 +21,16 @@ DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S %Z'
 # lag before submission is processed
 SUBMISSION_LAG_TIME_MINUTES = 5
 
+# number of hpo sites validate_all_hpos processes at the same time.
+# overridden by the VALIDATION_MAX_WORKERS environment variable
+VALIDATION_MAX_WORKERS_VAR = 'VALIDATION_MAX_WORKERS'
+DEFAULT_VALIDATION_MAX_WORKERS = 4
+
+# number of metric queries generate_metrics runs at the same time
+METRICS_MAX_WORKERS = 8
+# key of the metric task run for its side effects only
+PARTICIPANT_VALIDATION_TASK = '_participant_validation'
+
 # Table Headers
 RESULT_FILE_HEADERS = ["File Name", "Found", "Parsed", "Loaded"]
 ERROR_FILE_HEADERS = ["File Name", "Message"]
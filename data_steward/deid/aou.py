@@ -76,12 +76,10 @@ DESIGN:
 import json
 import logging
 import os
-import time
 from copy import copy
 from datetime import datetime
 
 # Third party imports
-import numpy as np
 import pandas as pd
 from google.cloud import bigquery as bq
 from google.oauth2 import service_account
@@ -139,6 +137,153 @@ def create_concept_id_lookup_table(client, input_dataset, credentials):
                 if_exists='replace')
 
 
+def read_dataframe(client, credentials, sql, query_config=None):
+    """
+    Execute a query to a data-frame
+
+    :param client: a BigQueryClient
+    :param credentials: bigquery credentials
+    :param sql: the query to execute
+    :param query_config: optional query job configuration
+    :return: the query results, an empty data-frame if the query failed
+    """
+    try:
+        if query_config:
+            df = pd.read_gbq(sql,
+                             project_id=client.project,
+                             credentials=credentials,
+                             dialect='standard',
+                             configuration=query_config)
+        else:
+            df = pd.read_gbq(sql,
+                             project_id=client.project,
+                             credentials=credentials,
+                             dialect='standard')
+
+        return df
+    except Exception:
+        LOGGER.exception(f"Unable to execute the query:\t{sql}")
+
+    return pd.DataFrame()
+
+
+def check_participant_ages(client,
+                           credentials,
+                           input_dataset,
+                           age_limit=MAX_AGE) -> bool:
+    """
+    Verify the mapping table only contains participants within age limits
+
+    :param client: a BigQueryClient
+    :param credentials: bigquery credentials
+    :param input_dataset: input dataset containing the person and _deid_map tables
+    :param age_limit: maximum allowable age of participants
+    :return: True if age eligible participants and no age ineligible
+        participants are in the mapping table
+    """
+    LOGGER.info(f"Using participant age limit of {age_limit}")
+    map_tablename = input_dataset + "._deid_map"
+
+    # ensure mapping table only contains participants within age limits
+    sql = (
+        f"SELECT DISTINCT p.person_id, "
+        f"{PIPELINE_TABLES}.calculate_age(CURRENT_DATE, EXTRACT(DATE FROM birth_datetime)) AS age "
+        f"FROM {input_dataset}.person AS p "
+        f"JOIN {map_tablename} AS map "
+        f"USING (person_id) "
+        f"ORDER BY age")
+    job_config = {'query': {'defaultDataset': {'datasetId': input_dataset}}}
+    person_table = read_dataframe(client,
+                                  credentials,
+                                  sql,
+                                  query_config=job_config)
+    LOGGER.info(f"possible patient count is:\t{person_table.shape[0]}")
+
+    # ensure age eligible participants exist in the mapping table
+    eligible_person_table = person_table[person_table.age < age_limit]
+    if eligible_person_table.shape[0] < 1:
+        LOGGER.error(
+            f"Unable to initialize Deid. {map_tablename} table cannot be "
+            f"joined to {input_dataset}.person table to verify age requirements."
+        )
+
+    # ensure no age ineligible participants are available in the mapping table
+    ineligible_person_table = person_table[person_table.age >= age_limit]
+    if ineligible_person_table.shape[0] > 0:
+        LOGGER.error(f"{ineligible_person_table.shape[0]} age ineligible "
+                     f"participants are available in "
+                     f"{map_tablename}.  Deid is bailing out!!")
+
+    LOGGER.info(f"map table contains {eligible_person_table.shape[0]} "
+                f"records.")
+
+    return eligible_person_table.shape[0] > 0 and ineligible_person_table.shape[
+        0] < 1
+
+
+def initialize_run(client,
+                   credentials,
+                   input_dataset,
+                   age_limit=MAX_AGE) -> bool:
+    """
+    Do the initialization that does not depend on the table being de-identified
+
+    Creates the concept_id lookup table for suppressions and verifies the
+    ages of the participants in the mapping table.
+
+    :param client: a BigQueryClient
+    :param credentials: bigquery credentials
+    :param input_dataset: input dataset containing the person and _deid_map tables
+    :param age_limit: maximum allowable age of participants
+    :return: True if deid can run on the input dataset
+    """
+    # Create concept_id lookup table for suppressions
+    create_concept_id_lookup_table(client, input_dataset, credentials)
+    return check_participant_ages(client, credentials, input_dataset, age_limit)
+
+
+def create_output_dataset(client, output_dataset):
+    """
+    Create the output dataset if it does not exist
+
+    :param client: a BigQueryClient
+    :param output_dataset: name of the output dataset
+    """
+    dataset = bq.Dataset(client.dataset(output_dataset))
+    client.create_dataset(dataset, exists_ok=True)
+
+
+def prepare_run(run_as_email,
+                input_dataset,
+                output_dataset,
+                age_limit=MAX_AGE) -> dict:
+    """
+    Do the work shared by all tables of a deid run once
+
+    :param run_as_email: service account email address to impersonate
+    :param input_dataset: name of the input dataset
+    :param output_dataset: name of the output dataset
+    :param age_limit: maximum allowable age of participants
+    :return: keyword arguments for main, sharing the credentials, the client
+        and the initialization with each table's AOU instance
+    :raises RuntimeError: if deid can not run on the input dataset
+    """
+    credentials = auth.get_impersonation_credentials(run_as_email, CDR_SCOPES)
+    client = BigQueryClient(project_id=app_identity.get_application_id(),
+                            credentials=credentials)
+    if not initialize_run(client, credentials, input_dataset, age_limit):
+        raise RuntimeError(
+            f"Unable to initialize process.  Check _deid_map table "
+            f"contents against {input_dataset}.person contents")
+    create_output_dataset(client, output_dataset)
+    return {
+        'credentials': credentials,
+        'bq_client': client,
+        'run_initialized': True,
+        'odataset_ready': True
+    }
+
+
 class AOU(Press):
 
     def __init__(self, **args):
@@ -146,13 +291,17 @@ class AOU(Press):
         Press.__init__(self, **args)
         self.run_as_email = args.get('run_as_email', '')
         self.private_key = args.get('private_key', '')
-        self.credentials = auth.get_impersonation_credentials(
-            self.run_as_email, CDR_SCOPES)
+        self.credentials = args.get('credentials')
+        if self.credentials is None:
+            self.credentials = auth.get_impersonation_credentials(
+                self.run_as_email, CDR_SCOPES)
         self.partition = args.get('cluster', False)
         self.priority = args.get('interactive', 'BATCH')
         self.project_id = app_identity.get_application_id()
-        self.bq_client = BigQueryClient(project_id=self.project_id,
-                                        credentials=self.credentials)
+        self.bq_client = args.get('bq_client') or BigQueryClient(
+            project_id=self.project_id, credentials=self.credentials)
+        # set if the output dataset is known to exist
+        self.odataset_ready = args.get('odataset_ready', False)
 
         if 'shift' in self.deid_rules:
             #
@@ -169,50 +318,12 @@ class AOU(Press):
         Press.initialize(self, **args)
         LOGGER.info(f"BEGINNING de-identification on table:\t{self.tablename}")
 
-        age_limit = args.get('age_limit', MAX_AGE)
-        LOGGER.info(f"Using participant age limit of {age_limit}")
-
-        million = 1000000
-        map_tablename = self.idataset + "._deid_map"
-
-        map_table = pd.DataFrame()
-
-        # Create concept_id lookup table for suppressions
-        create_concept_id_lookup_table(self.bq_client, self.idataset,
-                                       self.credentials)
-
-        # ensure mapping table only contains participants within age limits
-        sql = (
-            f"SELECT DISTINCT p.person_id, "
-            f"{PIPELINE_TABLES}.calculate_age(CURRENT_DATE, EXTRACT(DATE FROM birth_datetime)) AS age "
-            f"FROM {self.idataset}.person AS p "
-            f"JOIN {map_tablename} AS map "
-            f"USING (person_id) "
-            f"ORDER BY age")
-        job_config = {'query': {'defaultDataset': {'datasetId': self.idataset}}}
-        person_table = self.get_dataframe(sql=sql, query_config=job_config)
-        LOGGER.info(f"possible patient count is:\t{person_table.shape[0]}")
-
-        # ensure age eligible participants exist in the mapping table
-        eligible_person_table = person_table[person_table.age < age_limit]
-        if eligible_person_table.shape[0] < 1:
-            LOGGER.error(
-                f"Unable to initialize Deid. {map_tablename} table cannot be "
-                f"joined to {self.idataset}.person table to verify age requirements."
-            )
-
-        # ensure no age ineligible participants are available in the mapping table
-        ineligible_person_table = person_table[person_table.age >= age_limit]
-        if ineligible_person_table.shape[0] > 0:
-            LOGGER.error(f"{ineligible_person_table.shape[0]} age ineligible "
-                         f"participants are available in "
-                         f"{map_tablename}.  Deid is bailing out!!")
-
-        LOGGER.info(f"map table contains {eligible_person_table.shape[0]} "
-                    f"records.")
-
-        return eligible_person_table.shape[
-            0] > 0 and ineligible_person_table.shape[0] < 1
+        if args.get('run_initialized', False):
+            # initialize_run was already done once for all tables of the run
+            return True
+
+        return initialize_run(self.bq_client, self.credentials, self.idataset,
+                              args.get('age_limit', MAX_AGE))
 
     def get_dataframe(self, sql=None, limit=None, query_config=None):
         """
@@ -225,24 +336,8 @@ class AOU(Press):
         if limit:
             sql = sql + " LIMIT " + str(limit)
 
-        try:
-            if query_config:
-                df = pd.read_gbq(sql,
-                                 project_id=self.bq_client.project,
-                                 credentials=self.credentials,
-                                 dialect='standard',
-                                 configuration=query_config)
-            else:
-                df = pd.read_gbq(sql,
-                                 project_id=self.bq_client.project,
-                                 credentials=self.credentials,
-                                 dialect='standard')
-
-            return df
-        except Exception:
-            LOGGER.exception(f"Unable to execute the query:\t{sql}")
-
-        return pd.DataFrame()
+        return read_dataframe(self.bq_client, self.credentials, sql,
+                              query_config)
 
     def _add_suppression_rules(self, columns):
         """
@@ -412,12 +507,9 @@ class AOU(Press):
         client = self.bq_client  #bq.Client.from_service_account_json(self.private_key)
         #
         # Let's make sure the out dataset exists
-        datasets = list(client.list_datasets())
-        found = np.sum(
-            [1 for dataset in datasets if dataset.dataset_id == self.odataset])
-        if not found:
-            dataset = bq.Dataset(client.dataset(self.odataset))
-            client.create_dataset(dataset)
+        if not self.odataset_ready:
+            create_output_dataset(client, self.odataset)
+            self.odataset_ready = True
 
         # create the output table
         if create:
@@ -491,32 +583,29 @@ class AOU(Press):
         :param job_id:  job_id to verify finishes.
         """
         LOGGER.info(
-            f"sleeping for table:\t{self.get_tablename()}\t\tjob_id:\t{job_id}")
-        status = 'NONE'
-
-        while True:
-            status = client.get_job(job_id).state
+            f"waiting for table:\t{self.get_tablename()}\t\tjob_id:\t{job_id}")
+        client.wait_on_jobs([job_id], backoff_limit=None)
+        LOGGER.info("awake.  status is:\tDONE")
 
-            if status == 'DONE':
-                break
-            else:
-                time.sleep(5)
 
-        LOGGER.info(f"awake.  status is:\t{status}")
-
-
-def main(raw_args=None):
+def main(raw_args=None, **run_args):
     """
     Run the de-identifying software.
 
     Entry point for de-identification.  Setting the main this way allows the
     module to run as a stand alone script or as part of the pipeline.
+
+    :param raw_args: command line arguments
+    :param run_args: keyword arguments returned by prepare_run, if the table
+        is de-identified as part of a run of several tables
     """
     sys_args = parse_args(raw_args)
 
-    handle = AOU(**sys_args)
+    handle = AOU(**sys_args, **run_args)
 
-    if handle.initialize(age_limit=sys_args.get('age_limit')):
+    if handle.initialize(age_limit=sys_args.get('age_limit'),
+                         run_initialized=run_args.get('run_initialized',
+                                                      False)):
         handle.do()
     else:
         LOGGER.error(
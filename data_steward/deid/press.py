@@ -73,15 +73,16 @@ class Press(ABC):
         self.odataset = args.get('odataset', '')
         self.tablepath = args.get('table')
         self.run_as_email = args.get('run_as_email', '')
-        self.credentials = None
-        if self.run_as_email:
+        # credentials and client may be shared by the tables of a run
+        self.credentials = args.get('credentials')
+        if self.credentials is None and self.run_as_email:
             self.credentials = auth.get_impersonation_credentials(
                 self.run_as_email, CDR_SCOPES)
         self.tablename = os.path.basename(
             self.tablepath).split('.json')[0].strip()
         self.project_id = app_identity.get_application_id()
-        self.bq_client = BigQueryClient(project_id=self.project_id,
-                                        credentials=self.credentials)
+        self.bq_client = args.get('bq_client') or BigQueryClient(
+            project_id=self.project_id, credentials=self.credentials)
 
         self.logpath = args.get('logs', 'logs')
         set_up_logging(self.logpath, self.idataset)
@@ -4,9 +4,10 @@ Interact with Google Cloud BigQuery
 # Python stl imports
 import os
 from datetime import datetime
+from functools import partial
 import typing
 import logging
-from time import sleep
+from time import monotonic, sleep
 
 # Third-party imports
 from google.api_core import retry
@@ -23,6 +24,8 @@ from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 
 # Project imports
+from gcloud.bq.dataset_schema import DatasetSchema
+from gcloud.bq.job_waiter import JobWaiter
 from utils import auth
 from resources import fields_for, get_and_validate_schema_fields, replace_special_characters_for_labels, \
     is_rdr_dataset, is_mapping_table
@@ -186,6 +189,17 @@ class BigQueryClient(Client):
         return DATASET_COLUMNS_TPL.render(project_id=self.project,
                                           dataset_id=dataset_id)
 
+    def get_dataset_schema(self, dataset_id: str) -> DatasetSchema:
+        """
+        Get the tables and columns of a dataset with a single query
+
+        :param dataset_id: identifies the dataset whose metadata is queried
+        :return: a DatasetSchema snapshot of the dataset
+        """
+        query = JINJA_ENV.from_string(consts.DATASET_SCHEMA_QUERY).render(
+            project_id=self.project, dataset_id=dataset_id)
+        return DatasetSchema(dataset_id, self.query(query).result())
+
     def define_dataset(self, dataset_id: str, description: str,
                        label_or_tag: dict) -> bigquery.Dataset:
         """
@@ -544,34 +558,55 @@ class BigQueryClient(Client):
                 logging.info(f"Waiting on job {job_id} to complete")
                 job_info.result()
 
+    def get_done_job_ids(self, job_list: list, retry_limit: int = 300) -> set:
+        """
+        Get the jobs that are done, listing the unfinished jobs once
+
+        A job is confirmed with get_job the first time it is not listed as
+        pending or running, so a job not yet listed is not reported done.
+
+        :param job_list: list of job_ids
+        :param retry_limit: Max time to wait in retry strategy
+        :return: set of the job ids that are done
+        """
+        list_jobs_retry = retry.Retry(deadline=retry_limit)
+        unfinished = {
+            job.job_id
+            for state in consts.JOB_STATES_UNFINISHED
+            for job in self.list_jobs(state_filter=state, retry=list_jobs_retry)
+        }
+        return {
+            job_id for job_id in job_list if job_id not in unfinished and
+            self.get_job(job_id, retry=list_jobs_retry).state == 'DONE'
+        }
+
     def wait_on_jobs(self,
                      job_list: list = None,
                      retry_limit: int = 300,
-                     backoff_limit: int = 2**8) -> list:
+                     backoff_limit: int = 2**8,
+                     on_done=None) -> list:
         """
-        Waits on jobs until all are 'DONE' until backoff_limit is reached
+        Waits on jobs until all are 'DONE' or the wait time is reached
+
+        The status of all jobs is polled at once.  Polls are frequent while
+        jobs keep finishing and back off while none do.
 
-        :param job_list: list of job_ids. If not set, defaults to the last 10 jobs
+        :param job_list: list of job_ids
         :param retry_limit: Max time to wait in retry strategy
-        :param backoff_limit: Max time to wait in backoff strategy
+        :param backoff_limit: Bounds the wait to the time a doubling backoff
+            up to this many seconds took.  None to wait until all jobs are done
+        :param on_done: optional function called with each job id as soon as
+            the job is done
         :return jobs: list of incomplete job ids
         """
-        incomplete_jobs = job_list
-        list_jobs_retry = retry.Retry(deadline=retry_limit)
-        backoff = 1
-        while incomplete_jobs and backoff <= backoff_limit:
-            bq_jobs = self.list_jobs(max_results=len(job_list) * 3,
-                                     state_filter='DONE',
-                                     retry=list_jobs_retry)
-            bq_job_ids = [job.job_id for job in bq_jobs]
-            result = [job_id for job_id in job_list if job_id in bq_job_ids]
-            incomplete_jobs = list(set(job_list) - set(result))
-            if not incomplete_jobs:
-                break
-            logging.info(f"Waiting on jobs {incomplete_jobs} to complete")
-            sleep(backoff)
-            backoff *= 2
-        return incomplete_jobs
+        if not job_list:
+            return []
+        timeout = None if backoff_limit is None else 2 * backoff_limit - 1
+        waiter = JobWaiter(partial(self.get_done_job_ids,
+                                   retry_limit=retry_limit),
+                           sleep=sleep,
+                           clock=monotonic)
+        return waiter.wait(job_list, timeout=timeout, on_done=on_done)
 
     def restore_from_time(self,
                           datasets: typing.List[str],
@@ -0,0 +1,97 @@
+"""
+Snapshot of the tables and columns of a BigQuery dataset.
+
+Checking tables one by one with `get_table` or `table_exists` costs an API
+request per table, which adds up to thousands of serial requests on EHR
+datasets with a table per site and CDM table.  A DatasetSchema is loaded
+with one INFORMATION_SCHEMA query by `BigQueryClient.get_dataset_schema` and
+answers the same questions from memory.
+
+The snapshot is not refreshed.  Tables created or dropped after it is loaded
+are not seen, so load it at the start of a unit of work and pass it along.
+"""
+# Python stl imports
+from collections import OrderedDict
+
+# Third party imports
+import pandas as pd
+
+# Project imports
+from constants.utils import bq as consts
+
+
+class DatasetSchema:
+    """
+    Tables, table types and column names of a dataset
+    """
+
+    def __init__(self, dataset_id: str, rows):
+        """
+        :param dataset_id: identifies the dataset
+        :param rows: rows of DATASET_SCHEMA_QUERY, mappings with the keys
+            table_name, column_name and table_type
+        """
+        self.dataset_id = dataset_id
+        self._rows = [dict(row.items()) for row in rows]
+        self._columns = OrderedDict()
+        self._table_types = dict()
+        for row in self._rows:
+            table_name = row[consts.TABLE_NAME]
+            self._columns.setdefault(table_name,
+                                     []).append(row[consts.COLUMN_NAME])
+            self._table_types[table_name] = row[consts.TABLE_TYPE]
+
+    @property
+    def table_ids(self) -> list:
+        """
+        Ids of the tables and views in the dataset
+        """
+        return list(self._columns)
+
+    def has_table(self, table_id: str) -> bool:
+        """
+        Determine whether the dataset has a table or view
+
+        :param table_id: id of the table
+        :return: `True` if the table exists, `False` otherwise
+        """
+        return table_id in self._columns
+
+    def get_column_names(self, table_id: str) -> list:
+        """
+        Get the column names of a table
+
+        :param table_id: id of the table
+        :return: list of column names, empty if the table does not exist
+        """
+        return list(self._columns.get(table_id, []))
+
+    def has_column(self, table_id: str, column_name: str) -> bool:
+        """
+        Determine whether a table has a column
+
+        :param table_id: id of the table
+        :param column_name: name of the column
+        :return: `True` if the table has the column, `False` otherwise
+        """
+        return column_name in self._columns.get(table_id, [])
+
+    def get_table_type(self, table_id: str) -> str:
+        """
+        Get the type of a table, e.g. 'BASE TABLE' or 'VIEW'
+
+        :param table_id: id of the table
+        :return: the table type, None if the table does not exist
+        """
+        return self._table_types.get(table_id)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Get the snapshot as an INFORMATION_SCHEMA.COLUMNS like dataframe
+
+        :return: dataframe with the columns table_name, column_name and
+            table_type
+        """
+        return pd.DataFrame(
+            self._rows,
+            columns=[consts.TABLE_NAME, consts.COLUMN_NAME, consts.TABLE_TYPE])
@@ -0,0 +1,122 @@
+"""
+Wait on many BigQuery jobs with one batched status poll per interval.
+
+Waiters used to poll each job separately and sleep 1, 2, 4... seconds, so a
+short query could sit idle until the next backoff step.  A JobWaiter asks for
+the status of every tracked job at once through a `get_done_job_ids`
+function, notifies the caller as soon as each job is seen finished and polls
+again quickly while jobs keep finishing.  The interval only grows while
+nothing finishes.
+
+`get_done_job_ids` takes a list of pending job ids and returns the subset that
+is done.  `BigQueryClient.get_done_job_ids` and `bq_utils.get_done_job_ids`
+implement it for the client library and the discovery API respectively.
+"""
+# Python stl imports
+import logging
+import time
+
+# Project imports
+from constants.utils import bq as consts
+
+LOGGER = logging.getLogger(__name__)
+
+
+class JobWaiter:
+    """
+    Tracks BigQuery jobs until they finish
+    """
+
+    def __init__(self,
+                 get_done_job_ids,
+                 min_interval: float = consts.JOB_POLL_MIN_INTERVAL,
+                 max_interval: float = consts.JOB_POLL_MAX_INTERVAL,
+                 backoff: float = consts.JOB_POLL_BACKOFF,
+                 sleep=time.sleep,
+                 clock=time.monotonic):
+        """
+        :param get_done_job_ids: function taking a list of job ids and
+            returning the ids of the jobs that are done
+        :param min_interval: seconds to wait after a poll that found
+            finished jobs
+        :param max_interval: upper bound on the seconds between polls
+        :param backoff: factor the interval grows by after a poll that found
+            no finished jobs
+        :param sleep: function used to wait between polls
+        :param clock: function returning the current time in seconds, used
+            to enforce timeouts
+        """
+        if min_interval <= 0 or max_interval < min_interval or backoff < 1:
+            raise ValueError(
+                f'Invalid poll intervals: min_interval={min_interval}, '
+                f'max_interval={max_interval}, backoff={backoff}')
+        self.get_done_job_ids = get_done_job_ids
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.sleep = sleep
+        self.clock = clock
+
+    def wait(self, job_ids, timeout: float = None, on_done=None) -> list:
+        """
+        Wait until the jobs are done or the timeout is reached
+
+        The first poll happens right away so finished jobs are not waited on.
+
+        :param job_ids: ids of the jobs to wait on
+        :param timeout: max seconds to wait, None to wait until all jobs are
+            done
+        :param on_done: optional function called with each job id as soon as
+            the job is seen finished
+        :return: list of the job ids that did not finish, in the given order
+        """
+        pending = list(dict.fromkeys(job_ids))
+        interval = self.min_interval
+        start = self.clock()
+        polled = False
+        while pending:
+            done = set(self.get_done_job_ids(pending))
+            if done:
+                for job_id in pending:
+                    if job_id in done and on_done:
+                        on_done(job_id)
+                pending = [job_id for job_id in pending if job_id not in done]
+                if not pending:
+                    break
+                interval = self.min_interval
+            elif polled:
+                interval = min(interval * self.backoff, self.max_interval)
+
+            if timeout is not None:
+                remaining = timeout - (self.clock() - start)
+                if remaining <= 0:
+                    break
+                interval = min(interval, remaining)
+            LOGGER.info(f'Waiting {interval:.1f} seconds for completion of '
+                        f'{len(pending)} job(s): {pending}')
+            self.sleep(interval)
+            polled = True
+
+        if pending:
+            LOGGER.info(f'Job(s) {pending} failed to complete')
+        return pending
+
+
+def get_timeout_for_retries(retry_count: int, max_interval: float) -> float:
+    """
+    Get the time the doubling backoff of `retry_count` polls used to wait
+
+    Callers expressed how long to wait as a number of doubling poll
+    intervals.  This keeps their overall wait time.
+
+    :param retry_count: number of polls
+    :param max_interval: interval the doubling stopped at
+    :return: total seconds
+    """
+    timeout = 0
+    interval = 1
+    for _ in range(retry_count):
+        timeout += interval
+        if interval < max_interval:
+            interval *= 2
+    return timeout
@@ -4,6 +4,8 @@ Interact with Google Cloud Storage (GCS)
 # Python stl imports
 import logging
 import os
+import threading
+import time
 from typing import Union
 
 # Third-party imports
@@ -16,11 +18,78 @@ from pandas.core.frame import DataFrame
 
 # Project imports
 from common import JINJA_ENV
-from constants.utils.bq import SELECT_BUCKET_NAME_QUERY, LOOKUP_TABLES_DATASET_ID, HPO_ID_BUCKET_NAME_TABLE_ID
+from constants.utils.bq import SELECT_HPO_BUCKET_NAMES_QUERY, LOOKUP_TABLES_DATASET_ID, HPO_ID_BUCKET_NAME_TABLE_ID
 from utils import auth
 from utils.bq import query
 from validation.app_errors import BucketDoesNotExistError, BucketNotSet
 
+# seconds the hpo to bucket name lookup table is cached for
+HPO_BUCKET_CACHE_TTL = 300
+
+
+class HpoBucketRegistry:
+    """
+    Caches the bucket names of all HPO sites for a limited time
+
+    The lookup table is read once per project, dataset and service and is read
+    again after the cached copy is older than ttl seconds, so a bucket change
+    takes effect within that time.
+    """
+
+    def __init__(self, ttl: float = HPO_BUCKET_CACHE_TTL, clock=time.monotonic):
+        """
+        :param ttl: seconds a lookup table read stays valid
+        :param clock: returns the current time in seconds
+        """
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_bucket_names(self, project_id: str, dataset_id: str,
+                         service: str) -> dict:
+        """
+        Get the bucket names of all HPO sites, reading the lookup table if
+        the cached copy is missing or expired
+
+        :param project_id: identifies the project with the lookup table
+        :param dataset_id: identifies the dataset with the lookup table
+        :param service: the App Engine service the buckets are configured for
+        :return: dict of lower case hpo_id to the list of its bucket names
+        """
+        key = (project_id, dataset_id, service)
+        with self._lock:
+            expires, bucket_names = self._entries.get(key, (None, None))
+            if expires is not None and self.clock() < expires:
+                return bucket_names
+
+            hpo_buckets_query = JINJA_ENV.from_string(
+                SELECT_HPO_BUCKET_NAMES_QUERY).render(
+                    project_id=project_id,
+                    dataset_id=dataset_id,
+                    table_id=HPO_ID_BUCKET_NAME_TABLE_ID,
+                    service=service)
+            result_df: DataFrame = query(hpo_buckets_query)
+
+            bucket_names = {}
+            for hpo_id, bucket_name in zip(result_df['hpo_id'],
+                                           result_df['bucket_name']):
+                bucket_names.setdefault(hpo_id, [])
+                if isinstance(bucket_name, str):
+                    bucket_names[hpo_id].append(bucket_name)
+            self._entries[key] = (self.clock() + self.ttl, bucket_names)
+            return bucket_names
+
+    def clear(self):
+        """
+        Drop all cached lookup table reads
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+HPO_BUCKET_REGISTRY = HpoBucketRegistry()
+
 
 class StorageClient(Client):
     """
@@ -45,15 +114,18 @@ class StorageClient(Client):
 
         super().__init__(project=project_id, credentials=credentials)
 
-    def get_bucket_items_metadata(self, bucket: Bucket) -> list:
+    def get_bucket_items_metadata(self,
+                                  bucket: Bucket,
+                                  prefix: str = None) -> list:
         """
         Given a bucket, iterate through it's contents and pull out each objects
         metadata
         :param bucket: Bucket to iterate through
+        :param prefix: (Optional) only list objects whose names start with it
         :return: a list of dicts containing metadata
         """
 
-        blobs: list = list(self.list_blobs(bucket))
+        blobs: list = list(self.list_blobs(bucket, prefix=prefix))
         metadata: list = [self.get_blob_metadata(blob) for blob in blobs]
         return metadata
 
@@ -107,8 +179,9 @@ class StorageClient(Client):
 
         try:
             bucket = self.bucket(bucket_name)
-            # this call is only to verify that the bucket can be accessed, the results are not important
-            self.get_bucket_items_metadata(bucket)
+            # a single-item listing verifies the bucket exists and its objects
+            # can be listed, without reading the whole bucket
+            next(iter(self.list_blobs(bucket, max_results=1)), None)
         except NotFound:
             raise BucketDoesNotExistError(
                 f"Failed to acquire bucket '{bucket_name}' for hpo '{hpo_id}'",
@@ -135,10 +208,11 @@ class StorageClient(Client):
         List sub folders in folder specified by prefix
         SO link: https://stackoverflow.com/a/59008580
         :param bucket: GCS bucket name as string
-        :param prefix: path to directory to look into e.g. a/b/c/
+        :param prefix: path to directory to look into e.g. a/b/c/, empty for
+            the top level directories of the bucket
         :return: list of strings of sub-directories e.g. [a/b/c/v1/, a/b/c/v2/]
         """
-        if not prefix.endswith('/'):
+        if prefix and not prefix.endswith('/'):
             prefix += '/'
 
         extra_params: dict = {
@@ -161,27 +235,21 @@ class StorageClient(Client):
 
     def _get_hpo_bucket_id(self, hpo_id: str) -> str:
         """
-        Get the name of an HPO site's private bucket.
+        Get the name of an HPO site's private bucket from the cached lookup table.
         :param hpo_id: id of the HPO site
         :return: name of the bucket, or str 'None' if (1) no matching record is found
         or (2) multiple records are found in the lookup table.
         """
         service = os.environ.get('GAE_SERVICE', 'default')
 
-        hpo_bucket_query = JINJA_ENV.from_string(
-            SELECT_BUCKET_NAME_QUERY).render(
-                project_Id=self.project,
-                dataset_id=LOOKUP_TABLES_DATASET_ID,
-                table_id=HPO_ID_BUCKET_NAME_TABLE_ID,
-                hpo_id=hpo_id,
-                service=service)
-
-        result_df: DataFrame = query(hpo_bucket_query)
+        bucket_names: list = HPO_BUCKET_REGISTRY.get_bucket_names(
+            self.project, LOOKUP_TABLES_DATASET_ID,
+            service).get(hpo_id.lower(), [])
 
-        if result_df['bucket_name'].count() != 1:
+        if len(bucket_names) != 1:
             return 'None'
 
-        return result_df['bucket_name'].iloc[0]
+        return bucket_names[0]
 
     def copy_file(self, src_bucket: Bucket, dest_bucket: Bucket, src_path: str,
                   dest_path: str):
@@ -7,11 +7,10 @@ import json
 import logging
 import os
 import re
+import threading
 import cachetools
 from datetime import datetime
 
-from git import Repo
-
 from common import (VOCABULARY, ACHILLES, PROCESSED_TXT, RESULTS_HTML,
                     FITBIT_TABLES, PID_RID_MAPPING, COPE_SURVEY_MAP,
                     UNIONED_EHR, CONDITION_OCCURRENCE, DEATH, DEVICE_EXPOSURE,
@@ -181,48 +180,218 @@ def achilles_index_files():
     return achilles_index_files_list
 
 
-def fields_for(table, sub_path=None):
+def _is_sub_path_dir(dirpath, path, sub_path) -> bool:
     """
-    Return the json schema for any table identified in the schemas directory.
+    Check whether a schemas directory is searched for a sub_path lookup
 
-    Uses os.walk to traverse subdirectories
+    :param dirpath: directory of a schema file
+    :param path: the schemas directory joined with sub_path
+    :param sub_path: the sub-directory searched
+    :return: True if dirpath is within path and has the same name as sub_path
+    """
+    dirpath = os.path.normpath(dirpath)
+    path = os.path.normpath(path)
+    return ((dirpath == path or dirpath.startswith(path + os.sep)) and
+            os.path.basename(dirpath) == os.path.basename(sub_path))
 
-    :param table: The table to get a schema for
-    :param sub_path: A string identifying a sub-directory in resource_files/schemas.
-        If provided, this directory will be searched.
-    :returns: a json object representing the schemas for the named table
+
+class SchemaRegistry:
     """
+    Index of the table schema files in resource_files/schemas
+
+    The schemas directory is walked once, the first time a schema is looked
+    up, and each schema file is parsed once.  Lookups are answered from
+    memory afterwards.  Call `clear` after changing the schema files, e.g.
+    in tests writing or mocking them.
+    """
+
+    def __init__(self, root):
+        """
+        :param root: path of the schemas directory
+        """
+        self.root = root
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        """
+        Forget the schema files found and the schemas parsed
+        """
+        with self._lock:
+            self._files = None
+            self._paths = {}
+            self._texts = {}
+            self._fields = {}
+            self._field_names = {}
+
+    @property
+    def files(self) -> list:
+        """
+        Schema files of the schemas directory, in the order os.walk finds them
+
+        :return: list of (dirpath, table, file_path) tuples
+        """
+        with self._lock:
+            if self._files is None:
+                self._files = [(dirpath, filename[:-5],
+                                os.path.join(dirpath, filename))
+                               for dirpath, _, files in os.walk(self.root)
+                               for filename in files]
+            return self._files
+
+    def get_path(self, table, sub_path=None) -> str:
+        """
+        Get the path of the schema file of a table
+
+        :param table: the table to get the schema file of
+        :param sub_path: A string identifying a sub-directory of the schemas
+            directory.  If provided, only this directory is searched.
+        :return: path of the schema file
+        :raises RuntimeError: if no or multiple schema files exist for the
+            table
+        """
+        key = (table, sub_path)
+        with self._lock:
+            if key in self._paths:
+                return self._paths[key]
+
+            path = os.path.join(self.root, sub_path if sub_path else '')
+            json_paths = [
+                file_path for dirpath, file_table, file_path in self.files
+                if file_table == table and
+                (not sub_path or _is_sub_path_dir(dirpath, path, sub_path))
+            ]
+
+            if len(json_paths) > 1:
+                raise RuntimeError(
+                    f"Unable to read schema file because multiple schemas exist for:\t"
+                    f"{table} in path {path}")
+            elif not json_paths:
+                raise RuntimeError(
+                    f"Unable to find schema file for {table} in path {path}")
+
+            self._paths[key] = json_paths[0]
+            return json_paths[0]
+
+    def load(self, json_path) -> list:
+        """
+        Get the fields of a schema file, parsing it on first use
+
+        The fields returned are shared, do not modify them.
+
+        :param json_path: path of the schema file
+        :return: list of field dicts
+        """
+        with self._lock:
+            if json_path not in self._fields:
+                with open(json_path, 'r') as fp:
+                    self._texts[json_path] = fp.read()
+                self._fields[json_path] = json.loads(self._texts[json_path])
+            return self._fields[json_path]
+
+    def load_copy(self, json_path) -> list:
+        """
+        Get a copy of the fields of a schema file the caller may modify
+
+        :param json_path: path of the schema file
+        :return: list of field dicts
+        """
+        self.load(json_path)
+        # parsing the file contents again is faster than a deep copy
+        return json.loads(self._texts[json_path])
+
+    def get_fields(self, table, sub_path=None) -> list:
+        """
+        Get the fields of a table
+
+        The fields returned are shared, do not modify them.
+
+        :param table: the table to get the fields of
+        :param sub_path: A string identifying a sub-directory of the schemas
+            directory.  If provided, only this directory is searched.
+        :return: list of field dicts
+        """
+        return self.load(self.get_path(table, sub_path))
+
+    def get_field_names(self, table) -> tuple:
+        """
+        Get the names of the fields of a table
+
+        :param table: the table to get the field names of
+        :return: tuple of field names in schema order
+        """
+        with self._lock:
+            if table not in self._field_names:
+                self._field_names[table] = tuple(
+                    field.get('name', '') for field in self.get_fields(table))
+            return self._field_names[table]
+
+    def get_tables(self, dir_path, exclude_directories=None) -> list:
+        """
+        Get the tables of the schema files below a directory
+
+        :param dir_path: path of a directory within the schemas directory
+        :param exclude_directories: names of sub-directories to skip
+        :return: list of (table, file_path) tuples in the order os.walk
+            finds them
+        """
+        exclude_directories = set(exclude_directories or [])
+        dir_path = os.path.normpath(dir_path)
+        tables = []
+        for dirpath, table, file_path in self.files:
+            rel_path = os.path.relpath(os.path.normpath(dirpath), dir_path)
+            if rel_path.startswith(os.pardir):
+                continue
+            if exclude_directories.intersection(rel_path.split(os.sep)):
+                continue
+            tables.append((table, file_path))
+        return tables
+
+
+SCHEMA_REGISTRY = SchemaRegistry(fields_path)
+
+
+def clear_schema_registry():
+    """
+    Forget the schema files found and parsed so far
+
+    Use this in tests that change or mock the schema files.
+    """
+    SCHEMA_REGISTRY.clear()
+
+
+def _schema_table_name(table):
     # Added for unioned_ehr_xyz tables in EHR dataset
     if table.startswith(UNIONED_EHR):
         table = table.split(f'{UNIONED_EHR}_')[1]
+    return table
 
-    path = os.path.join(fields_path, sub_path if sub_path else '')
 
-    # default setting
-    json_path = os.path.join(path, f'{table}.json')
+def fields_for(table, sub_path=None):
+    """
+    Return the json schema for any table identified in the schemas directory.
 
-    unique_count = 0
-    for dirpath, _, files in os.walk(path):
-        if sub_path and os.path.basename(sub_path) != os.path.basename(dirpath):
-            continue
+    Schema files are looked up in the SCHEMA_REGISTRY, which walks the
+    schemas directory once
 
-        for filename in files:
-            if filename[:-5] == table:
-                json_path = os.path.join(dirpath, filename)
-                unique_count = unique_count + 1
+    :param table: The table to get a schema for
+    :param sub_path: A string identifying a sub-directory in resource_files/schemas.
+        If provided, this directory will be searched.
+    :returns: a json object representing the schemas for the named table
+    """
+    json_path = SCHEMA_REGISTRY.get_path(_schema_table_name(table), sub_path)
+    # callers may modify the fields they get
+    return SCHEMA_REGISTRY.load_copy(json_path)
 
-    if unique_count > 1:
-        raise RuntimeError(
-            f"Unable to read schema file because multiple schemas exist for:\t"
-            f"{table} in path {path}")
-    elif unique_count == 0:
-        raise RuntimeError(
-            f"Unable to find schema file for {table} in path {path}")
 
-    with open(json_path, 'r') as fp:
-        fields = json.load(fp)
+def get_field_names(table) -> tuple:
+    """
+    Return the names of the fields of a table identified in the schemas directory.
 
-    return fields
+    :param table: The table to get the field names for
+    :returns: tuple of field names in schema order
+    """
+    return SCHEMA_REGISTRY.get_field_names(_schema_table_name(table))
 
 
 def get_and_validate_schema_fields(schema_filepath: str) -> json:
@@ -356,24 +525,17 @@ def cdm_schemas(include_achilles=False, include_vocabulary=False):
     :param include_vocabulary:
     :return:
     """
-    result = dict()
     # TODO:  update this code as part of DC-1015 and remove this comment
     exclude_directories = list()
     if not include_achilles:
         exclude_directories.append(ACHILLES)
     if not include_vocabulary:
         exclude_directories.append(VOCABULARY)
-    for dir_path, dirs, files in os.walk(cdm_fields_path, topdown=True):
-        # The following line updates the dirs list gathered by os.walk to exclude directories in exclude_directories[]
-        dirs[:] = [d for d in dirs if d not in set(exclude_directories)]
-        for f in files:
-            file_path = os.path.join(dir_path, f)
-            with open(file_path, 'r', encoding='utf-8') as fp:
-                file_name = os.path.basename(f)
-                table_name = file_name.split('.')[0]
-                schema = json.load(fp)
-                result[table_name] = schema
-    return result
+    return {
+        table_name: SCHEMA_REGISTRY.load_copy(file_path)
+        for table_name, file_path in SCHEMA_REGISTRY.get_tables(
+            cdm_fields_path, exclude_directories)
+    }
 
 
 def rdr_src_id_schemas():
@@ -383,15 +545,10 @@ def rdr_src_id_schemas():
     :return: result
     """
     result = dict()
-    for dir_path, _, files in os.walk(rdr_src_id_fields_path, topdown=True):
-        for f in files:
-            file_path = os.path.join(dir_path, f)
-            with open(file_path, 'r', encoding='utf-8') as fp:
-                file_name = os.path.basename(f)
-                table_name = file_name.split('.')[0]
-                table_name = table_name.replace("rdr_", "")
-                schema = json.load(fp)
-                result[table_name] = schema
+    for table_name, file_path in SCHEMA_REGISTRY.get_tables(
+            rdr_src_id_fields_path):
+        table_name = table_name.replace("rdr_", "")
+        result[table_name] = SCHEMA_REGISTRY.load_copy(file_path)
     return result
 
 
@@ -401,17 +558,10 @@ def rdr_specific_schemas():
 
     :return:
     """
-    result = dict()
-    for dir_path, _, files in os.walk(rdr_fields_path):
-        for f in files:
-            file_path = os.path.join(dir_path, f)
-            with open(file_path, 'r', encoding='utf-8') as fp:
-                file_name = os.path.basename(f)
-                table_name = file_name.split('.')[0]
-                schema = json.load(fp)
-                result[table_name] = schema
-
-    return result
+    return {
+        table_name: SCHEMA_REGISTRY.load_copy(file_path)
+        for table_name, file_path in SCHEMA_REGISTRY.get_tables(rdr_fields_path)
+    }
 
 
 def get_person_id_tables(domain_tables):
@@ -433,21 +583,17 @@ def has_person_id(domain_table):
         :param domain_table: domain tables name
         return: True of False if person_id exists or not.
         """
-    return 'person_id' in [field['name'] for field in fields_for(domain_table)]
+    return 'person_id' in get_field_names(domain_table)
 
 
 def mapping_schemas():
-    result = dict()
-    for f in os.listdir(mapping_fields_path):
-        file_path = os.path.join(mapping_fields_path, f)
-        table_name = f.split('.')[0]
-
-        if is_mapping_table(table_name):
-            # only open and load mapping tables, instead of all tables
-            with open(file_path, 'r') as fp:
-                result[table_name] = json.load(fp)
-
-    return result
+    # only open and load mapping tables, instead of all tables
+    return {
+        table_name: SCHEMA_REGISTRY.load_copy(file_path)
+        for table_name, file_path in SCHEMA_REGISTRY.get_tables(
+            mapping_fields_path)
+        if is_mapping_table(table_name)
+    }
 
 
 def hash_dir(in_dir):
@@ -463,8 +609,16 @@ def hash_dir(in_dir):
     return hash_obj.hexdigest()
 
 
-CDM_TABLES = list(cdm_schemas().keys())  # NOTE it excludes AOU_DEATH
-MAPPING_TABLES = list(mapping_schemas().keys())
+# NOTE it excludes AOU_DEATH
+CDM_TABLES = [
+    table_name for table_name, _ in SCHEMA_REGISTRY.get_tables(
+        cdm_fields_path, [ACHILLES, VOCABULARY])
+]
+MAPPING_TABLES = [
+    table_name
+    for table_name, _ in SCHEMA_REGISTRY.get_tables(mapping_fields_path)
+    if is_mapping_table(table_name)
+]
 ACHILLES_INDEX_FILES = achilles_index_files()
 CDM_CSV_FILES = [f'{table}.csv' for table in CDM_TABLES]
 CDM_JSONL_FILES = [f'{table}.jsonl' for table in CDM_TABLES]
@@ -524,9 +678,8 @@ def get_concept_id_fields(table_name: str,
     :return: *concept_id schemas (w/ or w/o source concepts) given a table
     """
     concept_id_fields = [
-        field_name['name']
-        for field_name in fields_for(table_name)
-        if field_name['name'].endswith('concept_id')
+        field_name for field_name in get_field_names(table_name)
+        if field_name.endswith('concept_id')
     ]
 
     if exclude_source_concept_id:
@@ -546,9 +699,8 @@ def get_date_fields(table_name) -> List[str]:
     :return: all *date schemas in the table
     """
     return [
-        field_name['name']
-        for field_name in fields_for(table_name)
-        if field_name['name'].endswith('date')
+        field_name for field_name in get_field_names(table_name)
+        if field_name.endswith('date')
     ]
 
 
@@ -560,9 +712,8 @@ def get_datetime_fields(table_name) -> List[str]:
     :return: all *datetime schemas in the table
     """
     return [
-        field_name['name']
-        for field_name in fields_for(table_name)
-        if field_name['name'].endswith('datetime')
+        field_name for field_name in get_field_names(table_name)
+        if field_name.endswith('datetime')
     ]
 
 
@@ -585,9 +736,7 @@ def has_domain_table_id(table_name: str) -> str:
     :return: True/False if domain_table_id is available is table schemas
     """
     id_field = f'{table_name}_id'
-    return id_field if id_field in [
-        field.get('name', '') for field in fields_for(table_name)
-    ] else None
+    return id_field if id_field in get_field_names(table_name) else None
 
 
 def get_field_type(table_name, field_name):
@@ -596,7 +745,7 @@ def get_field_type(table_name, field_name):
     :param field_name: name of the field for which data type is to be identified
     :return: Returns fields data type as a string value if not none
     """
-    fields = fields_for(table_name)
+    fields = SCHEMA_REGISTRY.get_fields(_schema_table_name(table_name))
     field_type = [
         field['type'] for field in fields if field['name'] == field_name
     ]
@@ -640,7 +789,7 @@ def has_primary_key(table):
     """
     if table not in CDM_TABLES + [AOU_DEATH]:
         raise AssertionError()
-    fields = fields_for(table)
+    fields = SCHEMA_REGISTRY.get_fields(table)
     id_field = table + '_id'
     data_type = 'string' if table == AOU_DEATH else 'integer'
     return any(field for field in fields
@@ -672,6 +821,9 @@ def get_git_tag():
     gets latest git tag.
     :return: git tag in string format
     """
+    # GitPython is only needed here, imported lazily to keep imports fast
+    from git import Repo
+
     repo = Repo(os.getcwd(), search_parent_directories=True)
     try:
         tags = sorted(repo.tags, key=lambda t: t.commit.committed_datetime)
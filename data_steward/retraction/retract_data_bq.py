@@ -7,12 +7,14 @@ Retraction is performed for each dataset based on its data stage.
 # Python imports
 import argparse
 import logging
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from itertools import product
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 # Project imports
 from utils import pipeline_logging
-from gcloud.bq import BigQueryClient
+from gcloud.bq import BigQueryClient, DatasetSchema
 from common import (AOU_REQUIRED, CARE_SITE, CATI_TABLES, CONDITION_ERA, DEATH,
                     DOSE_ERA, DRUG_ERA, FACT_RELATIONSHIP, ID_CONSTANT_FACTOR,
                     JINJA_ENV, LOCATION, MAPPING_PREFIX, MEASUREMENT, NOTE,
@@ -25,7 +27,11 @@ from retraction.retract_utils import (get_datasets_list, get_dataset_type,
                                       is_ehr_dataset, is_fitbit_dataset,
                                       is_rdr_dataset, is_sandbox_dataset,
                                       is_unioned_dataset)
-from constants.retraction.retract_utils import (NONE, PERSON_ID, RESEARCH_ID)
+from constants.retraction.retract_utils import (NONE, PERSON_ID, RESEARCH_ID,
+                                                RETRACTION_MAX_WORKERS)
+from constants.utils.bq import VIEW
+from utils.sandbox import (KEY_ONLY_SANDBOX_FIELDS, SOURCE_TABLE,
+                           is_key_only_sandbox_table)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -65,6 +71,8 @@ WHERE person_id IN (
         -- No additional condition is needed for EHR/UnionedEHR retraction --
     {% elif 'death' in table %}
         -- No additional condition is needed for death table retraction --
+    {% elif is_key_only and domain_id == 'person_id' %}
+        -- No additional condition is needed for key-only sandbox tables keyed by person_id --
     {% elif is_sandbox %}
         -- NOTE Though 'only_ehr', this condition also drops RDR data that are affected by --
         -- the CR `domain_alignment`. We cannot avoid it under our current pipeline design. --
@@ -181,7 +189,8 @@ def get_retraction_queries(client: BigQueryClient,
                            lookup_table_id,
                            skip_sandboxing,
                            retraction_type,
-                           hpo_id: Optional[str] = None) -> List[str]:
+                           hpo_id: Optional[str] = None,
+                           dataset_schema: DatasetSchema = None) -> List[str]:
     """
     Gets list of queries for retraction.
     :param client: BigQuery client
@@ -192,12 +201,58 @@ def get_retraction_queries(client: BigQueryClient,
     :param retraction_type: string indicating whether all data needs to be removed including RDR,
         or if RDR data needs to be kept intact. Can take the values 'rdr_and_ehr' or 'only_ehr'.
     :param hpo_id: HPO ID that needs retraction. If None is specified, it looks at all the HPO IDs.
+    :param dataset_schema: DatasetSchema snapshot of the dataset.  Loaded
+        if not supplied.
     :return: list of queries
     """
+    query_groups = get_retraction_query_groups(client,
+                                               dataset_id,
+                                               sb_dataset_id,
+                                               lookup_table_id,
+                                               skip_sandboxing,
+                                               retraction_type,
+                                               hpo_id=hpo_id,
+                                               dataset_schema=dataset_schema)
+    return [query for queries in query_groups.values() for query in queries]
+
+
+def get_retraction_query_groups(
+        client: BigQueryClient,
+        dataset_id,
+        sb_dataset_id,
+        lookup_table_id,
+        skip_sandboxing,
+        retraction_type,
+        hpo_id: Optional[str] = None,
+        dataset_schema: DatasetSchema = None) -> Dict[str, List[str]]:
+    """
+    Gets the queries for retraction grouped by the table they retract from.
+
+    The queries of a group must run in order, e.g. the sandbox query of a
+    table before its delete query.  Groups can run at the same time.
+    The fact_relationship queries of an EHR dataset share a sandbox table, so
+    they are in one group.
+
+    :param client: BigQuery client
+    :param dataset_id: dataset to run retraction for
+    :param sb_dataset_id: sandbox dataset. lookup table must be in it.
+    :param lookup_table_id: table containing the person_ids and research_ids
+    :param skip_sandboxing: True if you wish not to sandbox the retracted data.
+    :param retraction_type: string indicating whether all data needs to be removed including RDR,
+        or if RDR data needs to be kept intact. Can take the values 'rdr_and_ehr' or 'only_ehr'.
+    :param hpo_id: HPO ID that needs retraction. If None is specified, it looks at all the HPO IDs.
+    :param dataset_schema: DatasetSchema snapshot of the dataset.  Loaded
+        if not supplied.
+    :return: OrderedDict of table name to list of queries
+    """
+    if dataset_schema is None:
+        dataset_schema = client.get_dataset_schema(dataset_id)
+
     tables_to_retract = get_tables_to_retract(client,
                                               dataset_id,
                                               retraction_type=retraction_type,
-                                              hpo_id=hpo_id)
+                                              hpo_id=hpo_id,
+                                              dataset_schema=dataset_schema)
 
     LOGGER.info(
         f"Tables to retract in {dataset_id}:\n"
@@ -208,9 +263,20 @@ def get_retraction_queries(client: BigQueryClient,
     person_id = RESEARCH_ID if is_deid_dataset(dataset_id) else PERSON_ID
     action_list = ['delete'] if skip_sandboxing else ['sandbox', 'delete']
 
-    queries = []
+    query_groups = OrderedDict()
 
     for table in tables_to_retract:
+        is_key_only = is_sandbox_dataset(
+            dataset_id) and is_key_only_sandbox_table(
+                dataset_schema.get_column_names(table))
+        if is_key_only:
+            # retracting the keys also keeps the rows of the retracted
+            # participants out of the full rows rebuilt from the source table
+            LOGGER.info(
+                f"{table} is a key-only sandbox table.  Its full rows can be "
+                f"rebuilt from the table in its `{SOURCE_TABLE}` column through "
+                f"time travel, only for the keys left after retraction.")
+        queries = query_groups.setdefault(table, [])
         for action in action_list:
             q = JINJA_ENV.from_string(RETRACT_QUERY).render(
                 sandbox=action == 'sandbox',
@@ -222,10 +288,11 @@ def get_retraction_queries(client: BigQueryClient,
                 person_id=person_id,
                 lookup_table_id=lookup_table_id,
                 is_sandbox=is_sandbox_dataset(dataset_id),
+                is_key_only=is_key_only,
                 is_ehr_dataset=is_ehr_dataset(dataset_id),
                 is_unioned_dataset=is_unioned_dataset(dataset_id),
                 domain_id=get_primary_key_for_sandbox_table(
-                    client, dataset_id, table),
+                    client, dataset_id, table, dataset_schema),
                 id_const=2 * ID_CONSTANT_FACTOR,
                 retraction_type=retraction_type,
                 is_deid=is_deid_dataset(dataset_id))
@@ -233,14 +300,18 @@ def get_retraction_queries(client: BigQueryClient,
 
     if not is_deid_dataset(dataset_id) and not is_fitbit_dataset(
             dataset_id) and not is_sandbox_dataset(dataset_id):
-        queries.extend(
-            get_retraction_queries_fact_relationship(client, dataset_id,
-                                                     sb_dataset_id,
-                                                     lookup_table_id,
-                                                     skip_sandboxing,
-                                                     retraction_type))
+        fact_relationship_queries = get_retraction_queries_fact_relationship(
+            client,
+            dataset_id,
+            sb_dataset_id,
+            lookup_table_id,
+            skip_sandboxing,
+            retraction_type,
+            dataset_schema=dataset_schema)
+        if fact_relationship_queries:
+            query_groups[FACT_RELATIONSHIP] = fact_relationship_queries
 
-    return queries
+    return query_groups
 
 
 def get_retraction_queries_fact_relationship(
@@ -250,7 +321,8 @@ def get_retraction_queries_fact_relationship(
         lookup_table_id,
         skip_sandboxing,
         retraction_type,
-        hpo_id: Optional[str] = None) -> List[str]:
+        hpo_id: Optional[str] = None,
+        dataset_schema: DatasetSchema = None) -> List[str]:
     """
     Get list of queries for retracting fact_relationship table.
 
@@ -262,9 +334,14 @@ def get_retraction_queries_fact_relationship(
     :param retraction_type: string indicating whether all data needs to be removed including RDR,
         or if RDR data needs to be kept intact. Can take the values 'rdr_and_ehr' or 'only_ehr'
     :param hpo_id: HPO ID that needs retraction. If None is specified, it looks at all the HPO IDs.
+    :param dataset_schema: DatasetSchema snapshot of the dataset.  Loaded
+        if not supplied.
     :return: list of queries
     """
-    if not client.table_exists(FACT_RELATIONSHIP, dataset_id):
+    if dataset_schema is None:
+        dataset_schema = client.get_dataset_schema(dataset_id)
+
+    if not dataset_schema.has_table(FACT_RELATIONSHIP):
         LOGGER.info(f"Skipping {FACT_RELATIONSHIP}. It does not exist.")
         return []
 
@@ -272,8 +349,8 @@ def get_retraction_queries_fact_relationship(
 
     if is_combined_dataset(
             dataset_id) and retraction_type == RETRACTION_ONLY_EHR and (
-                not client.table_exists(mapping_table_for(MEASUREMENT)) or
-                not client.table_exists(mapping_table_for(OBSERVATION))):
+                not dataset_schema.has_table(mapping_table_for(MEASUREMENT)) or
+                not dataset_schema.has_table(mapping_table_for(OBSERVATION))):
         LOGGER.info(
             f"Skipping {FACT_RELATIONSHIP}. Mapping tables missing for its ONLY_EHR retraction."
         )
@@ -321,6 +398,7 @@ def get_tables_to_retract(
     dataset,
     retraction_type,
     hpo_id: Optional[str] = None,
+    dataset_schema: DatasetSchema = None,
 ) -> List[str]:
     """
     Creates a list of tables that need retraction in the dataset.
@@ -328,8 +406,12 @@ def get_tables_to_retract(
     :param dataset: Dataset to run retraction on
     :param hpo_id: HPO ID that needs retraction. Mandatory only for EHR dataset.
     :param retraction_type: only_ehr or rdr_and_ehr
+    :param dataset_schema: DatasetSchema snapshot of the dataset.  Loaded
+        if not supplied.
     :return: list of table names for retraction
     """
+    if dataset_schema is None:
+        dataset_schema = client.get_dataset_schema(dataset)
 
     LOGGER.info(f'Checking tables to retract in {client.project}.{dataset}...')
     if is_ehr_dataset(dataset) and (not hpo_id or hpo_id == NONE):
@@ -344,25 +426,24 @@ def get_tables_to_retract(
             f'{prefix}_{table}' for prefix, table in
             product([hpo_id, UNIONED_EHR], TABLES_FOR_RETRACTION |
                     set(NON_EHR_TABLES))
-            if client.table_exists(f'{prefix}_{table}', dataset)
+            if dataset_schema.has_table(f'{prefix}_{table}')
         ]
     else:
-        existing_tables = [
-            table.table_id
-            for table in client.list_tables(f'{client.project}.{dataset}')
-        ]
         tables_to_retract = [
-            table for table in existing_tables
-            if any(col.name == 'person_id' for col in client.get_table(
-                f'{client.project}.{dataset}.{table}').schema) and
-            not skip_table_retraction(client, dataset, table, retraction_type)
+            table for table in dataset_schema.table_ids
+            if dataset_schema.has_column(table, PERSON_ID) and
+            not skip_table_retraction(client, dataset, table, retraction_type,
+                                      dataset_schema)
         ]
 
     return tables_to_retract
 
 
-def skip_table_retraction(client: BigQueryClient, dataset_id, table_id,
-                          retraction_type) -> bool:
+def skip_table_retraction(client: BigQueryClient,
+                          dataset_id,
+                          table_id,
+                          retraction_type,
+                          dataset_schema: DatasetSchema = None) -> bool:
     """
     Some tables have person_id but do not need retraction depending on how we
     want to retract. This function returns True if the table does not need retraction.
@@ -372,6 +453,8 @@ def skip_table_retraction(client: BigQueryClient, dataset_id, table_id,
     :param table_id: table to run retraction for
     :param retraction_type: string indicating whether all data needs to be removed including RDR,
         or if RDR data needs to be kept intact. Can take the values 'rdr_and_ehr' or 'only_ehr'
+    :param dataset_schema: DatasetSchema snapshot of the dataset.  Loaded
+        if not supplied.
     :return: True if the table should be skipped. False if we need to retract the table.
     """
     msg_only_rdr = f"Skipping {table_id} table because it has only RDR data."
@@ -383,8 +466,10 @@ def skip_table_retraction(client: BigQueryClient, dataset_id, table_id,
         f"Skipping {table_id}. This sandbox table either has an irregular naming, "
         "does not have `domain`_id column, or only contains non-EHR data.")
 
-    if client.get_table(
-            f'{client.project}.{dataset_id}.{table_id}').table_type == 'VIEW':
+    if dataset_schema is None:
+        dataset_schema = client.get_dataset_schema(dataset_id)
+
+    if dataset_schema.get_table_type(table_id) == VIEW:
         LOGGER.info(msg_view)
         return True
 
@@ -403,7 +488,8 @@ def skip_table_retraction(client: BigQueryClient, dataset_id, table_id,
             LOGGER.info(msg_only_rdr)
             return True
 
-        if not get_primary_key_for_sandbox_table(client, dataset_id, table_id):
+        if not get_primary_key_for_sandbox_table(client, dataset_id, table_id,
+                                                 dataset_schema):
             LOGGER.info(msg_unknown_domain_sb_table)
             return True
 
@@ -414,13 +500,13 @@ def skip_table_retraction(client: BigQueryClient, dataset_id, table_id,
             LOGGER.info(msg_only_rdr)
             return True
 
-        elif is_deid_dataset(dataset_id) and not client.table_exists(
-                f'{table_id}_ext', dataset_id):
+        elif is_deid_dataset(
+                dataset_id) and not dataset_schema.has_table(f'{table_id}_ext'):
             LOGGER.info(msg_no_mapping_table)
             return True
 
-        elif is_combined_dataset(dataset_id) and not client.table_exists(
-                mapping_table_for(table_id), dataset_id):
+        elif is_combined_dataset(dataset_id) and not dataset_schema.has_table(
+                mapping_table_for(table_id)):
             LOGGER.info(msg_no_mapping_table)
             return True
 
@@ -449,8 +535,11 @@ def skip_dataset_retraction(dataset_id, retraction_type) -> bool:
     return False
 
 
-def get_primary_key_for_sandbox_table(client: BigQueryClient, dataset,
-                                      table: str) -> str:
+def get_primary_key_for_sandbox_table(
+        client: BigQueryClient,
+        dataset,
+        table: str,
+        dataset_schema: DatasetSchema = None) -> str:
     """
     NOTE This is intended for `only_ehr` retraction for sandbox datasets.
 
@@ -464,6 +553,8 @@ def get_primary_key_for_sandbox_table(client: BigQueryClient, dataset,
     :param client: BigQuery client
     :param dataset: Dataset to run retraction on
     :param table: name of the sandbox table that needs retraction
+    :param dataset_schema: DatasetSchema snapshot of the dataset.  Loaded
+        if not supplied.
     :return: column name that the retraction must run on. 
         Returns '' if the domain table cannot be identified, the domain table
         does not contain person_id and/or domain_id, the domain table does 
@@ -474,14 +565,28 @@ def get_primary_key_for_sandbox_table(client: BigQueryClient, dataset,
     if MAPPING_PREFIX in table:
         return ''
 
-    col_names = [
-        col.name for col in client.get_table(
-            f'{client.project}.{dataset}.{table}').schema
-    ]
+    if dataset_schema is None:
+        dataset_schema = client.get_dataset_schema(dataset)
+    col_names = dataset_schema.get_column_names(table)
 
     if all(col_name != f"{PERSON}_id" for col_name in col_names):
         return ''
 
+    if is_key_only_sandbox_table(col_names):
+        # a key-only sandbox table holds the key field of its source table
+        # and person_id, whatever the table is named
+        key_fields = [
+            col_name for col_name in col_names
+            if col_name not in KEY_ONLY_SANDBOX_FIELDS + [f"{PERSON}_id"]
+        ]
+        if not key_fields:
+            return f"{PERSON}_id"
+        if len(key_fields) == 1 and key_fields[0] in {
+                f"{domain}_id" for domain in domain_tables
+        }:
+            return key_fields[0]
+        return ''
+
     for domain in domain_tables:
         if domain in table:
 
@@ -503,18 +608,105 @@ def get_primary_key_for_sandbox_table(client: BigQueryClient, dataset,
     return ''
 
 
-def retraction_query_runner(client: BigQueryClient, queries):
+def retraction_query_runner(client: BigQueryClient, queries) -> int:
     """
     Runs the retraction queries one by one.
     :param client: BigQuery client
     :param queries: List of queries to run
+    :return: number of rows affected by the DML queries
     """
+    num_dml_affected_rows = 0
     for query in queries:
         job = client.query(query)
         LOGGER.info(f'Running query for job_id {job.job_id}. Query:\n{query}')
         _ = job.result()
         LOGGER.info(
             f'Removed {job.num_dml_affected_rows} rows for job_id {job.job_id}')
+        num_dml_affected_rows += job.num_dml_affected_rows or 0
+    return num_dml_affected_rows
+
+
+def run_retraction_queries(client: BigQueryClient,
+                           get_query_groups,
+                           dataset_ids,
+                           max_workers=RETRACTION_MAX_WORKERS) -> List[Dict]:
+    """
+    Runs the retraction queries of several datasets at the same time.
+
+    The queries of a dataset are generated as soon as a worker is free, and
+    its tables are retracted as soon as its queries are known.  The queries
+    of a table run in order.  A failure only stops the table, or the dataset
+    if its queries cannot be generated.
+
+    :param client: BigQuery client
+    :param get_query_groups: function taking a dataset id and returning its
+        queries grouped by table as returned by get_retraction_query_groups
+    :param dataset_ids: datasets to retract from
+    :param max_workers: max number of queries running at the same time
+    :return: list of dicts with the keys dataset_id, table_id,
+        num_dml_affected_rows and error, one per table or per dataset whose
+        queries could not be generated.  error is None for tables retracted
+        successfully.
+    """
+    results = []
+    running = dict()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for dataset_id in dataset_ids:
+            running[executor.submit(get_query_groups,
+                                    dataset_id)] = (dataset_id, None)
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                dataset_id, table_id = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    LOGGER.exception(
+                        f'Retraction failed for {dataset_id}.{table_id or "*"}')
+                    results.append({
+                        'dataset_id': dataset_id,
+                        'table_id': table_id,
+                        'num_dml_affected_rows': None,
+                        'error': repr(exc)
+                    })
+                    continue
+
+                if table_id is None:
+                    LOGGER.info(f"Started retracting from dataset {dataset_id}")
+                    for table, queries in result.items():
+                        running[executor.submit(retraction_query_runner, client,
+                                                queries)] = (dataset_id, table)
+                else:
+                    results.append({
+                        'dataset_id': dataset_id,
+                        'table_id': table_id,
+                        'num_dml_affected_rows': result,
+                        'error': None
+                    })
+    return sorted(results,
+                  key=lambda result:
+                  (result['dataset_id'], result['table_id'] or ''))
+
+
+def log_retraction_summary(results) -> None:
+    """
+    Logs the rows removed from each table and the tables that failed.
+    :param results: list of dicts as returned by run_retraction_queries
+    """
+    LOGGER.info('Rows removed per table:')
+    for result in results:
+        if not result['error']:
+            LOGGER.info(f"\t{result['dataset_id']}.{result['table_id']}:\t"
+                        f"{result['num_dml_affected_rows']}")
+
+    failed = [result for result in results if result['error']]
+    if failed:
+        LOGGER.error(f'Retraction failed for {len(failed)} tables:')
+        for result in failed:
+            LOGGER.error(
+                f"\t{result['dataset_id']}.{result['table_id'] or '*'}:"
+                f"\t{result['error']}")
 
 
 def run_bq_retraction(project_id,
@@ -524,7 +716,8 @@ def run_bq_retraction(project_id,
                       dataset_list,
                       retraction_type,
                       skip_sandboxing=False,
-                      bq_client=None):
+                      bq_client=None,
+                      max_workers=RETRACTION_MAX_WORKERS):
     """
     Main function to perform retraction.
     Lookup table must have person_id and research_id, and it must reside in sandbox_dataset_id.
@@ -532,6 +725,8 @@ def run_bq_retraction(project_id,
     If only_ehr is specified, it removes only the records that originate from EHR.
     For non-deid datasets, fact_relationship gets retracted here though it does not have person_id column.
     For deid datasets, fact_relationship is empty by default so it does not get retracted.
+    Datasets and tables are retracted at the same time.  A failure does not
+    stop the retraction of other tables, it is raised once all of them finish.
 
     :param project_id: project id.
     :param sandbox_dataset_id: sandbox dataset ID. Lookup table must be in this dataset.
@@ -543,7 +738,10 @@ def run_bq_retraction(project_id,
         or if RDR data needs to be kept intact. Can take the values 'rdr_and_ehr' or 'only_ehr'
     :param skip_sandboxing: True if you wish not to sandbox the retracted data.
     :param bq_client: BigQuery client. Reuse the client if one already exists. If not, a new one will be created.
-    :return:
+    :param max_workers: max number of queries running at the same time.  1
+        runs them one after another.
+    :return: list of dicts as returned by run_retraction_queries
+    :raises RuntimeError: if the retraction of a dataset or table failed
     """
 
     # Skip retraction if type is incorrect
@@ -556,29 +754,33 @@ def run_bq_retraction(project_id,
     client = bq_client if bq_client else BigQueryClient(project_id)
 
     # NOTE get_datasets_list() excludes datasets that are type=OTHER.
-    dataset_ids = get_datasets_list(client, dataset_list)
-
-    for dataset in dataset_ids:
-
-        if skip_dataset_retraction(dataset, retraction_type):
-            continue
+    dataset_ids = [
+        dataset for dataset in get_datasets_list(client, dataset_list)
+        if not skip_dataset_retraction(dataset, retraction_type)
+    ]
 
+    def get_query_groups(dataset):
         # Argument hpo_id is effective for only EHR dataset.
-        hpo_id = hpo_id if is_ehr_dataset(dataset) else ''
-
-        queries = get_retraction_queries(client,
-                                         dataset,
-                                         sandbox_dataset_id,
-                                         lookup_table_id,
-                                         skip_sandboxing,
-                                         retraction_type=retraction_type,
-                                         hpo_id=hpo_id)
-
-        LOGGER.info(f"Started retracting from dataset {dataset}")
-        retraction_query_runner(client, queries)
-        LOGGER.info(f"Completed retracting from dataset {dataset}")
-
+        return get_retraction_query_groups(
+            client,
+            dataset,
+            sandbox_dataset_id,
+            lookup_table_id,
+            skip_sandboxing,
+            retraction_type=retraction_type,
+            hpo_id=hpo_id if is_ehr_dataset(dataset) else '')
+
+    results = run_retraction_queries(client, get_query_groups, dataset_ids,
+                                     max_workers)
+    log_retraction_summary(results)
+
+    failed = [result for result in results if result['error']]
+    if failed:
+        raise RuntimeError(
+            f'Retraction failed for {len(failed)} tables, see the log for details'
+        )
     LOGGER.info('Retraction completed.')
+    return results
 
 
 if __name__ == '__main__':
@@ -650,11 +852,23 @@ if __name__ == '__main__':
         help=
         'Specify this option if you do not want this script to sanbox the retracted records.'
     )
+    parser.add_argument(
+        '--max_workers',
+        dest='max_workers',
+        type=int,
+        default=RETRACTION_MAX_WORKERS,
+        required=False,
+        help='Max number of retraction queries running at the same time.')
     args = parser.parse_args()
 
     pipeline_logging.configure(level=logging.INFO,
                                add_console_handler=args.console_log)
 
-    run_bq_retraction(args.project_id, args.sandbox_dataset_id,
-                      args.pid_table_id, args.hpo_id, args.dataset_ids,
-                      args.retraction_type, args.skip_sandboxing)
+    run_bq_retraction(args.project_id,
+                      args.sandbox_dataset_id,
+                      args.pid_table_id,
+                      args.hpo_id,
+                      args.dataset_ids,
+                      args.retraction_type,
+                      args.skip_sandboxing,
+                      max_workers=args.max_workers)
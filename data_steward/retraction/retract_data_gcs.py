@@ -6,13 +6,27 @@ The pid table must be located in the sandbox_dataset
 The schema for the pid table is located in retract_data_bq.py as PID_TABLE_FIELDS
 If the submission folder is set to 'all_folders', all the submissions from the site will be considered for retraction
 If a submission folder is specified, only that folder will be considered for retraction
+
+Files are streamed in chunks rather than downloaded whole.  CSV files are
+parsed with the csv module and JSONL files (note.jsonl) line by line.  A file
+is read once to count the records to retract and, only if there are any,
+read again while its retracted version is uploaded to a temporary object
+that then replaces the file.  Records that are kept
+are written back byte for byte.  Files of all folders are processed at the
+same time.  With --dry_run only the counts are reported.
 """
-import os
-from io import BytesIO
 import argparse
+import csv
+import io
+import json
 import logging
+import os
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from google.cloud import bigquery
+from google.cloud.exceptions import NotFound
 from gcloud.gcs import StorageClient
 
 import common
@@ -30,6 +44,21 @@ PID_IN_COL2 = [
     common.DEVICE_EXPOSURE, common.SPECIMEN, common.NOTE
 ]
 
+PERSON_ID = 'person_id'
+CSV = 'csv'
+JSONL = 'jsonl'
+
+# number of files retracted at the same time
+GCS_RETRACTION_MAX_WORKERS = 8
+# bytes read or written per request.  Uploads need a multiple of 256 KiB.
+GCS_RETRACTION_CHUNK_SIZE = 32 * 256 * 1024
+# suffix of the temporary objects retracted files are uploaded to
+TEMP_SUFFIX = '.retraction.tmp'
+# files are decoded and encoded with surrogateescape so kept records are
+# written back unchanged, even if they are not valid UTF-8
+ENCODING = 'utf-8'
+ENCODING_ERRORS = 'surrogateescape'
+
 
 def run_gcs_retraction(project_id,
                        sandbox_dataset_id,
@@ -38,7 +67,9 @@ def run_gcs_retraction(project_id,
                        folder,
                        force_flag,
                        bucket=None,
-                       site_bucket=None):
+                       site_bucket=None,
+                       dry_run=False,
+                       max_workers=GCS_RETRACTION_MAX_WORKERS):
     """
     Retract from a folder/folders in a GCS bucket all records associated with a pid
 
@@ -51,6 +82,10 @@ def run_gcs_retraction(project_id,
     :param force_flag: if False then prompt for each file
     :param bucket: DRC bucket maintained by curation
     :param site_bucket: Site's bucket name
+    :param dry_run: if True only report the number of lines to retract per file
+    :param max_workers: max number of files retracted at the same time
+    :return: OrderedDict of file name to number of lines retracted, or to
+        retract if dry_run
     """
 
     # extract the pids
@@ -90,7 +125,7 @@ def run_gcs_retraction(project_id,
             logging.info(
                 f'Folder {folder} does not exist in {full_bucket_path}. Exiting'
             )
-            return
+            return OrderedDict()
 
     logging.info("Retracting data from the following folders:")
     logging.info([
@@ -98,6 +133,7 @@ def run_gcs_retraction(project_id,
         for folder_prefix in to_process_folder_list
     ])
 
+    blob_names = []
     for folder_prefix in to_process_folder_list:
         logging.info(f'Processing gs://{bucket.name}/{folder_prefix}')
         # separate cdm from the unknown (unexpected) files
@@ -110,8 +146,9 @@ def run_gcs_retraction(project_id,
         for item in file_names:
             # Only retract from CDM or PII files containing PIDs
             item = item.lower()
-            table_name = item.split('.')[0]
-            if table_name in PID_IN_COL1 + PID_IN_COL2:
+            table_name, _, extension = item.partition('.')
+            if (table_name in PID_IN_COL1 + PID_IN_COL2 and
+                    extension in (CSV, JSONL)):
                 found_files.append(item)
 
         logging.info('Found the following files to retract data from:')
@@ -130,38 +167,306 @@ def run_gcs_retraction(project_id,
             # Make sure user types Y to proceed
             response = get_response()
         if response == "Y":
-            retract(pids, bucket, found_files, folder_prefix, force_flag)
-            logging.info(
-                f"Retraction completed for folder {bucket.name}/{folder_prefix}"
-            )
+            blob_names.extend(
+                get_files_to_retract(pids, bucket, found_files, folder_prefix,
+                                     force_flag))
         elif response.lower() == "n":
             logging.info(f"Skipping folder {folder_prefix}")
+
+    # files of all folders are retracted at the same time
+    summary = retract_blobs(pids, bucket, blob_names, dry_run, max_workers)
     logging.info("Retraction from GCS complete")
-    return
+    return summary
+
+
+def get_pid_column(table_name, header) -> int:
+    """
+    Get the position of the person_id column in a CSV file
+
+    :param table_name: name of the table the file is loaded into
+    :param header: column names in the first row of the file
+    :return: position of the person_id column.  If the header has no
+        person_id column, 0 for PID_IN_COL1 tables and 1 for the others.
+    """
+    columns = [column.strip().strip('"').lower() for column in header]
+    if PERSON_ID in columns:
+        return columns.index(PERSON_ID)
+    return 0 if table_name in PID_IN_COL1 else 1
+
+
+def _is_pid(value, pids) -> bool:
+    """
+    Determine whether a person_id value is one of the pids
+
+    :param value: value of the person_id column or field
+    :param pids: set of integer pids
+    :return: True if the value is one of the pids, False if it is not or is
+        not an integer
+    """
+    try:
+        return int(str(value).strip()) in pids
+    except ValueError:
+        return False
+
+
+def _csv_records(lines):
+    """
+    Parse CSV records, keeping their text as it is in the file
+
+    :param lines: iterable of lines, with their line endings
+    :return: generator of tuples (list of values, text of the record).  A
+        record spans several lines if a quoted value has line breaks.
+    """
+    record_lines = []
+
+    def read_lines():
+        for line in lines:
+            record_lines.append(line)
+            yield line
+
+    for row in csv.reader(read_lines()):
+        record = ''.join(record_lines)
+        record_lines.clear()
+        yield row, record
+
+
+def filter_csv_lines(pids, table_name, lines, write=None) -> int:
+    """
+    Remove the records of pids from a CSV file
+
+    The header, blank lines, records with a non-integer person_id and
+    records with fewer than two values are kept.  Kept records are written
+    back as they are in the file.
+
+    :param pids: set of integer pids
+    :param table_name: name of the table the file is loaded into
+    :param lines: iterable of lines of the file
+    :param write: function called with the text of each kept record, None
+        to only count the records to remove
+    :return: number of records removed
+    """
+    lines_removed = 0
+    pid_column = None
+    for row, record in _csv_records(lines):
+        if pid_column is None:
+            pid_column = get_pid_column(table_name, row)
+        elif len(row) > max(pid_column, 1) and _is_pid(row[pid_column], pids):
+            lines_removed += 1
+            continue
+        if write:
+            write(record)
+    return lines_removed
+
+
+def filter_jsonl_lines(pids, lines, write=None) -> int:
+    """
+    Remove the records of pids from a JSONL file
 
+    Blank lines, lines which are not JSON objects and lines with a
+    non-integer person_id are kept.  Kept lines are written back as they are
+    in the file.
 
-def retract(pids, bucket, found_files, folder_prefix, force_flag):
+    :param pids: set of integer pids
+    :param lines: iterable of lines of the file
+    :param write: function called with each kept line, None to only count
+        the lines to remove
+    :return: number of lines removed
+    """
+    lines_removed = 0
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if isinstance(record, dict) and _is_pid(record.get(PERSON_ID), pids):
+            lines_removed += 1
+            continue
+        if write:
+            write(line)
+    return lines_removed
+
+
+def filter_file(pids, file_name, input_stream, output_stream=None) -> int:
+    """
+    Stream a submission file, removing the records of pids
+
+    :param pids: set of integer pids
+    :param file_name: name of the file, e.g. 'person.csv'
+    :param input_stream: binary file object to read the file from
+    :param output_stream: binary file object the kept records are written
+        to, None to only count the records to remove
+    :return: number of records removed
+    :raises ValueError: if the file is neither CSV nor JSONL
+    """
+    table_name, extension = file_name.lower().rsplit('.', 1)
+    lines = io.TextIOWrapper(input_stream,
+                             encoding=ENCODING,
+                             errors=ENCODING_ERRORS,
+                             newline='')
+    write = None
+    if output_stream is not None:
+
+        def write(text):
+            output_stream.write(text.encode(ENCODING, ENCODING_ERRORS))
+
+    try:
+        if extension == CSV:
+            return filter_csv_lines(pids, table_name, lines, write)
+        if extension == JSONL:
+            return filter_jsonl_lines(pids, lines, write)
+        raise ValueError(f'Unable to retract from {file_name}, only '
+                         f'{CSV} and {JSONL} files are supported')
+    finally:
+        # leave closing the input stream to the caller
+        lines.detach()
+
+
+def retract_blob(pids, bucket, blob_name, dry_run=False) -> int:
+    """
+    Remove the records of pids from a file in a bucket
+
+    The file is read once to count the records to remove.  Only if there are
+    any it is read again while the retracted file is uploaded to a temporary
+    object.  Once the upload succeeded, the temporary object is copied over
+    the file.  Both reads are pinned to the generation of the file, and the
+    copy fails if the file changes in between.  A failed read or upload
+    leaves the file as it is.
+
+    :param pids: set of integer pids
+    :param bucket: bucket containing the file
+    :param blob_name: name of the file in the bucket
+    :param dry_run: if True only count the records to remove
+    :return: number of records removed, or to remove if dry_run
+    """
+    file_name = blob_name.split('/')[-1]
+    blob = bucket.get_blob(blob_name)
+    if blob is None:
+        logging.info(f'Skipping {bucket.name}/{blob_name}, it does not exist')
+        return 0
+    source = bucket.blob(blob_name, generation=blob.generation)
+
+    with source.open('rb', chunk_size=GCS_RETRACTION_CHUNK_SIZE) as reader:
+        lines_removed = filter_file(pids, file_name, reader)
+    if not lines_removed or dry_run:
+        return lines_removed
+
+    logging.info(f'Uploading retracted {bucket.name}/{blob_name}...')
+    temp = bucket.blob(f'{blob_name}.{uuid.uuid4().hex}{TEMP_SUFFIX}')
+    try:
+        with source.open('rb', chunk_size=GCS_RETRACTION_CHUNK_SIZE) as reader:
+            # a writer closed by an error still finalizes the upload, so the
+            # file is only replaced once the whole file was written
+            with temp.open('wb',
+                           chunk_size=GCS_RETRACTION_CHUNK_SIZE,
+                           content_type=blob.content_type or 'text/csv',
+                           if_generation_match=0) as writer:
+                lines_removed = filter_file(pids, file_name, reader, writer)
+
+        target = bucket.blob(blob_name)
+        token, _, _ = target.rewrite(temp, if_generation_match=blob.generation)
+        while token is not None:
+            token, _, _ = target.rewrite(temp,
+                                         token=token,
+                                         if_generation_match=blob.generation)
+    finally:
+        try:
+            temp.delete()
+        except NotFound:
+            pass
+    logging.info(f'Retraction successful for file {bucket.name}/{blob_name}')
+    return lines_removed
+
+
+def retract_blobs(pids,
+                  bucket,
+                  blob_names,
+                  dry_run=False,
+                  max_workers=GCS_RETRACTION_MAX_WORKERS):
+    """
+    Remove the records of pids from files in a bucket, several at a time
+
+    A failing file does not stop the others.  The failures are raised once
+    all files are processed.
+
+    :param pids: person_ids to retract
+    :param bucket: bucket containing the files
+    :param blob_names: names of the files in the bucket
+    :param dry_run: if True only count the records to remove
+    :param max_workers: max number of files processed at the same time
+    :return: OrderedDict of file name to number of records removed, or to
+        remove if dry_run
+    :raises RuntimeError: if a file could not be retracted
+    """
+    pids = frozenset(int(pid) for pid in pids)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = OrderedDict(
+            (blob_name,
+             executor.submit(retract_blob, pids, bucket, blob_name, dry_run))
+            for blob_name in blob_names)
+
+    summary = OrderedDict()
+    failed = []
+    for blob_name, future in futures.items():
+        try:
+            summary[blob_name] = future.result()
+        except Exception:
+            logging.exception(
+                f'Retraction failed for {bucket.name}/{blob_name}')
+            failed.append(blob_name)
+
+    action = 'to retract' if dry_run else 'retracted'
+    logging.info(f'Lines {action} per file:')
+    for blob_name, lines_removed in summary.items():
+        logging.info(f'\t{bucket.name}/{blob_name}:\t{lines_removed}')
+    if failed:
+        raise RuntimeError(f'Retraction failed for {len(failed)} files in '
+                           f'{bucket.name}: {failed}')
+    return summary
+
+
+def retract(pids,
+            bucket,
+            found_files,
+            folder_prefix,
+            force_flag,
+            dry_run=False,
+            max_workers=GCS_RETRACTION_MAX_WORKERS):
     """
     Retract from a folder in a GCS bucket all records associated with a pid
     pid table must follow schema described in retract_data_bq.PID_TABLE_FIELDS and must reside in sandbox_dataset_id
     This function removes lines from all files containing person_ids if they exist in pid_table_id
-    Throws SyntaxError/TypeError/ValueError if non-ints are found
+    Lines with a non-integer person_id are kept
 
     :param pids: person_ids to retract
     :param bucket: bucket containing records to retract
     :param found_files: files found in the current folder
     :param folder_prefix: current folder being processed
     :param force_flag: if False then prompt for each file
+    :param dry_run: if True only count the records to remove
+    :param max_workers: max number of files processed at the same time
+    :return: OrderedDict of file name to number of records removed, or to
+        remove if dry_run
+    """
+    blob_names = get_files_to_retract(pids, bucket, found_files, folder_prefix,
+                                      force_flag)
+    return retract_blobs(pids, bucket, blob_names, dry_run, max_workers)
+
+
+def get_files_to_retract(pids, bucket, found_files, folder_prefix, force_flag):
     """
+    Get the files of a folder to retract from, prompting for each file
+
+    :param pids: person_ids to retract
+    :param bucket: bucket containing records to retract
+    :param found_files: files found in the current folder
+    :param folder_prefix: current folder being processed
+    :param force_flag: if False then prompt for each file
+    :return: list of file names in the bucket
+    """
+    blob_names = []
     for file_name in found_files:
-        table_name, extension = file_name.split(".")
-        # TODO retract from JSONL files
-        if extension.upper() in ['JSON', 'JSONL']:
-            continue
-        lines_removed = 0
         file_gcs_path = f'{bucket.name}/{folder_prefix}{file_name}'
         if force_flag:
-            logging.info(f"Downloading file in path {file_gcs_path}")
             response = "Y"
         else:
             # Make sure user types Y to proceed
@@ -170,64 +475,10 @@ def retract(pids, bucket, found_files, folder_prefix, force_flag):
             )
             response = get_response()
         if response == "Y":
-            # Output and input file content initialization
-            retracted_file_string = BytesIO()
-            blob = bucket.blob(f'{folder_prefix}{file_name}')
-            input_file_lines = blob.download_as_string().split(b'\n')
-            if len(input_file_lines) < 2:
-                continue
-            input_header = input_file_lines[0]
-            input_contents = input_file_lines[1:]
-            retracted_file_string.write(input_header + b'\n')
-            logging.info(
-                f"Checking for person_ids {pids} in path {file_gcs_path}")
-
-            # Check if file has person_id in first or second column
-            for input_line in input_contents:
-                input_line = input_line.strip()
-                # ensure line is not empty
-                if input_line:
-                    cols = input_line.split(b',')
-                    # ensure at least two columns exist
-                    if len(cols) > 1:
-                        col_1 = cols[0].replace(b'"', b'')
-                        col_2 = cols[1].replace(b'"', b'')
-                        # skip if non-integer is encountered and keep the line as is
-                        try:
-                            if ((table_name in PID_IN_COL1 and
-                                 int(col_1) in pids) or
-                                (table_name in PID_IN_COL2 and
-                                 int(col_2) in pids)):
-                                # do not write back this line since it contains a pid to retract
-                                # increment removed lines counter
-                                lines_removed += 1
-                            else:
-                                # pid not found, retain this line
-                                retracted_file_string.write(input_line + b'\n')
-                        except ValueError:
-                            # write back non-num lines
-                            retracted_file_string.write(input_line + b'\n')
-                    else:
-                        # write back ill-formed lines. Note: These lines do not make it into BigQuery
-                        retracted_file_string.write(input_line + b'\n')
-
-            # Write result back to bucket
-            if lines_removed > 0:
-                logging.info(
-                    f"{lines_removed} rows retracted from {file_gcs_path}")
-                logging.info(f"Uploading to overwrite...")
-                new_blob = bucket.blob(f'{folder_prefix}{file_name}')
-                new_blob.upload_from_file(retracted_file_string,
-                                          rewind=True,
-                                          content_type='text/csv')
-                logging.info(f"Retraction successful for file {file_gcs_path}")
-            else:
-                logging.info(
-                    f"Not updating file {file_gcs_path} since pids {pids} not found"
-                )
+            blob_names.append(f'{folder_prefix}{file_name}')
         elif response.lower() == "n":
             logging.info(f"Skipping file {file_gcs_path}")
-    return
+    return blob_names
 
 
 # Make sure user types Y to proceed
@@ -241,12 +492,12 @@ def get_response():
 
 def extract_pids_from_table(project_id, sandbox_dataset_id, pid_table_id):
     """
-    Extracts person_ids from table in BQ in the form of a set of integers
+    Extracts person_ids from table in BQ in the form of a list of integers
 
     :param project_id: project containing the sandbox dataset with pid table
     :param sandbox_dataset_id: dataset containing the pid table
     :param pid_table_id: identifies the table containing the person_ids to retract
-    :return: set of integer pids
+    :return: list of integer pids
     """
     q = EXTRACT_PIDS_QUERY.format(project_id=project_id,
                                   sandbox_dataset_id=sandbox_dataset_id,
@@ -311,8 +562,26 @@ if __name__ == '__main__':
         action='store_true',
         help='Optional. Indicates pids must be retracted without user prompts',
         required=False)
+    parser.add_argument(
+        '--dry_run',
+        dest='dry_run',
+        action='store_true',
+        help='Optional. Only report the number of lines to retract per file',
+        required=False)
+    parser.add_argument('--max_workers',
+                        dest='max_workers',
+                        type=int,
+                        default=GCS_RETRACTION_MAX_WORKERS,
+                        help='Optional. Max number of files retracted at the '
+                        'same time',
+                        required=False)
     args = parser.parse_args()
 
-    run_gcs_retraction(args.project_id, args.sandbox_dataset_id,
-                       args.pid_table_id, args.hpo_id, args.folder_name,
-                       args.force_flag)
+    run_gcs_retraction(args.project_id,
+                       args.sandbox_dataset_id,
+                       args.pid_table_id,
+                       args.hpo_id,
+                       args.folder_name,
+                       args.force_flag,
+                       dry_run=args.dry_run,
+                       max_workers=args.max_workers)
@@ -25,7 +25,7 @@ def main(args):
     folder_prefix = f'{args.folder}/'
     project = app_identity.get_application_id()
     bq_client = BigQueryClient(project)
-    _run_achilles(client=bq_client)
+    _run_achilles(client=bq_client, batch_by_table=args.batch_by_table)
     _run_export(datasource_id=dataset_id,
                 folder_prefix=folder_prefix,
                 target_bucket=target_bucket)
@@ -41,5 +41,10 @@ if __name__ == '__main__':
         '--folder',
         default='',
         help='Identifier for the folder in which achilles results sit.')
+    parser.add_argument(
+        '--batch_by_table',
+        action='store_true',
+        help='Combine the achilles analyses inserting into the same '
+        'results table and reading the same CDM table into one query.')
     args = parser.parse_args()
     main(args)
@@ -9,6 +9,8 @@ from datetime import datetime
 import logging
 import os
 from argparse import ArgumentParser
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # Third party imports
 import google
@@ -22,6 +24,7 @@ from resources import fields_for, fields_path, DEID_PATH
 from gcloud.bq import BigQueryClient
 from google.cloud.bigquery.job import CopyJobConfig, WriteDisposition
 from common import JINJA_ENV, PIPELINE_TABLES, EXT_SUFFIX
+from constants.deid.deid import DEID_MAX_WORKERS
 
 LOGGER = logging.getLogger(__name__)
 DEID_TABLES = [
@@ -249,6 +252,14 @@ def parse_args(raw_args=None):
                         action='store',
                         required=True,
                         help='Set the maximum allowable age of participants.')
+    parser.add_argument('--max_workers',
+                        dest='max_workers',
+                        action='store',
+                        type=int,
+                        required=False,
+                        default=DEID_MAX_WORKERS,
+                        help='Max number of tables de-identified at the same '
+                        'time.')
     return parser.parse_args(raw_args)
 
 
@@ -324,11 +335,62 @@ def copy_ext_tables(bq_client, input_dataset: str, output_dataset: str) -> list:
     return job_list
 
 
+def get_parameter_list(args, table, configured_tables, deid_tables_path):
+    """
+    Get the deid.aou command line arguments for a table
+
+    :param args: parsed command line arguments of this script
+    :param table: name of the table to de-identify
+    :param configured_tables: tables with a deid configuration file
+    :param deid_tables_path: path to the table configuration files
+    :return: list of command line arguments
+    """
+    if table in configured_tables:
+        tablepath = os.path.join(deid_tables_path, table + '.json')
+    else:
+        tablepath = table
+
+    parameter_list = [
+        '--rules',
+        os.path.join(DEID_PATH, 'config', 'ids',
+                     'config.json'), '--private_key', args.private_key,
+        '--table', tablepath, '--action', args.action, '--idataset',
+        args.input_dataset, '--log', LOGS_PATH, '--odataset', args.odataset,
+        '--age-limit', args.age_limit, '--run_as', args.run_as_email
+    ]
+
+    if args.interactive_mode:
+        parameter_list.append('--interactive')
+
+    field_names = [field.get('name') for field in fields_for(table)]
+    if 'person_id' in field_names:
+        parameter_list.append('--cluster')
+
+    return parameter_list
+
+
+def run_table_deid(table, parameter_list, run_args):
+    """
+    De-identify a table
+
+    :param table: name of the table to de-identify
+    :param parameter_list: deid.aou command line arguments for the table
+    :param run_args: keyword arguments returned by deid.aou.prepare_run
+    """
+    LOGGER.info(
+        f"Executing deid with:\n\tpython deid/aou.py {' '.join(parameter_list)}"
+    )
+    aou.main(parameter_list, **run_args)
+    LOGGER.info(f"Successfully executed deid on table: {table}")
+
+
 def main(raw_args=None):
     """
     Execute deid as a single script.
 
     Responsible for aggregating the tables deid will execute on and calling deid.
+    The initialization shared by all tables is done once, then the tables are
+    de-identified at the same time.  A table failing does not stop the others.
     """
     args = parse_args(raw_args)
     add_console_logging(args.console_log)
@@ -355,42 +417,30 @@ def main(raw_args=None):
     bq_client.wait_on_jobs(copy_job_list)
     logging.info(f"Finished copying ext tables.")
 
+    # the concept_id lookup table, the age check and the output dataset are
+    # shared by all tables
+    run_args = aou.prepare_run(args.run_as_email, args.input_dataset,
+                               args.odataset, int(args.age_limit))
+
+    with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+        futures = OrderedDict()
+        for table in tables + ['person_ext']:
+            parameter_list = get_parameter_list(args, table, configured_tables,
+                                                deid_tables_path)
+            futures[table] = executor.submit(run_table_deid, table,
+                                             parameter_list, run_args)
+
     exceptions = []
     successes = []
-    for table in tables + ['person_ext']:
-        tablepath = None
-        if table in configured_tables:
-            tablepath = os.path.join(deid_tables_path, table + '.json')
-        else:
-            tablepath = table
-
-        parameter_list = [
-            '--rules',
-            os.path.join(DEID_PATH, 'config', 'ids',
-                         'config.json'), '--private_key', args.private_key,
-            '--table', tablepath, '--action', args.action, '--idataset',
-            args.input_dataset, '--log', LOGS_PATH, '--odataset', args.odataset,
-            '--age-limit', args.age_limit, '--run_as', args.run_as_email
-        ]
-
-        if args.interactive_mode:
-            parameter_list.append('--interactive')
-
-        field_names = [field.get('name') for field in fields_for(table)]
-        if 'person_id' in field_names:
-            parameter_list.append('--cluster')
-
-        LOGGER.info(
-            f"Executing deid with:\n\tpython deid/aou.py {' '.join(parameter_list)}"
-        )
-
+    for table, future in futures.items():
         try:
-            aou.main(parameter_list)
+            future.result()
         except google.api_core.exceptions.GoogleAPIError:
-            LOGGER.exception("Encountered deid exception:\n")
+            # programming errors are raised, since the other tables are
+            # likely to fail the same way
+            LOGGER.exception(f"Encountered deid exception on table {table}:\n")
             exceptions.append(table)
         else:
-            LOGGER.info(f"Successfully executed deid on table: {table}")
             successes.append(table)
 
     copy_suppressed_table_schemas(known_tables, args.odataset)
@@ -0,0 +1,72 @@
+"""
+Runs tasks concurrently, each as soon as the tasks it depends on finish.
+
+Used to run the achilles statements (validation.sql_wrangle.run_commands) and
+the steps of the EHR union (validation.ehr_union.run_steps).
+"""
+# Python imports
+import logging
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+LOGGER = logging.getLogger(__name__)
+
+
+def run_dependent_tasks(tasks, max_workers=1):
+    """
+    Run tasks concurrently while honoring their dependencies
+
+    Tasks are started in order as soon as their dependencies finish, with at
+    most max_workers tasks submitted at a time.  If a task fails no further
+    tasks are started and the error is raised once the running tasks finish.
+
+    :param tasks: OrderedDict of task name to tuple (function, set of the
+        names of the tasks it depends on)
+    :param max_workers: max number of tasks running at the same time.  1 runs
+        the tasks one after another.
+    :return: None
+    :raises ValueError: if a task depends on a task that is not listed or the
+        dependencies of the tasks form a cycle
+    """
+    unknown = {
+        dependency for _, dependencies in tasks.values()
+        for dependency in dependencies
+    } - set(tasks)
+    if unknown:
+        raise ValueError(f'Tasks depend on unknown tasks {unknown}')
+
+    pending = OrderedDict(tasks)
+    finished = set()
+    running = dict()
+    failure = None
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while running or (pending and failure is None):
+            if failure is None:
+                for name, (function, dependencies) in list(pending.items()):
+                    if len(running) >= max_workers:
+                        break
+                    if dependencies <= finished:
+                        del pending[name]
+                        LOGGER.info(f'Starting {name}...')
+                        running[executor.submit(function)] = name
+                if not running:
+                    raise ValueError(f'Tasks {list(pending)} are blocked by a '
+                                     f'dependency cycle')
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    LOGGER.error(f'{name} failed, not starting '
+                                 f'{len(pending)} waiting tasks')
+                    failure = failure or error
+                else:
+                    LOGGER.info(f'Completed {name}')
+                    finished.add(name)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    if failure is not None:
+        raise failure
@@ -30,6 +30,50 @@ OPTIONS(
 {%- endblock %}
 """)
 
+# Metadata columns of key-only sandbox tables.  Key-only sandbox tables hold
+# the key fields of the sandboxed rows instead of the full rows.
+SANDBOXED_BY = 'sandboxed_by'
+SANDBOXED_AT = 'sandboxed_at'
+SOURCE_TABLE = 'source_table'
+KEY_ONLY_SANDBOX_FIELDS = [SANDBOXED_BY, SANDBOXED_AT, SOURCE_TABLE]
+
+# default time travel window of BigQuery datasets
+TIME_TRAVEL_HOURS = 168
+
+KEY_ONLY_SANDBOX_COLUMNS = JINJA_ENV.from_string("""
+{%- for key_field in key_fields %}{{alias}}.{{key_field}}, {% endfor -%}
+'{{rule}}' AS {{sandboxed_by}},
+CURRENT_TIMESTAMP() AS {{sandboxed_at}},
+'{{source_table}}' AS {{source_table_field}}""")
+
+# Rebuilds the full rows of a key-only sandbox table from the source table
+# as it was when the rows were sandboxed, using BigQuery time travel.  Fails
+# instead of returning no rows once the time travel window has passed.
+SANDBOXED_ROWS_QUERY = JINJA_ENV.from_string("""
+DECLARE snapshot_time TIMESTAMP DEFAULT (
+  SELECT COALESCE(MIN({{sandboxed_at}}), CURRENT_TIMESTAMP())
+  FROM `{{project}}.{{sandbox_dataset}}.{{sandbox_table}}`
+);
+
+IF snapshot_time < TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {{time_travel_hours}} HOUR) THEN
+  RAISE USING MESSAGE = FORMAT(
+    'Rows of `{{sandbox_dataset}}.{{sandbox_table}}` were sandboxed at %t, '
+    'outside the time travel window of `{{dataset}}.{{table}}`',
+    snapshot_time);
+END IF;
+
+{% if destination_table %}
+CREATE OR REPLACE TABLE `{{project}}.{{sandbox_dataset}}.{{destination_table}}` AS
+{% endif %}
+SELECT d.*
+FROM `{{project}}.{{dataset}}.{{table}}`
+  FOR SYSTEM_TIME AS OF snapshot_time AS d
+WHERE d.{{key_field}} IN (
+  SELECT {{key_field}}
+  FROM `{{project}}.{{sandbox_dataset}}.{{sandbox_table}}`
+)
+""")
+
 
 def create_sandbox_dataset(client, dataset_id):
     """
@@ -175,3 +219,73 @@ def get_sandbox_options(dataset_name,
 
     contents = ',\n'.join([description_text, labels_text])
     return TABLE_OPTIONS_CLAUSE.render(contents=contents)
+
+
+def get_key_only_sandbox_columns(key_fields, rule, source_table, alias='d'):
+    """
+    A helper function to get the columns a key-only sandbox table stores
+
+    :param key_fields: the fields identifying the sandboxed rows, typically the
+        table's primary key and person_id, so retraction can find the table
+    :param rule: name of the cleaning rule sandboxing the rows
+    :param source_table: fully qualified id of the table the rows are in
+    :param alias: alias of the source table in the sandbox query
+    :return: a select list for the sandbox query
+    """
+    return KEY_ONLY_SANDBOX_COLUMNS.render(key_fields=key_fields,
+                                           rule=rule,
+                                           source_table=source_table,
+                                           alias=alias,
+                                           sandboxed_by=SANDBOXED_BY,
+                                           sandboxed_at=SANDBOXED_AT,
+                                           source_table_field=SOURCE_TABLE)
+
+
+def is_key_only_sandbox_table(column_names):
+    """
+    A helper function to determine if a sandbox table only holds row keys
+
+    :param column_names: names of the columns of the sandbox table
+    :return: True if the table has the metadata columns of a key-only
+        sandbox table
+    """
+    return all(field in column_names for field in KEY_ONLY_SANDBOX_FIELDS)
+
+
+def get_sandboxed_rows_query(project_id,
+                             dataset_id,
+                             table,
+                             sandbox_dataset_id,
+                             sandbox_table,
+                             key_field,
+                             destination_table=None,
+                             time_travel_hours=TIME_TRAVEL_HOURS):
+    """
+    A helper function to get the full rows of a key-only sandbox table
+
+    The rows are read from the source table as of the time they were
+    sandboxed, so the query only works within the time travel window of the
+    source dataset, seven days by default.  The query raises an error if the
+    rows were sandboxed before the window.  Set destination_table to keep the
+    full rows for longer.
+
+    :param project_id: identifies the project
+    :param dataset_id: identifies the dataset the rows were sandboxed from
+    :param table: name of the table the rows were sandboxed from
+    :param sandbox_dataset_id: identifies the sandbox dataset
+    :param sandbox_table: name of the key-only sandbox table
+    :param key_field: the field identifying the rows of the table
+    :param destination_table: if set, the rows are saved to this table of
+        the sandbox dataset
+    :param time_travel_hours: time travel window of the source dataset
+    :return: a query script
+    """
+    return SANDBOXED_ROWS_QUERY.render(project=project_id,
+                                       dataset=dataset_id,
+                                       table=table,
+                                       sandbox_dataset=sandbox_dataset_id,
+                                       sandbox_table=sandbox_table,
+                                       key_field=key_field,
+                                       sandboxed_at=SANDBOXED_AT,
+                                       destination_table=destination_table,
+                                       time_travel_hours=time_travel_hours)
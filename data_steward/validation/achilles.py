@@ -1,12 +1,14 @@
 # Python imports
 import logging
 import os
+from collections import OrderedDict
 
 # Project imports
 import app_identity
 import bq_utils
 import resources
 import common
+from common import JINJA_ENV
 from validation import sql_wrangle
 
 ACHILLES_ANALYSIS = 'achilles_analysis'
@@ -15,6 +17,27 @@ ACHILLES_RESULTS_DIST = 'achilles_results_dist'
 ACHILLES_TABLES = [ACHILLES_ANALYSIS, ACHILLES_RESULTS, ACHILLES_RESULTS_DIST]
 ACHILLES_DML_SQL_PATH = os.path.join(resources.resource_files_path,
                                      'achilles_dml.sql')
+# max number of analyses running at the same time
+ACHILLES_MAX_WORKERS = 10
+
+# One INSERT for all analyses of a group.  Each analysis is projected onto
+# the columns of the group.  Its own columns are named by position through a
+# typed, empty first UNION ALL branch, as the INSERT column list did.
+ANALYSES_BATCH_QUERY = JINJA_ENV.from_string("""
+insert into {{table_id}} ({{columns | join(', ')}})
+{% for branch in branches %}
+{{ 'UNION ALL' if not loop.first }}
+(SELECT
+  {{ branch.projection }}
+FROM (
+  (SELECT {{ branch.prototype }} LIMIT 0)
+  UNION ALL
+  (
+{{ branch.query }}
+  )
+))
+{% endfor %}
+""")
 
 
 def _get_run_analysis_commands(hpo_id):
@@ -23,6 +46,124 @@ def _get_run_analysis_commands(hpo_id):
     return commands
 
 
+def _get_source_table(query, hpo_id):
+    """
+    Get the first CDM table an analysis query reads
+
+    :param query: query of the analysis
+    :param hpo_id: hpo_id of the site the query is qualified for
+    :return: table name, None if the query reads no CDM table
+    """
+    cdm_tables = {
+        resources.get_table_id(table_name, hpo_id=hpo_id)
+        for table_name in resources.CDM_TABLES
+    }
+    for token in sql_wrangle.TABLE_TOKEN_PATTERN.findall(query.lower()):
+        if token in cdm_tables:
+            return token
+    return None
+
+
+def _get_column_types(table_id):
+    """
+    Get the columns of an achilles results table
+
+    :param table_id: qualified name of the table
+    :return: ordered dict of column name to BigQuery type, empty if the table
+        is not an achilles results table
+    """
+    for table_name in [ACHILLES_RESULTS_DIST, ACHILLES_RESULTS]:
+        if table_id.endswith(table_name):
+            return OrderedDict(
+                (field['name'], resources.get_bq_col_type(field['type']))
+                for field in resources.fields_for(table_name))
+    return OrderedDict()
+
+
+def _get_batch_command(table_id, group):
+    """
+    Combine the analyses inserting into the same table into one INSERT
+
+    :param table_id: table the analyses insert into
+    :param group: list of (columns, query) of each analysis
+    :return: the combined statement
+    """
+    column_types = _get_column_types(table_id)
+    used = {column for columns, _ in group for column in columns}
+    columns = [column for column in column_types if column in used]
+
+    branches = []
+    for branch_columns, query in group:
+        projection = ', '.join(
+            column if column in branch_columns else
+            f'CAST(NULL AS {column_types[column]}) AS {column}'
+            for column in columns)
+        prototype = ', '.join(
+            f'CAST(NULL AS {column_types[column]}) AS {column}'
+            for column in branch_columns)
+        branches.append(
+            dict(projection=projection, prototype=prototype, query=query))
+    return ANALYSES_BATCH_QUERY.render(table_id=table_id,
+                                       columns=columns,
+                                       branches=branches)
+
+
+def _get_batched_analysis_commands(hpo_id):
+    """
+    Combine the analyses inserting into the same table and reading the same
+    CDM table into one INSERT ... UNION ALL per table pair
+
+    An analysis is moved into the statement of an earlier analysis with the
+    same tables only if it does not depend on any statement between them,
+    e.g. a temp table created, dropped or truncated in between.  Otherwise it
+    starts a new statement.  Other statements and analyses without another
+    analysis to combine with are kept as they are.
+
+    :param hpo_id: hpo_id of the site to run achilles on
+    :return: list of statements
+    """
+    analysis_commands = _get_run_analysis_commands(hpo_id)
+    dependencies = sql_wrangle.get_command_dependencies(analysis_commands)
+    # each slot is a statement to run, as a dict with the table pair it
+    # combines (None for a statement kept as it is), the analyses it combines
+    # and the indexes of the commands it stands for
+    slots = []
+    latest_slot = dict()
+    for index, command in enumerate(analysis_commands):
+        parts = sql_wrangle.get_insert_parts(command)
+        key = None
+        if parts:
+            table_id, columns, query = parts
+            source_table = _get_source_table(query, hpo_id)
+            if source_table and not set(columns) - set(
+                    _get_column_types(table_id)):
+                key = (table_id, source_table)
+
+        position = latest_slot.get(key)
+        if key is not None and position is not None and not any(
+                dependencies[index] & slot['indexes']
+                for slot in slots[position + 1:]):
+            slots[position]['group'].append((columns, query))
+            slots[position]['indexes'].add(index)
+            continue
+
+        slots.append({
+            'key': key,
+            'group': [(columns, query)] if key else [],
+            'indexes': {index}
+        })
+        if key is not None:
+            latest_slot[key] = len(slots) - 1
+
+    commands = []
+    for slot in slots:
+        if len(slot['indexes']) > 1:
+            commands.append(_get_batch_command(slot['key'][0], slot['group']))
+        else:
+            commands.append(analysis_commands[min(slot['indexes'])])
+    return commands
+
+
 def load_analyses(hpo_id):
     """
     Populate achilles lookup table
@@ -83,21 +224,35 @@ def run_analysis_job(command):
         raise RuntimeError('Job id %s taking too long' % job_id)
 
 
-def run_analyses(client, hpo_id):
+def run_analyses(client,
+                 hpo_id,
+                 max_workers=ACHILLES_MAX_WORKERS,
+                 batch_by_table=False):
     """
     Run the achilles analyses
-    
+
+    Analyses that do not read or write the same tables run concurrently.
+
     :param client: a BigQueryClient
     :param hpo_id: hpo_id of the site to run on
+    :param max_workers: max number of analyses running at the same time
+    :param batch_by_table: if True, analyses inserting into the same results
+        table and reading the same CDM table run as one INSERT
     :return: None
     """
-    commands = _get_run_analysis_commands(hpo_id)
-    for command in commands:
+
+    def run_command(command):
         if sql_wrangle.is_truncate(command) or sql_wrangle.is_drop(command):
             drop_or_truncate_table(client, command)
         else:
             run_analysis_job(command)
 
+    if batch_by_table:
+        commands = _get_batched_analysis_commands(hpo_id)
+    else:
+        commands = _get_run_analysis_commands(hpo_id)
+    sql_wrangle.run_commands(commands, run_command, max_workers)
+
 
 def create_tables(hpo_id, drop_existing=False):
     """
@@ -17,6 +17,8 @@ SPLIT_PATTERN = ';zzzzzz'
 
 ACHILLES_HEEL_DML = os.path.join(resources.resource_files_path,
                                  'achilles_heel_dml.sql')
+# max number of heel commands running at the same time
+ACHILLES_HEEL_MAX_WORKERS = 10
 
 
 def remove_sql_comment_from_string(string):
@@ -67,7 +69,9 @@ def drop_or_truncate_table(client, command):
     if sql_wrangle.is_truncate(command):
         table_id = sql_wrangle.get_truncate_table_name(command)
         query = 'DELETE FROM %s WHERE TRUE' % table_id
-        bq_utils.query(query)
+        job_result = bq_utils.query(query)
+        # commands reading the table may start once this returns
+        bq_utils.wait_on_jobs([job_result['jobReference']['jobId']])
     else:
         table_id = sql_wrangle.get_drop_table_name(command)
         assert (table_id not in common.VOCABULARY_TABLES)
@@ -97,21 +101,27 @@ def run_heel_analysis_job(command):
         raise RuntimeError('Job id %s taking too long' % job_id)
 
 
-def run_heel(client, hpo_id):
+def run_heel(client, hpo_id, max_workers=ACHILLES_HEEL_MAX_WORKERS):
     """
     Run heel commands
 
+    Commands that do not read or write the same tables run concurrently.
+
     :param client: BigQueryClient
     :param hpo_id: string name for the hpo identifier
+    :param max_workers: max number of commands running at the same time
     :returns: None
     """
-    commands = _get_heel_commands(hpo_id)
-    for command in commands:
+
+    def run_command(command):
         if sql_wrangle.is_truncate(command) or sql_wrangle.is_drop(command):
             drop_or_truncate_table(client, command)
         else:
             run_heel_analysis_job(command)
 
+    commands = list(_get_heel_commands(hpo_id))
+    sql_wrangle.run_commands(commands, run_command, max_workers)
+
 
 def create_tables(hpo_id, drop_existing=False):
     """
@@ -66,6 +66,18 @@ NOTE We DO NOT create unioned_ehr_death in this script. We create unioned_ehr_ao
 
  4) Create and load aou_death. death is not created in this process.
 
+ Steps 2 to 4 run concurrently.  Each table is loaded as soon as the mapping tables
+ its query reads are loaded.  Person to observation runs once all of them are done.
+
+ With --incremental only the sites whose submission tables were added, removed or
+ modified since the last union are reprocessed.  The last modified time and row count
+ of the tables read by each successful union are saved in _ehr_union_sources.  The
+ rows of changed sites are deleted from the mapping tables and the unioned tables
+ with mapped ids, and their submissions are loaded again using the same id offsets.
+ Tables without mapped ids (e.g. person, fact_relationship) are reloaded for all sites.
+ All tables are rebuilt if _ehr_union_sources is missing or the id offsets of the
+ sites changed, e.g. because a site was added to or excluded from the union.
+
 ## Notes
 Currently the following environment variables must be set:
  * GOOGLE_APPLICATION_CREDENTIALS: path to service account key json file (e.g. /path/to/all-of-us-ehr-dev-abc123.json)
@@ -84,7 +96,10 @@ TODO: Refactor query generation logic in mapping_query and table_union_query
 # Python imports
 import argparse
 import logging
+import re
+from collections import OrderedDict
 from datetime import datetime
+from functools import partial
 
 # Third party imports
 import google.cloud.bigquery as bq
@@ -102,6 +117,7 @@ from common import (AOU_DEATH, CARE_SITE, DEATH, FACT_RELATIONSHIP,
                     VISIT_DETAIL, VISIT_OCCURRENCE, BIGQUERY_DATASET_ID)
 from constants.validation import ehr_union as eu_constants
 from utils import pipeline_logging
+from utils.dependent_tasks import run_dependent_tasks
 from gcloud.bq import BigQueryClient
 from resources import (fields_for, get_table_id, has_primary_key,
                        validate_date_string, CDM_TABLES)
@@ -155,6 +171,39 @@ SELECT
 FROM union_aou_death
 """)
 
+DATASET_TABLES_QUERY = JINJA_ENV.from_string("""
+SELECT table_id, last_modified_time, row_count
+FROM `{{project}}.{{dataset}}.__TABLES__`
+""")
+
+UNION_SOURCES_QUERY = JINJA_ENV.from_string("""
+SELECT table_id, hpo_id, hpo_offset, last_modified_time, row_count
+FROM `{{project}}.{{dataset}}.{{sources_table}}`
+""")
+
+DELETE_UNIONED_SLICE_QUERY = JINJA_ENV.from_string("""
+DELETE FROM `{{project}}.{{dataset}}.{{unioned_table}}`
+WHERE {{table_name}}_id IN (
+    SELECT {{table_name}}_id
+    FROM `{{project}}.{{dataset}}.{{mapping_table}}`
+    WHERE src_hpo_id IN ({% for hpo_id in hpo_ids %}'{{hpo_id}}'{% if not loop.last %}, {% endif %}{% endfor %})
+)
+""")
+
+DELETE_MAPPING_SLICE_QUERY = JINJA_ENV.from_string("""
+DELETE FROM `{{project}}.{{dataset}}.{{mapping_table}}`
+WHERE src_hpo_id IN ({% for hpo_id in hpo_ids %}'{{hpo_id}}'{% if not loop.last %}, {% endif %}{% endfor %})
+""")
+
+DELETE_ALL_ROWS_QUERY = JINJA_ENV.from_string("""
+DELETE FROM `{{project}}.{{dataset}}.{{table}}` WHERE TRUE
+""")
+
+DELETE_PERSON_TO_OBSERVATION_QUERY = JINJA_ENV.from_string("""
+DELETE FROM `{{project}}.{{dataset}}.{{table}}`
+WHERE observation_id >= {{pto_start}} AND observation_id < {{pto_end}}
+""")
+
 
 def get_hpo_offsets(hpo_ids):
     """
@@ -181,7 +230,26 @@ def output_table_for(table_id):
     return f'{UNIONED_EHR}_{table_id}'
 
 
-def _mapping_subqueries(client, table_name, hpo_ids, dataset_id, project_id):
+def _list_table_ids(client, dataset_id, table_ids=None):
+    """
+    Get the ids of the tables in a dataset
+
+    :param client: a BigQueryClient
+    :param dataset_id: identifies the dataset
+    :param table_ids: ids of the tables already listed, if any
+    :return: list of table ids
+    """
+    if table_ids is not None:
+        return table_ids
+    return [table.table_id for table in client.list_tables(dataset_id)]
+
+
+def _mapping_subqueries(client,
+                        table_name,
+                        hpo_ids,
+                        dataset_id,
+                        project_id,
+                        table_ids=None):
     """
     Get list of subqueries (one for each HPO table found in the source) that comprise the ID mapping query
 
@@ -190,6 +258,8 @@ def _mapping_subqueries(client, table_name, hpo_ids, dataset_id, project_id):
     :param hpo_ids: list of HPOs to process
     :param dataset_id: identifies the source dataset
     :param project_id: identifies the GCP project
+    :param table_ids: ids of the tables in the source dataset.  Listed if
+        not supplied.
     :return: list of subqueries
     """
     # Until dynamic queries are refactored to use either a single template or dynamic SQL,
@@ -207,7 +277,7 @@ def _mapping_subqueries(client, table_name, hpo_ids, dataset_id, project_id):
     hpo_unique_identifiers = get_hpo_offsets(hpo_ids)
 
     # Exclude subqueries that reference tables that are missing from source dataset
-    all_table_ids = [table.table_id for table in client.list_tables(dataset_id)]
+    all_table_ids = _list_table_ids(client, dataset_id, table_ids)
     for hpo_id in hpo_ids:
         table_id = get_table_id(table_name, hpo_id=hpo_id)
         hpo_offset = hpo_unique_identifiers[hpo_id]
@@ -231,7 +301,8 @@ def mapping_query(client,
                   table_name,
                   hpo_ids,
                   dataset_id=None,
-                  project_id=None):
+                  project_id=None,
+                  table_ids=None):
     """
     Get query used to generate new ids for a CDM table
 
@@ -240,6 +311,8 @@ def mapping_query(client,
     :param hpo_ids: identifies the HPOs
     :param dataset_id: identifies the BQ dataset containing the input table
     :param project_id: identifies the GCP project containing the dataset
+    :param table_ids: ids of the tables in the input dataset.  Listed if not
+        supplied.
     :return: the query
     """
     if dataset_id is None:
@@ -247,7 +320,7 @@ def mapping_query(client,
     if project_id is None:
         project_id = app_identity.get_application_id()
     subqueries = _mapping_subqueries(client, table_name, hpo_ids, dataset_id,
-                                     project_id)
+                                     project_id, table_ids)
     union_all_query = UNION_ALL.join(subqueries)
     return f'''
     WITH all_{table_name} AS (
@@ -273,11 +346,18 @@ def mapping_table_for(domain_table):
     return f'{MAPPING_PREFIX}{domain_table}'
 
 
-def mapping(domain_table, hpo_ids, input_dataset_id, output_dataset_id,
-            project_id, client):
+def mapping(domain_table,
+            hpo_ids,
+            input_dataset_id,
+            output_dataset_id,
+            project_id,
+            client,
+            table_ids=None,
+            write_disposition='WRITE_TRUNCATE'):
     """
     Create and load a table that assigns unique ids to records in domain tables
-    Note: Overwrites destination table if it already exists
+    Note: Overwrites destination table if it already exists, unless
+    write_disposition is WRITE_APPEND
 
     :param domain_table:
     :param hpo_ids: identifies which HPOs' data to include in union
@@ -285,17 +365,20 @@ def mapping(domain_table, hpo_ids, input_dataset_id, output_dataset_id,
     :param output_dataset_id: identifies dataset where mapping table should be output
     :param project_id: identifies GCP project that contain the datasets
     :param client: a BigQueryClient
+    :param table_ids: ids of the tables in the input dataset.  Listed if not
+        supplied.
+    :param write_disposition: WRITE_TRUNCATE (default) or WRITE_APPEND
     :return:
     """
     q = mapping_query(client, domain_table, hpo_ids, input_dataset_id,
-                      project_id)
+                      project_id, table_ids)
     mapping_table = mapping_table_for(domain_table)
     logging.info(f'Query for {mapping_table} is {q}')
     fq_mapping_table = f'{project_id}.{output_dataset_id}.{mapping_table}'
     schema = fields_for(mapping_table)
     table = bq.Table(fq_mapping_table, schema=schema)
     table = client.create_table(table, exists_ok=True)
-    query(q, mapping_table, output_dataset_id, 'WRITE_TRUNCATE')
+    query(q, mapping_table, output_dataset_id, write_disposition)
 
 
 def query(q, dst_table_id, dst_dataset_id, write_disposition='WRITE_APPEND'):
@@ -594,8 +677,12 @@ def table_hpo_subquery(table_name, hpo_id, input_dataset_id, output_dataset_id):
         '''
 
 
-def _union_subqueries(client, table_name, hpo_ids, input_dataset_id,
-                      output_dataset_id):
+def _union_subqueries(client,
+                      table_name,
+                      hpo_ids,
+                      input_dataset_id,
+                      output_dataset_id,
+                      table_ids=None):
     """
     Get list of subqueries (one for each HPO table found in the source) that comprise the load query
 
@@ -604,13 +691,13 @@ def _union_subqueries(client, table_name, hpo_ids, input_dataset_id,
     :param hpo_ids: list of HPOs to process
     :param input_dataset_id: identifies the source dataset
     :param output_dataset_id: identifies the output dataset
+    :param table_ids: ids of the tables in the source dataset.  Listed if
+        not supplied.
     :return: list of subqueries
     """
     result = []
     # Exclude subqueries that reference tables that are missing from source dataset
-    all_table_ids = [
-        table.table_id for table in client.list_tables(input_dataset_id)
-    ]
+    all_table_ids = _list_table_ids(client, input_dataset_id, table_ids)
     for hpo_id in hpo_ids:
         table_id = get_table_id(table_name, hpo_id=hpo_id)
         if table_id in all_table_ids:
@@ -630,8 +717,12 @@ def _union_subqueries(client, table_name, hpo_ids, input_dataset_id,
     return result
 
 
-def table_union_query(client, table_name, hpo_ids, input_dataset_id,
-                      output_dataset_id):
+def table_union_query(client,
+                      table_name,
+                      hpo_ids,
+                      input_dataset_id,
+                      output_dataset_id,
+                      table_ids=None):
     """
     For a CDM table returns a query which aggregates all records from each HPO's submission for that table
 
@@ -640,25 +731,35 @@ def table_union_query(client, table_name, hpo_ids, input_dataset_id,
     :param hpo_ids: list of HPOs to process
     :param input_dataset_id: identifies the source dataset
     :param output_dataset_id: identifies the output dataset
+    :param table_ids: ids of the tables in the source dataset.  Listed if
+        not supplied.
     :return: query used to load the table in the output dataset
     """
     subqueries = _union_subqueries(client, table_name, hpo_ids,
-                                   input_dataset_id, output_dataset_id)
+                                   input_dataset_id, output_dataset_id,
+                                   table_ids)
     return UNION_ALL.join(subqueries)
 
 
-def fact_table_union_query(client, cdm_table, hpo_ids, input_dataset_id,
-                           output_dataset_id):
+def fact_table_union_query(client,
+                           cdm_table,
+                           hpo_ids,
+                           input_dataset_id,
+                           output_dataset_id,
+                           table_ids=None):
     """
     :param client: BigQueryClient
     :param cdm_table: name of the CDM table (e.g. 'person', 'visit_occurrence', 'death')
     :param hpo_ids: identifies which HPOs to include in union
     :param input_dataset_id: identifies dataset containing input data
     :param output_dataset_id: identifies dataset where result of union should be output
+    :param table_ids: ids of the tables in the input dataset.  Listed if not
+        supplied.
     :return:
     """
     union_query = table_union_query(client, cdm_table, hpo_ids,
-                                    input_dataset_id, output_dataset_id)
+                                    input_dataset_id, output_dataset_id,
+                                    table_ids)
 
     return f'''
     SELECT domain_concept_id_1,
@@ -671,7 +772,12 @@ def fact_table_union_query(client, cdm_table, hpo_ids, input_dataset_id,
     '''
 
 
-def load(client, cdm_table, hpo_ids, input_dataset_id, output_dataset_id):
+def load(client,
+         cdm_table,
+         hpo_ids,
+         input_dataset_id,
+         output_dataset_id,
+         table_ids=None):
     """
     Create and load a single domain table with union of all HPO domain tables
 
@@ -680,6 +786,8 @@ def load(client, cdm_table, hpo_ids, input_dataset_id, output_dataset_id):
     :param hpo_ids: identifies which HPOs to include in union
     :param input_dataset_id: identifies dataset containing input data
     :param output_dataset_id: identifies dataset where result of union should be output
+    :param table_ids: ids of the tables in the input dataset.  Listed if not
+        supplied.
     :return:
     """
     output_table = output_table_for(cdm_table)
@@ -689,10 +797,10 @@ def load(client, cdm_table, hpo_ids, input_dataset_id, output_dataset_id):
 
     if cdm_table == FACT_RELATIONSHIP:
         q = fact_table_union_query(client, cdm_table, hpo_ids, input_dataset_id,
-                                   output_dataset_id)
+                                   output_dataset_id, table_ids)
     else:
         q = table_union_query(client, cdm_table, hpo_ids, input_dataset_id,
-                              output_dataset_id)
+                              output_dataset_id, table_ids)
     query_result = query(q, output_table, output_dataset_id)
     query_job_id = query_result['jobReference']['jobId']
     logging.info(
@@ -701,6 +809,264 @@ def load(client, cdm_table, hpo_ids, input_dataset_id, output_dataset_id):
     return query_result
 
 
+def get_load_dependencies(cdm_table, output_dataset_id):
+    """
+    Get the domain tables whose mapping tables the load query of a table reads
+
+    :param cdm_table: name of the CDM table to load
+    :param output_dataset_id: identifies dataset where the mapping tables are
+    :return: set of domain table names
+    """
+    # the joins do not depend on the hpo, so the subquery of any hpo will do
+    if cdm_table == FACT_RELATIONSHIP:
+        q = fact_relationship_hpo_subquery(UNIONED_EHR, BIGQUERY_DATASET_ID,
+                                           output_dataset_id)
+    else:
+        q = table_hpo_subquery(cdm_table, UNIONED_EHR, BIGQUERY_DATASET_ID,
+                               output_dataset_id)
+    return set(
+        re.findall(rf'`{re.escape(output_dataset_id)}\.{MAPPING_PREFIX}(\w+)`',
+                   q))
+
+
+def run_steps(steps, max_workers=eu_constants.EHR_UNION_MAX_WORKERS):
+    """
+    Run steps of the union concurrently, each as soon as its dependencies finish
+
+    Steps are started in order, with at most max_workers steps submitted at a
+    time.  If a step fails no further steps are started and the error is
+    raised once the running steps finish.
+
+    :param steps: OrderedDict of step name to tuple (function, set of the
+        names of the steps it depends on)
+    :param max_workers: max number of steps running at the same time.  1 runs
+        the steps one after another.
+    :raises ValueError: if a step depends on a step that is not listed or the
+        dependencies of the steps form a cycle
+    """
+    run_dependent_tasks(steps, max_workers)
+
+
+def get_dataset_tables(client, project_id, dataset_id):
+    """
+    Get the last modified time and row count of the tables in a dataset
+
+    :param client: a BigQueryClient
+    :param project_id: identifies the GCP project
+    :param dataset_id: identifies the dataset
+    :return: OrderedDict of table id to a dict with the keys table_id,
+        last_modified_time and row_count
+    """
+    q = DATASET_TABLES_QUERY.render(project=project_id, dataset=dataset_id)
+    return OrderedDict((row['table_id'], dict(row.items()))
+                       for row in client.query(q).result())
+
+
+def get_union_sources(dataset_tables, hpo_ids):
+    """
+    Get the submission tables a union of the HPOs reads
+
+    :param dataset_tables: tables of the input dataset as returned by
+        get_dataset_tables
+    :param hpo_ids: identifies which HPOs to include in union
+    :return: dict of table id to a row of the EHR_UNION_SOURCES table
+    """
+    hpo_offsets = get_hpo_offsets(hpo_ids)
+    sources = dict()
+    for hpo_id in hpo_ids:
+        for table_name in CDM_TABLES:
+            table_id = get_table_id(table_name, hpo_id=hpo_id)
+            if table_id in dataset_tables:
+                sources[table_id] = {
+                    'table_id':
+                        table_id,
+                    'hpo_id':
+                        hpo_id,
+                    'hpo_offset':
+                        hpo_offsets[hpo_id],
+                    'last_modified_time':
+                        dataset_tables[table_id]['last_modified_time'],
+                    'row_count':
+                        dataset_tables[table_id]['row_count']
+                }
+    return sources
+
+
+def read_union_sources(client, project_id, output_dataset_id):
+    """
+    Get the submission tables read by the last successful union
+
+    :param client: a BigQueryClient
+    :param project_id: identifies the GCP project
+    :param output_dataset_id: identifies dataset where result of union is output
+    :return: dict of table id to a row of the EHR_UNION_SOURCES table, None
+        if the dataset has no such table
+    """
+    if not client.table_exists(eu_constants.EHR_UNION_SOURCES,
+                               output_dataset_id):
+        return None
+    q = UNION_SOURCES_QUERY.render(project=project_id,
+                                   dataset=output_dataset_id,
+                                   sources_table=eu_constants.EHR_UNION_SOURCES)
+    return {
+        row['table_id']: dict(row.items()) for row in client.query(q).result()
+    }
+
+
+def save_union_sources(client, project_id, output_dataset_id, sources):
+    """
+    Save the submission tables read by a successful union
+
+    :param client: a BigQueryClient
+    :param project_id: identifies the GCP project
+    :param output_dataset_id: identifies dataset where result of union is output
+    :param sources: dict as returned by get_union_sources
+    """
+    fq_table_id = f'{project_id}.{output_dataset_id}.{eu_constants.EHR_UNION_SOURCES}'
+    job_config = bq.LoadJobConfig(
+        schema=client.get_table_schema(eu_constants.EHR_UNION_SOURCES),
+        write_disposition=bq.WriteDisposition.WRITE_TRUNCATE)
+    client.load_table_from_json(list(sources.values()),
+                                fq_table_id,
+                                job_config=job_config).result()
+
+
+def get_changed_hpo_ids(previous_sources, sources, hpo_ids):
+    """
+    Get the HPOs whose submission tables changed since the last union
+
+    A site changed if one of its tables was added, removed or modified, or if
+    the site is no longer included in the union.
+
+    :param previous_sources: tables read by the last union as returned by
+        read_union_sources
+    :param sources: tables read by this union as returned by get_union_sources
+    :param hpo_ids: identifies which HPOs to include in union
+    :return: set of HPO ids, None if the tables must be rebuilt because the
+        last union is unknown or the ID offset of a site moved
+    """
+    if previous_sources is None:
+        return None
+    hpo_offsets = get_hpo_offsets(hpo_ids)
+    changed_hpo_ids = set()
+    for table_id in set(previous_sources) | set(sources):
+        previous = previous_sources.get(table_id)
+        current = sources.get(table_id)
+        if previous is None:
+            changed_hpo_ids.add(current['hpo_id'])
+            continue
+        hpo_id = previous['hpo_id']
+        if hpo_id in hpo_offsets and previous['hpo_offset'] != hpo_offsets[
+                hpo_id]:
+            return None
+        if current is None or any(
+                previous[key] != current[key]
+                for key in ['last_modified_time', 'row_count']):
+            changed_hpo_ids.add(hpo_id)
+    return changed_hpo_ids
+
+
+def _get_hpo_table_ids(table_name, hpo_ids, table_ids):
+    """
+    Get the ids of the tables the HPOs submitted for a CDM table
+
+    :param table_name: name of a CDM table
+    :param hpo_ids: identifies the HPOs
+    :param table_ids: ids of the tables in the input dataset
+    :return: list of table ids
+    """
+    hpo_table_ids = [
+        get_table_id(table_name, hpo_id=hpo_id) for hpo_id in hpo_ids
+    ]
+    return [table_id for table_id in hpo_table_ids if table_id in table_ids]
+
+
+def update_mapping(domain_table, hpo_ids, changed_hpo_ids, input_dataset_id,
+                   output_dataset_id, project_id, client, table_ids):
+    """
+    Replace the rows of changed HPOs in a mapping table
+
+    The rows the HPOs loaded into the unioned table are deleted first, while
+    the mapping table still identifies them.  The unioned person table keeps
+    the submitted person ids, so it is reloaded by update_load instead.
+
+    :param domain_table: name of the CDM table whose ids are mapped
+    :param hpo_ids: identifies which HPOs to include in union.  The ID
+        offsets of the HPOs depend on their order.
+    :param changed_hpo_ids: identifies the HPOs to reprocess
+    :param input_dataset_id: identifies dataset with multiple CDMs, each from an HPO submission
+    :param output_dataset_id: identifies dataset where result of union is output
+    :param project_id: identifies GCP project that contain the datasets
+    :param client: a BigQueryClient
+    :param table_ids: ids of the tables in the input dataset
+    """
+    mapping_table = mapping_table_for(domain_table)
+    changed_hpo_ids = sorted(changed_hpo_ids)
+    if domain_table != PERSON:
+        client.query(
+            DELETE_UNIONED_SLICE_QUERY.render(
+                project=project_id,
+                dataset=output_dataset_id,
+                unioned_table=output_table_for(domain_table),
+                table_name=domain_table,
+                mapping_table=mapping_table,
+                hpo_ids=changed_hpo_ids)).result()
+    client.query(
+        DELETE_MAPPING_SLICE_QUERY.render(project=project_id,
+                                          dataset=output_dataset_id,
+                                          mapping_table=mapping_table,
+                                          hpo_ids=changed_hpo_ids)).result()
+
+    changed_table_ids = _get_hpo_table_ids(domain_table, changed_hpo_ids,
+                                           table_ids)
+    if changed_table_ids:
+        mapping(domain_table,
+                hpo_ids,
+                input_dataset_id,
+                output_dataset_id,
+                project_id,
+                client,
+                table_ids=changed_table_ids,
+                write_disposition='WRITE_APPEND')
+
+
+def update_load(client, cdm_table, hpo_ids, changed_hpo_ids, project_id,
+                input_dataset_id, output_dataset_id, table_ids):
+    """
+    Load the rows of changed HPOs into a unioned table
+
+    Tables with mapped ids only get the rows of the changed HPOs, their old
+    rows are deleted by update_mapping.  Other tables cannot tell the rows
+    of the HPOs apart, so they are emptied and reloaded.
+
+    :param client: BigQueryClient
+    :param cdm_table: name of the CDM table
+    :param hpo_ids: identifies which HPOs to include in union
+    :param changed_hpo_ids: identifies the HPOs to reprocess
+    :param project_id: identifies GCP project that contain the datasets
+    :param input_dataset_id: identifies dataset containing input data
+    :param output_dataset_id: identifies dataset where result of union is output
+    :param table_ids: ids of the tables in the input dataset
+    """
+    if cdm_table in cdm.tables_to_map():
+        load_table_ids = _get_hpo_table_ids(cdm_table, changed_hpo_ids,
+                                            table_ids)
+    else:
+        client.query(
+            DELETE_ALL_ROWS_QUERY.render(
+                project=project_id,
+                dataset=output_dataset_id,
+                table=output_table_for(cdm_table))).result()
+        load_table_ids = _get_hpo_table_ids(cdm_table, hpo_ids, table_ids)
+    if load_table_ids:
+        load(client,
+             cdm_table,
+             hpo_ids,
+             input_dataset_id,
+             output_dataset_id,
+             table_ids=load_table_ids)
+
+
 def get_person_to_observation_query(dataset_id, ehr_cutoff_date=None):
     # Set ehr_cutoff_date if doesn't exist
     if not ehr_cutoff_date:
@@ -877,13 +1243,44 @@ def map_ehr_person_to_observation(output_dataset_id, ehr_cutoff_date=None):
     query(q, dst_table_id, dst_dataset_id, write_disposition='WRITE_APPEND')
 
 
-def create_load_aou_death(bq_client, project_id, input_dataset_id,
-                          output_dataset_id, hpo_ids) -> None:
+def delete_ehr_person_to_observation(client, project_id, output_dataset_id):
+    """
+    Delete the observation records moved from person by an earlier union
+
+    The records are identified by the ID space reserved for them, which ends
+    where the ID space of the first HPO starts.
+
+    :param client: a BigQueryClient
+    :param project_id: identifies GCP project that contain the datasets
+    :param output_dataset_id: identifies dataset where result of union is output
+    """
+    for table in [
+            output_table_for(OBSERVATION),
+            mapping_table_for(OBSERVATION)
+    ]:
+        client.query(
+            DELETE_PERSON_TO_OBSERVATION_QUERY.render(
+                project=project_id,
+                dataset=output_dataset_id,
+                table=table,
+                pto_start=eu_constants.EHR_PERSON_TO_OBS_CONSTANT,
+                pto_end=eu_constants.EHR_ID_MULTIPLIER_START *
+                ID_CONSTANT_FACTOR)).result()
+
+
+def create_load_aou_death(bq_client,
+                          project_id,
+                          input_dataset_id,
+                          output_dataset_id,
+                          hpo_ids,
+                          table_ids=None) -> None:
     """Create and load AOU_DEATH table.
     :param project_id: project containing the datasets
     :param input_dataset_id identifies a dataset containing multiple CDMs, one for each HPO submission
     :param output_dataset_id identifies the dataset to store the new CDM in
     :param hpo_ids: HPO site IDs. Note some sites may not have a DEATH table if they have not submitted anything yet.
+    :param table_ids: ids of the tables in the input dataset.  If not
+        supplied, each site's DEATH table is looked up separately.
     NOTE: `primary_death_record` is all `False` at this point. The CR
         `CalculatePrimaryDeathRecord` updates the table at the end of the
         Unioned EHR data tier creation.
@@ -900,10 +1297,15 @@ def create_load_aou_death(bq_client, project_id, input_dataset_id,
     bq_client.create_table(table_obj)
 
     # Filter out HPO sites without death data submission.
-    hpo_ids_with_death = [
-        hpo_id for hpo_id in hpo_ids
-        if bq_client.table_exists(f'{hpo_id}_{DEATH}', input_dataset_id)
-    ]
+    if table_ids is None:
+        hpo_ids_with_death = [
+            hpo_id for hpo_id in hpo_ids
+            if bq_client.table_exists(f'{hpo_id}_{DEATH}', input_dataset_id)
+        ]
+    else:
+        hpo_ids_with_death = [
+            hpo_id for hpo_id in hpo_ids if f'{hpo_id}_{DEATH}' in table_ids
+        ]
 
     query = LOAD_AOU_DEATH.render(project=project_id,
                                   input_dataset=input_dataset_id,
@@ -915,11 +1317,111 @@ def create_load_aou_death(bq_client, project_id, input_dataset_id,
     _ = job.result()
 
 
+def get_rebuild_steps(bq_client, project_id, input_dataset_id,
+                      output_dataset_id, hpo_ids, table_ids):
+    """
+    Get the steps that rebuild all unioned and mapping tables
+
+    :param bq_client: a BigQueryClient
+    :param project_id: project containing the datasets
+    :param input_dataset_id: identifies a dataset containing multiple CDMs, one for each HPO submission
+    :param output_dataset_id: identifies the dataset to store the new CDM in
+    :param hpo_ids: identifies which HPOs to include in union
+    :param table_ids: ids of the tables in the input dataset
+    :return: OrderedDict of steps as expected by run_steps
+    """
+    steps = OrderedDict()
+
+    # Create mapping tables. AOU_DEATH and DEATH are not included here.
+    # SURVEY_CONDUCT's mapping table is created empty here b/c HPO sites do not submit survery_conduct records.
+    for domain_table in cdm.tables_to_map() + [PERSON]:
+        if domain_table == SURVEY_CONDUCT:
+            bq_client.create_tables([
+                f'{project_id}.{output_dataset_id}.{mapping_table_for(SURVEY_CONDUCT)}'
+            ],
+                                    exists_ok=True)
+        steps[mapping_table_for(domain_table)] = (partial(mapping,
+                                                          domain_table,
+                                                          hpo_ids,
+                                                          input_dataset_id,
+                                                          output_dataset_id,
+                                                          project_id,
+                                                          bq_client,
+                                                          table_ids=table_ids),
+                                                  set())
+
+    # Load all tables with union of submitted tables as soon as the mapping
+    # tables they read are loaded.
+    # AOU_DEATH and DEATH are not loaded here.
+    # SURVEY_CONDUCT is skipped here b/c HPO sites do not submit survery_conduct records.
+    for table_name in CDM_TABLES:
+        if table_name in [DEATH, SURVEY_CONDUCT]:
+            continue
+        dependencies = {
+            mapping_table_for(domain_table) for domain_table in
+            get_load_dependencies(table_name, output_dataset_id)
+        }
+        steps[output_table_for(table_name)] = (partial(load,
+                                                       bq_client,
+                                                       table_name,
+                                                       hpo_ids,
+                                                       input_dataset_id,
+                                                       output_dataset_id,
+                                                       table_ids=table_ids),
+                                               dependencies)
+    return steps
+
+
+def get_incremental_steps(bq_client, project_id, input_dataset_id,
+                          output_dataset_id, hpo_ids, changed_hpo_ids,
+                          table_ids):
+    """
+    Get the steps that replace the rows of changed HPOs in the unioned and
+    mapping tables
+
+    :param bq_client: a BigQueryClient
+    :param project_id: project containing the datasets
+    :param input_dataset_id: identifies a dataset containing multiple CDMs, one for each HPO submission
+    :param output_dataset_id: identifies the dataset to store the new CDM in
+    :param hpo_ids: identifies which HPOs to include in union
+    :param changed_hpo_ids: identifies the HPOs to reprocess
+    :param table_ids: ids of the tables in the input dataset
+    :return: OrderedDict of steps as expected by run_steps
+    """
+    steps = OrderedDict()
+    if not changed_hpo_ids:
+        return steps
+
+    for domain_table in cdm.tables_to_map() + [PERSON]:
+        steps[mapping_table_for(domain_table)] = (partial(
+            update_mapping, domain_table, hpo_ids, changed_hpo_ids,
+            input_dataset_id, output_dataset_id, project_id, bq_client,
+            table_ids), set())
+
+    for table_name in CDM_TABLES:
+        if table_name in [DEATH, SURVEY_CONDUCT]:
+            continue
+        dependencies = {
+            mapping_table_for(domain_table) for domain_table in
+            get_load_dependencies(table_name, output_dataset_id)
+        }
+        # the old rows of a mapped table are deleted with its mapping table
+        if table_name in cdm.tables_to_map():
+            dependencies.add(mapping_table_for(table_name))
+        steps[output_table_for(table_name)] = (partial(
+            update_load, bq_client, table_name, hpo_ids, changed_hpo_ids,
+            project_id, input_dataset_id, output_dataset_id,
+            table_ids), dependencies)
+    return steps
+
+
 def main(input_dataset_id,
          output_dataset_id,
          project_id,
          hpo_ids_ex=None,
-         ehr_cutoff_date=None):
+         ehr_cutoff_date=None,
+         max_workers=eu_constants.EHR_UNION_MAX_WORKERS,
+         incremental=False):
     """
     Create a new CDM which is the union of all EHR datasets submitted by HPOs
 
@@ -928,6 +1430,11 @@ def main(input_dataset_id,
     :param project_id: project containing the datasets
     :param hpo_ids_ex: (optional) list that identifies HPOs not to process, by default process all
     :param ehr_cutoff_date: (optional) cutoff date for ehr data(same as CDR cutoff date)
+    :param max_workers: max number of mapping and load queries running at the
+        same time.  1 runs them one after another.
+    :param incremental: if True, only reprocess the HPOs whose submission
+        tables changed since the last union.  All tables are rebuilt if the
+        last union is unknown or the ID offsets of the HPOs changed.
     :returns: list of tables generated successfully
     """
     bq_client = BigQueryClient(project_id)
@@ -939,56 +1446,71 @@ def main(input_dataset_id,
     if hpo_ids_ex:
         hpo_ids = [hpo_id for hpo_id in hpo_ids if hpo_id not in hpo_ids_ex]
 
-    # Create empty output tables to ensure proper schema, clustering, etc.
-    # AOU_DEATH and DEATH are not created here.
-    for table in CDM_TABLES:
-        result_table = output_table_for(table)
-        if table == DEATH:
-            logging.info(f'Skipping {result_table} creation. '
-                         f'{UNIONED_EHR}_{AOU_DEATH} will be created instead.')
-            continue
-        logging.info(f'Creating {output_dataset_id}.{result_table}...')
-        bq_utils.create_standard_table(table,
-                                       result_table,
-                                       drop_existing=True,
-                                       dataset_id=output_dataset_id)
-
-    # Create mapping tables. AOU_DEATH and DEATH are not included here.
-    # SURVEY_CONDUCT's mapping table is created empty here b/c HPO sites do not submit survery_conduct records.
-    for domain_table in cdm.tables_to_map():
-        if domain_table == SURVEY_CONDUCT:
-            bq_client.create_tables([
-                f'{project_id}.{output_dataset_id}.{mapping_table_for(SURVEY_CONDUCT)}'
-            ],
-                                    exists_ok=True)
-        logging.info(f'Mapping {domain_table}...')
-        mapping(domain_table, hpo_ids, input_dataset_id, output_dataset_id,
-                project_id, bq_client)
-
-    # Load all tables with union of submitted tables
-    # AOU_DEATH and DEATH are not loaded here.
-    # SURVEY_CONDUCT is skipped here b/c HPO sites do not submit survery_conduct records.
-    for table_name in CDM_TABLES:
-        if table_name in [DEATH, SURVEY_CONDUCT]:
-            continue
-        logging.info(f'Creating union of table {table_name}...')
-        load(bq_client, table_name, hpo_ids, input_dataset_id,
-             output_dataset_id)
+    # The input dataset is listed once for all mapping and load queries
+    dataset_tables = get_dataset_tables(bq_client, project_id, input_dataset_id)
+    table_ids = list(dataset_tables)
+    sources = get_union_sources(dataset_tables, hpo_ids)
+
+    changed_hpo_ids = None
+    if incremental:
+        changed_hpo_ids = get_changed_hpo_ids(
+            read_union_sources(bq_client, project_id, output_dataset_id),
+            sources, hpo_ids)
+        if changed_hpo_ids is None:
+            logging.info('The last union is unknown or the HPO offsets '
+                         'changed.  Rebuilding all tables.')
+        else:
+            logging.info(f'Reprocessing HPOs {sorted(changed_hpo_ids)}')
+
+    if changed_hpo_ids is None:
+        # The sources are saved again once all tables are rebuilt, so a
+        # failed rebuild is never followed by an incremental union
+        bq_client.delete_table(
+            f'{project_id}.{output_dataset_id}.{eu_constants.EHR_UNION_SOURCES}',
+            not_found_ok=True)
+
+        # Create empty output tables to ensure proper schema, clustering, etc.
+        # AOU_DEATH and DEATH are not created here.
+        for table in CDM_TABLES:
+            result_table = output_table_for(table)
+            if table == DEATH:
+                logging.info(
+                    f'Skipping {result_table} creation. '
+                    f'{UNIONED_EHR}_{AOU_DEATH} will be created instead.')
+                continue
+            logging.info(f'Creating {output_dataset_id}.{result_table}...')
+            bq_utils.create_standard_table(table,
+                                           result_table,
+                                           drop_existing=True,
+                                           dataset_id=output_dataset_id)
+
+        steps = get_rebuild_steps(bq_client, project_id, input_dataset_id,
+                                  output_dataset_id, hpo_ids, table_ids)
+    else:
+        steps = get_incremental_steps(bq_client, project_id, input_dataset_id,
+                                      output_dataset_id, hpo_ids,
+                                      changed_hpo_ids, table_ids)
 
     # AOU_DEATH is created and loaded here.
-    logging.info(f'Creating and loading {UNIONED_EHR}_{AOU_DEATH}...')
-    create_load_aou_death(bq_client, project_id, input_dataset_id,
-                          output_dataset_id, hpo_ids)
-    logging.info(f'Completed {UNIONED_EHR}_{AOU_DEATH} load.')
-
+    steps[f'{UNIONED_EHR}_{AOU_DEATH}'] = (partial(create_load_aou_death,
+                                                   bq_client,
+                                                   project_id,
+                                                   input_dataset_id,
+                                                   output_dataset_id,
+                                                   hpo_ids,
+                                                   table_ids=table_ids), set())
+
+    run_steps(steps, max_workers)
     logging.info('Creation of Unioned EHR complete')
 
-    # create person mapping table
-    domain_table = PERSON
-    logging.info(f'Mapping {domain_table}...')
-    mapping(domain_table, hpo_ids, input_dataset_id, output_dataset_id,
-            project_id, bq_client)
+    if changed_hpo_ids is not None:
+        # the person to observation records are recreated for all HPOs below
+        delete_ehr_person_to_observation(bq_client, project_id,
+                                         output_dataset_id)
 
+    # Person to observation reads the unioned person table and the person
+    # mapping table and writes to observation, so it runs once all of them
+    # are loaded
     logging.info(
         'Dropping race/ethnicity/gender records from unioned_ehr_observation')
     clean_engine.clean_dataset(project_id, output_dataset_id, output_dataset_id,
@@ -1006,6 +1528,8 @@ def main(input_dataset_id,
 
     logging.info('Completed Person to Observation')
 
+    save_union_sources(bq_client, project_id, output_dataset_id, sources)
+
 
 if __name__ == '__main__':
     pipeline_logging.configure(logging.INFO, add_console_handler=True)
@@ -1033,6 +1557,18 @@ if __name__ == '__main__':
         help=
         "Date to set for observation table rows transferred from person table",
         type=validate_date_string)
+    parser.add_argument(
+        '--max_workers',
+        dest='max_workers',
+        type=int,
+        default=eu_constants.EHR_UNION_MAX_WORKERS,
+        help='Max number of mapping and load queries running at the same time')
+    parser.add_argument(
+        '--incremental',
+        dest='incremental',
+        action='store_true',
+        help='Only reprocess HPOs whose submissions changed since the last union'
+    )
 
     # HPOs to exclude. If nothing given, exclude nothing.
     args = parser.parse_args()
@@ -1041,4 +1577,6 @@ if __name__ == '__main__':
              args.output_dataset_id,
              args.project_id,
              hpo_ids_ex=args.hpo_id_ex,
-             ehr_cutoff_date=args.ehr_cutoff_date)
+             ehr_cutoff_date=args.ehr_cutoff_date,
+             max_workers=args.max_workers,
+             incremental=args.incremental)
@@ -1,17 +1,22 @@
 # Python imports
 import os
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 from io import open
 
 # Project imports
+import app_identity
 import bq_utils
 import resources
 from common import BIGQUERY_DATASET_ID
+from constants import bq_utils as bq_consts
 
 EXPORT_PATH = os.path.join(resources.resource_files_path, 'export')
 RESULTS_SCHEMA_PLACEHOLDER = '@results_database_schema.'
 VOCAB_SCHEMA_PLACEHOLDER = '@vocab_database_schema.'
 UNIONED_EHR = 'unioned_ehr'
+# number of export queries run at the same time
+EXPORT_MAX_WORKERS = 10
 
 
 def list_files(base_path):
@@ -55,35 +60,94 @@ def is_hpo_id(hpo_id):
     return hpo_id in [item['hpo_id'] for item in bq_utils.get_hpo_info()]
 
 
-# TODO Make this function more generic.
-def export_from_path(p, datasource_id):
+def get_report_datasource_id(datasource_id):
     """
-    Export results
-    :param p: path to SQL file
+    Get the datasource id export queries are rendered with
+
     :param datasource_id: HPO or aggregate dataset to run export for
+    :return: the datasource_id if it is an HPO or the unioned dataset,
+        None otherwise
+    """
+    if datasource_id == UNIONED_EHR or is_hpo_id(datasource_id):
+        return datasource_id
+    return None
+
+
+def list_query_files(p):
+    """
+    List the SQL files of an export path in the order the report is built
+
+    :param p: path to the export directory
+    :return: list of paths to SQL files
+    """
+    file_paths = [os.path.join(p, f) for f in list_files_only(p)]
+    for d in list_dirs_only(p):
+        file_paths.extend(list_query_files(os.path.join(p, d)))
+    return file_paths
+
+
+def get_query_result(sql):
+    """
+    Run a query and page through all of its results
+
+    :param sql: SQL statement
+    :return: the query response with the rows of all pages
+    """
+    response = bq_utils.query(sql)
+    rows = response.get(bq_consts.ROWS, [])
+    page_token = response.get(bq_consts.PAGE_TOKEN)
+    if page_token or not response.get(bq_consts.JOB_COMPLETE, True):
+        bq_service = bq_utils.create_service()
+        app_id = app_identity.get_application_id()
+        job_ref = response[bq_consts.JOB_REFERENCE]
+        while page_token or not response.get(bq_consts.JOB_COMPLETE, True):
+            # an incomplete job is polled again with the same (empty) token
+            response = bq_service.jobs().getQueryResults(
+                projectId=app_id,
+                jobId=job_ref[bq_consts.JOB_ID],
+                location=job_ref.get(bq_consts.LOCATION),
+                pageToken=page_token,
+                timeoutMs=bq_consts.SOCKET_TIMEOUT).execute(
+                    num_retries=bq_consts.BQ_DEFAULT_RETRY_COUNT)
+            rows.extend(response.get(bq_consts.ROWS, []))
+            page_token = response.get(bq_consts.PAGE_TOKEN)
+    return {**response, bq_consts.ROWS: rows}
+
+
+def export_query_file(file_path, datasource_id):
+    """
+    Run the export query in a SQL file
+
+    :param file_path: path to SQL file
+    :param datasource_id: id the query is rendered with
+    :return: `dict` structured for report render
+    """
+    with open(file_path, 'r') as fp:
+        sql = render(fp.read(),
+                     datasource_id,
+                     results_schema=BIGQUERY_DATASET_ID,
+                     vocab_schema='')
+    query_result = get_query_result(sql)
+    # TODO reshape results
+    return query_result_to_payload(query_result)
+
+
+def build_report(p, payloads):
+    """
+    Nest the payloads of the SQL files in an export path
+
+    :param p: path to the export directory
+    :param payloads: `dict` of SQL file path to its payload
     :return: `dict` structured for report render
     """
     result = dict()
-    if not is_hpo_id(datasource_id) and datasource_id != UNIONED_EHR:
-        datasource_id = None
     for f in list_files_only(p):
         name = f[0:-4].upper()
-        abs_path = os.path.join(p, f)
-        with open(abs_path, 'r') as fp:
-            sql = fp.read()
-            sql = render(sql,
-                         datasource_id,
-                         results_schema=BIGQUERY_DATASET_ID,
-                         vocab_schema='')
-            query_result = bq_utils.query(sql)
-            # TODO reshape results
-            result[name] = query_result_to_payload(query_result)
+        result[name] = payloads[os.path.join(p, f)]
 
     for d in list_dirs_only(p):
-        abs_path = os.path.join(p, d)
         name = d.upper()
-        # recursive call
-        dir_result = export_from_path(abs_path, datasource_id)
+        dir_result = build_report(os.path.join(p, d), payloads)
         if name in result:
             # a sql file generated the item already
             result[name].update(dir_result)
@@ -93,6 +157,39 @@ def export_from_path(p, datasource_id):
     return result
 
 
+def export_from_paths(paths, datasource_id, max_workers=EXPORT_MAX_WORKERS):
+    """
+    Export results for several reports, running all of their queries at once
+
+    :param paths: paths to the export directories
+    :param datasource_id: HPO or aggregate dataset to run export for
+    :param max_workers: maximum number of queries running at the same time
+    :return: `dict` of path to its `dict` structured for report render
+    """
+    datasource_id = get_report_datasource_id(datasource_id)
+    file_paths = [file_path for p in paths for file_path in list_query_files(p)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        payloads = dict(
+            zip(
+                file_paths,
+                executor.map(
+                    lambda file_path: export_query_file(file_path, datasource_id
+                                                       ), file_paths)))
+    return {p: build_report(p, payloads) for p in paths}
+
+
+# TODO Make this function more generic.
+def export_from_path(p, datasource_id, max_workers=EXPORT_MAX_WORKERS):
+    """
+    Export results
+    :param p: path to SQL file
+    :param datasource_id: HPO or aggregate dataset to run export for
+    :param max_workers: maximum number of queries running at the same time
+    :return: `dict` structured for report render
+    """
+    return export_from_paths([p], datasource_id, max_workers)[p]
+
+
 def convert_value(value, tpe):
     """
     Cast to specified type
@@ -115,7 +212,8 @@ def query_result_to_payload(qr):
     :return:
     """
     result = dict()
-    rows = qr['rows'] if int(qr['totalRows']) > 0 else []
+    rows = qr.get(bq_consts.ROWS, []) if int(
+        qr[bq_consts.TOTAL_ROWS]) > 0 else []
     fields = qr['schema']['fields']
     field_count = len(fields)
     for i in range(0, field_count):
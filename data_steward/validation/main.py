@@ -11,6 +11,9 @@ import json
 import logging
 import os
 import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache, partial
 from io import StringIO, open
 
 # Third party imports
@@ -41,6 +44,7 @@ from constants.validation import main as consts
 from retraction import retract_data_bq, retract_data_gcs
 from validation import achilles, achilles_heel, ehr_union, export, hpo_report
 from validation import email_notification as en
+from validation.submission_index import PROCESSED_FOLDER_INDEX
 from validation.app_errors import (BucketNotSet, log_traceback,
                                    errors_blueprint, InternalValidationError,
                                    BucketDoesNotExistError)
@@ -126,15 +130,21 @@ def run_export(datasource_id=None, folder_prefix="", target_bucket=None):
 
     # Run export queries and store json payloads in specified folder in the target bucket
     reports_prefix: str = f'{folder_prefix}{ACHILLES_EXPORT_PREFIX_STRING}{datasource_id}/'
-    for export_name in common.ALL_REPORTS:
-        sql_path = os.path.join(export.EXPORT_PATH, export_name)
-        result = export.export_from_path(sql_path, datasource_id)
-        content = json.dumps(result)
+    sql_paths = {
+        export_name: os.path.join(export.EXPORT_PATH, export_name)
+        for export_name in common.ALL_REPORTS
+    }
+    reports = export.export_from_paths(list(sql_paths.values()), datasource_id)
+
+    def upload_report(export_name):
+        content = json.dumps(reports[sql_paths[export_name]])
         fp = StringIO(content)
         blob = target_bucket.blob(f'{reports_prefix}{export_name}.json')
         blob.upload_from_file(fp)
-        result: dict = storage_client.get_blob_metadata(blob)
-        results.append(result)
+        return storage_client.get_blob_metadata(blob)
+
+    with ThreadPoolExecutor(max_workers=len(common.ALL_REPORTS)) as executor:
+        results.extend(executor.map(upload_report, common.ALL_REPORTS))
     result = save_datasources_json(storage_client=storage_client,
                                    datasource_id=datasource_id,
                                    folder_prefix=folder_prefix,
@@ -143,19 +153,21 @@ def run_export(datasource_id=None, folder_prefix="", target_bucket=None):
     return results
 
 
-def run_achilles(client, hpo_id=None):
+def run_achilles(client, hpo_id=None, batch_by_table=False):
     """
     checks for full results and run achilles/heel
 
     :client: a BigQueryClient
     :hpo_id: hpo on which to run achilles
+    :batch_by_table: if True, combine the analyses inserting into the same
+        table, see achilles.run_analyses
     :returns:
     """
     if hpo_id is not None:
         logging.info(f"Running achilles for hpo_id '{hpo_id}'")
     achilles.create_tables(hpo_id, True)
     achilles.load_analyses(hpo_id)
-    achilles.run_analyses(client, hpo_id=hpo_id)
+    achilles.run_analyses(client, hpo_id=hpo_id, batch_by_table=batch_by_table)
     if hpo_id is not None:
         logging.info(f"Running achilles_heel for hpo_id '{hpo_id}'")
     achilles_heel.create_tables(hpo_id, True)
@@ -222,10 +234,23 @@ def validate_hpo_files(hpo_id):
 def validate_all_hpos():
     """
     validation end point for all hpo_ids
+
+    Up to VALIDATION_MAX_WORKERS hpo sites are processed at the same time.
     """
-    for item in bq_utils.get_hpo_info():
-        hpo_id = item['hpo_id']
-        process_hpo(hpo_id)
+    hpo_ids = [item['hpo_id'] for item in bq_utils.get_hpo_info()]
+    max_workers = int(
+        os.environ.get(consts.VALIDATION_MAX_WORKERS_VAR,
+                       consts.DEFAULT_VALIDATION_MAX_WORKERS))
+    if max_workers <= 1:
+        for hpo_id in hpo_ids:
+            process_hpo(hpo_id)
+        return 'validation done!'
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(process_hpo, hpo_id) for hpo_id in hpo_ids]
+        # re-raise the first unexpected error in hpo order once all finish
+        for future in futures:
+            future.result()
     return 'validation done!'
 
 
@@ -279,9 +304,21 @@ def validate_submission(hpo_id: str, bucket, folder_items: list,
         table_id = resources.get_table_id(table_name, hpo_id=hpo_id)
         bq_utils.create_standard_table(table_name, table_id, drop_existing=True)
 
+    # Submit the load jobs of all CSV files and wait on them together
+    load_job_ids = load_submission_files(hpo_id, found_cdm_files,
+                                         found_pii_files, folder_prefix)
+    incomplete_jobs = bq_utils.wait_on_jobs(
+        load_job_ids.values()) if load_job_ids else []
+
     for cdm_file_name in sorted(resources.CDM_CSV_FILES):
         file_results, file_errors = perform_validation_on_file(
-            cdm_file_name, found_cdm_files, hpo_id, folder_prefix, bucket)
+            cdm_file_name,
+            found_cdm_files,
+            hpo_id,
+            folder_prefix,
+            bucket,
+            load_job_id=load_job_ids.get(cdm_file_name),
+            incomplete_jobs=incomplete_jobs)
         results.extend(file_results)
         errors.extend(file_errors)
 
@@ -300,7 +337,13 @@ def validate_submission(hpo_id: str, bucket, folder_items: list,
 
     for pii_file_name in sorted(common.PII_FILES):
         file_results, file_errors = perform_validation_on_file(
-            pii_file_name, found_pii_files, hpo_id, folder_prefix, bucket)
+            pii_file_name,
+            found_pii_files,
+            hpo_id,
+            folder_prefix,
+            bucket,
+            load_job_id=load_job_ids.get(pii_file_name),
+            incomplete_jobs=incomplete_jobs)
         results.extend(file_results)
         errors.extend(file_errors)
 
@@ -311,6 +354,31 @@ def validate_submission(hpo_id: str, bucket, folder_items: list,
     return dict(results=results, errors=errors, warnings=warnings)
 
 
+def load_submission_files(hpo_id: str, found_cdm_files: list,
+                          found_pii_files: list, folder_prefix: str) -> dict:
+    """
+    Submit a load job for each CDM and PII csv file found in a submission
+
+    The jobs are not waited on so BigQuery can run them at the same time.
+
+    :param hpo_id: identifies the hpo site
+    :param found_cdm_files: CDM files found in the submission folder
+    :param found_pii_files: PII files found in the submission folder
+    :param folder_prefix: directory containing the submission
+    :return: dict mapping file name to load job id, in submission order
+    """
+    found_file_names = set(found_cdm_files + found_pii_files)
+    load_job_ids = {}
+    for file_name in sorted(resources.CDM_CSV_FILES) + sorted(common.PII_FILES):
+        if file_name not in found_file_names:
+            continue
+        table_name = file_name.split('.')[0]
+        logging.info(f"Loading file '{file_name}'")
+        load_results = bq_utils.load_from_csv(hpo_id, table_name, folder_prefix)
+        load_job_ids[file_name] = load_results['jobReference']['jobId']
+    return load_job_ids
+
+
 def is_first_validation_run(folder_items):
     return common.RESULTS_HTML not in folder_items and common.PROCESSED_TXT not in folder_items
 
@@ -331,6 +399,7 @@ def generate_metrics(project_id, hpo_id, bucket, folder_prefix, summary):
     """
     report_data = summary.copy()
     error_occurred = False
+    metric_tasks = OrderedDict()
 
     # TODO separate query generation, query execution, writing to GCS
     gcs_path = f"gs://{bucket}/{folder_prefix}"
@@ -349,9 +418,8 @@ def generate_metrics(project_id, hpo_id, bucket, folder_prefix, summary):
             run_export(datasource_id=hpo_id, folder_prefix=folder_prefix)
             logging.info(f"Uploading achilles index files to '{gcs_path}'.")
             _upload_achilles_files(hpo_id, folder_prefix)
-            heel_error_query = get_heel_error_query(hpo_id)
-            report_data[report_consts.HEEL_ERRORS_REPORT_KEY] = query_rows(
-                heel_error_query)
+            metric_tasks[report_consts.HEEL_ERRORS_REPORT_KEY] = partial(
+                query_rows, get_heel_error_query(hpo_id))
         else:
             report_data[
                 report_consts.
@@ -359,56 +427,105 @@ def generate_metrics(project_id, hpo_id, bucket, folder_prefix, summary):
             logging.info(
                 f"Required files are missing in {gcs_path}. Skipping achilles.")
 
-        # non-unique key metrics
+        # the remaining metrics are independent and collected at the same time
+        metric_tasks.update(get_metric_tasks(bq_client, hpo_id))
+        collect_metrics(metric_tasks, report_data)
+
+        logging.info(f"Processing complete.")
+    except HttpError as err:
+        # cloud error occurred- log details for troubleshooting
+        logging.exception(
+            f"Failed to generate full report due to the following cloud error:\n\n{err.content}"
+        )
+        error_occurred = True
+    finally:
+        # report all results collected (attempt even if cloud error occurred)
+        report_data[report_consts.ERROR_OCCURRED_REPORT_KEY] = error_occurred
+    return report_data
+
+
+def get_metric_tasks(client, hpo_id):
+    """
+    Get the functions collecting the metrics of a submission
+
+    The metrics do not depend on each other, so the functions can run at the
+    same time.
+
+    :param client: a BigQueryClient
+    :param hpo_id: identifies the HPO site
+    :return: OrderedDict of report key to a function returning the report
+        rows.  Functions run for their side effects have a key starting with
+        an underscore.
+    """
+
+    def nonunique_key_metrics():
         logging.info(f"Getting non-unique key stats for {hpo_id}")
-        nonunique_metrics_query = get_duplicate_counts_query(bq_client, hpo_id)
-        report_data[
-            report_consts.NONUNIQUE_KEY_METRICS_REPORT_KEY] = query_rows(
-                nonunique_metrics_query)
+        return query_rows(get_duplicate_counts_query(client, hpo_id))
 
-        # drug class metrics
+    def drug_class_metrics():
         logging.info(f"Getting drug class for {hpo_id}")
-        drug_class_metrics_query = get_drug_class_counts_query(hpo_id)
-        report_data[report_consts.DRUG_CLASS_METRICS_REPORT_KEY] = query_rows(
-            drug_class_metrics_query)
+        return query_rows(get_drug_class_counts_query(hpo_id))
 
-        # missing PII
+    def missing_pii():
         logging.info(f"Getting missing record stats for {hpo_id}")
-        missing_pii_query = get_hpo_missing_pii_query(hpo_id)
-        missing_pii_results = query_rows(missing_pii_query)
-        report_data[report_consts.MISSING_PII_KEY] = missing_pii_results
+        return query_rows(get_hpo_missing_pii_query(hpo_id))
 
-        # completeness
+    def completeness_metrics():
         logging.info(f"Getting completeness stats for {hpo_id}")
-        completeness_query = completeness.get_hpo_completeness_query(hpo_id)
-        report_data[report_consts.COMPLETENESS_REPORT_KEY] = query_rows(
-            completeness_query)
+        return query_rows(completeness.get_hpo_completeness_query(hpo_id))
 
-        # participant validation metrics
+    def participant_validation():
         logging.info(f"Ensuring participant validation can be run for {hpo_id}")
-        setup_and_validate_participants(bq_client, hpo_id)
+        setup_and_validate_participants(client, hpo_id)
         participant_validation_query = get_participant_validation_summary_query(
             hpo_id)
         # TODO add to report_data based on requirements from EHR_OPS
 
-        # lab concept metrics
+    def lab_concept_metrics():
         logging.info(f"Getting lab concepts for {hpo_id}")
-        lab_concept_metrics_query = required_labs.get_lab_concept_summary_query(
-            bq_client, hpo_id)
-        report_data[report_consts.LAB_CONCEPT_METRICS_REPORT_KEY] = query_rows(
-            lab_concept_metrics_query)
+        return query_rows(
+            required_labs.get_lab_concept_summary_query(client, hpo_id))
+
+    return OrderedDict([
+        (report_consts.NONUNIQUE_KEY_METRICS_REPORT_KEY, nonunique_key_metrics),
+        (report_consts.DRUG_CLASS_METRICS_REPORT_KEY, drug_class_metrics),
+        (report_consts.MISSING_PII_KEY, missing_pii),
+        (report_consts.COMPLETENESS_REPORT_KEY, completeness_metrics),
+        (consts.PARTICIPANT_VALIDATION_TASK, participant_validation),
+        (report_consts.LAB_CONCEPT_METRICS_REPORT_KEY, lab_concept_metrics)
+    ])
 
-        logging.info(f"Processing complete.")
-    except HttpError as err:
-        # cloud error occurred- log details for troubleshooting
-        logging.exception(
-            f"Failed to generate full report due to the following cloud error:\n\n{err.content}"
-        )
-        error_occurred = True
-    finally:
-        # report all results collected (attempt even if cloud error occurred)
-        report_data[report_consts.ERROR_OCCURRED_REPORT_KEY] = error_occurred
-    return report_data
+
+def collect_metrics(metric_tasks, report_data):
+    """
+    Run the metric functions at the same time and add their results to the
+    report as they complete
+
+    A failing function does not stop the others.  Once all are complete the
+    first error is raised, so the report keeps the metrics that succeeded.
+
+    :param metric_tasks: OrderedDict of report key to a function returning
+        the report rows, as returned by get_metric_tasks
+    :param report_data: dict the results are added to
+    """
+    errors = []
+    with ThreadPoolExecutor(max_workers=consts.METRICS_MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(task): key for key, task in metric_tasks.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                rows = future.result()
+            except Exception as exc:
+                # the error is raised and logged once all tasks are complete
+                logging.warning(f"Failed to get {key} for the report")
+                errors.append(exc)
+                continue
+            if not key.startswith('_'):
+                report_data[key] = rows
+    if errors:
+        raise errors[0]
 
 
 def generate_empty_report(hpo_id, folder_prefix):
@@ -552,8 +669,8 @@ def process_hpo(hpo_id, force_run=False):
         project_id = app_identity.get_application_id()
         storage_client = StorageClient(project_id)
         bucket = storage_client.get_hpo_bucket(hpo_id)
-        bucket_items: list = storage_client.get_bucket_items_metadata(bucket)
-        folder_prefix = _get_submission_folder(bucket, bucket_items, force_run)
+        folder_prefix, folder_bucket_items = discover_submission_folder(
+            storage_client, bucket, force_run)
         if not folder_prefix:
             logging.info(
                 f"No submissions to process in {hpo_id} bucket {bucket.name}")
@@ -561,7 +678,8 @@ def process_hpo(hpo_id, force_run=False):
             folder_items = []
             if is_valid_folder_prefix_name(folder_prefix):
                 # perform validation
-                folder_items = get_folder_items(bucket_items, folder_prefix)
+                folder_items = get_folder_items(folder_bucket_items,
+                                                folder_prefix)
                 summary = validate_submission(hpo_id, bucket, folder_items,
                                               folder_prefix)
                 report_data = generate_metrics(project_id, hpo_id, bucket,
@@ -583,11 +701,27 @@ def process_hpo(hpo_id, force_run=False):
         logging.exception(message)
 
 
+@lru_cache(maxsize=None)
+def get_hpo_names():
+    """
+    Get the names of the HPO sites, looked up once per process
+
+    :return: dict of lower case hpo_id to the site's name
+    """
+    return {
+        hpo_dict['hpo_id'].lower(): hpo_dict['name']
+        for hpo_dict in bq_utils.get_hpo_info()
+    }
+
+
 def get_hpo_name(hpo_id):
-    hpo_list_of_dicts = bq_utils.get_hpo_info()
-    for hpo_dict in hpo_list_of_dicts:
-        if hpo_dict['hpo_id'].lower() == hpo_id.lower():
-            return hpo_dict['name']
+    hpo_names = get_hpo_names()
+    if hpo_id.lower() not in hpo_names:
+        # the site may have been added after the names were looked up
+        get_hpo_names.cache_clear()
+        hpo_names = get_hpo_names()
+    if hpo_id.lower() in hpo_names:
+        return hpo_names[hpo_id.lower()]
     raise ValueError(f"{hpo_id} is not a valid hpo_id")
 
 
@@ -696,8 +830,13 @@ def get_hpo_missing_pii_query(hpo_id):
         participant_match_table_id=participant_match_table_id)
 
 
-def perform_validation_on_file(file_name: str, found_file_names: list,
-                               hpo_id: str, folder_prefix, bucket):
+def perform_validation_on_file(file_name: str,
+                               found_file_names: list,
+                               hpo_id: str,
+                               folder_prefix,
+                               bucket,
+                               load_job_id: str = None,
+                               incomplete_jobs: list = None):
     """
     Attempts to load a csv file into BigQuery
 
@@ -706,6 +845,10 @@ def perform_validation_on_file(file_name: str, found_file_names: list,
     :param hpo_id: identifies the hpo site
     :param folder_prefix: directory containing the submission
     :param bucket: bucket containing the submission
+    :param load_job_id: id of a load job already submitted for a csv file.
+        If not set, the file is loaded and waited on here.
+    :param incomplete_jobs: job ids that did not complete when load_job_id
+        was waited on
     :return: tuple (results, errors) where
      results is list of tuples (file_name, found, parsed, loaded)
      errors is list of tuples (file_name, message)
@@ -720,9 +863,6 @@ def perform_validation_on_file(file_name: str, found_file_names: list,
             logging.info(f"Found file '{file_name}'")
             found = 1
             app_id: str = app_identity.get_application_id()
-            storage_client = StorageClient(app_id)
-            hpo_bucket = storage_client.get_hpo_bucket(hpo_id)
-
             bq_client = BigQueryClient(app_id)
 
             if table_name not in resources.CDM_TABLES:
@@ -730,7 +870,7 @@ def perform_validation_on_file(file_name: str, found_file_names: list,
 
             dataset_id: str = BIGQUERY_DATASET_ID
 
-            gcs_object_path: str = (f'gs://{hpo_bucket.name}/'
+            gcs_object_path: str = (f'gs://{bucket.name}/'
                                     f'{folder_prefix}'
                                     f'{table_name}.{extension}')
             table_id = resources.get_table_id(table_name, hpo_id)
@@ -770,11 +910,13 @@ def perform_validation_on_file(file_name: str, found_file_names: list,
     if file_name in found_file_names:
         logging.info(f"Found file '{file_name}'")
         found = 1
-        load_results = bq_utils.load_from_csv(hpo_id, table_name, folder_prefix)
-        load_job_id = load_results['jobReference']['jobId']
-        incomplete_jobs = bq_utils.wait_on_jobs([load_job_id])
+        if load_job_id is None:
+            load_results = bq_utils.load_from_csv(hpo_id, table_name,
+                                                  folder_prefix)
+            load_job_id = load_results['jobReference']['jobId']
+            incomplete_jobs = bq_utils.wait_on_jobs([load_job_id])
 
-        if not incomplete_jobs:
+        if load_job_id not in (incomplete_jobs or []):
             job_resource = bq_utils.get_job_details(job_id=load_job_id)
             job_status = job_resource['status']
             if 'errorResult' in job_status:
@@ -889,6 +1031,40 @@ def list_submitted_bucket_items(folder_bucketitems):
     return files_list
 
 
+def _is_ignored_folder(folder_name):
+    """
+    Determine if a top level folder is not a submission folder
+
+    :param folder_name: folder prefix of the form "<directory_name>/"
+    :return: True if the folder matches one of IGNORE_DIRECTORIES, case
+        insensitive
+    """
+    # DC-343  special temporary case where we have to deal with a possible
+    # directory dumped into the bucket by 'ehr sync' process from RDR
+    for exp in common.IGNORE_DIRECTORIES:
+        compiled_exp = re.compile(exp)
+        if compiled_exp.match(folder_name.lower()):
+            logging.info(
+                f"Skipping {folder_name} directory.  It is not a submission directory."
+            )
+            return True
+    return False
+
+
+def _get_latest_submitted(folder_bucket_items):
+    """
+    Get the time a folder was last submitted to
+
+    :param folder_bucket_items: metadata of the items in the folder
+    :return: latest updated time of the submitted items, None if the folder
+        has no submitted items
+    """
+    submitted_bucket_items = list_submitted_bucket_items(folder_bucket_items)
+    if not submitted_bucket_items:
+        return None
+    return max([item['updated'] for item in submitted_bucket_items])
+
+
 def _get_submission_folder(bucket, bucket_items, force_process=False):
     """
     Get the string name of the most recent submission directory for validation
@@ -909,47 +1085,24 @@ def _get_submission_folder(bucket, bucket_items, force_process=False):
         directory exists
     """
     # files in root are ignored here
-    all_folder_list = set([
-        item['name'].split('/')[0] + '/'
-        for item in bucket_items
-        if len(item['name'].split('/')) > 1
-    ])
-
-    folder_datetime_list = []
-    folders_with_submitted_files = []
-    for folder_name in all_folder_list:
-        # DC-343  special temporary case where we have to deal with a possible
-        # directory dumped into the bucket by 'ehr sync' process from RDR
-        ignore_folder = False
-        for exp in common.IGNORE_DIRECTORIES:
-            compiled_exp = re.compile(exp)
-            if compiled_exp.match(folder_name.lower()):
-                logging.info(
-                    f"Skipping {folder_name} directory.  It is not a submission directory."
-                )
-                ignore_folder = True
+    folder_bucket_items = dict()
+    for item in bucket_items:
+        if len(item['name'].split('/')) > 1:
+            folder_name = item['name'].split('/')[0] + '/'
+            folder_bucket_items.setdefault(folder_name, []).append(item)
 
-        if ignore_folder:
+    folder_datetimes = dict()
+    for folder_name, items in folder_bucket_items.items():
+        if _is_ignored_folder(folder_name):
             continue
 
         # this is not in a try/except block because this follows a bucket read which is in a try/except
-        folder_bucket_items = [
-            item for item in bucket_items
-            if item['name'].startswith(folder_name)
-        ]
-        submitted_bucket_items = list_submitted_bucket_items(
-            folder_bucket_items)
-
-        if submitted_bucket_items:
-            folders_with_submitted_files.append(folder_name)
-            latest_datetime = max(
-                [item['updated'] for item in submitted_bucket_items])
-            folder_datetime_list.append(latest_datetime)
-
-    if folder_datetime_list:
-        latest_datetime_index = folder_datetime_list.index(
-            max(folder_datetime_list))
-        to_process_folder = folders_with_submitted_files[latest_datetime_index]
+        latest_datetime = _get_latest_submitted(items)
+        if latest_datetime:
+            folder_datetimes[folder_name] = latest_datetime
+
+    if folder_datetimes:
+        to_process_folder = max(folder_datetimes, key=folder_datetimes.get)
         if force_process:
             return to_process_folder
         processed = _validation_done(bucket, to_process_folder)
@@ -961,6 +1114,76 @@ def _get_submission_folder(bucket, bucket_items, force_process=False):
     return None
 
 
+def discover_submission_folder(storage_client,
+                               bucket,
+                               force_process=False,
+                               index=PROCESSED_FOLDER_INDEX):
+    """
+    Find the most recent submission directory for validation and its items
+
+    Lists only the top level folders of the bucket and the objects of folders
+    not known to be processed.  Folders found to contain processed.txt are
+    added to the index and are ranked by their recorded submission time in
+    later runs.
+
+    Unlike _get_submission_folder, the submission time of an indexed folder is
+    not recomputed.  Files uploaded to an indexed folder afterwards, or a
+    change of its submission window, do not change its rank until it is
+    removed from the index, e.g. when its processed.txt was removed and it is
+    the latest folder, or after a restart.
+
+    :param storage_client: a StorageClient
+    :param bucket: Bucket Object to validate on
+    :param force_process: if True return most recently updated directory, even
+        if it has already been processed.
+    :param index: the ProcessedFolderIndex to read and update
+    :return: tuple (folder_prefix, folder_bucket_items) where folder_prefix is
+        of the form "<directory_name>/", or None if there is no directory to
+        process, and folder_bucket_items are the metadata of its items
+    """
+    processed_folders = index.get_folders(bucket.name)
+    folder_datetimes = dict()
+    folder_bucket_items = dict()
+    for folder_name in storage_client.list_sub_prefixes(bucket.name, ''):
+        if _is_ignored_folder(folder_name):
+            continue
+
+        if folder_name in processed_folders:
+            latest_datetime = processed_folders[folder_name]
+        else:
+            items = storage_client.get_bucket_items_metadata(bucket,
+                                                             prefix=folder_name)
+            latest_datetime = _get_latest_submitted(items)
+            folder_bucket_items[folder_name] = items
+            if any(basename(item) == common.PROCESSED_TXT for item in items):
+                index.add(bucket.name, folder_name, latest_datetime)
+                processed_folders[folder_name] = latest_datetime
+
+        if latest_datetime:
+            folder_datetimes[folder_name] = latest_datetime
+
+    if not folder_datetimes:
+        return None, []
+
+    to_process_folder = max(folder_datetimes, key=folder_datetimes.get)
+    if (to_process_folder in processed_folders and
+            to_process_folder not in folder_bucket_items and
+            not _validation_done(bucket, to_process_folder)):
+        # processed.txt was removed to have the folder validated again
+        index.remove(bucket.name, to_process_folder)
+        processed_folders.pop(to_process_folder)
+
+    if to_process_folder in processed_folders and not force_process:
+        logging.info(f'Skipping already processed folder {to_process_folder}')
+        return None, []
+
+    if to_process_folder not in folder_bucket_items:
+        folder_bucket_items[
+            to_process_folder] = storage_client.get_bucket_items_metadata(
+                bucket, prefix=to_process_folder)
+    return to_process_folder, folder_bucket_items[to_process_folder]
+
+
 def _is_cdm_file(gcs_file_name):
     return gcs_file_name.lower(
     ) in resources.CDM_CSV_FILES or gcs_file_name.lower(
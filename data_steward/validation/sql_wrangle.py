@@ -1,9 +1,12 @@
 # Python imports
 import re
+from collections import OrderedDict
+from functools import partial
 from io import open
 
 # Project imports
 import resources
+from utils.dependent_tasks import run_dependent_tasks
 
 COMMAND_SEP = ';'
 PREFIX_PLACEHOLDER = 'synpuf_100.'
@@ -11,6 +14,11 @@ TEMP_PREFIX = 'temp.'
 TEMP_TABLE_PATTERN = re.compile('\s*INTO\s+([^\s]+)')
 TRUNCATE_TABLE_PATTERN = re.compile('\s*truncate\s+table\s+([^\s]+)')
 DROP_TABLE_PATTERN = re.compile('\s*drop\s+table\s+([^\s]+)')
+INSERT_TABLE_PATTERN = re.compile(r'^\s*insert\s+into\s+([^\s(]+)',
+                                  re.IGNORECASE)
+INSERT_COLUMNS_PATTERN = re.compile(
+    r'^\s*insert\s+into\s+([^\s(]+)\s*\(([^)]*)\)', re.IGNORECASE)
+TABLE_TOKEN_PATTERN = re.compile(r'[\w.]+')
 COMMENTED_BLOCK_REGEX = re.compile(
     '(?P<before_comment>(^)(.)*)(?P<comment>(\/\*)(.)*(\*\/))(?P<after_comment>(.)*$)',
     re.DOTALL)
@@ -99,13 +107,14 @@ def qualify_tables(command, hpo_id=None):
     return command
 
 
-def is_to_temp_table(query):
+def remove_comments(query):
     """
-    Determine if the query is a DML statement that outputs to a temp table
+    Remove commented lines and block comments from a statement
+
+    Comments at the end of a line of code are kept, so line breaks are kept.
 
     :param query: The query string to parse
-    :return:  True if the query string is saving results to a temporary table.
-        False if not a DML statement outputting to a temporary table.
+    :return: the statement without comments
     """
     # remove all line comments
     query_without_line_comments = []
@@ -114,14 +123,24 @@ def is_to_temp_table(query):
             query_without_line_comments.append(line)
 
     # remove all block comments
-    query_string = ' '.join(query_without_line_comments)
+    query_string = '\n'.join(query_without_line_comments)
     match = COMMENTED_BLOCK_REGEX.search(query_string)
     while match:
         query_string = match.group('before_comment') + match.group(
             'after_comment')
         match = COMMENTED_BLOCK_REGEX.search(query_string)
+    return query_string
+
+
+def is_to_temp_table(query):
+    """
+    Determine if the query is a DML statement that outputs to a temp table
 
-    query_list = query_string.split()
+    :param query: The query string to parse
+    :return:  True if the query string is saving results to a temporary table.
+        False if not a DML statement outputting to a temporary table.
+    """
+    query_list = remove_comments(query).split()
     insert_query = False
     if query_list[0].lower() == 'insert':
         insert_query = True
@@ -191,3 +210,114 @@ def get_drop_table_name(q):
     """
     match = DROP_TABLE_PATTERN.search(q)
     return match.group(1)
+
+
+def get_insert_parts(command):
+    """
+    Split an INSERT statement with a column list into its parts
+
+    :param command: an achilles or heel statement
+    :return: tuple of (table name, list of column names, query), None if the
+        statement is not an INSERT with a column list
+    """
+    query = remove_comments(command)
+    match = INSERT_COLUMNS_PATTERN.search(query)
+    if not match:
+        return None
+    columns = [column.strip() for column in match.group(2).split(',')]
+    return match.group(1), columns, query[match.end():].strip()
+
+
+def get_command_tables(command):
+    """
+    Get the tables a command reads, appends to and overwrites
+
+    Reads are every identifier in the command, so they include column names
+    and aliases.  Only identifiers another command writes matter when
+    comparing commands.
+
+    :param command: an achilles or heel statement
+    :return: tuple of (reads, appends, writes) sets of table names, or None
+        if the tables cannot be determined
+    """
+    if is_truncate(command):
+        return set(), set(), {get_truncate_table_name(command).lower()}
+    if is_drop(command):
+        return set(), set(), {get_drop_table_name(command).lower()}
+    query = remove_comments(command)
+    if is_to_temp_table(command):
+        table_name = get_temp_table_name(command).lower()
+        body = get_temp_table_query(command)
+        appends, writes = set(), {table_name}
+    else:
+        match = INSERT_TABLE_PATTERN.search(query)
+        if not match:
+            return None
+        table_name = match.group(1).lower()
+        body = query[match.end():]
+        appends, writes = {table_name}, set()
+    reads = set(TABLE_TOKEN_PATTERN.findall(remove_comments(body).lower()))
+    return reads, appends, writes
+
+
+def get_command_dependencies(commands):
+    """
+    Get the earlier commands each command has to wait for
+
+    A command waits for an earlier command if one writes a table the other
+    reads or writes.  Commands appending to the same table do not wait for
+    each other since appends commute.  A command whose tables cannot be
+    determined waits for, and is waited on by, every other command.
+
+    :param commands: list of statements in the order they are listed
+    :return: list of sets of the indexes of earlier commands each waits for
+    """
+    tables = [get_command_tables(command) for command in commands]
+    dependencies = []
+    for index, command_tables in enumerate(tables):
+        depends_on = set()
+        for earlier_index, earlier_tables in enumerate(tables[:index]):
+            if command_tables is None or earlier_tables is None:
+                depends_on.add(earlier_index)
+                continue
+            reads, appends, writes = command_tables
+            earlier_reads, earlier_appends, earlier_writes = earlier_tables
+            if ((earlier_writes | earlier_appends) & reads or
+                    earlier_writes & (appends | writes) or
+                    earlier_appends & writes or
+                    earlier_reads & (appends | writes)):
+                depends_on.add(earlier_index)
+        dependencies.append(depends_on)
+    return dependencies
+
+
+def run_commands(commands, run_command, max_workers=1):
+    """
+    Run commands concurrently while honoring their dependencies
+
+    Commands are started in list order as soon as the commands they depend
+    on finish, with at most max_workers commands submitted at a time.  If a
+    command fails no further commands are started and the error is raised
+    once the running commands finish.
+
+    :param commands: list of statements in the order they are listed
+    :param run_command: function that runs a single statement to completion
+    :param max_workers: max number of commands running at the same time.  1
+        runs the commands one after another.
+    :return: None
+    """
+    if max_workers <= 1:
+        for command in commands:
+            run_command(command)
+        return
+
+    dependencies = get_command_dependencies(commands)
+    names = [
+        f'command {index + 1}/{len(commands)}' for index in range(len(commands))
+    ]
+    run_dependent_tasks(
+        OrderedDict((names[index],
+                     (partial(run_command, command),
+                      {names[dependency]
+                       for dependency in dependencies[index]}))
+                    for index, command in enumerate(commands)), max_workers)
@@ -0,0 +1,69 @@
+"""
+Remembers which submission folders of an HPO bucket were already processed.
+
+Submission discovery lists the objects of a folder to find out when it was
+last submitted to and whether it has a processed.txt file.  Once a folder is
+known to be processed, the index keeps the time of its latest submitted object
+so later validation runs can rank the folder without listing it again.
+The recorded time is not updated, so uploads to a folder after it was indexed
+do not change its rank.
+
+The index lives in memory and is rebuilt by listing the folders again after
+a restart.  The processed.txt files in the buckets stay the source of truth.
+"""
+# Python imports
+import threading
+
+
+class ProcessedFolderIndex:
+    """
+    Thread safe index of processed folders per bucket
+    """
+
+    def __init__(self):
+        self._folders = {}
+        self._lock = threading.Lock()
+
+    def get_folders(self, bucket_name: str) -> dict:
+        """
+        Get the processed folders of a bucket
+
+        :param bucket_name: name of the bucket
+        :return: dict of folder prefix to the time its latest submitted object
+            was updated, None if it had no submitted objects
+        """
+        with self._lock:
+            return dict(self._folders.get(bucket_name, {}))
+
+    def add(self, bucket_name: str, folder_prefix: str, latest_updated):
+        """
+        Record a folder as processed
+
+        :param bucket_name: name of the bucket
+        :param folder_prefix: folder prefix of the form '<folder_name>/'
+        :param latest_updated: time the latest submitted object in the folder
+            was updated, None if it has no submitted objects
+        """
+        with self._lock:
+            self._folders.setdefault(bucket_name,
+                                     {})[folder_prefix] = latest_updated
+
+    def remove(self, bucket_name: str, folder_prefix: str):
+        """
+        Forget a folder, e.g. because its processed.txt file was removed
+
+        :param bucket_name: name of the bucket
+        :param folder_prefix: folder prefix of the form '<folder_name>/'
+        """
+        with self._lock:
+            self._folders.get(bucket_name, {}).pop(folder_prefix, None)
+
+    def clear(self):
+        """
+        Forget all folders
+        """
+        with self._lock:
+            self._folders.clear()
+
+
+PROCESSED_FOLDER_INDEX = ProcessedFolderIndex()
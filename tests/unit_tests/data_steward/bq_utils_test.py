@@ -1,3 +1,5 @@
+import json
+import tempfile
 import unittest
 from datetime import datetime
 
@@ -28,51 +30,194 @@ class BqUtilsTest(unittest.TestCase):
         self.assertRaises(ValueError, bq_utils.load_cdm_csv, self.hpo_id,
                           'not_a_cdm_table')
 
-    @mock.patch('bq_utils.job_status_done', lambda x: True)
-    def test_wait_on_jobs_already_done(self):
+    @mock.patch('bq_utils.sleeper')
+    @mock.patch('bq_utils.get_done_job_ids', lambda job_ids: set(job_ids))
+    def test_wait_on_jobs_already_done(self, mock_sleep):
         job_ids = range(3)
         actual = bq_utils.wait_on_jobs(job_ids)
         expected = []
         self.assertEqual(actual, expected)
+        mock_sleep.assert_not_called()
 
-    @mock.patch('time.sleep', return_value=None)
-    @mock.patch('bq_utils.job_status_done', return_value=False)
-    def test_wait_on_jobs_all_fail(self, mock_job_status_done, mock_time_sleep):
+    @mock.patch('bq_utils.time.monotonic')
+    @mock.patch('bq_utils.sleeper')
+    @mock.patch('bq_utils.get_done_job_ids', return_value=set())
+    def test_wait_on_jobs_all_fail(self, mock_get_done_job_ids, mock_sleep,
+                                   mock_monotonic):
+        mock_monotonic.side_effect = lambda: sum(
+            args[0] for args, _ in mock_sleep.call_args_list)
         job_ids = list(range(3))
         actual = bq_utils.wait_on_jobs(job_ids)
         expected = job_ids
         self.assertEqual(actual, expected)
-        # TODO figure out how to count this
-        # self.assertEquals(mock_time_sleep.call_count, bq_utils.BQ_DEFAULT_RETRY_COUNT)
-
-    @mock.patch('time.sleep', return_value=None)
-    @mock.patch(
-        'bq_utils.job_status_done',
-        side_effect=[False, False, False, True, False, False, True, True, True])
-    def test_wait_on_jobs_get_done(self, mock_job_status_done, mock_time_sleep):
+
+    @mock.patch('bq_utils.time.monotonic')
+    @mock.patch('bq_utils.sleeper')
+    @mock.patch('bq_utils.get_done_job_ids',
+                side_effect=[set(), {2}, set(), {0, 1}])
+    def test_wait_on_jobs_get_done(self, mock_get_done_job_ids, mock_sleep,
+                                   mock_monotonic):
+        mock_monotonic.side_effect = lambda: sum(
+            args[0] for args, _ in mock_sleep.call_args_list)
         job_ids = list(range(3))
-        actual = bq_utils.wait_on_jobs(job_ids)
+        done = []
+        actual = bq_utils.wait_on_jobs(job_ids, on_done=done.append)
         expected = []
         self.assertEqual(actual, expected)
+        # callers are notified as soon as each job is done
+        self.assertEqual(done, [2, 0, 1])
+        # pending jobs are polled together
+        mock_get_done_job_ids.assert_called_with([0, 1])
 
-    @mock.patch('time.sleep', return_value=None)
-    @mock.patch('bq_utils.job_status_done',
-                side_effect=[
-                    False, False, True, False, False, False, False, False,
-                    False, False, False, False
-                ])
-    def test_wait_on_jobs_some_fail(self, mock_job_status_done,
-                                    mock_time_sleep):
+    @mock.patch('bq_utils.time.monotonic')
+    @mock.patch('bq_utils.sleeper')
+    @mock.patch('bq_utils.get_done_job_ids')
+    def test_wait_on_jobs_some_fail(self, mock_get_done_job_ids, mock_sleep,
+                                    mock_monotonic):
+        mock_monotonic.side_effect = lambda: sum(
+            args[0] for args, _ in mock_sleep.call_args_list)
+        mock_get_done_job_ids.side_effect = lambda job_ids: {0} & set(job_ids)
         job_ids = list(range(2))
         actual = bq_utils.wait_on_jobs(job_ids)
         expected = [1]
         self.assertEqual(actual, expected)
 
+    @mock.patch('bq_utils.time.monotonic')
     @mock.patch('bq_utils.sleeper')
-    @mock.patch('bq_utils.job_status_done')
-    def test_wait_on_jobs_retry_count(self, mock_job_status, mock_sleep):
-        max_sleep_interval = 512
-        mock_job_status.return_value = False
+    @mock.patch('bq_utils.get_done_job_ids')
+    def test_wait_on_jobs_retry_count(self, mock_get_done_job_ids, mock_sleep,
+                                      mock_monotonic):
+        mock_monotonic.side_effect = lambda: sum(
+            args[0] for args, _ in mock_sleep.call_args_list)
+        # the overall wait matches the former doubling backoff
+        max_wait = 1 + 2 + 4 + 8 + 16 + 32 + 64 + 128 + 256 + 512
+        mock_get_done_job_ids.return_value = set()
         job_ids = ["job_1", "job_2"]
         bq_utils.wait_on_jobs(job_ids)
-        mock_sleep.assert_called_with(max_sleep_interval)
+        intervals = [args[0] for args, _ in mock_sleep.call_args_list]
+        self.assertAlmostEqual(sum(intervals), max_wait)
+        self.assertLessEqual(max(intervals), bq_utils_consts.MAX_POLL_INTERVAL)
+
+    @mock.patch('bq_utils.app_identity.get_application_id')
+    @mock.patch('bq_utils.create_service')
+    def test_get_done_job_ids(self, mock_create_service, mock_get_app_id):
+        mock_get_app_id.return_value = 'fake_project'
+        bq_service = mock_create_service.return_value
+        states = {'job_1': 'DONE', 'job_2': 'RUNNING'}
+
+        def new_batch_http_request(callback):
+            batch = mock.MagicMock()
+            requests = []
+            batch.add.side_effect = lambda request, request_id: requests.append(
+                request_id)
+            batch.execute.side_effect = lambda: [
+                callback(request_id, {'status': {
+                    'state': states[request_id]
+                }}, None) if request_id in states else callback(
+                    request_id, None, Exception('not found'))
+                for request_id in requests
+            ]
+            return batch
+
+        bq_service.new_batch_http_request.side_effect = new_batch_http_request
+        actual = bq_utils.get_done_job_ids(['job_1', 'job_2', 'job_3'])
+        self.assertEqual(actual, {'job_1'})
+        bq_service.new_batch_http_request.assert_called_once()
+
+    @mock.patch('bq_utils.get_job_details')
+    @mock.patch('bq_utils.wait_on_jobs')
+    @mock.patch('bq_utils.create_table')
+    @mock.patch('bq_utils.create_service')
+    def test_load_table_from_csv(self, mock_create_service, mock_create_table,
+                                 mock_wait_on_jobs, mock_get_job_details):
+        fields = [{
+            'name': 'int_col',
+            'type': 'integer',
+            'mode': 'required'
+        }, {
+            'name': 'str_col',
+            'type': 'string',
+            'mode': 'nullable'
+        }, {
+            'name': 'label_col',
+            'type': 'string',
+            'mode': 'required'
+        }]
+        mock_insert = mock_create_service.return_value.jobs.return_value.insert
+        mock_insert.return_value.execute.return_value = {
+            'jobReference': {
+                'jobId': 'job_1'
+            }
+        }
+        mock_wait_on_jobs.return_value = []
+        mock_get_job_details.return_value = {'status': {'state': 'DONE'}}
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as csv_file:
+            # columns are matched to fields by name
+            csv_file.write("label_col,int_col,str_col\n"
+                           "a,1,\"it's, quoted\"\n,2,\n")
+            csv_file.flush()
+
+            result = bq_utils.load_table_from_csv('fake_project',
+                                                  'fake_dataset', 'fake_table',
+                                                  csv_file.name, fields)
+
+            # the file is uploaded with a load job instead of an INSERT query
+            self.assertEqual(result['jobReference']['jobId'], 'job_1')
+            mock_create_table.assert_called_once_with(table_id='fake_table',
+                                                      fields=fields,
+                                                      drop_existing=True,
+                                                      dataset_id='fake_dataset')
+            load = mock_insert.call_args.kwargs['body']['configuration']['load']
+            self.assertEqual(load['schema']['fields'], fields)
+            self.assertEqual(load['destinationTable']['tableId'], 'fake_table')
+            self.assertEqual(load['writeDisposition'],
+                             bq_utils_consts.WRITE_APPEND)
+            self.assertEqual(load['sourceFormat'], 'NEWLINE_DELIMITED_JSON')
+            media = mock_insert.call_args.kwargs['media_body']
+            rows = [
+                json.loads(line)
+                for line in media.getbytes(0, media.size()).splitlines()
+            ]
+            # an empty required string is loaded as an empty string
+            self.assertEqual(rows, [{
+                'label_col': 'a',
+                'int_col': '1',
+                'str_col': "it's, quoted"
+            }, {
+                'label_col': '',
+                'int_col': '2'
+            }])
+            mock_wait_on_jobs.assert_called_once_with(['job_1'])
+
+            # a failed load job is raised
+            mock_get_job_details.return_value = {
+                'status': {
+                    'state': 'DONE',
+                    'errorResult': {
+                        'message': 'bad row'
+                    }
+                }
+            }
+            with self.assertRaises(bq_utils.BigQueryJobWaitError) as context:
+                bq_utils.load_table_from_csv('fake_project', 'fake_dataset',
+                                             'fake_table', csv_file.name,
+                                             fields)
+            self.assertIn('bad row', str(context.exception))
+
+            # columns must be fields
+            mock_create_table.reset_mock()
+            with self.assertRaises(bq_utils.InvalidOperationError):
+                bq_utils.load_table_from_csv('fake_project', 'fake_dataset',
+                                             'fake_table', csv_file.name,
+                                             fields[:2])
+            mock_create_table.assert_not_called()
+
+        # required fields that are not strings must have a value
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as csv_file:
+            csv_file.write("int_col,label_col\n,a\n")
+            csv_file.flush()
+            with self.assertRaises(bq_utils.InvalidOperationError):
+                bq_utils.load_table_from_csv('fake_project', 'fake_dataset',
+                                             'fake_table', csv_file.name,
+                                             fields)
@@ -2,6 +2,9 @@
 import inspect
 from unittest import TestCase
 
+# Third party imports
+import mock
+
 # Project imports
 from cdr_cleaner import clean_cdr_engine as ce
 from cdr_cleaner.cleaning_rules.base_cleaning_rule import BaseCleaningRule
@@ -146,6 +149,29 @@ class CleanCDREngineTest(TestCase):
         }]
         self.assertListEqual(actual_queries, expected_queries)
 
+    def test_run_cataloged_query(self):
+        catalog = mock.MagicMock()
+        query_dict = {
+            cdr_consts.QUERY:
+                f'DELETE FROM `{self.dataset_id}.person` WHERE TRUE'
+        }
+
+        def query_runner(*args):
+            catalog.invalidate_query.assert_called_once_with(query_dict)
+            return 'job'
+
+        self.assertEqual(
+            ce.run_cataloged_query('client', query_dict, {}, 0, 1, catalog,
+                                   query_runner), 'job')
+        self.assertEqual(catalog.invalidate_query.call_count, 2)
+
+        # the tables are marked as modified when the query fails
+        catalog.reset_mock()
+        failing_runner = mock.MagicMock(side_effect=RuntimeError)
+        self.assertRaises(RuntimeError, ce.run_cataloged_query, 'client',
+                          query_dict, {}, 0, 1, catalog, failing_runner)
+        self.assertEqual(catalog.invalidate_query.call_count, 2)
+
     def test_get_rule_args(self):
         expected_param_names = [
             'project_id', 'dataset_id', 'sandbox_dataset_id'
@@ -1,3 +1,7 @@
+import json
+import os
+import subprocess
+import sys
 import unittest
 
 from mock import patch
@@ -6,6 +10,28 @@ import cdr_cleaner.clean_cdr as cc
 from constants.cdr_cleaner.clean_cdr import DataStage
 from tests.test_util import FakeRuleClass, fake_rule_func
 
+# modules of cdr_cleaner.cleaning_rules the engine needs at import time
+ENGINE_RULE_MODULES = [
+    'cdr_cleaner.cleaning_rules',
+    'cdr_cleaner.cleaning_rules.base_cleaning_rule'
+]
+
+# imports the BigQuery client library, which clean_cdr depends on, and then
+# clean_cdr in a fresh interpreter
+IMPORT_TIME_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import google.cloud.bigquery
+bigquery_elapsed = time.perf_counter() - start
+start = time.perf_counter()
+import cdr_cleaner.clean_cdr
+import resources
+elapsed = time.perf_counter() - start
+print(json.dumps({'bigquery_elapsed': bigquery_elapsed,
+                  'elapsed': elapsed,
+                  'modules': sorted(sys.modules)}))
+"""
+
 
 class CleanCDRTest(unittest.TestCase):
 
@@ -28,6 +54,38 @@ class CleanCDRTest(unittest.TestCase):
         expected_stages = list([s for s in DataStage])
         self.assertEqual(actual_stages, expected_stages)
 
+    def test_data_stage_rules_mapping(self):
+        stages = [s.value for s in DataStage if s is not DataStage.UNSPECIFIED]
+        self.assertCountEqual(cc.DATA_STAGE_RULES_MAPPING, stages)
+        self.assertEqual(
+            cc.DATA_STAGE_RULES_MAPPING.get_rule_paths(DataStage.EHR.value),
+            cc.EHR_CLEANING_CLASSES)
+        for stage in stages:
+            for rule in cc.DATA_STAGE_RULES_MAPPING[stage]:
+                self.assertTrue(callable(rule[0]))
+
+    def test_import_time(self):
+        """
+        Importing clean_cdr must not import the cleaning rules or GitPython
+        """
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        output = subprocess.run([sys.executable, '-c', IMPORT_TIME_SCRIPT],
+                                env=env,
+                                capture_output=True,
+                                text=True,
+                                check=True).stdout
+        result = json.loads(output.splitlines()[-1])
+
+        self.assertEqual([
+            module for module in result['modules']
+            if module.startswith('cdr_cleaner.cleaning_rules') or
+            module.split('.')[0] == 'git'
+        ], ENGINE_RULE_MODULES)
+        print(f"Importing clean_cdr took {result['elapsed']:.2f}s on top of "
+              f"{result['bigquery_elapsed']:.2f}s for google.cloud.bigquery")
+        # relative to the client library, so a slow machine does not fail it
+        self.assertLess(result['elapsed'], result['bigquery_elapsed'])
+
     def test_parser(self):
         test_args = [
             '-p', self.project_id, '-d', self.dataset_id, '-b',
@@ -118,7 +176,17 @@ class CleanCDRTest(unittest.TestCase):
             'data_stage': DataStage.EHR,
             'console_log': False,
             'list_queries': False,
-            'run_as': None
+            'run_as': None,
+            'max_concurrency': 1,
+            'ledger_file': None,
+            'ledger_table': False,
+            'resume': False,
+            'plan': False,
+            'batch_threshold_gb': None,
+            'fuse_sandbox': False,
+            'fuse_rules': False,
+            'combine_suppressions': False,
+            'key_only_sandbox': False
         }
         parser = cc.get_parser()
         actual_args, actual_kwargs = cc.fetch_args_kwargs(
@@ -301,7 +369,17 @@ class CleanCDRTest(unittest.TestCase):
                 'data_stage': DataStage.EHR,
                 'console_log': False,
                 'list_queries': False,
-                'run_as': cdr_sa
+                'run_as': cdr_sa,
+                'max_concurrency': 1,
+                'ledger_file': None,
+                'ledger_table': False,
+                'resume': False,
+                'plan': False,
+                'batch_threshold_gb': None,
+                'fuse_sandbox': False,
+                'fuse_rules': False,
+                'combine_suppressions': False,
+                'key_only_sandbox': False
             })
 
         expected_kargs = {}
@@ -319,7 +397,16 @@ class CleanCDRTest(unittest.TestCase):
             sandbox_dataset_id=self.sandbox_dataset_id,
             rules=rules,
             table_namer=DataStage.EHR.value,
-            run_as=cdr_sa)
+            run_as=cdr_sa,
+            max_concurrency=1,
+            ledger_file=None,
+            ledger_table=False,
+            resume=False,
+            batch_threshold_gb=None,
+            fuse_sandbox=False,
+            fuse_rules=False,
+            combine_suppressions=False,
+            key_only_sandbox=False)
 
         # Test get_queries() function call
         args = [
@@ -335,7 +422,9 @@ class CleanCDRTest(unittest.TestCase):
                 'sandbox_dataset_id': self.sandbox_dataset_id,
                 'data_stage': DataStage.EHR,
                 'console_log': False,
-                'list_queries': True
+                'list_queries': True,
+                'fuse_sandbox': False,
+                'key_only_sandbox': False
             })
 
         expected_kargs = {}
@@ -348,4 +437,6 @@ class CleanCDRTest(unittest.TestCase):
             dataset_id=self.dataset_id,
             sandbox_dataset_id=self.sandbox_dataset_id,
             rules=rules,
-            table_namer=DataStage.EHR.value)
+            table_namer=DataStage.EHR.value,
+            fuse_sandbox=False,
+            key_only_sandbox=False)
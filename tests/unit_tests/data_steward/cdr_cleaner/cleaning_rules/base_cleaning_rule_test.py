@@ -13,7 +13,8 @@ from mock import patch
 
 # Project imports
 from cdr_cleaner.cleaning_rules.base_cleaning_rule import BaseCleaningRule, \
-    get_delete_empty_sandbox_tables_queries, DROP_EMPTY_SANDBOX_TABLES_QUERY
+    get_delete_empty_sandbox_tables_queries, DROP_EMPTY_SANDBOX_TABLES_QUERY, \
+    fuse_sandbox_and_delete_queries
 from constants.cdr_cleaner import clean_cdr as cdr_consts
 
 
@@ -508,3 +509,58 @@ class BaseCleaningRuleTest(unittest.TestCase):
             self.project_id, self.sandbox_dataset_id, [])
 
         self.assertEqual(actual_query, [])
+
+    def test_fuse_sandbox_and_delete_queries(self):
+        sandbox_query = {
+            cdr_consts.QUERY: (
+                f'CREATE OR REPLACE TABLE '
+                f'`{self.project_id}.{self.sandbox_dataset_id}.aa_000_obs` AS '
+                f'SELECT * FROM `{self.project_id}.{self.dataset_id}.observation` '
+                f'WHERE observation_source_concept_id = 1')
+        }
+        delete_query = {
+            cdr_consts.QUERY: (
+                f'DELETE FROM `{self.project_id}.{self.dataset_id}.observation` '
+                f'WHERE observation_source_concept_id = 1')
+        }
+        other_delete_query = {
+            cdr_consts.QUERY: (
+                f'DELETE FROM `{self.project_id}.{self.dataset_id}.measurement` '
+                f'WHERE measurement_source_concept_id = 1')
+        }
+        rewrite_query = {
+            cdr_consts.QUERY: 'SELECT 1',
+            cdr_consts.DESTINATION_DATASET: self.dataset_id,
+            cdr_consts.DESTINATION_TABLE: 'observation'
+        }
+
+        actual = fuse_sandbox_and_delete_queries(
+            [sandbox_query, delete_query, rewrite_query], self.project_id,
+            self.dataset_id, self.sandbox_dataset_id,
+            lambda table: f'{table}_id')
+
+        self.assertEqual(len(actual), 2)
+        fused_query = actual[0][cdr_consts.QUERY]
+        self.assertTrue(fused_query.strip().startswith(
+            sandbox_query[cdr_consts.QUERY]))
+        self.assertIn(
+            f'DELETE FROM `{self.project_id}.{self.dataset_id}.observation`',
+            fused_query)
+        self.assertIn(
+            f'WHERE observation_id IN (\n  SELECT observation_id\n'
+            f'  FROM `{self.project_id}.{self.sandbox_dataset_id}.aa_000_obs`',
+            fused_query)
+        self.assertEqual(actual[1], rewrite_query)
+
+        # a delete from a table the sandbox query does not read is not fused
+        actual = fuse_sandbox_and_delete_queries(
+            [sandbox_query, other_delete_query], self.project_id,
+            self.dataset_id, self.sandbox_dataset_id,
+            lambda table: f'{table}_id')
+        self.assertEqual(actual, [sandbox_query, other_delete_query])
+
+    def test_fuse_sandbox_queries_opt_in(self):
+        rule = Inheritance(self.project_id, self.dataset_id,
+                           self.sandbox_dataset_id)
+        self.assertFalse(rule.fuse_sandbox_queries)
+        self.assertEqual(rule.get_sandbox_key_field('person'), 'person_id')
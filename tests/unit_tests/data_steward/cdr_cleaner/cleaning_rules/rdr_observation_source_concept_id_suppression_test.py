@@ -76,6 +76,27 @@ class ObservationSourceConceptIDRowSuppressionTest(unittest.TestCase):
 
         self.assertEqual(result_list, expected_list)
 
+    def test_get_fused_query_specs(self):
+        # pre-conditions
+        self.assertTrue(self.rule_instance.fuse_sandbox_queries)
+
+        # test
+        result_list = self.rule_instance.get_fused_query_specs()
+
+        # post conditions
+        self.assertEqual(len(result_list), 1)
+        fused_query = result_list[0][clean_consts.QUERY]
+        sandbox_table = self.rule_instance.get_sandbox_tablenames()[0]
+        self.assertIn(
+            f'CREATE OR REPLACE TABLE `{self.project_id}.{self.sandbox_id}.'
+            f'{sandbox_table}`', fused_query)
+        self.assertIn(
+            f'DELETE FROM `{self.project_id}.{self.dataset_id}.{OBSERVATION}`',
+            fused_query)
+        self.assertIn(
+            f'SELECT observation_id\n  FROM `{self.project_id}.'
+            f'{self.sandbox_id}.{sandbox_table}`', fused_query)
+
     def test_log_queries(self):
         # pre-conditions
         self.assertEqual(self.rule_instance.affected_datasets,
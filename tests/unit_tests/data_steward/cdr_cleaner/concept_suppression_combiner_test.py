@@ -0,0 +1,249 @@
+# Python imports
+from unittest import TestCase
+
+# Third party imports
+from mock import MagicMock, patch
+
+# Project imports
+from cdr_cleaner import clean_cdr_engine as ce
+from cdr_cleaner import concept_suppression_combiner as csc
+from cdr_cleaner.cleaning_rules.deid.birth_information_suppression import \
+    BirthInformationSuppression
+from cdr_cleaner.cleaning_rules.deid.concept_suppression import \
+    AbstractBqLookupTableConceptSuppression
+from common import CONDITION_OCCURRENCE, OBSERVATION
+from constants import bq_utils as bq_consts
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+
+PROJECT = 'test-project'
+DATASET = 'test_dataset'
+SANDBOX = 'test_sandbox'
+
+
+class LookupSuppression(AbstractBqLookupTableConceptSuppression):
+
+    def __init__(self,
+                 project_id,
+                 dataset_id,
+                 sandbox_dataset_id,
+                 table_namer=None):
+        super().__init__(issue_numbers=['DC0001'],
+                         description='suppress the concepts of a lookup table',
+                         affected_datasets=[cdr_consts.REGISTERED_TIER_DEID],
+                         project_id=project_id,
+                         dataset_id=dataset_id,
+                         sandbox_dataset_id=sandbox_dataset_id,
+                         affected_tables=[OBSERVATION, CONDITION_OCCURRENCE],
+                         concept_suppression_lookup_table='lookup_concepts',
+                         exclude_source_concept_id=True,
+                         table_namer=table_namer)
+
+    def create_suppression_lookup_table(self, client):
+        client.query('CREATE lookup_concepts')
+
+    def setup_validation(self, client, *args, **keyword_args):
+        pass
+
+    def validate_rule(self, client, *args, **keyword_args):
+        pass
+
+
+class SandboxOverrideSuppression(LookupSuppression):
+
+    def get_sandbox_query(self, table_name):
+        return {cdr_consts.QUERY: 'SELECT 1'}
+
+
+def other_rule(project_id, dataset_id, sandbox_dataset_id):
+    return [{cdr_consts.QUERY: f'UPDATE `{dataset_id}.person` SET x = 1'}]
+
+
+class ConceptSuppressionCombinerTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.project = PROJECT
+
+        tables_patcher = patch(
+            'cdr_cleaner.cleaning_rules.deid.concept_suppression.get_tables_in_dataset'
+        )
+        self.mock_get_tables = tables_patcher.start()
+        self.mock_get_tables.side_effect = lambda client, project, dataset, tables, **kwargs: tables
+        self.addCleanup(tables_patcher.stop)
+
+    def infer(self, rules):
+        return [(rule,) + ce.infer_rule(rule, PROJECT, DATASET, SANDBOX, 'rt')
+                for rule in rules]
+
+    def test_combine(self):
+        rules = self.infer([
+            LookupSuppression, BirthInformationSuppression, other_rule,
+            LookupSuppression, SandboxOverrideSuppression, other_rule
+        ])
+        combined_rules = list(csc.SuppressionCombiner().combine(rules))
+
+        # runs of a single rule and rules overriding the sandbox query are
+        # left as they are
+        self.assertEqual(len(combined_rules), 5)
+        self.assertEqual(combined_rules[1:], rules[2:])
+        clazz, query_function, setup_function, rule_info = combined_rules[0]
+        self.assertEqual(clazz, LookupSuppression)
+        self.assertEqual(
+            rule_info[cdr_consts.MODULE_NAME],
+            f'{csc.COMBINED_MODULE_NAME}.LookupSuppression__'
+            f'BirthInformationSuppression')
+
+        setup_function(self.client)
+        self.client.query.assert_called_once_with('CREATE lookup_concepts')
+        self.assertEqual(self.mock_get_tables.call_count, 2)
+
+        query_list = query_function()
+        lookup_query = query_list[0][cdr_consts.QUERY]
+        self.assertIn(
+            f'CREATE OR REPLACE TABLE `{PROJECT}.{SANDBOX}.'
+            f'rt_combined_suppression_1_concepts`', lookup_query)
+        self.assertIn(f'FROM `{PROJECT}.{SANDBOX}.lookup_concepts`',
+                      lookup_query)
+        self.assertIn('UNNEST(ARRAY<INT64>[1585259, 4083587, 3022007])',
+                      lookup_query)
+        self.assertIn("2 AS rule_no,", lookup_query)
+        self.assertIn('False AS include_source', lookup_query)
+
+        # each table is scanned once
+        observation_query, condition_query = query_list[1:3]
+        self.assertEqual(observation_query[cdr_consts.DESTINATION_TABLE],
+                         'rt_combined_suppression_1_observation')
+        self.assertEqual(observation_query[cdr_consts.DISPOSITION],
+                         bq_consts.WRITE_TRUNCATE)
+        self.assertIn('WHERE rule_no IN (1, 2)',
+                      observation_query[cdr_consts.QUERY])
+        self.assertEqual(
+            observation_query[cdr_consts.QUERY].count(
+                f'FROM `{PROJECT}.{DATASET}.observation`'), 1)
+        self.assertIn('COALESCE(s1.rule_no, 3)',
+                      observation_query[cdr_consts.QUERY])
+        self.assertIn('.source_rule_no, 3)',
+                      observation_query[cdr_consts.QUERY])
+        self.assertIn('WHERE rule_no IN (1)', condition_query[cdr_consts.QUERY])
+
+        # the rows of each rule are copied to its own sandbox table
+        rule_sandbox_queries = query_list[3:6]
+        self.assertEqual([
+            query[cdr_consts.DESTINATION_TABLE]
+            for query in rule_sandbox_queries
+        ], [
+            'rt_dc0001_observation', 'rt_dc1358_observation',
+            'rt_dc0001_condition_occurrence'
+        ])
+        self.assertIn(f'WHERE {csc.RULE_NO} = 2',
+                      rule_sandbox_queries[1][cdr_consts.QUERY])
+        self.assertIn(f'SELECT * EXCEPT ({csc.RULE_NO})',
+                      rule_sandbox_queries[1][cdr_consts.QUERY])
+
+        # rows are deleted once per table
+        delete_queries = query_list[6:8]
+        self.assertIn(f'FROM `{PROJECT}.{DATASET}.observation`',
+                      delete_queries[0][cdr_consts.QUERY])
+        self.assertIn('rt_combined_suppression_1_observation',
+                      delete_queries[0][cdr_consts.QUERY])
+        self.assertIn('DROP TABLE IF EXISTS', query_list[-1][cdr_consts.QUERY])
+        self.assertEqual(len(query_list), 10)
+
+    def test_key_only_sandbox(self):
+        rules = self.infer([LookupSuppression, BirthInformationSuppression])
+        for rule in rules:
+            rule[2].__self__.key_only_sandbox = True
+        instance = rules[0][2].__self__
+        instance.setup_rule(self.client)
+
+        # the key, person_id and the metadata are sandboxed, not the full rows
+        sandbox_query = instance.get_sandbox_query(OBSERVATION)[
+            cdr_consts.QUERY]
+        self.assertIn('d.observation_id, d.person_id,', sandbox_query)
+        self.assertIn("'LookupSuppression' AS sandboxed_by", sandbox_query)
+        self.assertIn('CURRENT_TIMESTAMP() AS sandboxed_at', sandbox_query)
+        self.assertIn(f"'{PROJECT}.{DATASET}.observation' AS source_table",
+                      sandbox_query)
+        self.assertNotIn('d.*', sandbox_query)
+        self.assertIn(
+            'observation_id IN (SELECT observation_id',
+            instance.get_suppression_query(OBSERVATION)[cdr_consts.QUERY])
+
+        # the full rows are read back through time travel
+        rows_query = instance.get_sandboxed_rows_query(
+            OBSERVATION, 'observation_rows')[cdr_consts.QUERY]
+        self.assertIn(
+            f'CREATE OR REPLACE TABLE `{PROJECT}.{SANDBOX}.observation_rows`',
+            rows_query)
+        self.assertIn(
+            f'FROM `{PROJECT}.{DATASET}.observation`\n'
+            f'  FOR SYSTEM_TIME AS OF snapshot_time AS d', rows_query)
+        self.assertIn(f'FROM `{PROJECT}.{SANDBOX}.rt_dc0001_observation`',
+                      rows_query)
+
+        # combined rules attribute the keys to the rule suppressing them
+        query_list = next(csc.SuppressionCombiner().combine(rules))[1]()
+        self.assertIn('d.observation_id, d.person_id,',
+                      query_list[1][cdr_consts.QUERY])
+        self.assertIn("REPLACE ('BirthInformationSuppression' AS sandboxed_by)",
+                      query_list[4][cdr_consts.QUERY])
+
+        # rules are only combined with rules of the same sandbox mode
+        rules[1][2].__self__.key_only_sandbox = False
+        self.assertEqual(len(list(csc.SuppressionCombiner().combine(rules))), 2)
+
+    def test_combine_no_tables(self):
+        self.mock_get_tables.side_effect = None
+        self.mock_get_tables.return_value = []
+        rules = self.infer([LookupSuppression, BirthInformationSuppression])
+        combined_rule = next(csc.SuppressionCombiner().combine(rules))
+
+        combined_rule[2](self.client)
+        self.assertEqual(combined_rule[1](), [])
+
+    @patch('cdr_cleaner.clean_cdr_engine.run_query')
+    @patch('cdr_cleaner.clean_cdr_engine.BigQueryClient')
+    def test_clean_dataset_combine_suppressions(self, mock_client,
+                                                mock_run_query):
+        mock_client.return_value = self.client
+        ce.clean_dataset(PROJECT,
+                         DATASET,
+                         SANDBOX, [(LookupSuppression,),
+                                   (BirthInformationSuppression,)],
+                         combine_suppressions=True)
+
+        queries = [
+            call.args[1][cdr_consts.QUERY]
+            for call in mock_run_query.call_args_list
+        ]
+        self.assertEqual(len(queries), 10)
+        self.assertIn('combined_suppression_1_concepts', queries[0])
+
+    @patch('cdr_cleaner.clean_cdr_engine.BigQueryClient')
+    def test_plan_dataset_combine_suppressions(self, mock_client):
+        mock_client.return_value = self.client
+        self.client.query.return_value.total_bytes_processed = 10
+        rules = [(LookupSuppression,), (BirthInformationSuppression,)]
+
+        estimates = ce.plan_dataset(PROJECT, DATASET, SANDBOX, rules)
+        self.assertEqual(len(estimates), 8)
+        self.assertFalse(
+            any(estimate['rule'].startswith(csc.COMBINED_MODULE_NAME)
+                for estimate in estimates))
+
+        # the plan estimates the queries the run would run
+        estimates = ce.plan_dataset(PROJECT,
+                                    DATASET,
+                                    SANDBOX,
+                                    rules,
+                                    combine_suppressions=True)
+        self.assertEqual(len(estimates), 10)
+        self.assertTrue(
+            all(estimate['rule'].startswith(csc.COMBINED_MODULE_NAME)
+                for estimate in estimates))
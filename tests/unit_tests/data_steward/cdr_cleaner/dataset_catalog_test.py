@@ -0,0 +1,97 @@
+# Python imports
+from unittest import TestCase
+
+# Third party imports
+from mock import MagicMock
+
+# Project imports
+from cdr_cleaner import clean_cdr_utils
+from cdr_cleaner import dataset_catalog as dc
+from gcloud.bq.dataset_schema import DatasetSchema
+
+PROJECT = 'test-project'
+DATASET = 'test_dataset'
+SANDBOX = 'test_sandbox'
+
+
+class DatasetCatalogTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.project = PROJECT
+        self.client.get_dataset_schema.side_effect = lambda dataset_id: DatasetSchema(
+            dataset_id, [{
+                'table_name': table_name,
+                'column_name': 'person_id',
+                'table_type': 'BASE TABLE'
+            } for table_name in ['person', 'observation']])
+        self.catalog = dc.DatasetCatalog(self.client, [DATASET, SANDBOX])
+
+    def test_get_tables(self):
+        tables = ['observation', 'measurement', 'person']
+        self.assertEqual(self.catalog.get_tables(DATASET, tables),
+                         ['observation', 'person'])
+        self.assertEqual(self.catalog.get_tables(DATASET, tables[:2]),
+                         ['observation'])
+        self.client.get_dataset_schema.assert_called_once_with(DATASET)
+
+        # only lookups concerning the modified table reload the dataset
+        self.catalog.invalidate(DATASET, 'measurement')
+        self.catalog.get_tables(DATASET, ['person'])
+        self.assertEqual(self.client.get_dataset_schema.call_count, 1)
+        self.catalog.get_tables(DATASET, ['measurement'])
+        self.assertEqual(self.client.get_dataset_schema.call_count, 2)
+
+        # other datasets are not kept
+        self.catalog.invalidate('other', 'person')
+        self.assertTrue(self.catalog.covers(PROJECT, SANDBOX))
+        self.assertFalse(self.catalog.covers(PROJECT, 'other'))
+        self.assertFalse(self.catalog.covers('other-project', DATASET))
+
+    def test_invalidate_query(self):
+        self.catalog.get_tables(DATASET, ['person', 'observation'])
+
+        # reads do not modify tables
+        self.catalog.invalidate_query(
+            {'query': f'SELECT * FROM `{DATASET}.person`'})
+        self.catalog.get_tables(DATASET, ['person'])
+        self.assertEqual(self.client.get_dataset_schema.call_count, 1)
+
+        self.catalog.invalidate_query({
+            'query': 'SELECT 1',
+            'destination_dataset_id': DATASET,
+            'destination_table_id': 'person'
+        })
+        self.catalog.get_tables(DATASET, ['observation'])
+        self.assertEqual(self.client.get_dataset_schema.call_count, 1)
+        self.catalog.get_tables(DATASET, ['person'])
+        self.assertEqual(self.client.get_dataset_schema.call_count, 2)
+
+        self.catalog.invalidate_query(
+            {'query': f'DELETE FROM `{PROJECT}.{DATASET}.person` WHERE TRUE'})
+        self.catalog.get_tables(DATASET, ['person'])
+        self.assertEqual(self.client.get_dataset_schema.call_count, 3)
+
+    def test_invalidate_all(self):
+        self.catalog.get_tables(DATASET, ['person'])
+        self.catalog.get_tables(SANDBOX, ['person'])
+        self.catalog.invalidate_all()
+        self.catalog.get_tables(DATASET, ['observation'])
+        self.catalog.get_tables(SANDBOX, ['observation'])
+        self.assertEqual(self.client.get_dataset_schema.call_count, 4)
+
+    def test_get_tables_in_dataset(self):
+        self.assertEqual(
+            clean_cdr_utils.get_tables_in_dataset(self.client,
+                                                  PROJECT,
+                                                  DATASET,
+                                                  ['person', 'measurement'],
+                                                  catalog=self.catalog),
+            ['person'])
+        self.client.query.assert_not_called()
@@ -0,0 +1,179 @@
+# Python imports
+from unittest import TestCase
+
+# Third party imports
+from google.cloud.exceptions import NotFound
+from mock import MagicMock, patch
+
+# Project imports
+from cdr_cleaner import clean_cdr_engine as ce
+from cdr_cleaner import query_planner as qp
+from constants import bq_utils as bq_consts
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+
+PROJECT = 'test-project'
+DATASET = 'test_dataset'
+SANDBOX = 'test_sandbox'
+GIB = qp.BYTES_PER_GIB
+
+
+def fake_rule(project_id, dataset_id, sandbox_dataset_id):
+    return [{
+        cdr_consts.QUERY:
+            (f'CREATE TABLE `{project_id}.{sandbox_dataset_id}.obs_sandbox` AS '
+             f'SELECT * FROM `{project_id}.{dataset_id}.observation`')
+    }, {
+        cdr_consts.QUERY:
+            f'DELETE FROM `{project_id}.{dataset_id}.observation` WHERE x = 0'
+    }, {
+        cdr_consts.QUERY: f'SELECT * FROM `{project_id}.{dataset_id}.person`',
+        cdr_consts.DESTINATION_DATASET: dataset_id,
+        cdr_consts.DESTINATION_TABLE: 'person',
+        cdr_consts.DISPOSITION: bq_consts.WRITE_TRUNCATE
+    }]
+
+
+class QueryPlannerTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.sandbox_query, self.dml_query, self.rewrite_query = fake_rule(
+            PROJECT, DATASET, SANDBOX)
+        self.client = MagicMock()
+        self.client.project = PROJECT
+        self.client.query.return_value.total_bytes_processed = 2 * GIB
+
+    def test_is_batch_candidate(self):
+        self.assertTrue(qp.is_batch_candidate(self.sandbox_query, SANDBOX))
+        self.assertTrue(qp.is_batch_candidate(self.dml_query, SANDBOX))
+        self.assertFalse(qp.is_batch_candidate(self.rewrite_query, SANDBOX))
+        self.assertFalse(
+            qp.is_batch_candidate(
+                {
+                    cdr_consts.QUERY:
+                        f'CREATE OR REPLACE TABLE `{DATASET}.person` AS '
+                        f'SELECT * FROM `{DATASET}.person`'
+                }, SANDBOX))
+
+    def test_is_batch_candidate_commented_dml(self):
+        for comment in [
+                '-- remove invalid rows\n', '/* remove\ninvalid rows */\n'
+        ]:
+            query = comment + self.dml_query[cdr_consts.QUERY]
+            self.assertTrue(
+                qp.is_batch_candidate({cdr_consts.QUERY: query}, SANDBOX))
+
+    def test_get_target_table(self):
+        dataset_ids = {DATASET, SANDBOX}
+        self.assertEqual(qp.get_target_table(self.sandbox_query, dataset_ids),
+                         f'{SANDBOX}.obs_sandbox')
+        self.assertEqual(qp.get_target_table(self.dml_query, dataset_ids),
+                         f'{DATASET}.observation')
+        self.assertEqual(qp.get_target_table(self.rewrite_query, dataset_ids),
+                         f'{DATASET}.person')
+        self.assertEqual(
+            qp.get_target_table({cdr_consts.QUERY: 'SELECT 1'}, dataset_ids),
+            qp.UNKNOWN_TABLE)
+
+    def test_generate_job_config_batch(self):
+        job_config = ce.generate_job_config(PROJECT, self.dml_query)
+        self.assertIsNone(job_config.priority)
+        job_config = ce.generate_job_config(PROJECT, {
+            **self.rewrite_query, cdr_consts.BATCH: True
+        })
+        self.assertEqual(job_config.priority, bq_consts.BATCH)
+        self.assertEqual(job_config.destination.table_id, 'person')
+
+    def test_batch_priority_policy(self):
+        policy = qp.BatchPriorityPolicy(SANDBOX, 1)
+
+        job_config = ce.generate_job_config(PROJECT, self.sandbox_query)
+        self.assertEqual(
+            policy.get_priority(self.client, self.sandbox_query, job_config),
+            bq_consts.BATCH)
+        dry_run_config = self.client.query.call_args[1]['job_config']
+        self.assertTrue(dry_run_config.dry_run)
+        # the job config of the real query is not modified
+        self.assertFalse(job_config.dry_run)
+
+        # rewrites stay interactive and are not dry-run
+        self.client.query.reset_mock()
+        job_config = ce.generate_job_config(PROJECT, self.rewrite_query)
+        self.assertEqual(
+            policy.get_priority(self.client, self.rewrite_query, job_config),
+            bq_consts.INTERACTIVE)
+        self.client.query.assert_not_called()
+
+        # small queries stay interactive
+        self.client.query.return_value.total_bytes_processed = GIB // 2
+        job_config = ce.generate_job_config(PROJECT, self.dml_query)
+        self.assertEqual(
+            policy.get_priority(self.client, self.dml_query, job_config),
+            bq_consts.INTERACTIVE)
+
+        # queries that cannot be estimated stay interactive
+        self.client.query.side_effect = NotFound('no table')
+        self.assertEqual(
+            policy.get_priority(self.client, self.dml_query, job_config),
+            bq_consts.INTERACTIVE)
+
+        self.assertRaises(ValueError, qp.BatchPriorityPolicy, SANDBOX, -1)
+
+    def test_run_query_priority_policy(self):
+        rule_info = {
+            cdr_consts.MODULE_NAME: 'fake_module',
+            cdr_consts.FUNCTION_NAME: 'fake_rule',
+            cdr_consts.LINE_NO: 1
+        }
+        dry_run_job = MagicMock(total_bytes_processed=2 * GIB)
+        query_job = MagicMock(errors=None)
+        self.client.query.side_effect = [dry_run_job, query_job]
+
+        policy = qp.BatchPriorityPolicy(SANDBOX, 1)
+        job = ce.run_query(self.client,
+                           self.dml_query,
+                           rule_info,
+                           0,
+                           1,
+                           priority_policy=policy)
+
+        self.assertEqual(job, query_job)
+        job_config = self.client.query.call_args[1]['job_config']
+        self.assertEqual(job_config.priority, bq_consts.BATCH)
+        self.assertFalse(job_config.dry_run)
+
+    @patch('cdr_cleaner.clean_cdr_engine.BigQueryClient')
+    def test_plan_dataset(self, mock_client):
+        mock_client.return_value = self.client
+
+        def query(query, job_config):
+            if 'DELETE' in query:
+                raise NotFound('no table')
+            return MagicMock(total_bytes_processed=2 * GIB)
+
+        self.client.query.side_effect = query
+        estimates = ce.plan_dataset(PROJECT,
+                                    DATASET,
+                                    SANDBOX, [(fake_rule,)],
+                                    batch_threshold_gb=1)
+
+        self.assertEqual(len(estimates), 3)
+        sandbox, dml, rewrite = estimates
+        self.assertEqual(sandbox['bytes_processed'], 2 * GIB)
+        self.assertEqual(sandbox['priority'], bq_consts.BATCH)
+        self.assertIsNone(dml['bytes_processed'])
+        self.assertIn('no table', dml['error'])
+        self.assertEqual(dml['priority'], bq_consts.INTERACTIVE)
+        self.assertEqual(rewrite['table'], f'{DATASET}.person')
+        self.assertEqual(rewrite['priority'], bq_consts.INTERACTIVE)
+
+        per_rule, per_table, total = qp.summarize_estimates(estimates)
+        self.assertEqual(total, 4 * GIB)
+        self.assertEqual(per_rule[sandbox['rule']], 4 * GIB)
+        self.assertEqual(per_table[f'{SANDBOX}.obs_sandbox'], 2 * GIB)
+        self.assertEqual(per_table[f'{DATASET}.observation'], 0)
@@ -0,0 +1,327 @@
+# Python imports
+from unittest import TestCase
+
+# Third party imports
+from mock import MagicMock, patch
+
+# Project imports
+from cdr_cleaner import clean_cdr_engine as ce
+from cdr_cleaner import rule_fusion as rf
+from cdr_cleaner.cleaning_rules.base_cleaning_rule import BaseCleaningRule
+from constants import bq_utils as bq_consts
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+
+PROJECT = 'test-project'
+DATASET = 'test_dataset'
+SANDBOX = 'test_sandbox'
+
+
+def rewrite_rule(project_id, dataset_id, sandbox_dataset_id):
+    return [{
+        cdr_consts.QUERY:
+            (f'CREATE OR REPLACE TABLE `{project_id}.{sandbox_dataset_id}.'
+             f'rewrite_sandbox` AS SELECT * FROM '
+             f'`{project_id}.{dataset_id}.observation` WHERE value = 1')
+    }, {
+        cdr_consts.QUERY:
+            (f'SELECT observation_id, IF(value = 1, 2, value) AS value '
+             f'FROM `{project_id}.{dataset_id}.observation`'),
+        cdr_consts.DESTINATION_DATASET: dataset_id,
+        cdr_consts.DESTINATION_TABLE: 'observation',
+        cdr_consts.DISPOSITION: bq_consts.WRITE_TRUNCATE
+    }]
+
+
+def update_rule(project_id, dataset_id, sandbox_dataset_id):
+    return [{
+        cdr_consts.QUERY: (f'UPDATE `{project_id}.{dataset_id}.observation` '
+                           f'SET value = NULL WHERE value = -1')
+    }]
+
+
+def replace_rule(project_id, dataset_id, sandbox_dataset_id):
+    return [{
+        cdr_consts.QUERY:
+            (f'CREATE OR REPLACE TABLE `{project_id}.{dataset_id}.observation` '
+             f'AS (SELECT o.observation_id, ROUND(o.value) AS value '
+             f'FROM `{project_id}.{dataset_id}.observation` o)')
+    }]
+
+
+def delete_rule(project_id, dataset_id, sandbox_dataset_id):
+    return [{
+        cdr_consts.QUERY:
+            f'DELETE FROM `{project_id}.{dataset_id}.observation` WHERE value = 0'
+    }]
+
+
+def measurement_rule(project_id, dataset_id, sandbox_dataset_id):
+    return [{
+        cdr_consts.QUERY: (f'UPDATE `{project_id}.{dataset_id}.measurement` '
+                           f'SET value = NULL WHERE value = -1')
+    }]
+
+
+def fusable(query_function, table='observation', fuse_rewrites=True):
+    """
+    Get a cleaning rule class running the queries of a rule function
+    """
+
+    class FusableRule(BaseCleaningRule):
+
+        def __init__(self, project_id, dataset_id, sandbox_dataset_id):
+            super().__init__(issue_numbers=['DC000'],
+                             description='rule fusion test rule',
+                             affected_datasets=[cdr_consts.RDR],
+                             affected_tables=[table],
+                             project_id=project_id,
+                             dataset_id=dataset_id,
+                             sandbox_dataset_id=sandbox_dataset_id,
+                             fuse_rewrites=fuse_rewrites)
+
+        def get_query_specs(self):
+            return query_function(self.project_id, self.dataset_id,
+                                  self.sandbox_dataset_id)
+
+        def setup_rule(self, client):
+            pass
+
+        def setup_validation(self, client):
+            pass
+
+        def validate_rule(self, client):
+            pass
+
+        def get_sandbox_tablenames(self):
+            return []
+
+    FusableRule.__name__ = query_function.__name__
+    return FusableRule
+
+
+class RuleFusionTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.project = PROJECT
+        self.client.query.return_value.total_bytes_processed = 100
+
+    def infer(self, rules):
+        return [(rule,) + ce.infer_rule(rule, PROJECT, DATASET, SANDBOX, '')
+                for rule in rules]
+
+    def test_update_as_select(self):
+        table_id, query = rf.update_as_select(
+            f"UPDATE `{PROJECT}.{DATASET}.observation` AS o "
+            f"SET value = NULL, o.value_as_string = 'a, b' "
+            f"WHERE value IN (SELECT value FROM `{PROJECT}.{DATASET}.lookup` "
+            f"WHERE x = 1)", DATASET)
+        self.assertEqual(table_id, 'observation')
+        self.assertIn('SELECT * REPLACE (', query)
+        self.assertIn('), value) AS value,', query)
+        self.assertIn("'a, b'", query)
+        self.assertIn('), value_as_string) AS value_as_string', query)
+        self.assertIn(f'FROM `{PROJECT}.{DATASET}.observation` AS o', query)
+
+        # joins, missing conditions and other datasets are not supported
+        self.assertIsNone(
+            rf.update_as_select(
+                f'UPDATE `{DATASET}.observation` o SET value = l.value '
+                f'FROM `{DATASET}.lookup` l WHERE o.id = l.id', DATASET))
+        self.assertIsNone(
+            rf.update_as_select(f'UPDATE `{DATASET}.observation` SET value = 1',
+                                DATASET))
+        self.assertIsNone(
+            rf.update_as_select(
+                f'UPDATE `other.observation` SET value = 1 WHERE TRUE',
+                DATASET))
+
+    def test_get_rewrite(self):
+        sandbox_query, rewrite_query = rewrite_rule(PROJECT, DATASET, SANDBOX)
+        self.assertIsNone(rf.get_rewrite(sandbox_query, DATASET))
+        self.assertEqual(rf.get_rewrite(rewrite_query, DATASET),
+                         ('observation', rewrite_query[cdr_consts.QUERY], True))
+        table_id, query, native = rf.get_rewrite(
+            replace_rule(PROJECT, DATASET, SANDBOX)[0], DATASET)
+        self.assertEqual((table_id, native), ('observation', True))
+        self.assertTrue(query.startswith('(SELECT'))
+        table_id, _, native = rf.get_rewrite(
+            update_rule(PROJECT, DATASET, SANDBOX)[0], DATASET)
+        self.assertEqual((table_id, native), ('observation', False))
+        self.assertIsNone(
+            rf.get_rewrite(delete_rule(PROJECT, DATASET, SANDBOX)[0], DATASET))
+        self.assertIsNone(
+            rf.get_rewrite({cdr_consts.QUERY: 'SELECT 1; SELECT 2'}, DATASET))
+
+    def test_replace_table_references(self):
+        query = (
+            f"SELECT o.* FROM `{PROJECT}.{DATASET}.observation` o "
+            f"JOIN {DATASET}.observation WHERE x = '{DATASET}.observation' "
+            f"AND y IN (SELECT y FROM `{DATASET}.observation_ext`)")
+        self.assertEqual(
+            rf.replace_table_references(query, DATASET, 'observation', 'step'),
+            f"SELECT o.* FROM step o JOIN step AS observation "
+            f"WHERE x = '{DATASET}.observation' "
+            f"AND y IN (SELECT y FROM `{DATASET}.observation_ext`)")
+
+    def test_fuse(self):
+        fuser = rf.RuleChainFuser(self.client, DATASET, SANDBOX)
+        rules = self.infer([
+            fusable(rewrite_rule),
+            fusable(update_rule),
+            fusable(replace_rule), delete_rule,
+            fusable(update_rule),
+            fusable(rewrite_rule),
+            fusable(measurement_rule, table='measurement')
+        ])
+        fused_rules = list(fuser.fuse(rules))
+
+        # each rule keeps its position.  The delete ends the first run.  The
+        # UPDATE after it starts a second run that the sandbox query of the
+        # next rewrite reads from.  The measurement rule rewrites another
+        # table and is not fused.
+        self.assertEqual([rule[3] for rule in fused_rules],
+                         [rule[3] for rule in rules])
+        query_list = fused_rules[0][1]()
+        self.assertEqual(len(query_list), 2)
+        self.assertEqual(query_list[0],
+                         rewrite_rule(PROJECT, DATASET, SANDBOX)[0])
+        fused = query_list[1]
+        self.assertEqual(fused[cdr_consts.DESTINATION_TABLE], 'observation')
+        self.assertEqual(fused[cdr_consts.DISPOSITION],
+                         bq_consts.WRITE_TRUNCATE)
+        self.assertIn(f'FROM `{PROJECT}.{DATASET}.observation`\n),',
+                      fused[cdr_consts.QUERY])
+        self.assertIn('FROM fused_step_1 AS observation',
+                      fused[cdr_consts.QUERY])
+        self.assertIn('FROM fused_step_2 o)', fused[cdr_consts.QUERY])
+        self.assertTrue(fused[cdr_consts.QUERY].strip().endswith(
+            'SELECT * FROM fused_step_3'))
+        # rules fused into the first one run no queries
+        self.assertEqual(fused_rules[1][1](), [])
+        self.assertEqual(fused_rules[2][1](), [])
+        self.assertEqual(fused_rules[3][1](),
+                         delete_rule(PROJECT, DATASET, SANDBOX))
+        sandbox_query, _ = fused_rules[4][1]()
+        self.assertIn('SELECT * REPLACE (', sandbox_query[cdr_consts.QUERY])
+        self.assertEqual(fused_rules[5][1](), [])
+        self.assertEqual(fused_rules[6][1](),
+                         measurement_rule(PROJECT, DATASET, SANDBOX))
+
+        self.assertEqual(len(fuser.reports), 2)
+        report = fuser.reports[0]
+        self.assertEqual(report['unfused_rewrites'], 3)
+        self.assertEqual(report['unfused_bytes'], 300)
+        self.assertEqual(report['saved_bytes'], 200)
+
+    def test_fuse_generates_specs_lazily(self):
+        fuser = rf.RuleChainFuser(self.client, DATASET, SANDBOX)
+        rules = self.infer([
+            fusable(replace_rule),
+            fusable(rewrite_rule),
+            fusable(update_rule, table='measurement')
+        ])
+        query_functions = [MagicMock(wraps=rule[1]) for rule in rules]
+        rules = [(clazz, query_function, setup_function, rule_info)
+                 for (clazz, _, setup_function,
+                      rule_info), query_function in zip(rules, query_functions)]
+
+        fused_rules = list(fuser.fuse(rules))
+
+        # runs are found from the rules' metadata alone
+        self.assertEqual(len(fused_rules), 3)
+        for query_function in query_functions:
+            query_function.assert_not_called()
+
+        # the specs of a run are generated when its first rule runs
+        fused_rules[0][1]()
+        query_functions[0].assert_called_once_with()
+        query_functions[1].assert_called_once_with()
+        query_functions[2].assert_not_called()
+        self.assertEqual(fused_rules[1][1](), [])
+        query_functions[1].assert_called_once_with()
+
+    def test_fuse_sandbox_reads_fused_table(self):
+        fuser = rf.RuleChainFuser(self.client, DATASET, SANDBOX)
+        fused_rules = list(
+            fuser.fuse(
+                self.infer([fusable(replace_rule),
+                            fusable(rewrite_rule)])))
+
+        self.assertEqual(len(fused_rules), 2)
+        sandbox_query, fused = fused_rules[0][1]()
+        # the sandbox query of the second rule reads the first rule's result
+        self.assertIn('AS SELECT * FROM (\n', sandbox_query[cdr_consts.QUERY])
+        self.assertIn('fused_step_1 AS (\n(SELECT o.observation_id',
+                      sandbox_query[cdr_consts.QUERY])
+        self.assertIn(') AS observation WHERE value = 1',
+                      sandbox_query[cdr_consts.QUERY])
+        self.assertIn('SELECT * FROM fused_step_2', fused[cdr_consts.QUERY])
+        self.assertEqual(fused_rules[1][1](), [])
+
+    def test_no_fusion(self):
+        fuser = rf.RuleChainFuser(self.client, DATASET, SANDBOX)
+        rules = self.infer([
+            fusable(update_rule),
+            fusable(update_rule),
+            fusable(rewrite_rule, fuse_rewrites=False), replace_rule,
+            fusable(replace_rule)
+        ])
+        fused_rules = list(fuser.fuse(rules))
+
+        # chains of UPDATE statements are left as they are and rules that
+        # do not opt in are never fused
+        self.assertEqual([rule[3] for rule in fused_rules],
+                         [rule[3] for rule in rules])
+        self.assertIs(fused_rules[2], rules[2])
+        self.assertIs(fused_rules[3], rules[3])
+        self.assertIs(fused_rules[4], rules[4])
+        for fused_rule, rule in zip(fused_rules, rules):
+            self.assertEqual(fused_rule[1](), rule[1]())
+        self.assertEqual(fuser.reports, [])
+
+    @patch('cdr_cleaner.clean_cdr_engine.run_query')
+    @patch('cdr_cleaner.clean_cdr_engine.BigQueryClient')
+    def test_clean_dataset_fuse_rules(self, mock_client, mock_run_query):
+        mock_client.return_value = self.client
+        ce.clean_dataset(PROJECT,
+                         DATASET,
+                         SANDBOX, [(fusable(replace_rule),),
+                                   (fusable(update_rule),), (delete_rule,)],
+                         fuse_rules=True)
+
+        queries = [
+            call.args[1][cdr_consts.QUERY]
+            for call in mock_run_query.call_args_list
+        ]
+        # the fused rule runs no queries of its own
+        self.assertEqual(len(queries), 2)
+        self.assertIn('fused_step_2', queries[0])
+        self.assertIn('DELETE', queries[1])
+
+    @patch('cdr_cleaner.clean_cdr_engine.BigQueryClient')
+    def test_plan_dataset_fuse_rules(self, mock_client):
+        mock_client.return_value = self.client
+        rules = [(fusable(replace_rule),), (fusable(update_rule),),
+                 (delete_rule,)]
+
+        estimates = ce.plan_dataset(PROJECT, DATASET, SANDBOX, rules)
+        self.assertEqual(len(estimates), 3)
+
+        # the plan estimates the fused rewrite and reports the bytes saved
+        with self.assertLogs('cdr_cleaner.clean_cdr_engine') as logs:
+            estimates = ce.plan_dataset(PROJECT,
+                                        DATASET,
+                                        SANDBOX,
+                                        rules,
+                                        fuse_rules=True)
+        self.assertEqual(len(estimates), 2)
+        self.assertIn('fused_step_2', str(self.client.query.call_args_list))
+        self.assertIn('Estimated bytes saved by fusing 1 runs of rules',
+                      logs.output[-1])
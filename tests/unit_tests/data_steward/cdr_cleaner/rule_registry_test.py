@@ -0,0 +1,64 @@
+# Python imports
+from unittest import TestCase
+
+# Third party imports
+from mock import patch
+
+# Project imports
+from cdr_cleaner import rule_registry as rr
+from cdr_cleaner.cleaning_rules.clean_mapping import CleanMappingExtTables
+from cdr_cleaner.cleaning_rules.drop_duplicate_states import \
+    get_drop_duplicate_states_queries
+
+CLEAN_MAPPING = 'cdr_cleaner.cleaning_rules.clean_mapping.CleanMappingExtTables'
+DROP_DUPLICATE_STATES = ('cdr_cleaner.cleaning_rules.drop_duplicate_states.'
+                         'get_drop_duplicate_states_queries')
+
+
+class RuleRegistryTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def test_import_rule(self):
+        self.assertIs(rr.import_rule(CLEAN_MAPPING), CleanMappingExtTables)
+        self.assertIs(rr.import_rule(DROP_DUPLICATE_STATES),
+                      get_drop_duplicate_states_queries)
+
+        with self.assertRaises(ImportError):
+            rr.import_rule('CleanMappingExtTables')
+        with self.assertRaises(ImportError):
+            rr.import_rule('cdr_cleaner.cleaning_rules.clean_mapping.Missing')
+        with self.assertRaises(ImportError):
+            rr.import_rule('cdr_cleaner.cleaning_rules.missing.Missing')
+
+    @patch('cdr_cleaner.rule_registry.importlib.import_module',
+           wraps=rr.importlib.import_module)
+    def test_rule_registry(self, mock_import_module):
+        registry = rr.RuleRegistry({
+            'ehr': [CLEAN_MAPPING],
+            'combined': [DROP_DUPLICATE_STATES, CLEAN_MAPPING]
+        })
+
+        # listing the data stages imports nothing
+        self.assertEqual(list(registry), ['ehr', 'combined'])
+        self.assertEqual(len(registry), 2)
+        self.assertIn('ehr', registry)
+        self.assertEqual(registry.get_rule_paths('ehr'), [CLEAN_MAPPING])
+        mock_import_module.assert_not_called()
+
+        # rules are imported for the data stage looked up only, once
+        self.assertEqual(registry['ehr'], [(CleanMappingExtTables,)])
+        self.assertIs(registry.get('ehr'), registry['ehr'])
+        mock_import_module.assert_called_once_with(
+            'cdr_cleaner.cleaning_rules.clean_mapping')
+
+        self.assertEqual(registry['combined'],
+                         [(get_drop_duplicate_states_queries,),
+                          (CleanMappingExtTables,)])
+        self.assertIsNone(registry.get('rdr'))
+        with self.assertRaises(KeyError):
+            registry['rdr']
@@ -0,0 +1,269 @@
+# Python imports
+import threading
+from unittest import TestCase
+
+# Third party imports
+from mock import MagicMock
+
+# Project imports
+from cdr_cleaner import clean_cdr_engine as ce
+from cdr_cleaner import rule_scheduler as rs
+from cdr_cleaner.cleaning_rules.base_cleaning_rule import BaseCleaningRule
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+
+PROJECT = 'test-project'
+DATASET = 'test_dataset'
+SANDBOX = 'test_sandbox'
+
+
+class FakeTableRule(BaseCleaningRule):
+    """
+    Sandboxes and deletes rows from each of its affected tables
+    """
+    tables = []
+
+    def __init__(self,
+                 project_id,
+                 dataset_id,
+                 sandbox_dataset_id,
+                 table_namer=None):
+        super().__init__(issue_numbers=[self.__class__.__name__.lower()],
+                         description='fake',
+                         affected_datasets=[cdr_consts.COMBINED],
+                         affected_tables=list(self.tables),
+                         project_id=project_id,
+                         dataset_id=dataset_id,
+                         sandbox_dataset_id=sandbox_dataset_id,
+                         table_namer=table_namer)
+
+    def get_sandbox_tablenames(self):
+        return [self.sandbox_table_for(table) for table in self.tables]
+
+    def setup_rule(self, client, *args, **keyword_args):
+        pass
+
+    def setup_validation(self, client, *args, **keyword_args):
+        pass
+
+    def validate_rule(self, client, *args, **keyword_args):
+        pass
+
+    def get_query_specs(self, *args, **keyword_args):
+        queries = []
+        for table in self.tables:
+            sandbox = self.sandbox_table_for(table)
+            queries.append({
+                cdr_consts.QUERY:
+                    f'CREATE TABLE `{self.project_id}.{self.sandbox_dataset_id}.{sandbox}` AS '
+                    f'SELECT * FROM `{self.project_id}.{self.dataset_id}.{table}` WHERE x = 0'
+            })
+            queries.append({
+                cdr_consts.QUERY:
+                    f'DELETE FROM `{self.project_id}.{self.dataset_id}.{table}` WHERE x = 0'
+            })
+        return queries
+
+
+class ObservationRule(FakeTableRule):
+    tables = ['observation']
+
+
+class MeasurementRule(FakeTableRule):
+    tables = ['measurement']
+
+
+class ObservationMeasurementRule(FakeTableRule):
+    tables = ['observation', 'measurement']
+
+
+class SetupRule(MeasurementRule):
+
+    def setup_rule(self, client, *args, **keyword_args):
+        client.setup_called = True
+
+
+class DynamicSqlRule(MeasurementRule):
+
+    def get_query_specs(self, *args, **keyword_args):
+        return [{
+            cdr_consts.QUERY:
+                "EXECUTE IMMEDIATE 'DELETE FROM ' || table_name || ' WHERE TRUE'"
+        }]
+
+
+def fake_legacy_rule(project_id, dataset_id, sandbox_dataset_id):
+    return [{cdr_consts.QUERY: f'SELECT 1 FROM `{dataset_id}.person`'}]
+
+
+class RuleSchedulerTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.project = PROJECT
+        self.lock = threading.Lock()
+        self.completed = []
+
+    def infer(self, rules):
+        return [(rule,) + ce.infer_rule(rule, PROJECT, DATASET, SANDBOX, '')
+                for rule in rules]
+
+    def fake_run_query(self, client, query_dict, rule_info, query_no,
+                       query_count):
+        with self.lock:
+            self.completed.append((rule_info[cdr_consts.MODULE_NAME],
+                                   query_dict[cdr_consts.QUERY]))
+        return query_dict[cdr_consts.QUERY]
+
+    def test_get_query_tables(self):
+        query_dict = {
+            cdr_consts.QUERY:
+                (f'INSERT INTO `{PROJECT}.{DATASET}.observation` '
+                 f'SELECT o.* FROM `{PROJECT}.{SANDBOX}.lookup` o '
+                 f'JOIN `{PROJECT}.vocabulary.concept` c USING (concept_id)'),
+            cdr_consts.DESTINATION_DATASET: SANDBOX,
+            cdr_consts.DESTINATION_TABLE: 'observation_copy'
+        }
+        touched, written = rs.get_query_tables(query_dict, {DATASET, SANDBOX})
+        self.assertSetEqual(
+            touched, {
+                f'{DATASET}.observation', f'{SANDBOX}.lookup',
+                f'{SANDBOX}.observation_copy'
+            })
+        self.assertSetEqual(
+            written, {f'{DATASET}.observation', f'{SANDBOX}.observation_copy'})
+
+        opaque = {cdr_consts.QUERY: 'EXECUTE IMMEDIATE "DROP TABLE x"'}
+        touched, _ = rs.get_query_tables(opaque, {DATASET, SANDBOX})
+        self.assertTrue(rs.is_opaque_query(opaque, touched))
+        self.assertFalse(
+            rs.is_opaque_query(
+                query_dict,
+                rs.get_query_tables(query_dict, {DATASET, SANDBOX})[0]))
+
+    def test_has_setup(self):
+        rule = ObservationRule(PROJECT, DATASET, SANDBOX)
+        self.assertFalse(rs.has_setup(rule.setup_rule))
+        rule = SetupRule(PROJECT, DATASET, SANDBOX)
+        self.assertTrue(rs.has_setup(rule.setup_rule))
+
+        def documented_noop(client):
+            """
+            A docstring does not count as setup
+            """
+            pass
+
+        self.assertFalse(rs.has_setup(documented_noop))
+
+    def test_independent_rules_run_concurrently(self):
+        # each rule's sandbox query blocks until the other rule's sandbox
+        # query has started, which only succeeds if they run concurrently
+        barrier = threading.Barrier(2, timeout=10)
+
+        def run_query(client, query_dict, rule_info, query_no, query_count):
+            if query_no == 0:
+                barrier.wait()
+            return self.fake_run_query(client, query_dict, rule_info, query_no,
+                                       query_count)
+
+        scheduler = rs.RuleScheduler(self.client, DATASET, SANDBOX, run_query,
+                                     2)
+        jobs = scheduler.run(self.infer([ObservationRule, MeasurementRule]))
+
+        self.assertEqual(len(jobs), 4)
+        self.assertIn('observation', jobs[0])
+        self.assertIn('measurement', jobs[2])
+        self.assertFalse(barrier.broken)
+
+    def test_dependencies(self):
+        scheduler = rs.RuleScheduler(self.client, DATASET, SANDBOX,
+                                     self.fake_run_query, 4)
+        scheduler.run(
+            self.infer([
+                ObservationRule, MeasurementRule, ObservationMeasurementRule,
+                fake_legacy_rule, MeasurementRule
+            ]))
+
+        obs, meas, obs_meas, legacy, last = scheduler.rules
+        self.assertSetEqual(obs.deps, set())
+        self.assertSetEqual(meas.deps, set())
+        self.assertSetEqual(obs_meas.deps, {obs.index, meas.index})
+        self.assertTrue(legacy.is_barrier)
+        self.assertSetEqual(legacy.deps, {0, 1, 2})
+        self.assertIn(legacy.index, last.deps)
+
+        # the sandbox query must finish before the delete on the same table
+        self.assertSetEqual(obs_meas.queries[1].deps, {(0, 0), (0, 1), (1, 0),
+                                                       (1, 1), (2, 0)})
+        # queries on different tables within a rule are independent
+        self.assertNotIn((2, 0), obs_meas.queries[2].deps)
+
+        # completion order respects the dependencies
+        modules = [module for module, _ in self.completed]
+        self.assertEqual(len(modules), 11)
+        obs_meas_start = self.completed.index(
+            (obs_meas.name, obs_meas.queries[0].query_dict[cdr_consts.QUERY]))
+        self.assertGreaterEqual(obs_meas_start, 4)
+
+    def test_setup_waits_for_earlier_rules(self):
+        scheduler = rs.RuleScheduler(self.client, DATASET, SANDBOX,
+                                     self.fake_run_query, 4)
+        scheduler.run(self.infer([ObservationRule, SetupRule]))
+
+        self.assertTrue(self.client.setup_called)
+        self.assertSetEqual(scheduler.rules[1].deps, {0})
+        self.assertEqual(len(self.completed), 4)
+
+    def test_setup_reloads_catalog(self):
+        catalog = MagicMock()
+        scheduler = rs.RuleScheduler(self.client,
+                                     DATASET,
+                                     SANDBOX,
+                                     self.fake_run_query,
+                                     4,
+                                     catalog=catalog)
+        scheduler.run(self.infer([ObservationRule, SetupRule]))
+
+        # only the rule with a setup reloads the catalog
+        catalog.invalidate_all.assert_called_once_with()
+
+    def test_opaque_query_is_barrier(self):
+        scheduler = rs.RuleScheduler(self.client, DATASET, SANDBOX,
+                                     self.fake_run_query, 4)
+        scheduler.run(
+            self.infer([ObservationRule, DynamicSqlRule, ObservationRule]))
+
+        # the declared tables do not overlap, the dynamic SQL may still write
+        # the observation table
+        first, dynamic, last = scheduler.rules
+        self.assertTrue(dynamic.is_barrier)
+        self.assertSetEqual(dynamic.deps, {first.index})
+        self.assertIn(dynamic.index, last.deps)
+        queries = [query for _, query in self.completed]
+        self.assertEqual(len(queries), 5)
+        self.assertIn('EXECUTE IMMEDIATE', queries[2])
+
+    def test_failure_stops_scheduling(self):
+
+        def run_query(client, query_dict, rule_info, query_no, query_count):
+            if 'DELETE' in query_dict[cdr_consts.QUERY]:
+                raise RuntimeError('query failed')
+            return self.fake_run_query(client, query_dict, rule_info, query_no,
+                                       query_count)
+
+        scheduler = rs.RuleScheduler(self.client, DATASET, SANDBOX, run_query,
+                                     2)
+        with self.assertRaises(RuntimeError):
+            scheduler.run(self.infer([ObservationRule, ObservationRule]))
+
+        # the second rule is never started
+        self.assertEqual(len(self.completed), 1)
+
+    def test_invalid_concurrency(self):
+        self.assertRaises(ValueError, rs.RuleScheduler, self.client, DATASET,
+                          SANDBOX, self.fake_run_query, 0)
@@ -0,0 +1,218 @@
+# Python imports
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+# Third party imports
+from mock import MagicMock, patch
+
+# Project imports
+from cdr_cleaner import clean_cdr_engine as ce
+from cdr_cleaner import run_ledger as rl
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+
+PROJECT = 'test-project'
+DATASET = 'test_dataset'
+SANDBOX = 'test_sandbox'
+
+
+def first_rule(project_id, dataset_id, sandbox_dataset_id):
+    return [{
+        cdr_consts.QUERY: f'DELETE FROM `{dataset_id}.observation` WHERE 1=1'
+    }, {
+        cdr_consts.QUERY: f'DELETE FROM `{dataset_id}.measurement` WHERE 1=1'
+    }]
+
+
+def second_rule(project_id, dataset_id, sandbox_dataset_id):
+    return [{cdr_consts.QUERY: f'DELETE FROM `{dataset_id}.person` WHERE 1=1'}]
+
+
+class RunLedgerTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.ledger_file = os.path.join(self.temp_dir.name, 'ledger.json')
+        self.query_dict = {cdr_consts.QUERY: 'SELECT 1'}
+        self.query_job = MagicMock()
+        self.query_job.job_id = 'job_1'
+        self.query_job.destination = None
+        self.query_job.num_dml_affected_rows = 10
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_get_query_hash(self):
+        same = {cdr_consts.QUERY: 'SELECT 1'}
+        other = {
+            cdr_consts.QUERY: 'SELECT 1',
+            cdr_consts.DESTINATION_TABLE: 'observation'
+        }
+        self.assertEqual(rl.get_query_hash(self.query_dict),
+                         rl.get_query_hash(same))
+        self.assertNotEqual(rl.get_query_hash(self.query_dict),
+                            rl.get_query_hash(other))
+
+    def test_local_ledger(self):
+        ledger = rl.LocalRunLedger(PROJECT, DATASET, self.ledger_file)
+        ledger.reset()
+        ledger.record_query(0, 'rule_a', 0, self.query_dict, self.query_job)
+        ledger.record_rule(0, 'rule_a', [self.query_dict])
+
+        with open(self.ledger_file) as fp:
+            stored = json.load(fp)
+        self.assertEqual(stored['dataset_id'], DATASET)
+        self.assertEqual(len(stored['entries']), 2)
+        self.assertEqual(stored['entries'][0]['job_id'], 'job_1')
+        self.assertEqual(stored['entries'][0]['num_dml_affected_rows'], 10)
+
+        # a new ledger object resumes from the file
+        resumed = rl.LocalRunLedger(PROJECT, DATASET, self.ledger_file)
+        resumed.load()
+        self.assertFalse(
+            resumed.is_rule_complete('rule_a', [{
+                cdr_consts.QUERY: 'SELECT 2'
+            }]))
+        self.assertFalse(resumed.is_rule_complete('rule_b', [self.query_dict]))
+        self.assertTrue(resumed.is_query_complete('rule_a', 0, self.query_dict))
+        self.assertFalse(
+            resumed.is_query_complete('rule_a', 0,
+                                      {cdr_consts.QUERY: 'SELECT 2'}))
+
+        # each entry marks a single occurrence as complete
+        resumed.load()
+        self.assertTrue(resumed.is_rule_complete('rule_a', [self.query_dict]))
+        self.assertFalse(resumed.is_rule_complete('rule_a', [self.query_dict]))
+        self.assertFalse(resumed.is_query_complete('rule_a', 0,
+                                                   self.query_dict))
+
+        resumed.reset()
+        resumed.load()
+        self.assertFalse(resumed.is_rule_complete('rule_a', [self.query_dict]))
+
+    def test_bigquery_ledger_writes_once_per_rule(self):
+        client = MagicMock()
+        client.project = PROJECT
+        ledger = rl.BigQueryRunLedger(client, DATASET, SANDBOX)
+        ledger.record_query(0, 'rule_a', 0, self.query_dict, self.query_job)
+        ledger.record_query(0, 'rule_a', 1, self.query_dict, self.query_job)
+        client.load_table_from_json.assert_not_called()
+
+        ledger.record_rule(0, 'rule_a', [self.query_dict, self.query_dict])
+        client.load_table_from_json.assert_called_once()
+        entries = client.load_table_from_json.call_args.args[0]
+        self.assertEqual([entry['entry_type'] for entry in entries],
+                         [rl.QUERY_ENTRY, rl.QUERY_ENTRY, rl.RULE_ENTRY])
+
+        # flushing writes only the entries recorded since the last write
+        ledger.record_query(1, 'rule_b', 0, self.query_dict, self.query_job)
+        ledger.flush()
+        ledger.flush()
+        self.assertEqual(client.load_table_from_json.call_count, 2)
+        self.assertEqual(len(client.load_table_from_json.call_args.args[0]), 1)
+
+    def test_local_ledger_other_dataset(self):
+        ledger = rl.LocalRunLedger(PROJECT, DATASET, self.ledger_file)
+        ledger.reset()
+        other = rl.LocalRunLedger(PROJECT, 'other_dataset', self.ledger_file)
+        self.assertRaises(RuntimeError, other.load)
+
+    def test_get_run_ledger(self):
+        client = MagicMock()
+        client.project = PROJECT
+        self.assertIsNone(rl.get_run_ledger(client, DATASET, SANDBOX))
+        self.assertIsInstance(
+            rl.get_run_ledger(client, DATASET, SANDBOX, self.ledger_file, True),
+            rl.LocalRunLedger)
+        ledger = rl.get_run_ledger(client, DATASET, SANDBOX, ledger_table=True)
+        self.assertIsInstance(ledger, rl.BigQueryRunLedger)
+        self.assertEqual(ledger.fq_table_id,
+                         f'{PROJECT}.{SANDBOX}.{rl.LEDGER_TABLE}')
+
+    @patch('cdr_cleaner.clean_cdr_engine.run_query')
+    @patch('cdr_cleaner.clean_cdr_engine.BigQueryClient')
+    def test_clean_dataset_resume(self, mock_client, mock_run_query):
+        mock_client.return_value.project = PROJECT
+        rules = [(first_rule,), (second_rule,)]
+
+        def run_query(client, query_dict, rule_info, query_no, query_count):
+            if 'measurement' in query_dict[cdr_consts.QUERY]:
+                raise RuntimeError('query failed')
+            return self.query_job
+
+        mock_run_query.side_effect = run_query
+        with self.assertRaises(RuntimeError):
+            ce.clean_dataset(PROJECT,
+                             DATASET,
+                             SANDBOX,
+                             rules,
+                             ledger_file=self.ledger_file)
+        self.assertEqual(mock_run_query.call_count, 2)
+
+        # resuming skips the completed observation query
+        mock_run_query.reset_mock()
+        mock_run_query.side_effect = None
+        mock_run_query.return_value = self.query_job
+        jobs = ce.clean_dataset(PROJECT,
+                                DATASET,
+                                SANDBOX,
+                                rules,
+                                ledger_file=self.ledger_file,
+                                resume=True)
+        self.assertEqual(len(jobs), 2)
+        queries = [
+            call.args[1][cdr_consts.QUERY]
+            for call in mock_run_query.call_args_list
+        ]
+        self.assertEqual(len(queries), 2)
+        self.assertIn('measurement', queries[0])
+        self.assertIn('person', queries[1])
+
+        # both rules are now complete and are skipped entirely
+        mock_run_query.reset_mock()
+        jobs = ce.clean_dataset(PROJECT,
+                                DATASET,
+                                SANDBOX,
+                                rules,
+                                max_concurrency=2,
+                                ledger_file=self.ledger_file,
+                                resume=True)
+        self.assertEqual(jobs, [])
+        mock_run_query.assert_not_called()
+
+    @patch('cdr_cleaner.clean_cdr_engine.run_query')
+    @patch('cdr_cleaner.clean_cdr_engine.BigQueryClient')
+    def test_resume_matches_rules_by_name(self, mock_client, mock_run_query):
+        mock_client.return_value.project = PROJECT
+        mock_run_query.return_value = self.query_job
+        ce.clean_dataset(PROJECT,
+                         DATASET,
+                         SANDBOX, [(first_rule,)],
+                         ledger_file=self.ledger_file)
+
+        # a rule added ahead of a completed one does not shift its entries
+        mock_run_query.reset_mock()
+        jobs = ce.clean_dataset(PROJECT,
+                                DATASET,
+                                SANDBOX, [(second_rule,), (first_rule,)],
+                                ledger_file=self.ledger_file,
+                                resume=True)
+        self.assertEqual(len(jobs), 1)
+        self.assertIn('person',
+                      mock_run_query.call_args.args[1][cdr_consts.QUERY])
+
+    @patch('cdr_cleaner.clean_cdr_engine.BigQueryClient')
+    def test_resume_requires_ledger(self, mock_client):
+        self.assertRaises(ValueError,
+                          ce.clean_dataset,
+                          PROJECT,
+                          DATASET,
+                          SANDBOX, [(first_rule,)],
+                          resume=True)
@@ -227,8 +227,9 @@ class BQCTest(TestCase):
 
     @patch.object(BigQueryClient, 'copy_table')
     @patch('gcloud.bq.Client.list_tables')
+    @patch('gcloud.bq.Client.get_job')
     @patch('gcloud.bq.Client.list_jobs')
-    def test_copy_dataset(self, mock_list_jobs, mock_list_tables,
+    def test_copy_dataset(self, mock_list_jobs, mock_get_job, mock_list_tables,
                           mock_copy_table):
         jobs = []
         fake_job_ids = []
@@ -239,7 +240,9 @@ class BQCTest(TestCase):
             fake_job.job_id = fake_job_id
             jobs.append(fake_job)
         mock_copy_table.side_effect = jobs
-        mock_list_jobs.return_value = jobs
+        # no job is pending or running
+        mock_list_jobs.return_value = []
+        mock_get_job.return_value.state = 'DONE'
         mock_job_config = MagicMock()
         mock_job_config.labels = {'foo_key': 'bar_value'}
 
@@ -269,23 +272,49 @@ class BQCTest(TestCase):
         ]
         mock_copy_table.assert_has_calls(expected_calls)
 
+    @patch('gcloud.bq.sleep')
+    @patch('gcloud.bq.Client.get_job')
     @patch('gcloud.bq.Client.list_jobs')
-    def test_wait_on_jobs(self, mock_list_jobs):
-        jobs = []
-        fake_job_ids = []
-        for i in range(1, 4):
-            fake_job = MagicMock()
-            fake_job_id = f'fake_job_{i}'
-            fake_job_ids.append(fake_job_id)
-            fake_job.job_id = fake_job_id
-            jobs.append(fake_job)
-        mock_list_jobs.return_value = jobs
+    def test_wait_on_jobs(self, mock_list_jobs, mock_get_job, mock_sleep):
+        fake_job_ids = [f'fake_job_{i}' for i in range(1, 4)]
+        running_job = MagicMock()
+        running_job.job_id = 'fake_job_3'
+        # fake_job_3 is running during the first poll
+        mock_list_jobs.side_effect = [[], [running_job], [], []]
+        mock_get_job.return_value.state = 'DONE'
+        done = []
+
+        incomplete = self.client.wait_on_jobs(fake_job_ids, on_done=done.append)
+
+        self.assertEqual(incomplete, [])
+        self.assertEqual(done, fake_job_ids)
+        mock_list_jobs.assert_has_calls([
+            call(state_filter='pending', retry=ANY),
+            call(state_filter='running', retry=ANY)
+        ])
+        self.assertEqual(mock_list_jobs.call_count, 4)
+        # each job is confirmed once
+        self.assertEqual(mock_get_job.call_count, 3)
+        mock_sleep.assert_called_once()
+
+    @patch('gcloud.bq.monotonic')
+    @patch('gcloud.bq.sleep')
+    @patch('gcloud.bq.Client.get_job')
+    @patch('gcloud.bq.Client.list_jobs')
+    def test_wait_on_jobs_incomplete(self, mock_list_jobs, mock_get_job,
+                                     mock_sleep, mock_monotonic):
+        mock_monotonic.side_effect = lambda: sum(
+            args[0] for args, _ in mock_sleep.call_args_list)
+        # a job not listed yet is not reported done
+        mock_list_jobs.return_value = []
+        mock_get_job.return_value.state = 'PENDING'
+
+        incomplete = self.client.wait_on_jobs(['fake_job_1'], backoff_limit=4)
 
-        self.client.wait_on_jobs(fake_job_ids)
-        mock_list_jobs.assert_called_once_with(max_results=9,
-                                               state_filter='DONE',
-                                               retry=ANY)
-        self.assertEqual(mock_list_jobs.call_count, 1)
+        self.assertEqual(incomplete, ['fake_job_1'])
+        self.assertEqual(sum(args[0] for args, _ in mock_sleep.call_args_list),
+                         7)
+        self.assertEqual(self.client.wait_on_jobs([]), [])
 
     @patch.object(BigQueryClient, 'get_dataset')
     @patch.object(BigQueryClient, 'get_table_count')
@@ -423,6 +452,27 @@ class BQCTest(TestCase):
         mock_environ_get.assert_called_once()
         mock_get_table.assert_called_with(table_name)
 
+    @patch.object(BigQueryClient, 'query')
+    def test_get_dataset_schema(self, mock_query):
+        mock_query.return_value.result.return_value = [{
+            'table_name': 'person',
+            'column_name': 'person_id',
+            'table_type': 'BASE TABLE'
+        }]
+
+        dataset_schema = self.client.get_dataset_schema(self.dataset_id)
+
+        mock_query.assert_called_once()
+        query = mock_query.call_args.args[0]
+        self.assertIn(
+            f'`{self.client.project}.{self.dataset_id}.INFORMATION_SCHEMA.COLUMNS`',
+            query)
+        self.assertIn(
+            f'`{self.client.project}.{self.dataset_id}.INFORMATION_SCHEMA.TABLES`',
+            query)
+        self.assertEqual(dataset_schema.dataset_id, self.dataset_id)
+        self.assertEqual(dataset_schema.table_ids, ['person'])
+
     @patch.object(BigQueryClient, 'wait_on_jobs')
     @patch.object(BigQueryClient, 'query')
     @patch.object(BigQueryClient, 'update_dataset')
@@ -0,0 +1,51 @@
+# Python imports
+from unittest import TestCase
+
+# Project imports
+from gcloud.bq.dataset_schema import DatasetSchema
+
+
+class DatasetSchemaTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        rows = [('person', 'person_id', 'BASE TABLE'),
+                ('person', 'gender_concept_id', 'BASE TABLE'),
+                ('observation', 'observation_id', 'BASE TABLE'),
+                ('observation', 'person_id', 'BASE TABLE'),
+                ('person_view', 'person_id', 'VIEW')]
+        self.dataset_schema = DatasetSchema('fake_dataset', [{
+            'table_name': table_name,
+            'column_name': column_name,
+            'table_type': table_type
+        } for table_name, column_name, table_type in rows])
+
+    def test_dataset_schema(self):
+        self.assertEqual(self.dataset_schema.table_ids,
+                         ['person', 'observation', 'person_view'])
+        self.assertTrue(self.dataset_schema.has_table('observation'))
+        self.assertFalse(self.dataset_schema.has_table('measurement'))
+        self.assertEqual(self.dataset_schema.get_column_names('person'),
+                         ['person_id', 'gender_concept_id'])
+        self.assertEqual(self.dataset_schema.get_column_names('measurement'),
+                         [])
+        self.assertTrue(
+            self.dataset_schema.has_column('observation', 'person_id'))
+        self.assertFalse(
+            self.dataset_schema.has_column('observation', 'gender_concept_id'))
+        self.assertEqual(self.dataset_schema.get_table_type('person_view'),
+                         'VIEW')
+        self.assertIsNone(self.dataset_schema.get_table_type('measurement'))
+
+    def test_to_dataframe(self):
+        table_df = self.dataset_schema.to_dataframe()
+        self.assertEqual(list(table_df.columns),
+                         ['table_name', 'column_name', 'table_type'])
+        self.assertEqual(
+            table_df[table_df['column_name'] == 'person_id']
+            ['table_name'].to_list(), ['person', 'observation', 'person_view'])
@@ -0,0 +1,83 @@
+# Python imports
+from unittest import TestCase
+
+# Third party imports
+from mock import MagicMock
+
+# Project imports
+from gcloud.bq.job_waiter import JobWaiter, get_timeout_for_retries
+
+
+class FakeClock:
+    """
+    A clock that only advances when sleeping
+    """
+
+    def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class JobWaiterTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_wait(self):
+        get_done_job_ids = MagicMock(
+            side_effect=[set(),
+                         set(), {'job_2'},
+                         set(), {'job_1', 'job_3'}])
+        waiter = JobWaiter(get_done_job_ids,
+                           min_interval=1,
+                           max_interval=3,
+                           backoff=2,
+                           sleep=self.clock.sleep,
+                           clock=self.clock)
+        done = []
+
+        incomplete = waiter.wait(['job_1', 'job_2', 'job_3', 'job_1'],
+                                 on_done=done.append)
+
+        self.assertEqual(incomplete, [])
+        self.assertEqual(done, ['job_2', 'job_1', 'job_3'])
+        get_done_job_ids.assert_called_with(['job_1', 'job_3'])
+        # the interval grows while nothing finishes and resets when jobs do
+        self.assertEqual(self.clock.sleeps, [1, 2, 1, 2])
+
+    def test_wait_timeout(self):
+        waiter = JobWaiter(lambda job_ids: set(),
+                           min_interval=1,
+                           max_interval=4,
+                           backoff=2,
+                           sleep=self.clock.sleep,
+                           clock=self.clock)
+
+        self.assertEqual(waiter.wait(['job_1'], timeout=10), ['job_1'])
+        self.assertEqual(self.clock.sleeps, [1, 2, 4, 3])
+
+    def test_invalid_intervals(self):
+        self.assertRaises(ValueError, JobWaiter, set, min_interval=0)
+        self.assertRaises(ValueError,
+                          JobWaiter,
+                          set,
+                          min_interval=2,
+                          max_interval=1)
+        self.assertRaises(ValueError, JobWaiter, set, backoff=0.5)
+
+    def test_get_timeout_for_retries(self):
+        self.assertEqual(get_timeout_for_retries(4, 500), 15)
+        self.assertEqual(get_timeout_for_retries(4, 2), 1 + 2 + 2 + 2)
@@ -5,9 +5,10 @@ from typing import Callable
 
 # Third party imports
 from google.cloud.exceptions import NotFound
+from pandas import DataFrame
 
 # Project imports
-from gcloud.gcs import StorageClient
+from gcloud.gcs import StorageClient, HpoBucketRegistry, HPO_BUCKET_REGISTRY
 from validation.app_errors import BucketNotSet, BucketDoesNotExistError
 
 
@@ -18,7 +19,7 @@ class DummyClient(StorageClient):
 
     # pylint: disable=super-init-not-called
     def __init__(self):
-        pass
+        self.project = 'fake_project'
 
 
 class GCSTest(TestCase):
@@ -35,6 +36,7 @@ class GCSTest(TestCase):
         self.prefix: str = 'foo_prefix/'
         self.file_name: str = 'foo_file.csv'
         self.hpo_id = 'fake_hpo_id'
+        HPO_BUCKET_REGISTRY.clear()
 
     @patch('gcloud.gcs.StorageClient._get_hpo_bucket_id')
     def test_get_hpo_bucket_not_set(self, mock_get_hpo_bucket_id):
@@ -58,19 +60,80 @@ class GCSTest(TestCase):
             self.client.get_hpo_bucket(self.hpo_id)
         self.assertEqual(e.exception.message, expected_message('None'))
 
-    @patch.object(DummyClient, 'get_bucket_items_metadata')
+    @patch.object(DummyClient, 'list_blobs')
     @patch.object(DummyClient, '_get_hpo_bucket_id')
     def test_get_hpo_bucket_not_found(self, mock_get_bucket_id,
-                                      mock_get_items_metadata):
+                                      mock_list_blobs):
         fake_bucket_name = 'FAKE_BUCKET_NAME'
         mock_get_bucket_id.return_value = fake_bucket_name
         expected_message = f"Failed to acquire bucket '{fake_bucket_name}' for hpo '{self.hpo_id}'"
-        mock_get_items_metadata.side_effect = NotFound('')
+        mock_list_blobs.side_effect = NotFound('')
 
         with self.assertRaises(BucketDoesNotExistError) as e:
             self.client.get_hpo_bucket(self.hpo_id)
         self.assertEqual(e.exception.message, expected_message)
 
+    @patch.object(DummyClient, 'list_blobs')
+    @patch.object(DummyClient, '_get_hpo_bucket_id')
+    def test_get_hpo_bucket(self, mock_get_bucket_id, mock_list_blobs):
+        mock_get_bucket_id.return_value = self.bucket
+        mock_list_blobs.return_value = iter([MagicMock(), MagicMock()])
+
+        bucket = self.client.get_hpo_bucket(self.hpo_id)
+
+        self.assertEqual(bucket.name, self.bucket)
+        # access is checked with a single-item listing
+        mock_list_blobs.assert_called_once_with(bucket, max_results=1)
+
+    @patch('gcloud.gcs.query')
+    def test_get_hpo_bucket_id(self, mock_query):
+        mock_query.return_value = DataFrame({
+            'hpo_id': [self.hpo_id, 'other_hpo', 'other_hpo', 'unset_hpo'],
+            'bucket_name': [self.bucket, 'bucket_1', 'bucket_2', None]
+        })
+
+        self.assertEqual(self.client._get_hpo_bucket_id(self.hpo_id.upper()),
+                         self.bucket)
+        # multiple, unset and missing records
+        self.assertEqual(self.client._get_hpo_bucket_id('other_hpo'), 'None')
+        self.assertEqual(self.client._get_hpo_bucket_id('unset_hpo'), 'None')
+        self.assertEqual(self.client._get_hpo_bucket_id('missing_hpo'), 'None')
+        # the lookup table is read once for all sites
+        mock_query.assert_called_once()
+        self.assertIn('`fake_project.lookup_tables.hpo_id_bucket_name`',
+                      mock_query.call_args[0][0])
+
+    @patch('gcloud.gcs.query')
+    def test_hpo_bucket_registry_ttl(self, mock_query):
+        mock_query.side_effect = [
+            DataFrame({
+                'hpo_id': [self.hpo_id],
+                'bucket_name': [self.bucket]
+            }),
+            DataFrame({
+                'hpo_id': [self.hpo_id],
+                'bucket_name': ['new_bucket']
+            })
+        ]
+        now = [0]
+        registry = HpoBucketRegistry(ttl=60, clock=lambda: now[0])
+
+        self.assertEqual(
+            registry.get_bucket_names('p', 'd', 's')[self.hpo_id],
+            [self.bucket])
+        now[0] = 59
+        self.assertEqual(
+            registry.get_bucket_names('p', 'd', 's')[self.hpo_id],
+            [self.bucket])
+        self.assertEqual(mock_query.call_count, 1)
+
+        # the table is read again once the cached copy expires
+        now[0] = 60
+        self.assertEqual(
+            registry.get_bucket_names('p', 'd', 's')[self.hpo_id],
+            ['new_bucket'])
+        self.assertEqual(mock_query.call_count, 2)
+
     @patch('google.cloud.storage.bucket.Bucket')
     @patch.object(DummyClient, 'list_blobs')
     def test_get_bucket_items_metadata(self, mock_list_blobs, mock_bucket):
@@ -90,12 +90,20 @@ class ResourcesTest(unittest.TestCase):
         searched and the file is found, this file is opened and read.
         """
         # preconditions
+        # the schema files were already found on import
+        resources.clear_schema_registry()
+        self.addCleanup(resources.clear_schema_registry)
         sub_dir = 'baz'
         # mocks result tuples for os.walk
-        walk_results = [(os.path.join('resource_files', 'schemas'), [sub_dir],
+        # the registry walks the whole schemas directory
+        walk_results = [(resources.fields_path, [sub_dir, 'other'],
                          ['duplicate.json', 'unique1.json']),
-                        (os.path.join('resource_files', 'schemas', sub_dir), [],
-                         ['duplicate.json', 'unique2.json'])]
+                        (os.path.join(resources.fields_path, sub_dir), [],
+                         ['duplicate.json', 'unique2.json']),
+                        (os.path.join(resources.fields_path,
+                                      'other'), [sub_dir], []),
+                        (os.path.join(resources.fields_path, 'other',
+                                      sub_dir), [], ['shadow.json'])]
 
         mock_walk.return_value = walk_results
 
@@ -111,6 +119,35 @@ class ResourcesTest(unittest.TestCase):
                 actual_fields = resources.fields_for('duplicate', sub_dir)
                 self.assertEqual(actual_fields, json_data)
 
+        # a directory of the same name elsewhere is not searched
+        self.assertRaises(RuntimeError, resources.fields_for, 'shadow', sub_dir)
+        self.assertEqual(
+            resources.SCHEMA_REGISTRY.get_path('shadow', f'other/{sub_dir}'),
+            os.path.join(resources.fields_path, 'other', sub_dir,
+                         'shadow.json'))
+
+    def test_schema_registry(self):
+        resources.clear_schema_registry()
+        with mock.patch('resources.os.walk', wraps=os.walk) as mock_walk:
+            fields = resources.fields_for('person')
+            self.assertEqual(resources.get_field_names('person'),
+                             tuple(field['name'] for field in fields))
+            self.assertIn('gender_concept_id',
+                          resources.get_concept_id_fields('person'))
+            self.assertEqual(resources.has_domain_table_id('person'),
+                             'person_id')
+            # the schemas directory is walked once
+            mock_walk.assert_called_once_with(resources.fields_path)
+
+            # callers get a copy of the fields they may modify
+            fields[0]['name'] = 'changed'
+            self.assertNotEqual(
+                resources.fields_for('person')[0]['name'], 'changed')
+
+            resources.clear_schema_registry()
+            resources.fields_for('person')
+            self.assertEqual(mock_walk.call_count, 2)
+
     def test_cdm_tables(self):
         expected = [
             'observation_period',
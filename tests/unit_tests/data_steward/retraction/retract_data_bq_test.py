@@ -0,0 +1,289 @@
+# Python imports
+import threading
+import unittest
+from collections import OrderedDict
+
+# Third party imports
+import mock
+
+# Project imports
+from gcloud.bq.dataset_schema import DatasetSchema
+from retraction import retract_data_bq as rdb
+
+
+class RetractDataBqTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.project_id = 'project_id'
+        self.sandbox_id = 'sandbox_dataset'
+        self.lookup_table_id = 'pid_table'
+        self.executed = []
+        self.lock = threading.Lock()
+        self.client = mock.MagicMock()
+        self.client.query.side_effect = self.query
+
+    def query(self, q):
+        if 'fail' in q:
+            raise RuntimeError(f'{q} failed')
+        with self.lock:
+            self.executed.append(q)
+        job = mock.MagicMock()
+        job.job_id = q
+        job.num_dml_affected_rows = 2 if q.startswith('delete') else None
+        return job
+
+    def get_query_groups(self, dataset_id):
+        if dataset_id == 'broken_dataset':
+            raise ValueError('unable to list tables')
+        return OrderedDict((
+            table,
+            [f'sandbox {dataset_id}.{table}', f'{action} {dataset_id}.{table}'])
+                           for table, action in [(
+                               'person',
+                               'delete'), ('observation', 'delete_fail')])
+
+    def test_run_retraction_queries(self):
+        results = rdb.run_retraction_queries(
+            self.client,
+            self.get_query_groups, ['dataset_1', 'broken_dataset', 'dataset_2'],
+            max_workers=4)
+
+        self.assertEqual([(result['dataset_id'], result['table_id'],
+                           result['num_dml_affected_rows'])
+                          for result in results],
+                         [('broken_dataset', None, None),
+                          ('dataset_1', 'observation', None),
+                          ('dataset_1', 'person', 2),
+                          ('dataset_2', 'observation', None),
+                          ('dataset_2', 'person', 2)])
+        self.assertIn('unable to list tables', results[0]['error'])
+        self.assertIn('failed', results[1]['error'])
+        self.assertIsNone(results[2]['error'])
+
+        # the sandbox query of a table runs before its delete query
+        for dataset_id in ['dataset_1', 'dataset_2']:
+            self.assertLess(self.executed.index(f'sandbox {dataset_id}.person'),
+                            self.executed.index(f'delete {dataset_id}.person'))
+            self.assertIn(f'sandbox {dataset_id}.observation', self.executed)
+
+    @mock.patch('retraction.retract_data_bq.get_retraction_query_groups')
+    @mock.patch('retraction.retract_data_bq.is_ehr_dataset')
+    @mock.patch('retraction.retract_data_bq.skip_dataset_retraction')
+    @mock.patch('retraction.retract_data_bq.get_datasets_list')
+    def test_run_bq_retraction(self, mock_get_datasets_list, mock_skip_dataset,
+                               mock_is_ehr, mock_get_query_groups):
+        mock_get_datasets_list.return_value = [
+            'ehr_dataset', 'rdr_dataset', 'combined_dataset'
+        ]
+        mock_skip_dataset.side_effect = lambda dataset, _: dataset == 'rdr_dataset'
+        mock_is_ehr.side_effect = lambda dataset: dataset == 'ehr_dataset'
+        mock_get_query_groups.side_effect = lambda client, dataset, *args, **kwargs: OrderedDict(
+            [('person', [f'delete {dataset}.person'])])
+
+        results = rdb.run_bq_retraction(self.project_id, self.sandbox_id,
+                                        self.lookup_table_id, 'fake',
+                                        ['all_datasets'],
+                                        rdb.RETRACTION_RDR_EHR, True,
+                                        self.client)
+
+        self.assertEqual(
+            [(result['dataset_id'], result['num_dml_affected_rows'])
+             for result in results], [('combined_dataset', 2),
+                                      ('ehr_dataset', 2)])
+        hpo_ids = {
+            call.args[1]: call.kwargs['hpo_id']
+            for call in mock_get_query_groups.call_args_list
+        }
+        # the hpo_id is only passed for EHR datasets
+        self.assertEqual(hpo_ids, {
+            'ehr_dataset': 'fake',
+            'combined_dataset': ''
+        })
+
+        # a failed table is raised once the other datasets are retracted
+        mock_get_query_groups.side_effect = lambda client, dataset, *args, **kwargs: OrderedDict(
+            [('person', [f'delete {dataset}.person'])])
+        mock_get_datasets_list.return_value = [
+            'fail_dataset', 'combined_dataset'
+        ]
+        self.executed.clear()
+        with self.assertRaises(RuntimeError):
+            rdb.run_bq_retraction(self.project_id, self.sandbox_id,
+                                  self.lookup_table_id, 'fake',
+                                  ['all_datasets'], rdb.RETRACTION_RDR_EHR,
+                                  True, self.client)
+        self.assertEqual(self.executed, ['delete combined_dataset.person'])
+
+    @mock.patch(
+        'retraction.retract_data_bq.get_retraction_queries_fact_relationship')
+    @mock.patch('retraction.retract_data_bq.get_primary_key_for_sandbox_table')
+    @mock.patch('retraction.retract_data_bq.get_tables_to_retract')
+    def test_get_retraction_query_groups(self, mock_get_tables,
+                                         mock_get_primary_key,
+                                         mock_get_fact_relationship_queries):
+        mock_get_tables.return_value = ['person', 'observation']
+        mock_get_primary_key.return_value = ''
+        mock_get_fact_relationship_queries.return_value = ['sandbox', 'delete']
+        self.client.project = self.project_id
+
+        query_groups = rdb.get_retraction_query_groups(
+            self.client, 'combined_dataset', self.sandbox_id,
+            self.lookup_table_id, False, rdb.RETRACTION_RDR_EHR)
+
+        self.assertEqual(list(query_groups),
+                         ['person', 'observation', 'fact_relationship'])
+        sandbox_query, delete_query = query_groups['observation']
+        self.assertIn(
+            f'CREATE TABLE `{self.project_id}.{self.sandbox_id}.'
+            f'retract_combined_dataset_observation`', sandbox_query)
+        self.assertIn('DELETE', delete_query)
+        self.assertEqual(
+            rdb.get_retraction_queries(self.client, 'combined_dataset',
+                                       self.sandbox_id, self.lookup_table_id,
+                                       False, rdb.RETRACTION_RDR_EHR),
+            [query for queries in query_groups.values() for query in queries])
+
+    @mock.patch('retraction.retract_data_bq.is_combined_dataset')
+    @mock.patch('retraction.retract_data_bq.is_sandbox_dataset')
+    @mock.patch('retraction.retract_data_bq.is_unioned_dataset')
+    @mock.patch('retraction.retract_data_bq.is_ehr_dataset')
+    def test_get_tables_to_retract(self, mock_is_ehr, mock_is_unioned,
+                                   mock_is_sandbox, mock_is_combined):
+        for mock_ in [mock_is_ehr, mock_is_unioned, mock_is_sandbox]:
+            mock_.return_value = False
+        mock_is_combined.return_value = True
+        rows = [('person', 'person_id', 'BASE TABLE'),
+                ('observation', 'person_id', 'BASE TABLE'),
+                ('_mapping_observation', 'observation_id', 'BASE TABLE'),
+                ('measurement', 'person_id', 'BASE TABLE'),
+                ('person_view', 'person_id', 'VIEW'),
+                ('concept', 'concept_id', 'BASE TABLE')]
+        dataset_schema = DatasetSchema('combined_dataset', [{
+            'table_name': table_name,
+            'column_name': column_name,
+            'table_type': table_type
+        } for table_name, column_name, table_type in rows])
+        self.client.get_dataset_schema.return_value = dataset_schema
+
+        self.assertEqual(
+            rdb.get_tables_to_retract(self.client, 'combined_dataset',
+                                      rdb.RETRACTION_RDR_EHR),
+            ['person', 'observation', 'measurement'])
+        # only EHR data is retracted from tables with mapping tables
+        self.assertEqual(
+            rdb.get_tables_to_retract(self.client, 'combined_dataset',
+                                      rdb.RETRACTION_ONLY_EHR), ['observation'])
+
+        # the dataset is queried once, no table is looked up by itself
+        self.assertEqual(self.client.get_dataset_schema.call_count, 2)
+        self.client.get_table.assert_not_called()
+        self.client.table_exists.assert_not_called()
+        self.client.list_tables.assert_not_called()
+
+        # an EHR dataset only checks the tables of the site
+        mock_is_ehr.return_value = True
+        self.assertEqual(
+            rdb.get_tables_to_retract(self.client,
+                                      'ehr_dataset',
+                                      rdb.RETRACTION_RDR_EHR,
+                                      hpo_id='fake',
+                                      dataset_schema=DatasetSchema(
+                                          'ehr_dataset', [{
+                                              'table_name': 'fake_person',
+                                              'column_name': 'person_id',
+                                              'table_type': 'BASE TABLE'
+                                          }])), ['fake_person'])
+        self.assertEqual(self.client.get_dataset_schema.call_count, 2)
+
+    @mock.patch('retraction.retract_data_bq.is_sandbox_dataset')
+    @mock.patch('retraction.retract_data_bq.is_unioned_dataset')
+    @mock.patch('retraction.retract_data_bq.is_ehr_dataset')
+    def test_get_tables_to_retract_key_only_sandbox(self, mock_is_ehr,
+                                                    mock_is_unioned,
+                                                    mock_is_sandbox):
+        mock_is_ehr.return_value = mock_is_unioned.return_value = False
+        mock_is_sandbox.return_value = True
+        # key-only sandbox tables keep the key and person_id of the rows
+        columns = [
+            'observation_id', 'person_id', 'sandboxed_by', 'sandboxed_at',
+            'source_table'
+        ]
+        dataset_schema = DatasetSchema('rt_sandbox', [{
+            'table_name': 'rt_dc1358_observation',
+            'column_name': column_name,
+            'table_type': 'BASE TABLE'
+        } for column_name in columns])
+
+        for retraction_type in [
+                rdb.RETRACTION_RDR_EHR, rdb.RETRACTION_ONLY_EHR
+        ]:
+            self.assertEqual(
+                rdb.get_tables_to_retract(self.client,
+                                          'rt_sandbox',
+                                          retraction_type,
+                                          dataset_schema=dataset_schema),
+                ['rt_dc1358_observation'])
+        self.assertEqual(
+            rdb.get_primary_key_for_sandbox_table(self.client, 'rt_sandbox',
+                                                  'rt_dc1358_observation',
+                                                  dataset_schema),
+            'observation_id')
+
+    def test_get_primary_key_for_key_only_sandbox_table(self):
+        # the key of a key-only sandbox table is read from its columns, not
+        # from the table name
+        key_only_columns = ['sandboxed_by', 'sandboxed_at', 'source_table']
+        tables = {
+            'rt_combined_suppression_a': ['measurement_id', 'person_id'] +
+                                         key_only_columns,
+            'rt_combined_suppression_b': ['person_id'] + key_only_columns,
+            'rt_combined_suppression_c': ['note_id', 'visit_id', 'person_id'] +
+                                         key_only_columns,
+            'rt_plain_observation': ['observation_id', 'person_id']
+        }
+        dataset_schema = DatasetSchema('rt_sandbox', [{
+            'table_name': table,
+            'column_name': column_name,
+            'table_type': 'BASE TABLE'
+        } for table, columns in tables.items() for column_name in columns])
+
+        actual = {
+            table:
+                rdb.get_primary_key_for_sandbox_table(self.client, 'rt_sandbox',
+                                                      table, dataset_schema)
+            for table in tables
+        }
+        self.assertEqual(
+            actual, {
+                'rt_combined_suppression_a': 'measurement_id',
+                'rt_combined_suppression_b': 'person_id',
+                'rt_combined_suppression_c': '',
+                'rt_plain_observation': 'observation_id'
+            })
+
+    def test_retract_query_person_id_key(self):
+        # only key-only sandbox tables keyed by person_id skip the EHR
+        # condition
+        params = dict(project=self.project_id,
+                      sb_dataset=self.sandbox_id,
+                      dataset='rt_sandbox',
+                      table='sandbox_person',
+                      person_id='person_id',
+                      lookup_table_id=self.lookup_table_id,
+                      is_sandbox=True,
+                      domain_id='person_id',
+                      id_const=2000000000000000,
+                      retraction_type='only_ehr')
+        key_only_query = rdb.JINJA_ENV.from_string(rdb.RETRACT_QUERY).render(
+            is_key_only=True, **params)
+        sandbox_query = rdb.JINJA_ENV.from_string(rdb.RETRACT_QUERY).render(
+            is_key_only=False, **params)
+
+        self.assertNotIn('AND person_id >', key_only_query)
+        self.assertIn('AND person_id > 2000000000000000', sandbox_query)
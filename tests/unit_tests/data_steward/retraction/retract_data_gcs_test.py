@@ -0,0 +1,221 @@
+# Python imports
+import io
+import unittest
+
+# Third party imports
+import mock
+
+# Project imports
+from retraction import retract_data_gcs as rd
+
+PIDS = frozenset([1, 2])
+PERSON_CSV = (b'person_id,gender_concept_id\n'
+              b'1,8532\n'
+              b'3,8507\n'
+              b'\n'
+              b'"2",8532\n'
+              b'x,0\n')
+OBSERVATION_CSV = (b'observation_id,person_id,value_as_string\n'
+                   b'10,1,"a, b"\n'
+                   b'11,3,"line one\r\nline two"\n'
+                   b'12,2,"c"\n'
+                   b'13\n')
+NOTE_JSONL = (b'{"note_id": 1, "person_id": 1, "note_text": "a"}\n'
+              b'{"note_id": 2, "person_id": 3, "note_text": "\xc3\xa9"}\n'
+              b'\n'
+              b'not json\n'
+              b'{"note_id": 3, "person_id": "2"}')
+
+
+class UploadStream(io.BytesIO):
+    """
+    Keeps the uploaded bytes after the stream is closed
+    """
+
+    def __init__(self, uploads, name):
+        super().__init__()
+        self.uploads = uploads
+        self.name = name
+
+    def close(self):
+        self.uploads[self.name] = self.getvalue()
+        super().close()
+
+
+class RetractDataGcsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.folder_prefix = 'hpo_id/site_bucket/2020-01-01/'
+        self.files = {
+            f'{self.folder_prefix}person.csv':
+                PERSON_CSV,
+            f'{self.folder_prefix}observation.csv':
+                OBSERVATION_CSV,
+            f'{self.folder_prefix}note.jsonl':
+                NOTE_JSONL,
+            f'{self.folder_prefix}measurement.csv':
+                b'measurement_id,person_id\n'
+        }
+        self.uploads = {}
+        self.temp_uploads = {}
+        self.deleted = []
+        self.bucket = mock.MagicMock()
+        self.bucket.name = 'drc_bucket'
+        self.bucket.get_blob.side_effect = self.get_blob
+        self.bucket.blob.side_effect = self.get_blob
+
+    def get_blob(self, name, generation=None):
+        if name.endswith('fail.csv'):
+            raise RuntimeError(f'{name} failed')
+        blob = mock.MagicMock()
+        blob.name = name
+        blob.generation = 5
+        blob.content_type = None
+
+        def open_blob(mode, **kwargs):
+            if mode == 'rb':
+                return self.open_reader(name)
+            self.assertTrue(name.endswith(rd.TEMP_SUFFIX))
+            self.assertEqual(kwargs['if_generation_match'], 0)
+            self.assertEqual(kwargs['content_type'], 'text/csv')
+            return UploadStream(self.temp_uploads, name)
+
+        def rewrite(source, token=None, if_generation_match=None):
+            self.assertEqual(if_generation_match, 5)
+            self.uploads[name] = self.temp_uploads[source.name]
+            return None, 0, 0
+
+        def delete():
+            self.deleted.append(name)
+
+        blob.open.side_effect = open_blob
+        blob.rewrite.side_effect = rewrite
+        blob.delete.side_effect = delete
+        return blob
+
+    def open_reader(self, name):
+        return io.BytesIO(self.files[name])
+
+    def filter_file(self, file_name, content):
+        output = io.BytesIO()
+        lines_removed = rd.filter_file(PIDS, file_name, io.BytesIO(content),
+                                       output)
+        return lines_removed, output.getvalue()
+
+    def test_filter_file(self):
+        self.assertEqual(self.filter_file('person.csv', PERSON_CSV),
+                         (2, b'person_id,gender_concept_id\n3,8507\n\nx,0\n'))
+        # quoted commas and line breaks are kept as they are
+        self.assertEqual(self.filter_file('OBSERVATION.CSV', OBSERVATION_CSV),
+                         (2, b'observation_id,person_id,value_as_string\n'
+                          b'11,3,"line one\r\nline two"\n'
+                          b'13\n'))
+        self.assertEqual(
+            self.filter_file('note.jsonl', NOTE_JSONL),
+            (2, b'{"note_id": 2, "person_id": 3, "note_text": "\xc3\xa9"}\n'
+             b'\n'
+             b'not json\n'))
+
+        # blank lines and line endings are written back byte for byte
+        self.assertEqual(
+            self.filter_file(
+                'person.csv',
+                b'person_id,a\r\n1,x\r\n\r\n2,"y\nz"\r\n3,w\r\n\r\n'),
+            (2, b'person_id,a\r\n\r\n3,w\r\n\r\n'))
+        self.assertEqual(
+            self.filter_file(
+                'note.jsonl', b'{"person_id": 3}\r\n\r\n{"person_id": 1}\n'
+                b'\n{"person_id": 4}'),
+            (1, b'{"person_id": 3}\r\n\r\n\n{"person_id": 4}'))
+
+        # only counts if there is no output stream
+        self.assertEqual(
+            rd.filter_file(PIDS, 'person.csv', io.BytesIO(PERSON_CSV)), 2)
+        with self.assertRaises(ValueError):
+            rd.filter_file(PIDS, 'person.json', io.BytesIO(b'{}'))
+
+    def test_get_pid_column(self):
+        self.assertEqual(
+            rd.get_pid_column('observation', ['observation_id', '"PERSON_ID"']),
+            1)
+        self.assertEqual(rd.get_pid_column('person', ['a', 'b']), 0)
+        self.assertEqual(rd.get_pid_column('observation', ['a', 'b']), 1)
+
+    def test_retract(self):
+        summary = rd.retract(
+            ['1', 2], self.bucket,
+            ['person.csv', 'observation.csv', 'note.jsonl', 'measurement.csv'],
+            self.folder_prefix, True)
+
+        self.assertEqual(list(summary.values()), [2, 2, 2, 0])
+        # files without pids to retract are not uploaded
+        self.assertEqual(sorted(self.uploads), [
+            f'{self.folder_prefix}note.jsonl',
+            f'{self.folder_prefix}observation.csv',
+            f'{self.folder_prefix}person.csv'
+        ])
+        self.assertEqual(self.uploads[f'{self.folder_prefix}person.csv'],
+                         b'person_id,gender_concept_id\n3,8507\n\nx,0\n')
+        # the temporary objects are removed
+        self.assertEqual(sorted(self.deleted), sorted(self.temp_uploads))
+
+    def test_retract_blob_read_error(self):
+        blob_name = f'{self.folder_prefix}person.csv'
+        opened = []
+
+        class FailingReader(io.BytesIO):
+            """
+            Fails partway through the file on the second read of the file
+            """
+
+            def read1(self, size=-1):
+                if len(opened) > 1 and self.tell() > 0:
+                    raise IOError('connection reset')
+                return super().read1(8)
+
+        def open_reader(name):
+            opened.append(name)
+            return FailingReader(self.files[name])
+
+        self.open_reader = open_reader
+        with self.assertRaises(IOError):
+            rd.retract_blob(PIDS, self.bucket, blob_name)
+
+        # the upload went to a temporary object only, which is removed
+        self.assertEqual(self.uploads, {})
+        self.assertEqual(len(self.temp_uploads), 1)
+        self.assertEqual(self.deleted, list(self.temp_uploads))
+
+    def test_retract_dry_run(self):
+        summary = rd.retract(PIDS,
+                             self.bucket, ['person.csv', 'note.jsonl'],
+                             self.folder_prefix,
+                             True,
+                             dry_run=True)
+
+        self.assertEqual(
+            dict(summary), {
+                f'{self.folder_prefix}person.csv': 2,
+                f'{self.folder_prefix}note.jsonl': 2
+            })
+        self.assertEqual(self.uploads, {})
+
+    @mock.patch('retraction.retract_data_gcs.get_response')
+    def test_retract_failure(self, mock_get_response):
+        mock_get_response.side_effect = ['Y', 'n', 'Y']
+
+        # a failing file does not stop the others
+        with self.assertRaises(RuntimeError) as context:
+            rd.retract(PIDS, self.bucket,
+                       ['fail.csv', 'observation.csv', 'person.csv'],
+                       self.folder_prefix, False)
+
+        self.assertIn('fail.csv', str(context.exception))
+        self.assertEqual(list(self.uploads),
+                         [f'{self.folder_prefix}person.csv'])
@@ -3,6 +3,7 @@ Unit test for run_deid module
 
 test_parse_args -- ensures the output dataset name includes _deid
 test_main -- ensures the parameter list contains the output dataset command line argument
+test_main_table_failure -- ensures a table failing on an API error does not stop the others
 test_known_tables -- ensures all table names known to curation are returned
 test_get_output_table_schemas -- ensures only table schemas for suppressed tables are copied
 
@@ -13,6 +14,7 @@ import os
 import unittest
 
 # Third party imports
+from google.api_core.exceptions import GoogleAPIError
 from mock import patch
 import mock
 from unittest.mock import call
@@ -81,6 +83,7 @@ class RunDeidTest(unittest.TestCase):
 
         # setting correct_parameter_dict values not set in setUp function
         correct_parameter_dict['console_log'] = False
+        correct_parameter_dict['max_workers'] = run_deid.DEID_MAX_WORKERS
         correct_parameter_dict['interactive_mode'] = False
         correct_parameter_dict['input_dataset'] = self.input_dataset
         correct_parameter_dict['run_as_email'] = correct_parameter_dict.pop(
@@ -97,6 +100,7 @@ class RunDeidTest(unittest.TestCase):
         # Post conditions
         self.assertEqual(correct_parameter_dict, results_dict)
 
+    @patch('deid.aou.prepare_run')
     @patch('tools.run_deid.copy_ext_tables')
     @patch('tools.run_deid.BigQueryClient')
     @patch('tools.run_deid.fields_for')
@@ -107,7 +111,7 @@ class RunDeidTest(unittest.TestCase):
     @patch('tools.run_deid.get_output_tables')
     def test_main(self, mock_tables, mock_load, mock_copy, mock_main,
                   mock_suppressed, mock_fields, mock_bq_client,
-                  mock_copy_ext_tables):
+                  mock_copy_ext_tables, mock_prepare_run):
         # Tests if incorrect parameters are given
         self.assertRaises(SystemExit, run_deid.main,
                           self.incorrect_parameter_list)
@@ -115,11 +119,17 @@ class RunDeidTest(unittest.TestCase):
         # Preconditions
         mock_tables.return_value = ['fake1']
         mock_fields.return_value = {}
+        run_args = {'run_initialized': True}
+        mock_prepare_run.return_value = run_args
 
         # Tests if correct parameters are given
         run_deid.main(self.correct_parameter_list)
 
         # Post conditions
+        # the initialization shared by all tables is done once
+        mock_prepare_run.assert_called_once_with(self.run_as_email,
+                                                 self.input_dataset,
+                                                 self.output_dataset, 89)
         mock_main.assert_has_calls([
             call([
                 '--rules',
@@ -128,7 +138,7 @@ class RunDeidTest(unittest.TestCase):
                 '--action', self.action, '--idataset', self.input_dataset,
                 '--log', 'LOGS', '--odataset', self.output_dataset,
                 '--age-limit', self.max_age, '--run_as', self.run_as_email
-            ]),
+            ], **run_args),
             call([
                 '--rules',
                 os.path.join(DEID_PATH, 'config', 'ids', 'config.json'),
@@ -136,11 +146,51 @@ class RunDeidTest(unittest.TestCase):
                 '--action', self.action, '--idataset', self.input_dataset,
                 '--log', 'LOGS', '--odataset', self.output_dataset,
                 '--age-limit', self.max_age, '--run_as', self.run_as_email
-            ])
-        ])
+            ], **run_args)
+        ],
+                                   any_order=True)
         self.assertEqual(mock_main.call_count, 2)
         self.assertEqual(mock_copy_ext_tables.call_count, 1)
 
+    @patch('deid.aou.prepare_run')
+    @patch('tools.run_deid.copy_ext_tables')
+    @patch('tools.run_deid.BigQueryClient')
+    @patch('tools.run_deid.fields_for')
+    @patch('tools.run_deid.copy_suppressed_table_schemas')
+    @patch('deid.aou.main')
+    @patch('tools.run_deid.load_deid_map_table')
+    @patch('tools.run_deid.get_output_tables')
+    def test_main_table_failure(self, mock_tables, mock_load, mock_main,
+                                mock_suppressed, mock_fields, mock_bq_client,
+                                mock_copy_ext_tables, mock_prepare_run):
+        # Preconditions
+        mock_tables.return_value = ['fake1', 'fake2']
+        mock_fields.return_value = {}
+
+        def aou_main(parameter_list, **run_args):
+            if 'fake1' in parameter_list:
+                raise GoogleAPIError('fake1 failed')
+
+        mock_main.side_effect = aou_main
+
+        # Tests
+        with self.assertLogs(run_deid.LOGGER, level='ERROR') as logs:
+            run_deid.main(self.correct_parameter_list)
+
+        # Post conditions
+        self.assertEqual(mock_main.call_count, 3)
+        mock_suppressed.assert_called_once()
+        self.assertIn('processing table: fake1', logs.output[-1])
+        self.assertFalse(
+            any('processing table: fake2' in line for line in logs.output))
+
+        # errors other than API errors are raised
+        mock_main.reset_mock()
+        mock_suppressed.reset_mock()
+        mock_main.side_effect = KeyError('fake1')
+        self.assertRaises(KeyError, run_deid.main, self.correct_parameter_list)
+        mock_suppressed.assert_not_called()
+
     @patch('tools.run_deid.os.walk')
     def test_known_tables(self, mock_walk):
         # preconditions
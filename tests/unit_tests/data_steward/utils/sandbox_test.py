@@ -115,3 +115,62 @@ class SandboxTest(unittest.TestCase):
             contents=',\n'.join([description_string, labels_string]))
 
         self.assertEqual(actual_options, expected_options)
+
+    def test_get_key_only_sandbox_columns(self):
+        actual = sandbox.get_key_only_sandbox_columns(
+            ['observation_id', 'person_id'], 'MyRule',
+            'project.dataset.observation')
+
+        self.assertEqual(
+            actual, "d.observation_id, d.person_id, "
+            "'MyRule' AS sandboxed_by,\n"
+            "CURRENT_TIMESTAMP() AS sandboxed_at,\n"
+            "'project.dataset.observation' AS source_table")
+
+    def test_is_key_only_sandbox_table(self):
+        self.assertTrue(
+            sandbox.is_key_only_sandbox_table([
+                'observation_id', 'person_id', 'sandboxed_by', 'sandboxed_at',
+                'source_table'
+            ]))
+        self.assertFalse(
+            sandbox.is_key_only_sandbox_table(
+                ['observation_id', 'person_id', 'source_table']))
+
+    def test_get_sandboxed_rows_query(self):
+        actual = sandbox.get_sandboxed_rows_query('project', 'dataset',
+                                                  'observation', 'sandbox',
+                                                  'rt_observation',
+                                                  'observation_id')
+
+        self.assertIn('SELECT COALESCE(MIN(sandboxed_at), CURRENT_TIMESTAMP())',
+                      actual)
+        self.assertIn('FOR SYSTEM_TIME AS OF snapshot_time AS d', actual)
+        self.assertIn('WHERE d.observation_id IN', actual)
+        self.assertNotIn('CREATE', actual)
+        # rows sandboxed before the time travel window raise an error
+        self.assertIn(
+            'IF snapshot_time < TIMESTAMP_SUB(CURRENT_TIMESTAMP(), '
+            'INTERVAL 168 HOUR) THEN', actual)
+        self.assertIn('RAISE USING MESSAGE', actual)
+        self.assertIn(
+            'INTERVAL 48 HOUR',
+            sandbox.get_sandboxed_rows_query('project',
+                                             'dataset',
+                                             'observation',
+                                             'sandbox',
+                                             'rt_observation',
+                                             'observation_id',
+                                             time_travel_hours=48))
+
+        actual = sandbox.get_sandboxed_rows_query(
+            'project',
+            'dataset',
+            'observation',
+            'sandbox',
+            'rt_observation',
+            'observation_id',
+            destination_table='rt_observation_rows')
+        self.assertIn(
+            'CREATE OR REPLACE TABLE `project.sandbox.rt_observation_rows` AS',
+            actual)
@@ -1,5 +1,6 @@
 # Python imports
 import unittest
+from unittest import mock
 
 # Third party imports
 
@@ -35,3 +36,98 @@ class AchillesTest(unittest.TestCase):
         for command in commands:
             is_temp = sql_wrangle.is_to_temp_table(command)
             self.assertFalse(is_temp, command)
+
+    def test_analyses_are_independent(self):
+        commands = achilles._get_run_analysis_commands(self.hpo_id)
+        dependencies = sql_wrangle.get_command_dependencies(commands)
+
+        # every analysis only reads cdm tables and appends to results
+        self.assertEqual(dependencies, [set()] * self.achilles_analysis_count)
+
+    def test_get_batched_analysis_commands(self):
+        commands = achilles._get_run_analysis_commands(self.hpo_id)
+        batched = achilles._get_batched_analysis_commands(self.hpo_id)
+
+        # the analyses are independent, so there is one statement per results
+        # table and cdm table
+        self.assertEqual(len(batched), 27)
+        keys = []
+        for command in batched:
+            table_id, columns, query = sql_wrangle.get_insert_parts(command)
+            keys.append(
+                (table_id, achilles._get_source_table(query, self.hpo_id)))
+            self.assertEqual(columns, [
+                column for column in achilles._get_column_types(table_id)
+                if column in columns
+            ])
+        self.assertEqual(len(set(keys)), len(keys))
+
+        # every analysis is part of exactly one statement
+        for command in commands:
+            query = sql_wrangle.get_insert_parts(command)[2]
+            # analyses without another analysis to combine with are kept
+            containing = [
+                index for index, batched_command in enumerate(batched)
+                if batched_command == command or query in batched_command
+            ]
+            self.assertEqual(len(containing), 1)
+
+    @mock.patch('validation.achilles._get_run_analysis_commands')
+    def test_get_batched_analysis_commands_keeps_order(self, mock_commands):
+        table_id = f'{self.hpo_id}_{achilles.ACHILLES_RESULTS}'
+        person = f'{self.hpo_id}_person'
+        insert = (f'insert into {table_id} (analysis_id, count_value) '
+                  f'select {{}}, count(*) from {person}')
+        delete = f'delete from {table_id} where analysis_id = 1'
+        dist_insert = (
+            f'insert into {self.hpo_id}_{achilles.ACHILLES_RESULTS_DIST} '
+            f'(analysis_id, count_value) select 5, count(*) from {person}')
+        mock_commands.return_value = [
+            insert.format(1), dist_insert,
+            insert.format(2), delete,
+            insert.format(3),
+            insert.format(4)
+        ]
+
+        batched = achilles._get_batched_analysis_commands(self.hpo_id)
+
+        # an independent statement in between does not keep analyses apart,
+        # the insert after the delete is not moved ahead of it
+        self.assertEqual(len(batched), 4)
+        self.assertIn('select 1, count(*)', batched[0])
+        self.assertIn('select 2, count(*)', batched[0])
+        self.assertEqual(batched[1:3], [dist_insert, delete])
+        self.assertIn('select 3, count(*)', batched[3])
+        self.assertIn('select 4, count(*)', batched[3])
+
+    def test_get_batch_command(self):
+        table_id = f'{self.hpo_id}_{achilles.ACHILLES_RESULTS}'
+        command = achilles._get_batch_command(
+            table_id, [(['analysis_id', 'count_value'], 'select 1, 2'),
+                       (['stratum_1', 'analysis_id'], 'select "a", 3 -- x')])
+
+        self.assertIn(
+            f'insert into {table_id} (analysis_id, stratum_1, count_value)',
+            command)
+        # analyses are projected onto the columns of the group by position
+        self.assertIn(
+            'analysis_id, CAST(NULL AS STRING) AS stratum_1, count_value\n'
+            'FROM (\n'
+            '  (SELECT CAST(NULL AS INT64) AS analysis_id, '
+            'CAST(NULL AS INT64) AS count_value LIMIT 0)', command)
+        self.assertIn(
+            'analysis_id, stratum_1, CAST(NULL AS INT64) AS count_value\n'
+            'FROM (\n'
+            '  (SELECT CAST(NULL AS STRING) AS stratum_1, '
+            'CAST(NULL AS INT64) AS analysis_id LIMIT 0)', command)
+        # a trailing comment does not comment out the rest of the statement
+        self.assertIn('select "a", 3 -- x\n  )', command)
+
+    @mock.patch('validation.achilles.sql_wrangle.run_commands')
+    def test_run_analyses_batch_by_table(self, mock_run_commands):
+        achilles.run_analyses(mock.MagicMock(),
+                              self.hpo_id,
+                              batch_by_table=True)
+        commands = mock_run_commands.call_args[0][0]
+        self.assertEqual(commands,
+                         achilles._get_batched_analysis_commands(self.hpo_id))
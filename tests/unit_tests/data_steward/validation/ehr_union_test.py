@@ -1,5 +1,7 @@
 # Python Imports
+import threading
 import unittest
+from collections import OrderedDict
 from unittest import mock
 from unittest.mock import ANY
 
@@ -314,8 +316,349 @@ class EhrUnionTest(unittest.TestCase):
                 "project_id",
                 hpo_ids_ex=[self.FAKE_SITE_2])
         mock_mapping.assert_called_with(ANY, [self.FAKE_SITE_1],
-                                        "input_dataset_id", "output_dataset_id",
-                                        "project_id", ANY)
+                                        "input_dataset_id",
+                                        "output_dataset_id",
+                                        "project_id",
+                                        ANY,
+                                        table_ids=ANY)
+
+    def test_get_load_dependencies(self):
+        self.assertEqual(
+            eu.get_load_dependencies('visit_detail', 'fake_dataset'),
+            {'visit_detail', 'visit_occurrence', 'care_site'})
+        self.assertEqual(eu.get_load_dependencies('person', 'fake_dataset'),
+                         {'location', 'care_site'})
+        self.assertEqual(
+            eu.get_load_dependencies('fact_relationship', 'fake_dataset'),
+            {'measurement'})
+        self.assertEqual(eu.get_load_dependencies('death', 'fake_dataset'),
+                         set())
+
+    def test_run_steps(self):
+        finished = []
+
+        def step(name):
+            return lambda: finished.append(name)
+
+        steps = OrderedDict([('b', (step('b'), {'a'})),
+                             ('a', (step('a'), set())),
+                             ('c', (step('c'), {'a', 'b'}))])
+        eu.run_steps(steps, max_workers=3)
+        self.assertEqual(finished, ['a', 'b', 'c'])
+
+        def fail():
+            raise RuntimeError('step failed')
+
+        finished.clear()
+        steps['a'] = (fail, set())
+        with self.assertRaises(RuntimeError):
+            eu.run_steps(steps, max_workers=3)
+        # steps depending on a failed step do not run
+        self.assertEqual(finished, [])
+
+        steps['a'] = (step('a'), {'d'})
+        self.assertRaises(ValueError, eu.run_steps, steps)
+
+        # steps waiting on each other are reported instead of waited for
+        finished.clear()
+        steps['a'] = (step('a'), set())
+        steps['b'] = (step('b'), {'a', 'c'})
+        with self.assertRaisesRegex(ValueError, r"\['b', 'c'\]"):
+            eu.run_steps(steps, max_workers=3)
+        self.assertEqual(finished, ['a'])
+
+        # queued independent steps do not run after one fails
+        finished.clear()
+        started = threading.Event()
+
+        def fail_after_start():
+            started.wait(10)
+            raise RuntimeError('step failed')
+
+        def start(name):
+
+            def run():
+                started.set()
+                finished.append(name)
+
+            return run
+
+        steps = OrderedDict([('a', (fail_after_start, set()))] +
+                            [(f'load {i}', (start(f'load {i}'), set()))
+                             for i in range(19)])
+        with self.assertRaises(RuntimeError):
+            eu.run_steps(steps, max_workers=2)
+        self.assertLess(len(finished), 19)
+
+    @mock.patch('validation.ehr_union.create_load_aou_death')
+    @mock.patch('validation.ehr_union.clean_engine.clean_dataset')
+    @mock.patch('validation.ehr_union.move_ehr_person_to_observation')
+    @mock.patch('validation.ehr_union.map_ehr_person_to_observation')
+    @mock.patch('validation.ehr_union.load')
+    @mock.patch('validation.ehr_union.mapping')
+    @mock.patch('bq_utils.create_standard_table')
+    @mock.patch('bq_utils.get_hpo_info')
+    def test_main_order(self, mock_hpo_info, mock_create_std_tbl, mock_mapping,
+                        mock_load, mock_map_person, mock_move_person,
+                        mock_clean_dataset, mock_load_aou_death):
+        mock_hpo_info.return_value = [{
+            'hpo_id': hpo_id
+        } for hpo_id in self.hpo_ids]
+        table_id = f'{self.FAKE_SITE_1}_person'
+        mock_client = self.mock_bq_client.return_value
+        mock_client.query.return_value.result.return_value = [{
+            'table_id': table_id,
+            'last_modified_time': 1,
+            'row_count': 1
+        }]
+        finished = []
+        mock_mapping.side_effect = lambda table, *args, **kwargs: finished.append(
+            eu.mapping_table_for(table))
+        mock_load.side_effect = lambda client, table, *args, **kwargs: finished.append(
+            eu.output_table_for(table))
+        mock_map_person.side_effect = lambda *args, **kwargs: finished.append(
+            'map_person')
+
+        eu.main('input_dataset_id',
+                'output_dataset_id',
+                'project_id',
+                max_workers=4)
+
+        # the input dataset is listed once
+        mock_client.query.assert_called_once()
+        self.assertIn('`project_id.input_dataset_id.__TABLES__`',
+                      mock_client.query.call_args.args[0])
+        mock_client.list_tables.assert_not_called()
+        for call in mock_mapping.call_args_list + mock_load.call_args_list:
+            self.assertEqual(call.kwargs['table_ids'], [table_id])
+        # tables load after the mapping tables they read
+        for table in ['visit_detail', 'person', 'fact_relationship']:
+            for dependency in eu.get_load_dependencies(table,
+                                                       'output_dataset_id'):
+                self.assertLess(
+                    finished.index(eu.mapping_table_for(dependency)),
+                    finished.index(eu.output_table_for(table)))
+        # person to observation runs after everything else
+        self.assertEqual(finished[-1], 'map_person')
+        self.assertIn(eu.mapping_table_for('person'), finished)
+        mock_load_aou_death.assert_called_once()
+        # the sources are saved once the union succeeded
+        mock_client.load_table_from_json.assert_called_once()
+        self.assertEqual([
+            row['table_id']
+            for row in mock_client.load_table_from_json.call_args.args[0]
+        ], [table_id])
+
+    def test_get_changed_hpo_ids(self):
+        dataset_tables = {
+            f'{hpo_id}_{table}': {
+                'last_modified_time': 1,
+                'row_count': 10
+            } for hpo_id in self.hpo_ids for table in ['person', 'measurement']
+        }
+        dataset_tables['other_table'] = {
+            'last_modified_time': 1,
+            'row_count': 10
+        }
+        previous_sources = eu.get_union_sources(dataset_tables, self.hpo_ids)
+        self.assertEqual(len(previous_sources), 4)
+        self.assertEqual(
+            previous_sources[f'{self.FAKE_SITE_2}_person']['hpo_offset'],
+            eu.get_hpo_offsets(self.hpo_ids)[self.FAKE_SITE_2])
+
+        # the last union is unknown
+        self.assertIsNone(
+            eu.get_changed_hpo_ids(None, previous_sources, self.hpo_ids))
+        self.assertEqual(
+            eu.get_changed_hpo_ids(previous_sources, previous_sources,
+                                   self.hpo_ids), set())
+
+        # a table of the second site is modified
+        dataset_tables[f'{self.FAKE_SITE_2}_measurement'] = {
+            'last_modified_time': 2,
+            'row_count': 10
+        }
+        sources = eu.get_union_sources(dataset_tables, self.hpo_ids)
+        self.assertEqual(
+            eu.get_changed_hpo_ids(previous_sources, sources, self.hpo_ids),
+            {self.FAKE_SITE_2})
+
+        # a table of the first site is added
+        dataset_tables[f'{self.FAKE_SITE_1}_visit_occurrence'] = {
+            'last_modified_time': 1,
+            'row_count': 1
+        }
+        sources = eu.get_union_sources(dataset_tables, self.hpo_ids)
+        self.assertEqual(
+            eu.get_changed_hpo_ids(previous_sources, sources, self.hpo_ids),
+            {self.FAKE_SITE_1, self.FAKE_SITE_2})
+
+        # the last site is excluded, the offsets of the others do not move
+        sources = eu.get_union_sources(dataset_tables, [self.FAKE_SITE_1])
+        self.assertEqual(
+            eu.get_changed_hpo_ids(previous_sources, sources,
+                                   [self.FAKE_SITE_1]),
+            {self.FAKE_SITE_1, self.FAKE_SITE_2})
+
+        # the first site is excluded, the offset of the second one moves
+        sources = eu.get_union_sources(dataset_tables, [self.FAKE_SITE_2])
+        self.assertIsNone(
+            eu.get_changed_hpo_ids(previous_sources, sources,
+                                   [self.FAKE_SITE_2]))
+
+    @mock.patch('validation.ehr_union.mapping')
+    def test_update_mapping(self, mock_mapping):
+        table_ids = [
+            f'{self.FAKE_SITE_1}_measurement', f'{self.FAKE_SITE_2}_measurement'
+        ]
+        eu.update_mapping('measurement', self.hpo_ids, {self.FAKE_SITE_2},
+                          'input_dataset', 'output_dataset', 'project',
+                          self.mock_bq_client, table_ids)
+
+        queries = [
+            call.args[0] for call in self.mock_bq_client.query.call_args_list
+        ]
+        self.assertEqual(len(queries), 2)
+        # the unioned rows are deleted while the mapping table identifies them
+        self.assertIn(
+            'DELETE FROM `project.output_dataset.unioned_ehr_measurement`',
+            queries[0])
+        self.assertIn('FROM `project.output_dataset._mapping_measurement`',
+                      queries[0])
+        self.assertIn(f"WHERE src_hpo_id IN ('{self.FAKE_SITE_2}')", queries[0])
+        self.assertIn(
+            'DELETE FROM `project.output_dataset._mapping_measurement`',
+            queries[1])
+        # all hpo ids are passed to keep the offsets, only the changed
+        # tables are read
+        mock_mapping.assert_called_once_with(
+            'measurement',
+            self.hpo_ids,
+            'input_dataset',
+            'output_dataset',
+            'project',
+            self.mock_bq_client,
+            table_ids=[f'{self.FAKE_SITE_2}_measurement'],
+            write_disposition='WRITE_APPEND')
+
+        # the unioned person table is reloaded instead
+        self.mock_bq_client.reset_mock()
+        mock_mapping.reset_mock()
+        eu.update_mapping('person', self.hpo_ids, {self.FAKE_SITE_2},
+                          'input_dataset', 'output_dataset', 'project',
+                          self.mock_bq_client, table_ids)
+        self.mock_bq_client.query.assert_called_once()
+        mock_mapping.assert_not_called()
+
+    @mock.patch('validation.ehr_union.load')
+    def test_update_load(self, mock_load):
+        table_ids = [
+            f'{hpo_id}_{table}' for hpo_id in self.hpo_ids
+            for table in ['measurement', 'person']
+        ]
+        eu.update_load(self.mock_bq_client, 'measurement', self.hpo_ids,
+                       {self.FAKE_SITE_1}, 'project', 'input_dataset',
+                       'output_dataset', table_ids)
+        self.mock_bq_client.query.assert_not_called()
+        mock_load.assert_called_once_with(
+            self.mock_bq_client,
+            'measurement',
+            self.hpo_ids,
+            'input_dataset',
+            'output_dataset',
+            table_ids=[f'{self.FAKE_SITE_1}_measurement'])
+
+        # tables without mapped ids are reloaded for all sites
+        mock_load.reset_mock()
+        eu.update_load(self.mock_bq_client, 'person', self.hpo_ids,
+                       {self.FAKE_SITE_1}, 'project', 'input_dataset',
+                       'output_dataset', table_ids)
+        self.assertIn('DELETE FROM `project.output_dataset.unioned_ehr_person`',
+                      self.mock_bq_client.query.call_args.args[0])
+        self.assertEqual(mock_load.call_args.kwargs['table_ids'],
+                         [f'{hpo_id}_person' for hpo_id in self.hpo_ids])
+
+    @mock.patch('validation.ehr_union.read_union_sources')
+    @mock.patch('validation.ehr_union.delete_ehr_person_to_observation')
+    @mock.patch('validation.ehr_union.create_load_aou_death')
+    @mock.patch('validation.ehr_union.clean_engine.clean_dataset')
+    @mock.patch('validation.ehr_union.move_ehr_person_to_observation')
+    @mock.patch('validation.ehr_union.map_ehr_person_to_observation')
+    @mock.patch('validation.ehr_union.update_load')
+    @mock.patch('validation.ehr_union.update_mapping')
+    @mock.patch('bq_utils.create_standard_table')
+    @mock.patch('bq_utils.get_hpo_info')
+    def test_main_incremental(self, mock_hpo_info, mock_create_std_tbl,
+                              mock_update_mapping, mock_update_load,
+                              mock_map_person, mock_move_person,
+                              mock_clean_dataset, mock_load_aou_death,
+                              mock_delete_pto, mock_read_sources):
+        mock_hpo_info.return_value = [{
+            'hpo_id': hpo_id
+        } for hpo_id in self.hpo_ids]
+        mock_client = self.mock_bq_client.return_value
+        mock_client.query.return_value.result.return_value = [{
+            'table_id': f'{hpo_id}_person',
+            'last_modified_time': 1,
+            'row_count': 1
+        } for hpo_id in self.hpo_ids]
+        previous_sources = eu.get_union_sources(
+            {
+                f'{self.FAKE_SITE_1}_person': {
+                    'last_modified_time': 1,
+                    'row_count': 1
+                }
+            }, self.hpo_ids)
+        mock_read_sources.return_value = previous_sources
+
+        eu.main('input_dataset_id',
+                'output_dataset_id',
+                'project_id',
+                incremental=True)
+
+        # only the new submission of the second site is processed
+        mock_create_std_tbl.assert_not_called()
+        mock_client.delete_table.assert_not_called()
+        for call in mock_update_mapping.call_args_list + mock_update_load.call_args_list:
+            self.assertIn({self.FAKE_SITE_2}, call.args)
+        mock_load_aou_death.assert_called_once()
+        mock_delete_pto.assert_called_once_with(mock_client, 'project_id',
+                                                'output_dataset_id')
+        mock_map_person.assert_called_once()
+        mock_client.load_table_from_json.assert_called_once()
+
+        # the tables are rebuilt if the last union is unknown
+        mock_read_sources.return_value = None
+        mock_update_mapping.reset_mock()
+        mock_delete_pto.reset_mock()
+        with mock.patch('validation.ehr_union.mapping'), mock.patch(
+                'validation.ehr_union.load'):
+            eu.main('input_dataset_id',
+                    'output_dataset_id',
+                    'project_id',
+                    incremental=True)
+        mock_update_mapping.assert_not_called()
+        mock_delete_pto.assert_not_called()
+        self.assertTrue(mock_create_std_tbl.called)
+        mock_client.delete_table.assert_called_once_with(
+            'project_id.output_dataset_id._ehr_union_sources',
+            not_found_ok=True)
+
+    def test_delete_ehr_person_to_observation(self):
+        eu.delete_ehr_person_to_observation(self.mock_bq_client, 'project',
+                                            'output_dataset')
+        queries = [
+            call.args[0] for call in self.mock_bq_client.query.call_args_list
+        ]
+        self.assertEqual(len(queries), 2)
+        self.assertIn('`project.output_dataset.unioned_ehr_observation`',
+                      queries[0])
+        self.assertIn('`project.output_dataset._mapping_observation`',
+                      queries[1])
+        for q in queries:
+            self.assertIn(
+                'WHERE observation_id >= 2000000000000000 '
+                'AND observation_id < 3000000000000000', q)
 
     def tearDown(self):
         pass
@@ -0,0 +1,134 @@
+# Python imports
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+# Project imports
+from validation import export
+from constants import bq_utils as bq_consts
+
+FAKE_HPO_ID = 'fake'
+
+
+def fake_response(values, page_token=None, complete=True, total_rows=None):
+    response = {
+        bq_consts.JOB_REFERENCE: {
+            bq_consts.JOB_ID: 'job_1',
+            bq_consts.LOCATION: 'US'
+        },
+        bq_consts.JOB_COMPLETE: complete
+    }
+    if complete:
+        response[bq_consts.SCHEMA] = {
+            bq_consts.FIELDS: [{
+                'name': 'count_value',
+                'type': 'INTEGER'
+            }]
+        }
+        response[bq_consts.TOTAL_ROWS] = str(
+            len(values) if total_rows is None else total_rows)
+        response[bq_consts.ROWS] = [{'f': [{'v': str(v)}]} for v in values]
+    if page_token:
+        response[bq_consts.PAGE_TOKEN] = page_token
+    return response
+
+
+class ExportTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print(
+            '\n**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.export_path = self.temp_dir.name
+        # person.sql and person/summary.sql both contribute to PERSON
+        os.makedirs(os.path.join(self.export_path, 'person'))
+        for file_path, value in [('person.sql', 1),
+                                 (os.path.join('person', 'summary.sql'), 2),
+                                 ('gender.sql', 3)]:
+            with open(os.path.join(self.export_path, file_path), 'w') as fp:
+                fp.write(f'SELECT {value} AS count_value '
+                         f'FROM {export.RESULTS_SCHEMA_PLACEHOLDER}achilles')
+
+        mock_query_patcher = mock.patch('validation.export.bq_utils.query')
+        self.mock_query = mock_query_patcher.start()
+        self.addCleanup(mock_query_patcher.stop)
+
+        def query(sql):
+            return fake_response([int(sql.split()[1])])
+
+        self.mock_query.side_effect = query
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    @mock.patch('validation.export.is_hpo_id')
+    def test_export_from_path(self, mock_is_hpo_id):
+        mock_is_hpo_id.return_value = True
+
+        result = export.export_from_path(self.export_path, FAKE_HPO_ID)
+
+        self.assertEqual(
+            result, {
+                'PERSON': {
+                    'COUNT_VALUE': 1,
+                    'SUMMARY': {
+                        'COUNT_VALUE': 2
+                    }
+                },
+                'GENDER': {
+                    'COUNT_VALUE': 3
+                }
+            })
+        # the hpo is looked up once, not once per directory
+        mock_is_hpo_id.assert_called_once_with(FAKE_HPO_ID)
+        self.assertEqual(self.mock_query.call_count, 3)
+        for call in self.mock_query.call_args_list:
+            self.assertIn(f'{FAKE_HPO_ID}_achilles', call.args[0])
+
+    @mock.patch('validation.export.is_hpo_id')
+    def test_export_from_paths_unknown_datasource(self, mock_is_hpo_id):
+        mock_is_hpo_id.return_value = False
+
+        results = export.export_from_paths([self.export_path], 'other')
+
+        self.assertEqual(len(results[self.export_path]), 2)
+        for call in self.mock_query.call_args_list:
+            self.assertNotIn('other', call.args[0])
+
+        mock_is_hpo_id.reset_mock()
+        export.export_from_paths([self.export_path], export.UNIONED_EHR)
+        mock_is_hpo_id.assert_not_called()
+
+    @mock.patch('validation.export.app_identity.get_application_id')
+    @mock.patch('validation.export.bq_utils.create_service')
+    def test_get_query_result_pages(self, mock_create_service, mock_app_id):
+        mock_app_id.return_value = 'fake-project'
+        self.mock_query.side_effect = None
+        self.mock_query.return_value = fake_response([], complete=False)
+        mock_get_query_results = mock_create_service.return_value.jobs.return_value.getQueryResults
+        mock_get_query_results.return_value.execute.side_effect = [
+            fake_response([1, 2], page_token='page_2', total_rows=4),
+            fake_response([3, 4], total_rows=4)
+        ]
+
+        query_result = export.get_query_result('SELECT 1')
+
+        self.assertEqual(export.query_result_to_payload(query_result),
+                         {'COUNT_VALUE': [1, 2, 3, 4]})
+        self.assertEqual(mock_get_query_results.call_count, 2)
+        self.assertEqual(mock_get_query_results.call_args.kwargs['pageToken'],
+                         'page_2')
+        self.assertEqual(mock_get_query_results.call_args.kwargs['location'],
+                         'US')
+
+    def test_query_result_to_payload(self):
+        self.assertEqual(export.query_result_to_payload(fake_response([5])),
+                         {'COUNT_VALUE': 5})
+        self.assertEqual(export.query_result_to_payload(fake_response([])),
+                         {'COUNT_VALUE': []})
@@ -15,6 +15,7 @@ import resources
 from constants.validation import hpo_report as report_consts
 from constants.validation import main as main_consts
 from constants.validation.participants import identity_match as id_match_consts
+from validation.submission_index import PROCESSED_FOLDER_INDEX
 from tests.test_util import mock_google_http_error, mock_google_cloud_error, mock_google_service_unavailable_error
 
 with mock.patch('google.cloud.logging.Client') as mock_gc_logging_client:
@@ -46,11 +47,13 @@ class ValidationMainTest(TestCase):
         self.hpo_bucket = 'fake_aou_000'
         self.project_id = 'fake_project_id'
         self.bigquery_dataset_id = 'fake_dataset_id'
-        mock_get_hpo_name = mock.patch('validation.main.get_hpo_name')
-        self.mock_get_hpo_name = mock_get_hpo_name.start()
+        self.get_hpo_name_patcher = mock.patch('validation.main.get_hpo_name')
+        self.mock_get_hpo_name = self.get_hpo_name_patcher.start()
         self.mock_get_hpo_name.return_value = 'Fake HPO'
-        self.addCleanup(mock_get_hpo_name.stop)
+        self.addCleanup(self.get_hpo_name_patcher.stop)
         self.folder_prefix = '2019-01-01-v1/'
+        PROCESSED_FOLDER_INDEX.clear()
+        main.get_hpo_names.cache_clear()
 
     def _create_dummy_bucket_items(self,
                                    time_created,
@@ -229,6 +232,126 @@ class ValidationMainTest(TestCase):
                 self.hpo_bucket, bucket_items + [partipant_item])
             self.assertEqual(submission_folder, 't2/')
 
+    @mock.patch('validation.main._validation_done')
+    def test_discover_submission_folder(self, mock_validation_done):
+        now = datetime.datetime.now()
+        bucket_items = []
+        for day, folder in enumerate(['t0/', 't1/', 't2/']):
+            updated = now - datetime.timedelta(days=3 - day)
+            bucket_items.append({
+                'name': f'{folder}person.csv',
+                'updated': updated,
+                'timeCreated': updated
+            })
+        processed_items = [{
+            'name': f'{folder}{common.PROCESSED_TXT}',
+            'updated': now,
+            'timeCreated': now
+        } for folder in ['t0/', 't1/']]
+        storage_client = mock.MagicMock()
+        storage_client.list_sub_prefixes.return_value = [
+            't0/', 't1/', 't2/', f'{common.PARTICIPANT_DIR}/'
+        ]
+        storage_client.get_bucket_items_metadata.side_effect = lambda bucket, prefix: [
+            item for item in bucket_items + processed_items
+            if item['name'].startswith(prefix)
+        ]
+        bucket = mock.MagicMock()
+        type(bucket).name = mock.PropertyMock(return_value=self.hpo_bucket)
+
+        # the latest unprocessed folder is found, processed folders are
+        # indexed and the participant directory is not listed
+        folder_prefix, folder_items = main.discover_submission_folder(
+            storage_client, bucket)
+        self.assertEqual(folder_prefix, 't2/')
+        self.assertEqual(folder_items, bucket_items[2:])
+        self.assertEqual(
+            set(PROCESSED_FOLDER_INDEX.get_folders(self.hpo_bucket)),
+            {'t0/', 't1/'})
+        mock_validation_done.assert_not_called()
+        # same folder as when the whole bucket is listed
+        mock_validation_done.return_value = False
+        self.assertEqual(main._get_submission_folder(bucket, bucket_items),
+                         folder_prefix)
+
+        # indexed folders are not listed again
+        storage_client.get_bucket_items_metadata.reset_mock()
+        processed_items.append({
+            'name': f't2/{common.PROCESSED_TXT}',
+            'updated': now,
+            'timeCreated': now
+        })
+        self.assertEqual(
+            main.discover_submission_folder(storage_client, bucket), (None, []))
+        self.assertEqual([
+            call.kwargs['prefix']
+            for call in storage_client.get_bucket_items_metadata.call_args_list
+        ], ['t2/'])
+
+        storage_client.get_bucket_items_metadata.reset_mock()
+        mock_validation_done.return_value = True
+        self.assertEqual(
+            main.discover_submission_folder(storage_client, bucket), (None, []))
+        storage_client.get_bucket_items_metadata.assert_not_called()
+
+        # a forced run lists the folder it returns
+        folder_prefix, folder_items = main.discover_submission_folder(
+            storage_client, bucket, force_process=True)
+        self.assertEqual(folder_prefix, 't2/')
+        self.assertEqual(folder_items, bucket_items[2:] + processed_items[2:])
+
+        # a folder whose processed.txt was removed is validated again
+        processed_items.pop()
+        mock_validation_done.return_value = False
+        folder_prefix, folder_items = main.discover_submission_folder(
+            storage_client, bucket)
+        self.assertEqual(folder_prefix, 't2/')
+        self.assertNotIn('t2/',
+                         PROCESSED_FOLDER_INDEX.get_folders(self.hpo_bucket))
+
+    @mock.patch('validation.main._validation_done')
+    def test_discover_submission_folder_keeps_indexed_time(
+            self, mock_validation_done):
+        now = datetime.datetime.now()
+        bucket_items = []
+        for day, folder in enumerate(['t0/', 't1/']):
+            updated = now - datetime.timedelta(days=3 - day)
+            bucket_items.append({
+                'name': f'{folder}person.csv',
+                'updated': updated,
+                'timeCreated': updated
+            })
+        bucket_items.append({
+            'name': f't0/{common.PROCESSED_TXT}',
+            'updated': now,
+            'timeCreated': now
+        })
+        storage_client = mock.MagicMock()
+        storage_client.list_sub_prefixes.return_value = ['t0/', 't1/']
+        storage_client.get_bucket_items_metadata.side_effect = lambda bucket, prefix: [
+            item for item in bucket_items if item['name'].startswith(prefix)
+        ]
+        bucket = mock.MagicMock()
+        type(bucket).name = mock.PropertyMock(return_value=self.hpo_bucket)
+        mock_validation_done.side_effect = lambda bucket, folder: folder == 't0/'
+
+        folder_prefix, _ = main.discover_submission_folder(
+            storage_client, bucket)
+        self.assertEqual(folder_prefix, 't1/')
+
+        # a later upload to the indexed folder does not change its rank, while
+        # ranking the whole bucket listing picks it and skips it as processed
+        updated = now - datetime.timedelta(hours=4)
+        bucket_items.append({
+            'name': 't0/visit_occurrence.csv',
+            'updated': updated,
+            'timeCreated': updated
+        })
+        self.assertIsNone(main._get_submission_folder(bucket, bucket_items))
+        folder_prefix, _ = main.discover_submission_folder(
+            storage_client, bucket)
+        self.assertEqual(folder_prefix, 't1/')
+
     @mock.patch('api_util.check_cron')
     def test_categorize_folder_items(self, mock_check_cron):
         expected_cdm_files = ['person.csv']
@@ -242,20 +365,27 @@ class ValidationMainTest(TestCase):
         self.assertCountEqual(expected_pii_files, pii_files)
         self.assertCountEqual(expected_unknown_files, unknown_files)
 
+    @mock.patch('bq_utils.wait_on_jobs')
+    @mock.patch('bq_utils.load_from_csv')
     @mock.patch('bq_utils.create_standard_table')
     @mock.patch('validation.main.perform_validation_on_file')
     @mock.patch('api_util.check_cron')
     def test_validate_submission(self, mock_check_cron,
                                  mock_perform_validation_on_file,
-                                 mock_create_standard_table):
+                                 mock_create_standard_table, mock_load_from_csv,
+                                 mock_wait_on_jobs):
         """
         Checks the return value of validate_submission
 
         :param mock_check_cron:
         :param mock_perform_validation_on_file:
         :param mock_create_standard_table:
+        :param mock_load_from_csv:
+        :param mock_wait_on_jobs:
         :return:
         """
+        mock_load_from_csv.return_value = {'jobReference': {'jobId': 'job_1'}}
+        mock_wait_on_jobs.return_value = []
         folder_prefix = '2019-01-01/'
         folder_items = ['person.csv', 'invalid_file.csv']
 
@@ -289,7 +419,7 @@ class ValidationMainTest(TestCase):
             expected_errors += errors
 
         def perform_validation_on_file(cdm_file_name, found_cdm_files, hpo_id,
-                                       folder_prefix, bucket):
+                                       folder_prefix, bucket, **kwargs):
             return perform_validation_on_file_returns.get(cdm_file_name)
 
         mock_perform_validation_on_file.side_effect = perform_validation_on_file
@@ -303,6 +433,88 @@ class ValidationMainTest(TestCase):
         self.assertCountEqual(expected_errors, actual_result.get('errors'))
         self.assertCountEqual(expected_warnings, actual_result.get('warnings'))
 
+    @mock.patch('bq_utils.get_job_details')
+    @mock.patch('bq_utils.wait_on_jobs')
+    @mock.patch('bq_utils.load_from_csv')
+    @mock.patch('bq_utils.create_standard_table')
+    @mock.patch('api_util.check_cron')
+    def test_validate_submission_loads_together(self, mock_check_cron,
+                                                mock_create_standard_table,
+                                                mock_load_from_csv,
+                                                mock_wait_on_jobs,
+                                                mock_get_job_details):
+        """
+        Checks that all load jobs are submitted before they are waited on
+        """
+        folder_items = ['visit_occurrence.csv', 'pii_name.csv', 'person.csv']
+        mock_load_from_csv.side_effect = lambda hpo_id, table_name, prefix: {
+            'jobReference': {
+                'jobId': f'job_{table_name}'
+            }
+        }
+
+        def wait_on_jobs(job_ids):
+            # every load job was submitted before any is waited on
+            self.assertEqual(mock_load_from_csv.call_count, 3)
+            return []
+
+        def get_job_details(job_id):
+            if job_id == 'job_visit_occurrence':
+                return {
+                    'status': {
+                        'errorResult': {},
+                        'errors': [{
+                            'message': 'Fake parsing error'
+                        }]
+                    }
+                }
+            return {'status': {'state': 'DONE'}}
+
+        mock_wait_on_jobs.side_effect = wait_on_jobs
+        mock_get_job_details.side_effect = get_job_details
+        mock_bucket = mock.MagicMock()
+        type(mock_bucket).name = mock.PropertyMock(return_value=self.hpo_bucket)
+
+        actual_result = main.validate_submission(self.hpo_id, mock_bucket,
+                                                 folder_items,
+                                                 self.folder_prefix)
+
+        mock_wait_on_jobs.assert_called_once()
+        self.assertCountEqual(
+            mock_wait_on_jobs.call_args[0][0],
+            ['job_person', 'job_visit_occurrence', 'job_pii_name'])
+        # results keep the order of the files
+        expected_results = [(file_name, int(file_name in folder_items),
+                             int(file_name in ['person.csv', 'pii_name.csv']),
+                             int(file_name in ['person.csv', 'pii_name.csv']))
+                            for file_name in sorted(resources.CDM_CSV_FILES) +
+                            sorted(common.PII_FILES)
+                            if file_name in common.SUBMISSION_FILES]
+        self.assertEqual(expected_results, actual_result['results'])
+        self.assertEqual([('visit_occurrence.csv', 'Fake parsing error')],
+                         actual_result['errors'])
+
+        # an incomplete load job aborts validation of the submission
+        mock_wait_on_jobs.side_effect = None
+        mock_wait_on_jobs.return_value = ['job_pii_name']
+        self.assertRaises(main.InternalValidationError,
+                          main.validate_submission, self.hpo_id, mock_bucket,
+                          folder_items, self.folder_prefix)
+
+    @mock.patch.dict('os.environ',
+                     {main_consts.VALIDATION_MAX_WORKERS_VAR: '2'})
+    @mock.patch('validation.main.process_hpo')
+    @mock.patch('bq_utils.get_hpo_info')
+    @mock.patch('api_util.check_cron')
+    def test_validate_all_hpos_concurrent(self, mock_check_cron, mock_hpo_csv,
+                                          mock_process_hpo):
+        hpo_ids = ['hpo_a', 'hpo_b', 'hpo_c']
+        mock_hpo_csv.return_value = [{'hpo_id': hpo_id} for hpo_id in hpo_ids]
+        with main.app.test_client() as c:
+            c.get(main_consts.PREFIX + 'ValidateAllHpoFiles')
+        self.assertCountEqual(
+            [call.args[0] for call in mock_process_hpo.call_args_list], hpo_ids)
+
     @mock.patch('bq_utils.get_hpo_info')
     @mock.patch('logging.exception')
     @mock.patch('api_util.check_cron')
@@ -313,7 +525,7 @@ class ValidationMainTest(TestCase):
         mock_hpo_csv.return_value = [{'hpo_id': self.hpo_id}]
         mock_client = mock.MagicMock()
         self.mock_storage_client.return_value = mock_client
-        mock_client.get_bucket_items_metadata.side_effect = mock_google_cloud_error(
+        mock_client.list_sub_prefixes.side_effect = mock_google_cloud_error(
             content=http_error_string.encode())
         with main.app.test_client() as c:
             c.get(main_consts.PREFIX + 'ValidateAllHpoFiles')
@@ -389,7 +601,7 @@ class ValidationMainTest(TestCase):
         after_lag_time = datetime.datetime.today() - datetime.timedelta(
             minutes=7)
 
-        mock_client.get_bucket_items_metadata.return_value = [{
+        bucket_items = [{
             'name': 'unknown.pdf',
             'timeCreated': now,
             'updated': after_lag_time
@@ -414,6 +626,13 @@ class ValidationMainTest(TestCase):
             'timeCreated': now,
             'updated': after_lag_time
         }]
+        mock_client.list_sub_prefixes.return_value = [
+            'participant/', 'PARTICIPANT/', 'Participant/',
+            submission_path.lower(), submission_path
+        ]
+        mock_client.get_bucket_items_metadata.side_effect = lambda bucket, prefix: [
+            item for item in bucket_items if item['name'].startswith(prefix)
+        ]
 
         mock_validation.return_value = {
             'results': [(f'{submission_path}measurement.csv', 1, 1, 1)],
@@ -428,8 +647,15 @@ class ValidationMainTest(TestCase):
 
         # post conditions
         mock_folder_items.assert_called()
-        mock_folder_items.assert_called_once_with(
-            mock_client.get_bucket_items_metadata.return_value, submission_path)
+        mock_folder_items.assert_called_once_with(bucket_items[-1:],
+                                                  submission_path)
+        # only the top level folders and the submission folders are listed
+        mock_client.list_sub_prefixes.assert_called_once_with(
+            'fake_bucket_name', '')
+        self.assertCountEqual([
+            call.kwargs['prefix']
+            for call in mock_client.get_bucket_items_metadata.call_args_list
+        ], [submission_path.lower(), submission_path])
         mock_validation.assert_called()
         mock_validation.assert_called_once_with(fake_hpo, mock_bucket,
                                                 mock_folder_items.return_value,
@@ -622,6 +848,63 @@ class ValidationMainTest(TestCase):
             error_occurred = result.get(report_consts.ERROR_OCCURRED_REPORT_KEY)
             self.assertEqual(error_occurred, True)
 
+    def test_collect_metrics(self):
+        calls = []
+
+        def rows(name):
+            calls.append(name)
+            return [{'name': name}]
+
+        def error():
+            calls.append('error')
+            raise mock_google_http_error(status_code=500,
+                                         reason='baz',
+                                         content=b'bar')
+
+        metric_tasks = {
+            'first': lambda: rows('first'),
+            'failing': error,
+            '_side_effect': lambda: rows('_side_effect'),
+            'last': lambda: rows('last')
+        }
+        report_data = {}
+
+        # a failing metric does not stop the others
+        with self.assertRaises(main.HttpError):
+            main.collect_metrics(metric_tasks, report_data)
+
+        self.assertCountEqual(calls, ['first', 'error', '_side_effect', 'last'])
+        self.assertEqual(report_data, {
+            'first': [{
+                'name': 'first'
+            }],
+            'last': [{
+                'name': 'last'
+            }]
+        })
+
+    @mock.patch('bq_utils.get_hpo_info')
+    def test_get_hpo_name(self, mock_hpo_info):
+        self.get_hpo_name_patcher.stop()
+        mock_hpo_info.return_value = [{
+            'hpo_id': 'hpo_a',
+            'name': 'Site A'
+        }, {
+            'hpo_id': 'hpo_b',
+            'name': 'Site B'
+        }]
+
+        self.assertEqual(main.get_hpo_name('HPO_A'), 'Site A')
+        self.assertEqual(main.get_hpo_name('hpo_b'), 'Site B')
+        # the sites are looked up once
+        mock_hpo_info.assert_called_once()
+
+        # unknown sites are looked up again in case they were just added
+        mock_hpo_info.return_value.append({'hpo_id': 'hpo_c', 'name': 'Site C'})
+        self.assertEqual(main.get_hpo_name('hpo_c'), 'Site C')
+        self.assertRaises(ValueError, main.get_hpo_name, 'hpo_d')
+        self.assertEqual(mock_hpo_info.call_count, 3)
+
     @mock.patch('bq_utils.get_hpo_info')
     def test_html_incorrect_folder_name(self, mock_hpo_csv):
         mock_hpo_csv.return_value = [{'hpo_id': self.hpo_id}]
@@ -1,5 +1,6 @@
 # Python imports
 import os
+import threading
 import unittest
 
 # Third party imports
@@ -213,5 +214,96 @@ class SQLWrangleTest(unittest.TestCase):
             'SELECT * FROM synpuf_100.death WHERE 1=1')
         self.assertEqual(r, 'SELECT * FROM aou_death WHERE 1=1')
 
+    def test_get_insert_parts(self):
+        command = (
+            '-- 1 Number of persons\n'
+            'insert into fake_achilles_results (analysis_id, count_value)\n'
+            'select 1 as analysis_id, COUNT(*) as count_value\n'
+            ' from fake_person -- all persons')
+        self.assertEqual(sql_wrangle.get_insert_parts(command),
+                         ('fake_achilles_results', [
+                             'analysis_id', 'count_value'
+                         ], 'select 1 as analysis_id, COUNT(*) as count_value\n'
+                          ' from fake_person -- all persons'))
+        self.assertIsNone(sql_wrangle.get_insert_parts(self.query_1))
+
+    def test_get_command_dependencies(self):
+        commands = [
+            'insert into fake_achilles_results (analysis_id) select 1 from fake_person',
+            'insert into fake_achilles_results (analysis_id) select 2 from fake_visit_occurrence',
+            'INTO fake_temp_tempresults select count_value from fake_achilles_results',
+            'insert into fake_achilles_results_dist (analysis_id) select 3 from fake_person',
+            'insert into fake_achilles_heel_results (rule_id) select 1 from fake_temp_tempresults',
+            'truncate table fake_temp_tempresults',
+            'drop table fake_temp_tempresults',
+            'insert into fake_achilles_results (analysis_id) select 4 from fake_person',
+            'CREATE TABLE fake_other AS select 1',
+            'insert into fake_achilles_results_dist (analysis_id) select 5 from fake_person'
+        ]
+        self.assertEqual(
+            sql_wrangle.get_command_tables(commands[2]),
+            ({'select', 'count_value', 'from', 'fake_achilles_results'
+             }, set(), {'fake_temp_tempresults'}))
+        self.assertIsNone(sql_wrangle.get_command_tables(commands[8]))
+
+        self.assertEqual(sql_wrangle.get_command_dependencies(commands), [
+            set(),
+            set(), {0, 1},
+            set(), {2}, {2, 4}, {2, 4, 5}, {2},
+            set(range(8)), {8}
+        ])
+
+    def test_run_commands(self):
+        commands = [
+            'insert into fake_achilles_results (analysis_id) select 1',
+            'insert into fake_achilles_results (analysis_id) select 2',
+            'INTO fake_temp_tempresults select * from fake_achilles_results'
+        ]
+        # the independent commands block until both have started, which only
+        # succeeds if they run concurrently
+        barrier = threading.Barrier(2, timeout=10)
+        ran = []
+
+        def run_command(command):
+            if command.startswith('insert'):
+                barrier.wait()
+            ran.append(command)
+
+        sql_wrangle.run_commands(commands, run_command, max_workers=2)
+        self.assertCountEqual(ran[:2], commands[:2])
+        self.assertEqual(ran[2], commands[2])
+
+        # no command starts after one fails
+        ran = []
+
+        def fail_command(command):
+            ran.append(command)
+            raise RuntimeError('Job id taking too long')
+
+        self.assertRaises(RuntimeError, sql_wrangle.run_commands, commands[1:],
+                          fail_command, 2)
+        self.assertEqual(ran, commands[1:2])
+
+        # at most max_workers commands are submitted, so queued independent
+        # commands do not run after one fails
+        ran = []
+        commands = [
+            f'insert into fake_achilles_results (analysis_id) select {i}'
+            for i in range(20)
+        ]
+        started = threading.Event()
+
+        def fail_first(command):
+            ran.append(command)
+            if command == commands[0]:
+                # let the other worker pick up a command first
+                started.wait(10)
+                raise RuntimeError('Job id taking too long')
+            started.set()
+
+        self.assertRaises(RuntimeError, sql_wrangle.run_commands, commands,
+                          fail_first, 2)
+        self.assertLess(len(ran), len(commands))
+
     def tearDown(self):
         pass